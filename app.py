@@ -11,10 +11,25 @@ import os
 import random
 import re
 import colorsys
+import calendar
+import unicodedata
 import datetime
 import json
+import shutil
+import tempfile
 import secrets
 import math
+import heapq
+import itertools
+import asyncio
+import selectors
+import collections
+import http.client
+import http.server
+import urllib.parse
+import time
+import threading
+import numpy as np
 from typing import Optional, Tuple
 
 # ─────────────────────────────────────────────
@@ -188,7 +203,7 @@ def init_session():
         "auth_tab":               "login",
         "ctx_popup":              False,
         "gbl_user":               "",
-        "my_col":                 [],
+        "my_col":                 None,    # ColCollection, created on first use
         "quiz_session":           None,
         "quiz_session_answers":   {},
         "busca_query":            "",      # FIX: separate from widget key
@@ -1121,6 +1136,24 @@ def page_home():
     st.markdown('</div>', unsafe_allow_html=True)
 
 
+GALLERY_ROWS = 100_000
+
+def gallery_window(n: int, first: int, template_size: int, height: int, overscan: int = 2) -> Tuple[int, int]:
+    # Like the Power Apps gallery: only the rows that fit in the viewport (+ a small overscan) are materialized
+    visible = math.ceil(height / (template_size + 4)) + overscan
+    start = max(0, min(first, n - 1))
+    return start, min(n, start + visible)
+
+def datatable_page(schema: str, rows: int, n: int, columns: list, sort_col: str, desc: bool, page: int, page_size: int):
+    import pyarrow as pa
+    order = synth_order(schema, rows, sort_col, desc, n)
+    idx = order[page * page_size:(page + 1) * page_size]
+    known = synth_table(schema, rows)
+    at = synth_arrow(schema, rows, idx, [c for c in columns if c in known])
+    # Colunas desconhecidas viram texto de exemplo; nenhuma coluna = projeção vazia, nunca a tabela inteira
+    return pa.table({c: at.column(c) if c in known else pa.array([f"{c} {j + 1}" for j in idx]) for c in columns})
+
+
 def page_controles():
     st.markdown('<div class="main-wrap">', unsafe_allow_html=True)
     breadcrumb("Documentação", "Laboratório de Controles")
@@ -1189,24 +1222,38 @@ def page_controles():
             st.code(f'DatePicker1.DefaultDate = Date({dv.year},{dv.month},{dv.day})\nDatePicker1.Format = {fmt}\n// Ler: DatePicker1.SelectedDate',language="powerapps")
 
     with tabs[3]:
-        lab_header("Gallery","O controle mais importante do Power Apps")
+        lab_header("Gallery","O controle mais importante do Power Apps — só os itens visíveis são renderizados")
         c1,c2=st.columns([1,1.5],gap="large")
         with c1:
             col_label("⚙️ Configurações")
-            gn=st.slider("Quantidade de itens",1,8,4,key="gal_n")
+            gn=st.select_slider("Itens na coleção",[8,100,1_000,10_000,100_000],1_000,format_func=lambda v: f"{v:,}",key="gal_n")
             ts=st.slider("TemplateSize (altura px)",50,160,80,key="gal_ts")
+            gh=st.slider("Height da Gallery (px)",160,800,260,20,key="gal_h")
+            top=st.slider("Rolagem — primeiro item visível",1,gn,1,key=f"gal_top_{gn}") if gn>1 else 1
             show_s=st.checkbox("Mostrar item selecionado",True,key="gal_ss")
         with c2:
             col_label("👁️ Preview & Código")
             sel_i=2 if show_s else -1
+            synth_table("Funcionarios",GALLERY_ROWS)
+            t0=time.perf_counter()
+            start,stop=gallery_window(gn,top-1,ts,gh)
+            gdf=synth_frame("Funcionarios",GALLERY_ROWS,slice(start,stop),["Nome","Cargo","Departamento"])
             hi=""
-            for i in range(1,gn+1):
+            for i,r in enumerate(gdf.itertuples(index=False),start+1):
                 ss="border-left:3px solid #0078d4;background:#eff6fc;" if i==sel_i else "background:white;"
-                hi+=f'<div style="border:1px solid #e5e7eb;height:{ts}px;padding:10px 14px;margin-bottom:4px;display:flex;align-items:center;{ss}border-radius:8px;gap:12px;"><div style="width:34px;height:34px;background:#0078d4;border-radius:50%;color:white;display:flex;align-items:center;justify-content:center;font-size:12px;font-weight:700;flex-shrink:0">{i}</div><div><div style="font-weight:600;font-size:12px">Item {i}</div><div style="font-size:11px;color:#6b7280">Subtítulo...</div></div><div style="margin-left:auto;color:#9ca3af">›</div></div>'
-            st.markdown(f'<div style="background:#f9fafb;padding:8px;border-radius:10px;height:260px;overflow-y:auto;">{hi}</div>',unsafe_allow_html=True)
+                ini="".join(p[0] for p in r.Nome.split()[:2])
+                hi+=f'<div style="border:1px solid #e5e7eb;height:{ts}px;padding:10px 14px;margin-bottom:4px;display:flex;align-items:center;{ss}border-radius:8px;gap:12px;"><div style="width:34px;height:34px;background:#0078d4;border-radius:50%;color:white;display:flex;align-items:center;justify-content:center;font-size:12px;font-weight:700;flex-shrink:0">{ini}</div><div><div style="font-weight:600;font-size:12px">{r.Nome}</div><div style="font-size:11px;color:#6b7280">#{i:,} · {r.Cargo} · {r.Departamento}</div></div><div style="margin-left:auto;color:#9ca3af">›</div></div>'
+            ms=(time.perf_counter()-t0)*1000
+            st.markdown(f'<div style="background:#f9fafb;padding:8px;border-radius:10px;height:{gh}px;overflow:hidden;">{hi}</div>',unsafe_allow_html=True)
+            st.caption(f"Itens {start+1:,}–{stop:,} de {gn:,} renderizados")
+            m1,m2,m3=st.columns(3)
+            m1.metric("Itens renderizados",f"{stop-start:,}",f"de {gn:,} na coleção",delta_color="off")
+            m2.metric("HTML gerado",f"{len(hi)/1024:,.1f} KB",f"~{len(hi)/max(1,stop-start)*gn/1024/1024:,.1f} MB se tudo fosse renderizado",delta_color="off")
+            m3.metric("Tempo de render",f"{ms:,.1f} ms")
             sp()
-            st.code(f'Gallery1.Items        = Filter(MinhaTabela, Ativo = true)\nGallery1.TemplateSize = {ts}\n// Item selecionado:   Gallery1.Selected\n// Navegar ao clicar:  Navigate(Tela2, None, {{rec: ThisItem}})',language="powerapps")
+            st.code(f'Gallery1.Items        = Filter(Funcionarios, Ativo = true)\nGallery1.TemplateSize = {ts}\n// Item selecionado:   Gallery1.Selected\n// Navegar ao clicar:  Navigate(Tela2, None, {{rec: ThisItem}})',language="powerapps")
         info_box("⚠️ <b>Performance:</b> Sempre use Filter() no Items do Gallery — nunca carregue toda a tabela com ClearCollect() apenas para exibir.","warning")
+        info_box("💡 A Gallery só cria controles para os itens visíveis e busca dados em lotes de 100 conforme você rola. Um <code>TemplateSize</code> menor ou uma Gallery mais alta aumentam os itens renderizados por tela — e o custo de cada controle dentro do template.","info")
 
     with tabs[4]:
         lab_header("Button","Personalizando botões")
@@ -1254,25 +1301,418 @@ def page_controles():
             st.code(f'Timer1.Duration  = {dur}\nTimer1.AutoStart = {str(aut).lower()}\nTimer1.Repeat    = {str(rep).lower()}\nTimer1.Visible   = false\n// Atualizar a cada {dur/1000:.1f}s:\nTimer1.OnTimerEnd = ClearCollect(colDados, MinhaTabela)',language="powerapps")
 
     with tabs[7]:
-        lab_header("Data Table","Exibição tabular com colunas configuráveis")
+        lab_header("Data Table","Exibição tabular com ordenação e paginação no servidor")
         c1,c2=st.columns([1,1.5],gap="large")
         with c1:
             col_label("⚙️ Configurações")
-            cr=st.text_input("Colunas","Nome, Cargo, Departamento",key="dt_cr")
+            cr=st.text_input("Colunas","Nome, Cargo, Departamento, Salario",key="dt_cr")
             dc=[c.strip() for c in cr.split(",") if c.strip()]
-            dr=st.slider("Linhas de exemplo",2,6,3,key="dt_dr")
+            known=synth_table("Funcionarios",GALLERY_ROWS)
+            dn=st.select_slider("Linhas na coleção",[1_000,10_000,100_000],100_000,format_func=lambda v: f"{v:,}",key="dt_n")
+            ps=st.selectbox("Linhas por página",[25,50,100,250,500],2,key="dt_ps")
+            sortable=[c for c in dc if c in known] or ["ID"]
+            sc=st.selectbox("Ordenar por",sortable,key="dt_sc")
+            desc=st.radio("Ordem",["Ascending","Descending"],horizontal=True,key="dt_ord")=="Descending"
+            pages=max(1,math.ceil(dn/ps))
+            pg=st.number_input(f"Página (1–{pages:,})",1,pages,1,key=f"dt_pg_{dn}_{ps}")
         with c2:
             col_label("👁️ Preview & Código")
-            import pandas as pd
-            data={col:[f"{col} {i+1}" for i in range(dr)] for col in dc}
-            st.dataframe(pd.DataFrame(data),use_container_width=True)
+            t0=time.perf_counter()
+            at=datatable_page("Funcionarios",GALLERY_ROWS,dn,dc,sc,desc,int(pg)-1,ps)
+            ms=(time.perf_counter()-t0)*1000
+            st.dataframe(at,use_container_width=True,hide_index=True,height=300)
+            m1,m2,m3=st.columns(3)
+            m1.metric("Linhas enviadas",f"{at.num_rows:,}",f"de {dn:,}",delta_color="off")
+            m2.metric("Payload da página",f"{at.nbytes/1024:,.1f} KB")
+            m3.metric("Ordenar + paginar",f"{ms:,.1f} ms")
+            st.caption(f"Colunas reais da tabela sintética Funcionarios: {', '.join(known)}")
             cb="\n".join([f'DataTableColumn{i+1}.FieldName = "{c}"' for i,c in enumerate(dc)])
-            st.code(f'DataTable1.Items = Filter(MinhaTabela, Ativo = true)\n{cb}\n// Somente leitura — use Gallery para edição inline',language="powerapps")
+            st.code(f'DataTable1.Items = SortByColumns(Filter(Funcionarios, Ativo = true), "{sc}", SortOrder.{"Descending" if desc else "Ascending"})\n{cb}\n// Somente leitura — use Gallery para edição inline',language="powerapps")
 
     st.markdown('</div>',unsafe_allow_html=True)
     section_quiz("controles")
 
 
+# ══════════════════════════════════════════════
+# POWER FX — MOTOR DE FORMATAÇÃO Text() / Value() E ARREDONDAMENTO
+# ══════════════════════════════════════════════
+PFX_LOCALES = {
+    "pt-BR": {"dec": ",", "grp": ".", "am": ("AM", "PM"),
+              "months": ["janeiro","fevereiro","março","abril","maio","junho","julho","agosto","setembro","outubro","novembro","dezembro"],
+              "days": ["segunda-feira","terça-feira","quarta-feira","quinta-feira","sexta-feira","sábado","domingo"],
+              "ShortDate": "dd/mm/yyyy", "LongDate": 'dddd, d "de" mmmm "de" yyyy', "ShortTime": "hh:mm", "LongTime": "hh:mm:ss",
+              "ShortDateTime": "dd/mm/yyyy hh:mm", "LongDateTime": 'dddd, d "de" mmmm "de" yyyy hh:mm:ss'},
+    "en-US": {"dec": ".", "grp": ",", "am": ("AM", "PM"),
+              "months": ["January","February","March","April","May","June","July","August","September","October","November","December"],
+              "days": ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"],
+              "ShortDate": "m/d/yyyy", "LongDate": "dddd, mmmm d, yyyy", "ShortTime": "h:mm AM/PM", "LongTime": "h:mm:ss AM/PM",
+              "ShortDateTime": "m/d/yyyy h:mm AM/PM", "LongDateTime": "dddd, mmmm d, yyyy h:mm:ss AM/PM"},
+}
+# Value(): número com milhar em grupos de 3 e no máximo um separador decimal, no idioma dado
+PFX_VALUE_RE = {lang: re.compile(r"[+-]?(?=%s?\d)(?:\d{1,3}(?:%s\d{3})+|\d*)(?:%s\d*)?(?:[eE][+-]?\d+)?"
+                                 % (re.escape(loc["dec"]), re.escape(loc["grp"]), re.escape(loc["dec"])))
+                for lang, loc in PFX_LOCALES.items()}
+PFX_FMT_DATE_RE = re.compile(r"AM/PM|am/pm|A/P|a/p|[yY]+|[mM]+|[dD]+|[hH]+|[sS]+")
+PFX_FMT_LANG_RE = re.compile(r"^\[\$-([A-Za-z]{2}-[A-Za-z]{2})\]")
+PFX_FMT_SAMPLES = {"Número": ['R$ #.##0,00', '#.##0', '0,0%', '00000-000', '#.##0,00;(#.##0,00);"zero"', "[$-en-US]#,##0.00"],
+                   "Data/hora": ["dd/mm/yyyy hh:mm", 'dddd, d "de" mmmm', "mmm/yy", "DateTimeFormat.LongDate", "h:mm AM/PM"]}
+
+def pfx_round(x, digits: int, mode: str = "Round"):
+    """Round/RoundUp/RoundDown do Power Fx: metade para longe do zero, em base decimal (Round(2.675, 2) = 2,68).
+    Aceita escalar ou array; o array é ajustado a 15 dígitos significativos antes, como faz o tipo decimal."""
+    a = np.asarray(x, dtype=np.float64)
+    scale = 10.0 ** digits
+    s = np.abs(a) * scale
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mag = np.where(s > 0, 10.0 ** (14 - np.floor(np.log10(np.where(s > 0, s, 1)))), 1.0)
+    s = np.round(s * mag) / mag
+    r = np.floor(s + 0.5) if mode == "Round" else np.ceil(s) if mode == "RoundUp" else np.floor(s)
+    out = np.copysign(r / scale, a)
+    return float(out) if out.ndim == 0 else out
+
+class PfxFormat:
+    """
+    Formato do Text() compilado uma vez: seções (positivo; negativo; zero) com prefixo, slots de dígito,
+    separadores e sufixo — ou a lista de peças de data. many() formata um array inteiro com NumPy.
+    """
+    def __init__(self, fmt: str, lang: str):
+        m = PFX_FMT_LANG_RE.match(fmt)
+        self.src, self.flang = fmt, (m.group(1) if m else lang)
+        if self.flang not in PFX_LOCALES:
+            raise ValueError(f"Idioma “{self.flang}” não suportado — use {' ou '.join(PFX_LOCALES)}.")
+        body = fmt[m.end():] if m else fmt
+        if body.startswith("DateTimeFormat."):
+            name = body.split(".", 1)[1]
+            if name not in PFX_LOCALES["en-US"] or name in ("dec", "grp", "am", "months", "days"):
+                raise ValueError(f"DateTimeFormat.{name} não existe.")
+            self.named, self.kind, self.sections = name, "date", None
+            return
+        self.named = None
+        toks = self.tokenize(body)
+        self.kind = "date" if any(k == "date" for k, _ in toks) else "number"
+        if self.kind == "date":
+            self.pieces = self.date_pieces(toks)
+        else:
+            secs, cur = [], []
+            for t in toks:
+                if t == ("sep", ";"):
+                    secs.append(cur)
+                    cur = []
+                else:
+                    cur.append(t)
+            self.sections = [self.number_section(s) for s in secs + [cur]][:3]
+
+    def tokenize(self, body: str) -> list:
+        loc, out, i = PFX_LOCALES[self.flang], [], 0
+        while i < len(body):
+            ch = body[i]
+            if ch == '"':
+                j = body.find('"', i + 1)
+                if j < 0:
+                    raise ValueError("Aspas sem fechamento no formato.")
+                out.append(("lit", body[i + 1:j]))
+                i = j + 1
+                continue
+            if ch == "\\" and i + 1 < len(body):
+                out.append(("lit", body[i + 1]))
+                i += 2
+                continue
+            m = PFX_FMT_DATE_RE.match(body, i)
+            if m:
+                out.append(("date", m.group(0)))
+                i = m.end()
+                continue
+            out.append(("digit", ch) if ch in "0#" else ("dec", ch) if ch == loc["dec"] else ("grp", ch) if ch == loc["grp"] else
+                       ("pct", ch) if ch == "%" else ("sep", ch) if ch == ";" else ("lit", ch))
+            i += 1
+        return out
+
+    def number_section(self, toks: list) -> dict:
+        where = [i for i, (k, _) in enumerate(toks) if k in ("digit", "dec")]
+        if not where:
+            return {"prefix": "".join(v for _, v in toks), "slots": [], "dmin": 0, "dmax": 0, "group": False, "pct": False, "suffix": "", "const": True}
+        lo, hi = where[0], where[-1]
+        core = toks[lo:hi + 1]
+        dec = next((i for i, (k, _) in enumerate(core) if k == "dec"), len(core))
+        frac = [v for k, v in core[dec + 1:] if k == "digit"]
+        if any(k in ("lit", "grp") for k, _ in core[dec + 1:]):
+            raise ValueError("Texto ou separador de milhar depois da vírgula decimal não é suportado.")
+        if "#" in frac and "0" in frac[frac.index("#"):]:
+            raise ValueError("Nas casas decimais, os 0 vêm antes dos #.")
+        # Parte inteira da direita para a esquerda: ("0"|"#") ou ("lit", texto) — o separador de milhar vira agrupamento
+        slots = [("lit", v) if k in ("lit", "pct") else v for k, v in reversed(core[:dec]) if k != "grp"]
+        return {"prefix": "".join(v for _, v in toks[:lo]), "slots": slots, "dmin": frac.count("0"), "dmax": len(frac),
+                "group": any(k == "grp" for k, _ in core[:dec]), "pct": any(k == "pct" for k, _ in toks),
+                "suffix": "".join(v for _, v in toks[hi + 1:]), "const": False}
+
+    @staticmethod
+    def date_pieces(toks: list) -> list:
+        # Regra do Excel: m/mm logo depois de h/hh ou logo antes de s/ss é minuto (n), não mês
+        ampm = any(k == "date" and v.lower() in ("am/pm", "a/p") for k, v in toks)
+        dates = [i for i, (k, _) in enumerate(toks) if k == "date"]
+        pieces = [(v, "lit") for _, v in toks]
+        for n, i in enumerate(dates):
+            v = toks[i][1]
+            low = v.lower()
+            if low in ("am/pm", "a/p"):
+                pieces[i] = (v, "date")
+                continue
+            c, w = low[0], len(low)
+            if c == "m" and w <= 2:
+                prev = toks[dates[n - 1]][1].lower() if n else ""
+                nxt = toks[dates[n + 1]][1].lower() if n + 1 < len(dates) else ""
+                c = "n" if prev.startswith("h") or nxt.startswith("s") else "m"
+            code = {"y": "yyyy" if w > 2 else "yy", "m": c * min(w, 4), "d": c * min(w, 4), "n": c * w,
+                    "s": c * min(w, 2), "h": ("h12" if ampm else "h") + ("h" if w > 1 else "")}[c]
+            pieces[i] = (code, "date")
+        return pieces
+
+    def many(self, values, lang: str) -> np.ndarray:
+        loc = PFX_LOCALES[lang]
+        values = np.asarray(values)
+        if self.named or self.kind == "date":
+            if values.dtype.kind in "biuf":
+                raise ValueError(f"O formato “{self.src}” é de data/hora, mas o valor é um número.")
+            if self.named:
+                return pfx_format(loc[self.named], "en-US").many(values, lang)
+            return self.dates(values.astype("datetime64[ms]"), loc)
+        if values.dtype.kind in "Mm":
+            raise ValueError(f"O formato “{self.src}” é numérico, mas o valor é data/hora.")
+        try:
+            x = values.astype(np.float64)
+        except (TypeError, ValueError):
+            raise ValueError(f"O formato “{self.src}” é numérico, mas o valor não é um número.")
+        out = np.full(x.shape, "", dtype=object)
+        secs, nan = self.sections, np.isnan(x)
+        # Uma seção: todos, com "-" nos negativos; duas: positivo/zero; negativo — três: positivo; negativo; zero
+        if len(secs) == 1:
+            picks = [(~nan, secs[0], False)]
+        else:
+            picks = [(~nan & ((x > 0) if len(secs) > 2 else (x >= 0)), secs[0], False), (x < 0, secs[1], True)]
+            if len(secs) > 2:
+                picks.append((x == 0, secs[2], True))
+        for mask, sec, own_sign in picks:
+            idx = np.flatnonzero(mask)
+            if len(idx):
+                out[idx] = self.numbers(x[idx], sec, loc, own_sign)
+        return out.astype(str)
+
+    def numbers(self, x: np.ndarray, sec: dict, loc: dict, own_sign: bool) -> np.ndarray:
+        import decimal
+        if sec["const"]:
+            return np.full(len(x), sec["prefix"])
+        a = np.abs(x) * (100.0 if sec["pct"] else 1.0)
+        dmax = sec["dmax"]
+        n = np.rint(pfx_round(a, dmax) * 10.0 ** dmax)
+        big = ~(n < 2.0 ** 53)
+        if big.any():
+            # Além de 53 bits o float perde dígitos: esses poucos valores vão por Decimal, com int do Python
+            if not np.isfinite(a[big]).all():
+                raise ValueError("Número fora do intervalo para Text().")
+            n = np.array([int(decimal.Decimal(f"{v:.15g}").scaleb(dmax).quantize(decimal.Decimal(1), decimal.ROUND_HALF_UP)) if b else int(m)
+                          for v, m, b in zip(a, n, big)], dtype=object)
+        else:
+            n = n.astype(np.int64)
+        ip, fp = n // 10 ** dmax, n % 10 ** dmax
+        nd, t = np.zeros(len(x), np.int64), ip
+        while np.any(t > 0):
+            nd += (t > 0).astype(np.int64)
+            t = t // 10
+        digit_slots = [s for s in sec["slots"] if not isinstance(s, tuple)]
+        lits, k = collections.defaultdict(str), 0   # literais do molde (ex.: o "-" de 00000-000), presos ao dígito k
+        for s in sec["slots"]:
+            if isinstance(s, tuple):
+                lits[k] = s[1] + lits[k]
+            else:
+                k += 1
+        cols = []                                   # da direita para a esquerda: (caractere ou códigos, visível)
+        width = max(int(nd.max()), len(digit_slots))
+        for k in range(width + 1):
+            cols += [(c, None) for c in reversed(lits.get(k, ""))]
+            if k == width:
+                break
+            if sec["group"] and k and k % 3 == 0:
+                cols.append((loc["grp"], nd > k))
+            cols.append(((ip % 10).astype(np.int64) + 48, (nd > k) | (k < len(digit_slots) and digit_slots[k] == "0")))
+            ip = ip // 10
+        cols.reverse()
+        if dmax:
+            fd = [((fp // 10 ** (dmax - j - 1)) % 10).astype(np.int64) for j in range(dmax)]
+            keep, shown = np.zeros(len(x), bool), [None] * dmax
+            for j in range(dmax - 1, -1, -1):
+                keep = keep | (fd[j] != 0) | (j < sec["dmin"])
+                shown[j] = keep
+            cols += [(loc["dec"], shown[0])] + [(fd[j] + 48, shown[j]) for j in range(dmax)]
+        sign = np.where((x < 0) & (n != 0) & (not own_sign), "-", "")
+        return np.char.add(np.char.add(np.char.add(sign, sec["prefix"]), self.assemble(cols, len(x))), sec["suffix"])
+
+    @staticmethod
+    def assemble(cols: list, n: int) -> np.ndarray:
+        # Matriz de code points (linhas × colunas) vista como strings U: uma passada, sem laço por linha
+        if not cols:
+            return np.full(n, "")
+        mat = np.empty((n, len(cols)), dtype=np.uint32)
+        for j, (ch, show) in enumerate(cols):
+            v = ord(ch) if isinstance(ch, str) else ch
+            mat[:, j] = v if show is None else np.where(show, v, 32)
+        return np.char.strip(mat.view(f"U{len(cols)}").ravel())
+
+    def dates(self, d: np.ndarray, loc: dict) -> np.ndarray:
+        days = d.astype("datetime64[D]")
+        month0 = d.astype("datetime64[M]")
+        y = d.astype("datetime64[Y]").astype(np.int64) + 1970
+        mo = month0.astype(np.int64) % 12 + 1
+        dd = (days - month0.astype("datetime64[D]")).astype(np.int64) + 1
+        sec = ((d - days.astype("datetime64[ms]")) // np.timedelta64(1, "s")).astype(np.int64)
+        hh, mi, ss = sec // 3600, sec // 60 % 60, sec % 60
+        wd = (days.astype(np.int64) + 3) % 7
+        months, wdays = np.array(loc["months"]), np.array(loc["days"])
+        z = lambda v, w: np.char.zfill(v.astype(str), w)
+        parts = {"yyyy": lambda: z(y, 4), "yy": lambda: z(y % 100, 2), "y": lambda: z(y % 100, 2),
+                 "m": lambda: mo.astype(str), "mm": lambda: z(mo, 2), "mmm": lambda: months[mo - 1].astype("U3"), "mmmm": lambda: months[mo - 1],
+                 "d": lambda: dd.astype(str), "dd": lambda: z(dd, 2), "ddd": lambda: wdays[wd].astype("U3"), "dddd": lambda: wdays[wd],
+                 "h": lambda: hh.astype(str), "hh": lambda: z(hh, 2), "h12": lambda: ((hh + 11) % 12 + 1).astype(str), "h12h": lambda: z((hh + 11) % 12 + 1, 2),
+                 "n": lambda: mi.astype(str), "nn": lambda: z(mi, 2), "s": lambda: ss.astype(str), "ss": lambda: z(ss, 2),
+                 "AM/PM": lambda: np.where(hh < 12, loc["am"][0], loc["am"][1]), "am/pm": lambda: np.where(hh < 12, "am", "pm"),
+                 "A/P": lambda: np.where(hh < 12, "A", "P"), "a/p": lambda: np.where(hh < 12, "a", "p")}
+        out = np.full(d.shape, "", dtype="U1")
+        for v, kind in self.pieces:
+            if kind == "lit":
+                out = np.char.add(out, v)
+            elif v in parts:
+                out = np.char.add(out, parts[v]())
+            else:
+                raise ValueError(f"Código de data “{v}” não reconhecido.")
+        return np.where(np.isnat(d), "", out)
+
+@st.cache_resource(show_spinner=False)
+def pfx_compiled() -> dict:
+    # Dicionário compartilhado entre sessões; a consulta ao cache do Streamlit custa mais que compilar, então é feita uma vez por execução
+    return {}
+
+PFX_COMPILED = pfx_compiled()
+
+def pfx_format(fmt: str, lang: str) -> PfxFormat:
+    # O mesmo formato aparece em milhares de células: compila uma vez por (formato, idioma do autor)
+    f = PFX_COMPILED.get((fmt, lang))
+    if f is None:
+        if len(PFX_COMPILED) >= 512:
+            PFX_COMPILED.clear()
+        f = PFX_COMPILED[(fmt, lang)] = PfxFormat(fmt, lang)
+    return f
+
+def pfx_text(value, fmt: Optional[str] = None, lang: str = "pt-BR", author: str = "pt-BR") -> str:
+    """Text(valor, formato, idioma): escalar, usando o mesmo formatador compilado do modo em lote."""
+    if value is None:
+        return ""
+    if fmt is None:
+        if isinstance(value, (datetime.date, np.datetime64)):
+            fmt = "DateTimeFormat.ShortDateTime" if isinstance(value, datetime.datetime) else "DateTimeFormat.ShortDate"
+        else:
+            return f"{float(value):.15g}".replace(".", PFX_LOCALES[lang]["dec"]) if not isinstance(value, str) else value
+    if isinstance(value, datetime.date):
+        value = np.datetime64(value, "ms")
+    return str(pfx_format(fmt, author).many(np.array([value]), lang)[0])
+
+def pfx_value(text, lang: str = "pt-BR"):
+    """Value(texto, idioma): separadores do idioma, símbolo de moeda e espaços ignorados, % divide por 100. Inválido → Blank (None)."""
+    if text is None or isinstance(text, (int, float)):
+        return text
+    loc = PFX_LOCALES[lang]
+    s = str(text).strip()
+    neg = s.startswith("(") and s.endswith(")")
+    pct = s.endswith("%")
+    s = re.sub(r"[^\d\-+eE" + re.escape(loc["dec"] + loc["grp"]) + "]", "", s)
+    if not PFX_VALUE_RE[lang].fullmatch(s):
+        return None
+    v = float(s.replace(loc["grp"], "").replace(loc["dec"], "."))
+    return (-v if neg else v) / (100 if pct else 1)
+
+def pfx_value_many(texts, lang: str = "pt-BR") -> np.ndarray:
+    import pandas as pd
+    loc = PFX_LOCALES[lang]
+    s = pd.Series(np.asarray(texts, dtype=str)).str.strip()
+    pct = s.str.endswith("%").to_numpy()
+    neg = (s.str.startswith("(") & s.str.endswith(")")).to_numpy()
+    s = s.str.replace(r"[^\d\-+eE" + re.escape(loc["dec"] + loc["grp"]) + "]", "", regex=True)
+    s = s.where(s.str.fullmatch(PFX_VALUE_RE[lang]), "")
+    s = s.str.replace(loc["grp"], "", regex=False).str.replace(loc["dec"], ".", regex=False)
+    v = pd.to_numeric(s, errors="coerce").to_numpy(np.float64)
+    return np.where(neg, -v, v) / np.where(pct, 100.0, 1.0)
+
+def pfx_format_lab(key: str):
+    import pandas as pd
+    lab_header("🔣 Laboratório — Text(), Value() e Round() como o Power Fx faz","Formatos compilados uma vez e reaproveitados: teste valores soltos ou formate uma coluna inteira de Vendas em lote")
+    c1,c2 = st.columns([1,1.3],gap="large")
+    with c1:
+        kind = st.radio("Valor",["Número","Data/hora"],horizontal=True,key=f"{key}_kind")
+        if kind == "Número":
+            value = st.number_input("Valor",value=1234.5,format="%.4f",key=f"{key}_num")
+        else:
+            a1,a2 = st.columns(2)
+            value = datetime.datetime.combine(a1.date_input("Data",datetime.date(2026,3,7),key=f"{key}_d"),
+                                              a2.time_input("Hora",datetime.time(14,5),key=f"{key}_t"))
+        samples = PFX_FMT_SAMPLES[kind]
+        ex = st.selectbox("Exemplos de formato",samples,key=f"{key}_ex_{kind}")
+        fmt = st.text_input("Formato (2º argumento)",ex,key=f"{key}_fmt_{kind}_{samples.index(ex)}")
+        a1,a2 = st.columns(2)
+        author = a1.selectbox("Idioma do formato (autor)",list(PFX_LOCALES),key=f"{key}_author")
+        lang = a2.selectbox("Idioma do resultado (3º argumento)",list(PFX_LOCALES),key=f"{key}_lang")
+        try:
+            out = pfx_text(value, fmt, lang, author)
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            return
+        st.success(f"Resultado: **{out or '(vazio)'}**")
+        arg = f"{value:.15g}".replace(".", PFX_LOCALES[author]["dec"]) if kind == "Número" else \
+              f"DateTime({value.year}, {value.month}, {value.day}, {value.hour}, {value.minute}, 0)"
+        fmt_arg = fmt if fmt.startswith("DateTimeFormat.") else '"' + fmt.replace('"', '""') + '"'
+        sep = "; " if PFX_LOCALES[author]["dec"] == "," else ", "
+        st.code(f'Text({arg}{sep}{fmt_arg}{sep}"{lang}")\n// → {out}',language="powerapps")
+        sp()
+        col_label("↩️ Value() — de volta para número")
+        back = st.text_input("Texto",out if kind == "Número" else pfx_text(1234.5, "#,##0.00", lang, "en-US"),key=f"{key}_val_{kind}_{out}")
+        v = pfx_value(back, lang)
+        st.info(f'Value("{back}", "{lang}") → **{"Blank()" if v is None else f"{v:.15g}"}**')
+    with c2:
+        col_label("🎯 Round × RoundUp × RoundDown × round() do Python")
+        nums = np.array([2.675, 1.005, 0.285, 2.5, -2.5, -1.21, float(value) if kind == "Número" else 12.567])
+        digits = st.slider("Casas decimais",-2,4,2,key=f"{key}_dig")
+        st.dataframe(pd.DataFrame({"Valor": nums, "Round": pfx_round(nums, digits), "RoundUp": pfx_round(nums, digits, "RoundUp"),
+                                   "RoundDown": pfx_round(nums, digits, "RoundDown"), "round() Python": [round(float(n), digits) for n in nums]}),
+                     use_container_width=True, hide_index=True)
+        st.caption("round() do Python arredonda o double binário (2,675 vira 2,67) e usa 'metade para o par' (round(2.5) = 2); o Power Fx arredonda o decimal, metade para longe do zero.")
+        sp()
+        col_label("⚡ Modo em lote — coluna de Vendas")
+        b1,b2 = st.columns(2)
+        rows = b1.select_slider("Linhas",[10_000,100_000,1_000_000],100_000,format_func=lambda v: f"{v:,}",key=f"{key}_rows")
+        col = "Total" if kind == "Número" else "Data"
+        b2.metric("Coluna", col, f"Text(ThisRecord.{col}, …)", delta_color="off")
+        data = synth_table("Vendas", rows)[col]
+        t0 = time.perf_counter()
+        PfxFormat(fmt, author)
+        compile_ms = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        fm = pfx_format(fmt, author)
+        cached_ms = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        vec = fm.many(np.asarray(data), lang)
+        vec_ms = (time.perf_counter() - t0) * 1000
+        n = min(rows, 2_000)
+        sample = np.asarray(data[:n]).tolist()
+        t0 = time.perf_counter()
+        for v in sample:
+            pfx_text(v, fmt, lang, author)
+        loop_ms = (time.perf_counter() - t0) * 1000 * rows / n
+        m1,m2,m3 = st.columns(3)
+        m1.metric("Vetorizado", f"{vec_ms:,.0f} ms", f"{rows / max(vec_ms, 1e-3) * 1000:,.0f} linhas/s", delta_color="off")
+        m2.metric("Linha a linha (estimado)", frt_fmt(loop_ms / 1000), f"{loop_ms / max(vec_ms, 1e-3):,.0f}× mais lento", delta_color="inverse")
+        m3.metric("Compilar formato", f"{compile_ms * 1000:,.0f} µs", f"em cache: {cached_ms * 1000:,.1f} µs", delta_color="off")
+        st.dataframe(pd.DataFrame({col: np.asarray(data[:8]), f"Text({col})": vec[:8]}), use_container_width=True, hide_index=True)
+    st.caption("O formatador é compilado uma vez por (formato, idioma do autor) e guardado em cache; o lote usa NumPy sobre a coluna inteira. "
+               "A estimativa 'linha a linha' chama Text() item por item (já com o formato em cache) numa amostra de até 2.000 linhas e extrapola.")
+
+
 def page_formulas():
     st.markdown('<div class="main-wrap">',unsafe_allow_html=True)
     breadcrumb("Documentação","Laboratório de Fórmulas")
@@ -1414,14 +1854,17 @@ def page_formulas():
             st.markdown("##### Round()")
             vn=st.number_input("Valor",value=12.567,format="%.3f",key="rnd_v")
             dc=st.slider("Casas decimais",0,4,2,key="rnd_d")
-            st.info(f"Round: **{round(vn,dc)}**")
-            st.code(f'Round({vn}, {dc})      // → {round(vn,dc)}\nRoundUp({vn}, {dc})    // arredonda para cima\nRoundDown({vn}, {dc})  // arredonda para baixo\nInt({vn})              // → {int(vn)} (trunca)',language="powerapps")
+            rn,ru,rd=(f"{pfx_round(vn,dc,m):.15g}" for m in ("Round","RoundUp","RoundDown"))
+            st.info(f"Round: **{rn}**")
+            st.code(f'Round({vn}, {dc})      // → {rn}\nRoundUp({vn}, {dc})    // → {ru} (longe do zero)\nRoundDown({vn}, {dc})  // → {rd} (em direção ao zero)\nInt({vn})              // → {int(np.floor(vn))} (arredonda para baixo)',language="powerapps")
         with c2:
             st.markdown("##### Concatenate() / Text()")
             nm=st.text_input("Nome","Maria Silva",key="cc_n")
             cr=st.text_input("Cargo","Analista",key="cc_c")
             st.info(f"**Olá, {nm}! Cargo: {cr}**")
-            st.code(f'"Olá, " & inp_Nome.Text & "! Cargo: " & inp_Cargo.Text\n\nText(1234.5, "R$ #.##0,00")  // → R$ 1.234,50\nText(Now(), "dd/mm/yyyy hh:mm")\n\nUpper(inp_Nome.Text)   // MARIA SILVA\nLower(inp_Email.Text)  // maria@empresa.com\nProper(inp_Nome.Text)  // Maria Silva',language="powerapps")
+            st.code(f'"Olá, " & inp_Nome.Text & "! Cargo: " & inp_Cargo.Text\n\nText(1234.5, "R$ #.##0,00")  // → {pfx_text(1234.5,"R$ #.##0,00")}\nText(Now(), "dd/mm/yyyy hh:mm")  // → {pfx_text(datetime.datetime.now(),"dd/mm/yyyy hh:mm")}\n\nUpper(inp_Nome.Text)   // MARIA SILVA\nLower(inp_Email.Text)  // maria@empresa.com\nProper(inp_Nome.Text)  // Maria Silva',language="powerapps")
+        st.divider()
+        pfx_format_lab("pfx_fmt")
 
     st.markdown('</div>',unsafe_allow_html=True)
     section_quiz("formulas")
@@ -1474,6 +1917,1623 @@ def page_validacao():
     section_quiz("validacao")
 
 
+# ─────────────────────────────────────────────
+# DADOS SINTÉTICOS — gerador colunar com cache em disco
+# ─────────────────────────────────────────────
+SYNTH_DIR = ".synth_cache"
+SYNTH_VERSION = 1
+
+class DictCol:
+    """Coluna de texto codificada em dicionário: códigos inteiros + categorias únicas."""
+    __slots__ = ("codes", "cats")
+    def __init__(self, codes, cats):
+        self.codes, self.cats = codes, cats
+    def __len__(self):
+        return len(self.codes)
+    def __getitem__(self, sel):
+        return DictCol(self.codes[sel], self.cats)
+    def map(self, fn):
+        return np.asarray(fn(self.cats))[self.codes]
+    def decode(self):
+        return self.cats[self.codes]
+
+def is_dict_col(col) -> bool:
+    # Duck-typed on purpose: cached tables outlive the DictCol class object redefined on every rerun
+    return hasattr(col, "codes") and hasattr(col, "cats")
+
+def col_decode(col):
+    return col.decode() if is_dict_col(col) else col
+
+SYN_STATUS   = np.array(["Aberto","Em andamento","Aguardando","Concluído","Cancelado"])
+SYN_REGIAO   = np.array(["Norte","Nordeste","Centro-Oeste","Sudeste","Sul"])
+SYN_PRIOR    = np.array(["Baixa","Média","Alta","Crítica"])
+SYN_NOMES    = np.array(["Ana","Bruno","Carla","Diego","Elaine","Fábio","Gabriela","Hugo","Isabela","João",
+                         "Karina","Lucas","Mariana","Nelson","Olívia","Paulo","Renata","Sérgio","Tatiane","Vitor"])
+SYN_SOBRENOM = np.array(["Silva","Souza","Oliveira","Santos","Pereira","Lima","Costa","Ferreira","Almeida","Ribeiro"])
+SYN_ASSUNTOS = np.array(["Erro no login","Solicitação de acesso","Falha na impressora","Reset de senha",
+                         "Instalação de software","Problema no e-mail","Lentidão no sistema","Troca de equipamento",
+                         "Dúvida sobre relatório","Permissão no SharePoint","VPN não conecta","Licença expirada"])
+SYN_DEPTOS   = np.array(["Financeiro","RH","TI","Comercial","Marketing","Operações","Jurídico","Compras"])
+SYN_CARGOS   = np.array(["Analista","Assistente","Coordenador","Gerente","Diretor","Estagiário","Especialista","Técnico"])
+SYN_CIDADES  = np.array(["São Paulo","Rio de Janeiro","Belo Horizonte","Curitiba","Porto Alegre","Salvador",
+                         "Recife","Fortaleza","Brasília","Manaus","Goiânia","Campinas"])
+SYN_PRODUTOS = np.array(["Notebook","Monitor 24\"","Teclado","Mouse","Headset","Webcam","Cadeira","Mesa",
+                         "Impressora","Roteador","SSD 1TB","Dock USB-C","Tablet","Smartphone","Projetor","Nobreak"])
+SYN_PRECOS   = np.array([4200,1100,180,90,350,280,1500,900,1300,450,520,700,2300,3100,2800,800], dtype=np.float64)
+SYN_CATEG    = np.array(["Informática","Informática","Periféricos","Periféricos","Periféricos","Periféricos","Mobiliário",
+                         "Mobiliário","Informática","Rede","Informática","Periféricos","Mobile","Mobile","Audiovisual","Rede"])
+SYN_START    = np.datetime64("2018-01-01")
+SYN_END      = np.datetime64("2026-06-30")   # fixed, so the same seed gives the same table on any day
+
+def syn_people() -> np.ndarray:
+    return np.array([f"{n} {s}" for n in SYN_NOMES for s in SYN_SOBRENOM])
+
+def syn_dates(rng, rows, sorted_=True):
+    span = int((SYN_END - SYN_START).astype(int))
+    days = np.linspace(0, span, rows).astype(np.int32) if sorted_ else rng.integers(0, span, rows, dtype=np.int32)
+    return SYN_START + days.astype("timedelta64[D]")
+
+def gen_chamados(rng, rows: int) -> dict:
+    # Itens recentes (IDs altos) são os mais abertos — o que fica além do limite de delegação muda o resultado
+    age = np.linspace(0.0, 1.0, rows, dtype=np.float32)
+    p_open = 0.05 + 0.55 * age
+    u = rng.random(rows, dtype=np.float32)
+    status = np.where(u < p_open, 0, np.where(u < p_open + 0.10, 1,
+             np.where(u < p_open + 0.15, 2, np.where(u < 0.97, 3, 4)))).astype(np.int8)
+    titulo_cats = np.array([f"{a} #{i:03d}" for a in SYN_ASSUNTOS for i in range(1, 101)])
+    cliente_cats = syn_people()
+    return {
+        "ID":         np.arange(1, rows + 1, dtype=np.int32),
+        "Titulo":     DictCol(rng.integers(0, len(titulo_cats), rows, dtype=np.int16), titulo_cats),
+        "Cliente":    DictCol(rng.integers(0, len(cliente_cats), rows, dtype=np.int16), cliente_cats),
+        "Status":     DictCol(status, SYN_STATUS),
+        "Regiao":     DictCol(rng.integers(0, len(SYN_REGIAO), rows, dtype=np.int8), SYN_REGIAO),
+        "Prioridade": DictCol(rng.choice(len(SYN_PRIOR), rows, p=[.4, .35, .2, .05]).astype(np.int8), SYN_PRIOR),
+        "Valor":      np.round(rng.gamma(2.0, 250.0, rows), 2),
+        "Criado":     syn_dates(rng, rows),
+        "Ativo":      status < 3,
+    }
+
+def gen_funcionarios(rng, rows: int) -> dict:
+    people = syn_people()
+    nome = rng.integers(0, len(people), rows, dtype=np.int16)
+    emails = np.array([unicodedata.normalize("NFKD", p).encode("ascii", "ignore").decode().lower().replace(" ", ".")
+                       + "@empresa.com" for p in people])
+    cargo = rng.choice(len(SYN_CARGOS), rows, p=[.25, .15, .1, .07, .02, .1, .16, .15]).astype(np.int8)
+    base = np.array([6500, 3200, 11000, 16000, 32000, 1800, 13000, 4500], dtype=np.float64)
+    ids = np.arange(1, rows + 1, dtype=np.int32)
+    return {
+        "ID":           ids,
+        "Nome":         DictCol(nome, people),
+        "Email":        DictCol(nome, emails),
+        "Cargo":        DictCol(cargo, SYN_CARGOS),
+        "Departamento": DictCol(rng.integers(0, len(SYN_DEPTOS), rows, dtype=np.int8), SYN_DEPTOS),
+        "Cidade":       DictCol(rng.integers(0, len(SYN_CIDADES), rows, dtype=np.int8), SYN_CIDADES),
+        "Salario":      np.round(base[cargo] * rng.uniform(0.85, 1.35, rows), 2),
+        "Admissao":     syn_dates(rng, rows, sorted_=False),
+        "Ativo":        rng.random(rows) < 0.92,
+    }
+
+def gen_vendas(rng, rows: int) -> dict:
+    prod = rng.integers(0, len(SYN_PRODUTOS), rows, dtype=np.int8)
+    qtd = rng.integers(1, 6, rows, dtype=np.int16)
+    preco = np.round(SYN_PRECOS[prod] * rng.uniform(0.9, 1.1, rows), 2)
+    people = syn_people()
+    return {
+        "ID":        np.arange(1, rows + 1, dtype=np.int32),
+        "Data":      syn_dates(rng, rows),
+        "Produto":   DictCol(prod, SYN_PRODUTOS),
+        "Categoria": DictCol(prod, SYN_CATEG),
+        "Regiao":    DictCol(rng.integers(0, len(SYN_REGIAO), rows, dtype=np.int8), SYN_REGIAO),
+        "Vendedor":  DictCol(rng.integers(0, len(people), rows, dtype=np.int16), people),
+        "Qtd":       qtd,
+        "Valor":     preco,
+        "Total":     np.round(preco * qtd, 2),
+    }
+
+def gen_pedidos(rng, rows: int) -> dict:
+    people = syn_people()
+    status = np.array(["Rascunho","Enviado","Aprovado","Faturado","Entregue","Cancelado"])
+    itens = rng.integers(1, 12, rows, dtype=np.int16)
+    return {
+        "ID":            np.arange(1, rows + 1, dtype=np.int32),
+        "Cliente":       DictCol(rng.integers(0, len(people), rows, dtype=np.int16), people),
+        "FuncionarioID": rng.integers(1, max(2, rows // 20), rows, dtype=np.int32),
+        "Data":          syn_dates(rng, rows),
+        "Status":        DictCol(rng.choice(len(status), rows, p=[.05, .15, .2, .2, .35, .05]).astype(np.int8), status),
+        "Itens":         itens,
+        "ValorTotal":    np.round(itens * rng.gamma(2.0, 180.0, rows), 2),
+    }
+
+SYNTH_SCHEMAS = {
+    "Chamados":     gen_chamados,
+    "Funcionarios": gen_funcionarios,
+    "Vendas":       gen_vendas,
+    "Pedidos":      gen_pedidos,
+}
+
+def synth_path(schema: str, rows: int, seed: int) -> str:
+    return os.path.join(SYNTH_DIR, f"{schema}_{rows}_{seed}_v{SYNTH_VERSION}")
+
+def synth_save(path: str, table: dict):
+    # Write to a private temp dir, then rename atomically — concurrent processes never see half a table
+    tmp = f"{path}.tmp-{os.getpid()}-{secrets.token_hex(4)}"
+    os.makedirs(tmp)
+    cols = {}
+    for name, col in table.items():
+        if is_dict_col(col):
+            np.save(os.path.join(tmp, f"{name}.codes.npy"), col.codes)
+            np.save(os.path.join(tmp, f"{name}.cats.npy"), col.cats)
+            cols[name] = "dict"
+        else:
+            np.save(os.path.join(tmp, f"{name}.npy"), col)
+            cols[name] = "array"
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"columns": cols, "rows": len(next(iter(table.values())))}, f)
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)  # another process finished first
+
+def synth_load(path: str) -> dict:
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    out = {}
+    for name, kind in meta["columns"].items():
+        if kind == "dict":
+            out[name] = DictCol(np.load(os.path.join(path, f"{name}.codes.npy"), mmap_mode="r"),
+                                np.load(os.path.join(path, f"{name}.cats.npy")))
+        else:
+            out[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+    return out
+
+@st.cache_resource(show_spinner="Gerando dados sintéticos…", max_entries=16)
+def synth_table(schema: str, rows: int, seed: int = 42) -> dict:
+    """
+    Tabela sintética determinística e colunar, chaveada por (schema, rows, seed).
+    Gerada uma única vez em disco (.npy) e aberta com memory-map: todas as sessões
+    e processos compartilham as mesmas páginas, sem cópia por sessão.
+    """
+    path = synth_path(schema, rows, seed)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        os.makedirs(SYNTH_DIR, exist_ok=True)
+        synth_save(path, SYNTH_SCHEMAS[schema](np.random.default_rng(seed), rows))
+    return synth_load(path)
+
+def col_sort_key(col):
+    if is_dict_col(col):
+        return col.map(lambda a: np.argsort(np.argsort(a, kind="stable"), kind="stable"))
+    col = np.asarray(col)
+    return col.astype("int64") if col.dtype.kind == "M" else col
+
+def sort_order(keys, desc: bool = False) -> np.ndarray:
+    # argsort estável nos dois sentidos: inverter o resultado crescente inverteria também os empates
+    keys = np.asarray(keys)
+    if not desc:
+        return np.argsort(keys, kind="stable")
+    return len(keys) - 1 - np.argsort(keys[::-1], kind="stable")[::-1]
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def synth_order(schema: str, rows: int, column: str, desc: bool, limit: int = 0, seed: int = 42) -> np.ndarray:
+    # Server-side sort: one argsort per (table, column, order), shared by every session
+    col = synth_table(schema, rows, seed)[column]
+    col = col[:limit] if limit else col
+    return sort_order(col_sort_key(col), desc)
+
+def synth_arrow(schema: str, rows: int, idx, columns=None, seed: int = 42):
+    import pyarrow as pa
+    table = synth_table(schema, rows, seed)
+    return pa.table({c: pa.array(np.asarray(col_decode(table[c][idx]))) for c in (table if columns is None else columns)})
+
+def synth_frame(schema: str, rows: int, idx=None, columns=None, seed: int = 42):
+    import pandas as pd
+    table = synth_table(schema, rows, seed)
+    idx = slice(None) if idx is None else idx
+    return pd.DataFrame({c: col_decode(table[c][idx]) for c in (table if columns is None else columns)})
+
+class ColCollection:
+    """
+    Coleção Power Apps em formato colunar: arrays NumPy tipados com capacidade
+    crescente, texto codificado em dicionário e agregados (CountRows/Sum)
+    mantidos de forma incremental. Limitada a max_rows por sessão.
+    """
+    NUMERIC = {"num": np.float64, "int": np.int64}
+
+    def __init__(self, schema: dict, max_rows: int = 10_000):
+        self.schema, self.max_rows = dict(schema), max_rows
+        self.n, self.seq, self.version = 0, 0, 0
+        self.derived = {}                       # AddColumns: nome → (fórmula, AST)
+        self.cats = {c: ([], {}) for c, t in schema.items() if t == "text"}
+        self.cols = {c: self._empty(t, 16) for c, t in schema.items()}
+        self.sums = {c: 0.0 for c, t in schema.items() if t in self.NUMERIC}
+        self._arrow = None
+
+    def _empty(self, kind, cap):
+        return np.zeros(cap, self.NUMERIC.get(kind, np.int32))
+
+    def _reserve(self, extra: int):
+        need = self.n + extra
+        if need > self.max_rows:
+            raise ValueError(f"Coleção cheia — limite de {self.max_rows:,} linhas por sessão.")
+        cap = len(next(iter(self.cols.values())))
+        if need > cap:
+            cap = min(self.max_rows, max(need, cap * 2))   # amortized doubling
+            for c, arr in self.cols.items():
+                grown = np.zeros(cap, arr.dtype)
+                grown[:self.n] = arr[:self.n]
+                self.cols[c] = grown
+
+    def _code(self, col, value) -> int:
+        values, index = self.cats[col]
+        value = str(value)
+        if value not in index:
+            index[value] = len(values)
+            values.append(value)
+        return index[value]
+
+    def _touch(self):
+        self.version += 1
+        self._arrow = None
+
+    def table(self, sel=None) -> dict:
+        sel = slice(0, self.n) if sel is None else sel
+        return {c: DictCol(arr[sel], np.array(self.cats[c][0] or [""])) if c in self.cats else arr[sel]
+                for c, arr in self.cols.items()}
+
+    # ── Power FX operations ──
+    def collect(self, *records):
+        self._reserve(len(records))
+        start = self.n
+        for i, rec in enumerate(records, start):
+            for c, kind in self.schema.items():
+                v = rec.get(c)
+                self.cols[c][i] = self._code(c, "" if v is None else v) if kind == "text" else (v or 0)
+        self.n += len(records)
+        self.seq += len(records)
+        for c in self.sums:
+            self.sums[c] += float(self.cols[c][start:self.n].sum())
+        for name in self.derived:
+            self._eval_derived(name, slice(start, self.n))
+        self._touch()
+
+    def clear(self):
+        self.n = 0
+        self.sums = {c: 0.0 for c in self.sums}
+        self._touch()
+
+    def clear_collect(self, *records):
+        self.clear()
+        self.collect(*records)
+
+    def remove(self, rows):
+        rows = np.unique(np.asarray(rows, np.int64))
+        rows = rows[(rows >= 0) & (rows < self.n)]
+        if not len(rows):
+            return 0
+        keep = np.ones(self.n, bool)
+        keep[rows] = False
+        for c in self.sums:
+            self.sums[c] -= float(self.cols[c][rows].sum())
+        kept = int(keep.sum())
+        for c, arr in self.cols.items():
+            arr[:kept] = arr[:self.n][keep]
+        self.n = kept
+        self._touch()
+        return len(rows)
+
+    def remove_if(self, formula: str) -> int:
+        ev = VecEval(self.table(), self.n)
+        mask = np.broadcast_to(ev.cond(pfx_parse(formula), slice(0, self.n)), (self.n,))
+        return self.remove(np.flatnonzero(mask))
+
+    def patch(self, row: int, changes: dict):
+        if not 0 <= row < self.n:
+            raise ValueError(f"Registro {row + 1} não existe na coleção.")
+        for c, v in changes.items():
+            if c not in self.schema:
+                raise ValueError(f'Coluna desconhecida "{c}".')
+            if c in self.sums:
+                self.sums[c] += float(v) - float(self.cols[c][row])
+            self.cols[c][row] = self._code(c, v) if self.schema[c] == "text" else v
+        for name in self.derived:
+            self._eval_derived(name, slice(row, row + 1))
+        self._touch()
+
+    def add_columns(self, name: str, formula: str):
+        self.derived[name] = (formula, pfx_parse(formula))
+        self.cols[name] = np.zeros(len(next(iter(self.cols.values()))), np.float64)
+        self.sums[name] = 0.0
+        self._eval_derived(name, slice(0, self.n))
+        self._touch()
+
+    def _eval_derived(self, name, sel):
+        # Only the touched rows are recomputed; the running Sum is adjusted by the delta
+        ev = VecEval(self.table(), self.n)
+        new = np.broadcast_to(np.asarray(ev.val(self.derived[name][1], sel), np.float64), (len(range(self.n)[sel]),))
+        self.sums[name] += float(new.sum() - self.cols[name][sel].sum())
+        self.cols[name][sel] = new
+
+    def count_rows(self) -> int:
+        return self.n
+
+    def sum(self, col: str) -> float:
+        return self.sums[col]
+
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.cols.values())
+
+    def to_arrow(self, last: int = 500):
+        # Built once per version and reused across reruns — no DataFrame rebuild per interaction
+        if self._arrow is None:
+            import pyarrow as pa
+            start = max(0, self.n - last)
+            view = self.table(slice(start, self.n))
+            self._arrow = pa.table({"#": np.arange(start + 1, self.n + 1), **{c: np.asarray(col_decode(v)) for c, v in view.items()}})
+        return self._arrow
+
+# ─────────────────────────────────────────────
+# POWER FX — PARSER & ANALISADOR DE DELEGAÇÃO
+# ─────────────────────────────────────────────
+PFX_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+|//[^\n]*|/\*.*?\*/)
+  | (?P<str>"(?:[^"]|"")*")
+  | (?P<num>\d+(?:\.\d+)?)
+  | (?P<id>[A-Za-z_][A-Za-z0-9_]*|'[^']+')
+  | (?P<op><=|>=|<>|&&|\|\||[=<>+\-*/&!^%(){}\[\],;:.@])
+""", re.X | re.S)
+
+PFX_BINOPS = {"||":1, "Or":1, "&&":2, "And":2,
+              "=":3, "<>":3, "<":3, ">":3, "<=":3, ">=":3, "in":3, "exactin":3,
+              "&":4, "+":5, "-":5, "*":6, "/":6, "^":7}
+PFX_COMPARE = {"=", "<>", "<", ">", "<=", ">="}
+
+def pfx_tokenize(src: str) -> list:
+    toks, pos = [], 0
+    while pos < len(src):
+        m = PFX_TOKEN_RE.match(src, pos)
+        if not m:
+            raise ValueError(f"Caractere inesperado na posição {pos}: {src[pos]!r}")
+        if m.lastgroup != "ws":
+            toks.append((m.lastgroup, m.group(), pos))
+        pos = m.end()
+    toks.append(("eof", "", pos))
+    return toks
+
+class PfxParser:
+    """Parser recursivo (Pratt) de Power FX → AST de dicts {"t": tipo, ...}."""
+    def __init__(self, src: str):
+        self.toks = pfx_tokenize(src)
+        self.i = 0
+
+    def peek(self, k=0):
+        return self.toks[min(self.i + k, len(self.toks) - 1)]
+
+    def at(self, val):
+        kind, v, _ = self.peek()
+        return kind == "op" and v == val
+
+    def take(self, val=None):
+        tok = self.peek()
+        if val is not None and not (tok[0] == "op" and tok[1] == val):
+            raise ValueError(f"Esperado '{val}' na posição {tok[2]}, encontrado '{tok[1] or 'fim da fórmula'}'")
+        self.i += 1
+        return tok
+
+    def parse(self):
+        node = self.chain()
+        if self.peek()[0] != "eof":
+            tok = self.peek()
+            raise ValueError(f"Token inesperado '{tok[1]}' na posição {tok[2]}")
+        return node
+
+    def chain(self):
+        items = [self.expr(0)]
+        while self.at(";"):
+            self.take()
+            if self.peek()[0] == "eof" or self.at(")") or self.at("}"):
+                break
+            items.append(self.expr(0))
+        return items[0] if len(items) == 1 else {"t":"chain", "items":items, "pos":items[0]["pos"]}
+
+    def expr(self, min_prec):
+        left = self.unary()
+        while True:
+            kind, val, pos = self.peek()
+            prec = PFX_BINOPS.get(val) if kind in ("op", "id") else None
+            if prec is None or prec <= min_prec:
+                return left
+            self.take()
+            left = {"t":"bin", "op":val, "l":left, "r":self.expr(prec), "pos":pos}
+
+    def unary(self):
+        kind, val, pos = self.peek()
+        if (kind == "op" and val in ("!", "-")) or (kind == "id" and val == "Not" and self.peek(1)[1] != "("):
+            self.take()
+            return {"t":"un", "op":val, "x":self.unary(), "pos":pos}
+        return self.postfix(self.primary())
+
+    def args(self):
+        self.take("(")
+        args = []
+        if not self.at(")"):
+            args.append(self.chain())
+            while self.at(","):
+                self.take()
+                args.append(self.chain())
+        end = self.take(")")[2] + 1
+        return args, end
+
+    def primary(self):
+        kind, val, pos = self.take()
+        if kind == "num":
+            return {"t":"num", "v":float(val), "pos":pos}
+        if kind == "str":
+            return {"t":"str", "v":val[1:-1].replace('""', '"'), "pos":pos}
+        if kind == "op" and val == "@":
+            kind, val, pos = self.take()
+        if kind == "id":
+            name = val.strip("'")
+            if self.at("("):
+                args, end = self.args()
+                return {"t":"call", "name":name, "args":args, "pos":pos, "end":end}
+            return {"t":"id", "name":name, "pos":pos}
+        if kind == "op" and val == "(":
+            node = self.chain()
+            self.take(")")
+            return node
+        if kind == "op" and val == "{":
+            fields = []
+            while not self.at("}"):
+                k = self.take()
+                if k[0] not in ("id", "str"):
+                    raise ValueError(f"Nome de campo inválido na posição {k[2]}")
+                self.take(":")
+                fields.append((k[1].strip("'\""), self.expr(0)))
+                if not self.at(","):
+                    break
+                self.take()
+            self.take("}")
+            return {"t":"rec", "fields":fields, "pos":pos}
+        if kind == "op" and val == "[":
+            items = []
+            while not self.at("]"):
+                items.append(self.expr(0))
+                if not self.at(","):
+                    break
+                self.take()
+            self.take("]")
+            return {"t":"tbl", "items":items, "pos":pos}
+        raise ValueError(f"Token inesperado '{val or 'fim da fórmula'}' na posição {pos}")
+
+    def postfix(self, node):
+        while True:
+            if self.at("."):
+                self.take()
+                kind, val, pos = self.take()
+                if kind != "id":
+                    raise ValueError(f"Esperado nome após '.' na posição {pos}")
+                node = {"t":"dot", "base":node, "name":val.strip("'"), "pos":node["pos"]}
+                if self.at("("):
+                    # Connector call: Office365Users.SearchUser({...})
+                    args, end = self.args()
+                    node = {"t":"call", "name":pfx_dotted(node), "args":args, "pos":node["pos"], "end":end}
+            elif self.at("%"):
+                self.take()
+                node = {"t":"un", "op":"%", "x":node, "pos":node["pos"]}
+            else:
+                return node
+
+def pfx_dotted(node) -> str:
+    if node["t"] == "dot":
+        return f'{pfx_dotted(node["base"])}.{node["name"]}'
+    return node.get("name", "?")
+
+def pfx_children(node) -> list:
+    t = node["t"]
+    if t == "call":  return node["args"]
+    if t == "chain": return node["items"]
+    if t == "bin":   return [node["l"], node["r"]]
+    if t == "un":    return [node["x"]]
+    if t == "dot":   return [node["base"]]
+    if t == "rec":   return [v for _, v in node["fields"]]
+    if t == "tbl":   return node["items"]
+    return []
+
+def pfx_walk(node):
+    yield node
+    for ch in pfx_children(node):
+        yield from pfx_walk(ch)
+
+def pfx_parse(src: str):
+    return PfxParser(src).parse()
+
+# ── Delegation knowledge ──
+# Baseline flag per function comes from the cheat sheet (FORMULAS); profiles override it.
+PFX_DELEG_BASE = {}
+for _f in FORMULAS:
+    for _part in _f["nome"].split("/"):
+        _nm = _part.replace("()", "").strip()
+        if _nm.isidentifier():
+            PFX_DELEG_BASE[_nm] = _f["deleg"]
+
+PFX_PROFILES = {
+    "SharePoint": {
+        "funcs": {"Filter","LookUp","SortByColumns","CountRows","Sum","Average","Min","Max","First"},
+        "pred":  {"StartsWith"},
+        "ops":   PFX_COMPARE | {"&&","||","And","Or","!","Not"},
+        "latency_ms": 350, "row_ms": 0.6, "page": 100,
+    },
+    "Dataverse": {
+        "funcs": {"Filter","LookUp","Search","Sort","SortByColumns","CountRows","Sum","Average","Min","Max","Distinct","First"},
+        "pred":  {"StartsWith","IsBlank"},
+        "ops":   PFX_COMPARE | {"&&","||","And","Or","!","Not","in"},
+        "latency_ms": 180, "row_ms": 0.3, "page": 100,
+    },
+    "SQL Server": {
+        "funcs": {"Filter","LookUp","Search","Sort","SortByColumns","CountRows","Sum","Average","Min","Max","First"},
+        "pred":  {"StartsWith","EndsWith","IsBlank"},
+        "ops":   PFX_COMPARE | {"&&","||","And","Or","!","Not","in","+","-","*","/"},
+        "latency_ms": 120, "row_ms": 0.2, "page": 100,
+    },
+}
+PFX_CONTEXTS = ["App.OnStart", "Gallery.Items", "Template da Gallery (ThisItem)", "Button.OnSelect"]
+
+PFX_READ_FUNCS  = {"Filter","LookUp","Search","Sort","SortByColumns","CountRows","CountIf","Sum","Average",
+                   "Min","Max","Distinct","First","Last","FirstN","LastN","AddColumns","DropColumns",
+                   "ShowColumns","RenameColumns","GroupBy","ForAll"}
+PFX_WRITE_FUNCS = {"Patch","Remove","RemoveIf","UpdateIf","Update"}
+PFX_COLLECT     = {"Collect","ClearCollect"}
+PFX_PREDICATE   = {"Filter":slice(1, None), "LookUp":slice(1, 2), "CountIf":slice(1, None),
+                   "RemoveIf":slice(1, None), "UpdateIf":slice(1, None, 2)}
+PFX_PER_ROW     = {"ForAll":slice(1, None), "AddColumns":slice(2, None, 2), "Sum":slice(1, 2),
+                   "Average":slice(1, 2), "Min":slice(1, 2), "Max":slice(1, 2), **PFX_PREDICATE}
+PFX_VAR_PREFIX  = ("gbl", "loc", "var", "col", "ctx")
+PFX_SEQUENCE_MAX = 50_000   # limite de Sequence() no Power Fx
+PFX_NOT_COLUMN  = {"true","false","ThisItem","Self","Parent","Ascending","Descending","Blank"}
+# Dotted names that are controls/enums (TextInput1.Text, TimeUnit.Days) instead of record columns (Status.Value)
+PFX_CONTROL_RE  = re.compile(r"^(TextInput|Dropdown|ComboBox|DatePicker|Gallery|Toggle|Slider|Radio|Checkbox|Label|"
+                             r"Button|Form|DataTable|Timer|inp|txt|drp|cmb|dp|gal|tog|sld|chk|lbl|btn|frm|"
+                             r"Color|TimeUnit|SortOrder|ScreenTransition|DisplayMode|NotificationType|Match|App|Host)")
+
+def pfx_is_source(node, local=frozenset()) -> bool:
+    # `local`: nomes em escopo na fórmula (campos de With, coleções criadas, Value de Sequence) — não são fontes
+    return (node["t"] == "id" and not node["name"].startswith(PFX_VAR_PREFIX)
+            and node["name"] not in PFX_NOT_COLUMN and node["name"] != "ThisRecord" and node["name"] not in local)
+
+def pfx_column_refs(node, local=frozenset()) -> set:
+    refs = set()
+    def rec(n):
+        t = n["t"]
+        if t == "id":
+            if pfx_is_source(n, local):
+                refs.add(n["name"])
+        elif t == "dot":
+            root = n
+            while root["t"] == "dot":
+                root = root["base"]
+            if root["t"] == "id" and root["name"] == "ThisRecord":
+                refs.add(n["name"])
+            elif root["t"] == "id" and pfx_is_source(root, local) and not PFX_CONTROL_RE.match(root["name"]):
+                refs.add(root["name"])
+        else:
+            for ch in pfx_children(n):
+                rec(ch)
+    rec(node)
+    return refs
+
+def pfx_predicate_issues(pred, prof, local=frozenset()) -> list:
+    issues = []
+    def nodes(n):
+        yield n
+        if not (n["t"] == "call" and n["name"] in PFX_READ_FUNCS):  # nested queries are analysed on their own
+            for ch in pfx_children(n):
+                yield from nodes(ch)
+    for n in nodes(pred):
+        if n["t"] == "call" and n["name"] in PFX_READ_FUNCS:
+            continue
+        if n["t"] == "call" and n["name"] not in ("And", "Or", "Not") and n["name"] not in prof["pred"]:
+            if pfx_column_refs(n, local):
+                issues.append(f'{n["name"]}() aplicado a coluna')
+        elif n["t"] == "bin":
+            lcols, rcols = pfx_column_refs(n["l"], local), pfx_column_refs(n["r"], local)
+            if n["op"] not in prof["ops"] and (lcols or rcols):
+                issues.append(f'operador "{n["op"]}" com coluna')
+            elif n["op"] in PFX_COMPARE and lcols and rcols:
+                issues.append("comparação coluna × coluna")
+        elif n["t"] == "un" and n["op"] not in prof["ops"] and pfx_column_refs(n["x"], local):
+            issues.append(f'operador "{n["op"]}" com coluna')
+    return issues
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def analyze_powerfx(src: str, profile: str, context: str, row_limit: int, source_rows: int, visible_items: int = 10) -> dict:
+    """
+    Analisa uma fórmula Power FX e retorna avisos, chamadas de dados e custo estimado.
+    O resultado fica em cache por hash de (fórmula, perfil, contexto, limites).
+    """
+    prof = PFX_PROFILES[profile]
+    tree = pfx_parse(src)
+    findings, info = [], {}
+
+    def sequence_rows(node):
+        # Sequence(n) é uma tabela local de n linhas (coluna Value); None se não for Sequence()
+        if node["t"] != "call" or node["name"] != "Sequence":
+            return None
+        a = node["args"][0] if node["args"] else None
+        return min(int(a["v"]), PFX_SEQUENCE_MAX) if a is not None and a["t"] == "num" else min(source_rows, row_limit)
+
+    # 0. local scopes: variables/collections created here, With fields and Sequence() Value are not data sources
+    scope = {}
+    defined = {n["args"][0]["name"] for n in pfx_walk(tree) if n["t"] == "call" and n["name"] in ("ClearCollect", "Set")
+               and n["args"] and n["args"][0]["t"] == "id"}
+    defined |= {k for n in pfx_walk(tree) if n["t"] == "call" and n["name"] == "UpdateContext"
+                and n["args"] and n["args"][0]["t"] == "rec" for k, _ in n["args"][0]["fields"]}
+
+    def bind(n, local):
+        scope[id(n)] = local
+        inner = local
+        if n["t"] == "call" and n["name"] == "With" and n["args"] and n["args"][0]["t"] == "rec":
+            inner = local | {k for k, _ in n["args"][0]["fields"]}
+        elif n["t"] == "call" and n["name"] in PFX_PER_ROW and n["args"] and sequence_rows(n["args"][0]) is not None:
+            inner = local | {"Value"}
+        for i, ch in enumerate(pfx_children(n)):
+            bind(ch, inner if i else local)   # os nomes valem só a partir do 2º argumento
+    bind(tree, frozenset(defined))
+
+    def source_of(node):
+        # → (source name or None, delegable so far, reasons)
+        if pfx_is_source(node, scope[id(node)]):
+            return node["name"], True, []
+        if node["t"] == "call" and node["name"] in PFX_READ_FUNCS and node["args"]:
+            return read_call(node)
+        return None, True, []
+
+    def read_call(n):
+        if id(n) in info:
+            c = info[id(n)]
+            return c["Fonte"], c["deleg"], c["reasons"]
+        src_name, deleg, reasons = source_of(n["args"][0])
+        if src_name is None:
+            return None, True, []
+        reasons = list(reasons)
+        if n["name"] not in prof["funcs"]:
+            flag = PFX_DELEG_BASE.get(n["name"], "❌")
+            reasons.append(f'{n["name"]}() não é delegável no {profile}' + (" (parcial)" if flag == "⚠️" else ""))
+        sl = PFX_PREDICATE.get(n["name"])
+        if sl is not None:
+            for pred in n["args"][sl]:
+                reasons += [f"{n['name']}(): {r}" for r in pfx_predicate_issues(pred, prof, scope[id(pred)])]
+        deleg = not reasons
+        if n["name"] in ("LookUp","CountRows","CountIf","Sum","Average","Min","Max","First","Last"):
+            rows = min(source_rows, row_limit) if not deleg else 1
+        else:
+            rows = min(source_rows, row_limit) if not deleg else min(source_rows, prof["page"])
+        info[id(n)] = {"Função":n["name"], "Fonte":src_name, "deleg":deleg, "reasons":reasons,
+                       "rows":rows, "kind":"leitura", "pos":n["pos"], "snippet":src[n["pos"]:n.get("end", n["pos"] + 40)]}
+        return src_name, deleg, reasons
+
+    # 1. classify every data call (reads/writes first, then what Collect() copies into memory)
+    for n in pfx_walk(tree):
+        if n["t"] != "call":
+            continue
+        if n["name"] in PFX_READ_FUNCS and n["args"]:
+            read_call(n)
+        elif n["name"] in PFX_WRITE_FUNCS and n["args"] and pfx_is_source(n["args"][0], scope[id(n["args"][0])]):
+            info[id(n)] = {"Função":n["name"], "Fonte":n["args"][0]["name"], "deleg":True, "reasons":[], "rows":1,
+                           "kind":"escrita", "pos":n["pos"], "snippet":src[n["pos"]:n.get("end", n["pos"] + 40)]}
+    for n in pfx_walk(tree):
+        if n["t"] != "call" or n["name"] not in PFX_COLLECT:
+            continue
+        for a in n["args"][1:]:
+            if pfx_is_source(a, scope[id(a)]):
+                info[id(a)] = {"Função":n["name"], "Fonte":a["name"], "deleg":False, "kind":"leitura",
+                               "reasons":[f"{n['name']}() copia a fonte inteira para memória"],
+                               "rows":min(source_rows, row_limit), "pos":a["pos"], "snippet":a["name"]}
+            elif id(a) in info and info[id(a)]["kind"] == "leitura" and info[id(a)]["rows"] > 1:
+                info[id(a)]["rows"] = min(source_rows, row_limit)
+                if source_rows > row_limit:
+                    info[id(a)]["reasons"].append(f"{n['name']}() guarda no máximo {row_limit} linhas na coleção")
+                    info[id(a)]["deleg"] = False
+
+    # 2. cost model: Concurrent() runs branches in parallel, per-row args multiply calls
+    def iterations(table):
+        c = info.get(id(table))
+        if c:
+            return max(1, c["rows"])
+        seq = sequence_rows(table)
+        return max(1, seq) if seq is not None else min(source_rows, row_limit)
+
+    def cost(n, mult, per_row_ctx, track=True):
+        ms = calls_n = rows = 0.0
+        c = info.get(id(n))
+        if c is not None:
+            ms += mult * (prof["latency_ms"] + c["rows"] * prof["row_ms"])
+            calls_n += mult
+            rows += mult * c["rows"]
+            if track:
+                c["mult"] = c.get("mult", 0) + mult
+                c["per_row"] = c.get("per_row") or per_row_ctx
+        if n["t"] == "call" and n["name"] == "Concurrent":
+            parts = [cost(a, mult, per_row_ctx, track) for a in n["args"]]
+            return (ms + max((p[0] for p in parts), default=0), calls_n + sum(p[1] for p in parts),
+                    rows + sum(p[2] for p in parts))
+        per_row = PFX_PER_ROW.get(n["name"]) if n["t"] == "call" else None
+        for i, ch in enumerate(pfx_children(n)):
+            inner = per_row is not None and i in range(len(n["args"]))[per_row]
+            m = mult * iterations(n["args"][0]) if inner else mult
+            # Predicates of a delegable call run on the server, not once per row
+            if inner and c is not None and c["deleg"] and n["name"] in PFX_PREDICATE:
+                m = mult
+            p = cost(ch, m, per_row_ctx or (n["name"] if inner else None), track)
+            ms, calls_n, rows = ms + p[0], calls_n + p[1], rows + p[2]
+        return ms, calls_n, rows
+
+    base_mult = visible_items if context.startswith("Template") else 1
+    total_ms, total_calls, total_rows = cost(tree, base_mult, None)
+
+    # 3. findings
+    for c in sorted(info.values(), key=lambda c: c["pos"]):
+        if c["kind"] == "leitura" and not c["deleg"]:
+            lost = max(0, source_rows - row_limit)
+            msg = f'<b>{c["Função"]}({c["Fonte"]})</b> — ' + "; ".join(dict.fromkeys(c["reasons"]))
+            if lost:
+                findings.append({"sev":"danger", "rule":"Delegação",
+                                 "msg":f"{msg}. Só as primeiras <b>{row_limit:,}</b> linhas são avaliadas — <b>{lost:,}</b> registros ignorados silenciosamente."})
+            else:
+                findings.append({"sev":"warning", "rule":"Delegação",
+                                 "msg":f"{msg}. Hoje a fonte cabe no limite de {row_limit:,} linhas, mas o resultado ficará errado quando crescer."})
+        if c["kind"] == "leitura" and (c.get("per_row") or context.startswith("Template")):
+            where = f'dentro de {c["per_row"]}()' if c.get("per_row") else "no template da Gallery"
+            findings.append({"sev":"warning", "rule":"N+1",
+                             "msg":f'<b>{c["Função"]}({c["Fonte"]})</b> {where} executa <b>{int(c.get("mult", 1)):,}</b> chamadas de rede. '
+                                   "Traga os dados relacionados uma vez (AddColumns sobre coleção, Collect prévio ou coluna lookup expandida)."})
+
+    for n in pfx_walk(tree):
+        if n["t"] == "call" and n["name"] == "ForAll" and len(n["args"]) > 1:
+            writes = [w["name"] for a in n["args"][1:] for w in pfx_walk(a)
+                      if w["t"] == "call" and w["name"] in PFX_WRITE_FUNCS | PFX_COLLECT | {"SubmitForm"}]
+            if writes:
+                findings.append({"sev":"warning", "rule":"ForAll + Patch",
+                                 "msg":f"ForAll() com {', '.join(sorted(set(writes)))}() grava um registro por iteração "
+                                       f"(~{iterations(n['args'][0]):,} chamadas sequenciais). Prefira <code>Patch(Fonte, ForAll(..., {{registro}}))</code> "
+                                       "— uma única chamada em lote."})
+
+    def defines(n):
+        if n["t"] == "call" and n["name"] in PFX_COLLECT | {"Set"} and n["args"] and n["args"][0]["t"] == "id":
+            return n["args"][0]["name"]
+        return None
+
+    def is_load(n):
+        return defines(n) is not None and any(id(x) in info for x in pfx_walk(n))
+
+    for n in pfx_walk(tree):
+        if n["t"] != "chain":
+            continue
+        run, defined = [], set()
+        for item in n["items"] + [None]:
+            names = {x["name"] for x in pfx_walk(item) if x["t"] == "id"} if item else set()
+            if item is not None and is_load(item) and not (names & defined):
+                run.append(item)
+                defined.add(defines(item))
+                continue
+            if len(run) >= 2:
+                seq = sum(cost(x, 1, None, False)[0] for x in run)
+                par = max(cost(x, 1, None, False)[0] for x in run)
+                findings.append({"sev":"info", "rule":"Concurrent()",
+                                 "msg":f"{len(run)} cargas independentes em sequência ({', '.join(defines(x) for x in run)}). "
+                                       f"Envolva-as em <code>Concurrent()</code>: ~{seq:,.0f} ms → ~{par:,.0f} ms."})
+            run, defined = ([item], {defines(item)}) if item is not None and is_load(item) else ([], set())
+
+    rows_out = [{"Função":c["Função"], "Fonte":c["Fonte"], "Tipo":c["kind"],
+                 "Delegável":"✅" if c["deleg"] else "❌", "Chamadas":int(c.get("mult", 1)),
+                 "Linhas/chamada":c["rows"], "Trecho":c["snippet"][:80]}
+                for c in sorted(info.values(), key=lambda c: c["pos"])]
+    return {"findings":findings, "calls":rows_out,
+            "total_ms":total_ms, "total_calls":int(total_calls), "total_rows":int(total_rows)}
+
+PFX_SAMPLE = """ClearCollect(colClientes, Filter(Clientes_TB, IsBlank(Email) = false));
+ClearCollect(colProdutos, Produtos_TB);
+Set(gblPerfil, LookUp(Perfis_TB, Email = User().Email));
+ForAll(colCarrinho,
+    Patch(Pedidos_TB, Defaults(Pedidos_TB), {Produto: ThisRecord.Nome, Qtd: ThisRecord.Qtd})
+)"""
+
+def powerfx_analyzer_lab(key: str = "pfx", profile: str = "SharePoint"):
+    lab_header("🔬 Analisador de Fórmulas Power FX","Cole fórmulas de OnStart/Items e veja avisos de delegação, N+1 e custo de rede estimado")
+    c1,c2 = st.columns([1.4,1],gap="large")
+    with c1:
+        col_label("📝 Fórmula")
+        src = st.text_area("Fórmula",PFX_SAMPLE,height=220,key=f"{key}_src",label_visibility="collapsed")
+    with c2:
+        col_label("⚙️ Cenário")
+        profile = st.selectbox("Fonte de dados",list(PFX_PROFILES),list(PFX_PROFILES).index(profile),key=f"{key}_prof")
+        context = st.selectbox("Propriedade",PFX_CONTEXTS,key=f"{key}_ctx")
+        row_limit = st.slider("Limite de linhas de dados (configurações do app)",500,2000,500,100,key=f"{key}_lim")
+        source_rows = st.number_input("Linhas em cada fonte",1,10_000_000,25_000,1000,key=f"{key}_rows")
+        visible = st.slider("Itens visíveis na Gallery",1,50,10,key=f"{key}_vis") if context.startswith("Template") else 10
+    if not src.strip():
+        return
+    try:
+        res = analyze_powerfx(src, profile, context, int(row_limit), int(source_rows), int(visible))
+    except ValueError as e:
+        st.error(f"❌ Erro de sintaxe: {e}")
+        return
+    m1,m2,m3 = st.columns(3)
+    m1.metric("Chamadas de rede", f"{res['total_calls']:,}")
+    m2.metric("Linhas transferidas", f"{res['total_rows']:,}")
+    m3.metric("Tempo estimado", f"{res['total_ms']/1000:,.1f} s")
+    if not res["findings"]:
+        info_box("✅ Nenhum problema encontrado para este perfil de fonte de dados.","success")
+    for f in res["findings"]:
+        info_box(f"<b>{f['rule']}:</b> {f['msg']}", f["sev"])
+    if res["calls"]:
+        import pandas as pd
+        st.dataframe(pd.DataFrame(res["calls"]),use_container_width=True,hide_index=True)
+    st.caption(f"Estimativa: {PFX_PROFILES[profile]['latency_ms']} ms por chamada + {PFX_PROFILES[profile]['row_ms']} ms por linha no {profile}. Valores ilustrativos.")
+
+
+# ─────────────────────────────────────────────
+# SIMULADOR DE LIMITE DE DELEGAÇÃO (NumPy)
+# ─────────────────────────────────────────────
+def vec_str(x, fn):
+    # Apply a string function to a DictCol (over its categories only) or to a scalar
+    if is_dict_col(x):
+        return x.map(fn)
+    return np.asarray(fn(np.array([x])))[0]
+
+class VecEval:
+    """Avalia Filter/Search/Sort Power FX sobre colunas NumPy — sem laço por linha."""
+    def __init__(self, table: dict, limit: int):
+        self.t, self.limit = table, limit
+        self.n = len(next(iter(table.values())))
+
+    # ── tables → row selection (slice or index array) ──
+    def rows(self, node):
+        t = node["t"]
+        if t == "id":
+            return slice(0, min(self.n, self.limit))
+        if t != "call":
+            raise ValueError("Esperada uma tabela (fonte, Filter, Search, Sort…)")
+        name, args = node["name"], node["args"]
+        if name == "Filter":
+            sel = self.rows(args[0])
+            mask = np.ones(self.size(sel), bool)
+            for p in args[1:]:
+                mask &= np.broadcast_to(self.cond(p, sel), mask.shape)
+            return self.index(sel)[mask]
+        if name == "Search":
+            sel = self.rows(args[0])
+            term = str(self.val(args[1], sel)).lower()
+            if not term:
+                return sel
+            mask = np.zeros(self.size(sel), bool)
+            for c in args[2:]:
+                col = self.column(self.val(c, sel) if c["t"] == "str" else c["name"], sel)
+                mask |= vec_str(col, lambda a: np.char.find(np.char.lower(a.astype(str)), term) >= 0)
+            return self.index(sel)[mask]
+        if name in ("SortByColumns", "Sort"):
+            sel = self.index(self.rows(args[0]))
+            keys = []
+            pairs = list(zip(args[1::2], args[2::2] or [None])) if name == "SortByColumns" else [(args[1], args[2] if len(args) > 2 else None)]
+            for col_node, ord_node in pairs:
+                col = self.column(col_node["v"], sel) if col_node["t"] == "str" else self.val(col_node, sel)
+                key = col.map(lambda a: np.argsort(np.argsort(a, kind="stable"), kind="stable")) if is_dict_col(col) else np.asarray(col)
+                if key.dtype.kind == "M":
+                    key = key.astype("int64")
+                desc = ord_node is not None and "Desc" in pfx_dotted(ord_node)
+                keys.append(-key.astype(np.float64) if desc else key)
+            return sel[np.lexsort(keys[::-1])] if keys else sel
+        if name in ("FirstN", "First"):
+            k = int(self.val(args[1], slice(0, 0))) if len(args) > 1 else 1
+            return self.index(self.rows(args[0]))[:k]
+        if name == "LookUp":
+            return self.rows({"t":"call", "name":"Filter", "args":args[:2]})[:1]
+        raise ValueError(f"{name}() não é suportado no simulador")
+
+    def size(self, sel):
+        return len(range(self.n)[sel]) if isinstance(sel, slice) else len(sel)
+
+    def index(self, sel):
+        return np.arange(self.n, dtype=np.int64)[sel] if isinstance(sel, slice) else sel
+
+    def column(self, name, sel):
+        if name not in self.t:
+            raise ValueError(f'Coluna desconhecida "{name}". Disponíveis: {", ".join(self.t)}')
+        return self.t[name][sel]
+
+    # ── scalar/vector expressions ──
+    def cond(self, node, sel) -> np.ndarray:
+        # Condição de Filter/RemoveIf: precisa dar verdadeiro/falso (texto não vira booleano em silêncio)
+        v = self.val(node, sel)
+        if self.kind(v) != "lógico":
+            raise ValueError(f"A condição deve ser verdadeiro/falso, não {self.kind(v)}")
+        return np.asarray(v, bool)
+
+    def val(self, node, sel):
+        t = node["t"]
+        if t == "num": return node["v"]
+        if t == "str": return node["v"]
+        if t == "id":
+            if node["name"] in ("true", "false"): return node["name"] == "true"
+            if node["name"] in ("Ascending", "Descending"): return node["name"]
+            return self.column(node["name"], sel)
+        if t == "dot":
+            root = pfx_dotted(node).split(".")
+            if root[0] == "ThisRecord": return self.column(root[1], sel)
+            if root[0] in self.t: return self.column(root[0], sel)   # Status.Value (coluna Choice)
+            return root[-1]
+        if t == "tbl":
+            return [self.val(i, sel) for i in node["items"]]
+        if t == "un":
+            x = self.val(node["x"], sel)
+            if node["op"] in ("!", "Not"): return ~np.asarray(x, bool)
+            if node["op"] == "-": return -np.asarray(x)
+            return np.asarray(x) / 100
+        if t == "bin":
+            return self.binop(node["op"], node["l"], node["r"], sel)
+        if t == "call":
+            return self.call(node, sel)
+        raise ValueError("Expressão não suportada no simulador")
+
+    @staticmethod
+    def kind(x) -> str:
+        if is_dict_col(x) or isinstance(x, str):
+            return "texto"
+        k = np.asarray(x).dtype.kind
+        return "texto" if k in "USO" else "data" if k == "M" else "lógico" if k == "b" else "número"
+
+    @staticmethod
+    def text(x):
+        # Número vira texto como no Power Fx (500, não 500.0)
+        a = np.asarray(x)
+        a = np.char.mod("%.15g", a) if a.dtype.kind in "iuf" else np.char.lower(a.astype(str)) if a.dtype.kind == "b" else a.astype(str)
+        return a if a.ndim else str(a)
+
+    def binop(self, op, ln, rn, sel):
+        if op in ("&&", "And"): return np.logical_and(self.val(ln, sel), self.val(rn, sel))
+        if op in ("||", "Or"):  return np.logical_or(self.val(ln, sel), self.val(rn, sel))
+        l, r = self.val(ln, sel), self.val(rn, sel)
+        try:
+            return self.apply(op, l, r)
+        except TypeError:   # inclui UFuncTypeError do NumPy (ex.: Valor > "abc")
+            raise ValueError(f'Operador "{op}" não se aplica a {self.kind(l)} e {self.kind(r)}')
+
+    def apply(self, op, l, r):
+        if op in ("in", "exactin"):
+            if isinstance(r, list):
+                return vec_str(l, lambda a: np.isin(a, r)) if is_dict_col(l) else np.isin(l, r)
+            fold = (lambda a: a) if op == "exactin" else np.char.lower
+            needle = str(l) if op == "exactin" else str(l).lower()
+            return vec_str(r, lambda a: np.char.find(fold(a.astype(str)), needle) >= 0)
+        if op == "&":
+            # Concatenação: com um lado escalar, só as categorias do DictCol são tocadas
+            if is_dict_col(l) and not is_dict_col(r) and np.ndim(r) == 0:
+                return l.map(lambda a: np.char.add(a.astype(str), self.text(r)))
+            if is_dict_col(r) and not is_dict_col(l) and np.ndim(l) == 0:
+                return r.map(lambda a: np.char.add(self.text(l), a.astype(str)))
+            return np.char.add(self.text(col_decode(l)), self.text(col_decode(r)))
+        if is_dict_col(l) or is_dict_col(r):
+            col, other, flip = (l, r, False) if is_dict_col(l) else (r, l, True)
+            if is_dict_col(other):
+                l, r = l.decode(), r.decode()
+            elif op in ("=", "<>"):
+                hit = np.flatnonzero(col.cats == other)
+                eq = col.codes == hit[0] if len(hit) else np.zeros(len(col), bool)
+                return eq if op == "=" else ~eq
+            elif op in ("<", ">", "<=", ">="):
+                cmp = {"<":np.less, ">":np.greater, "<=":np.less_equal, ">=":np.greater_equal}[op]
+                return col.map(lambda a: cmp(other, a) if flip else cmp(a, other))
+            else:
+                raise ValueError(f'Operador "{op}" não se aplica a texto — use & para concatenar')
+        ops = {"=":np.equal, "<>":np.not_equal, "<":np.less, ">":np.greater, "<=":np.less_equal,
+               ">=":np.greater_equal, "+":np.add, "-":np.subtract, "*":np.multiply, "/":np.divide, "^":np.power}
+        if op not in ops:
+            raise ValueError(f'Operador "{op}" não suportado no simulador')
+        if isinstance(l, np.ndarray) and l.dtype.kind == "M" and isinstance(r, str):
+            try:
+                r = np.datetime64(r)
+            except ValueError:
+                raise ValueError(f'"{r}" não é uma data')
+        if op == "/" and np.any(np.asarray(r) == 0):
+            raise ValueError("Divisão por zero")   # como no Power Fx (e no tsm_eval): erro, não infinito
+        return ops[op](l, r)
+
+    def call(self, node, sel):
+        name, a = node["name"], [self.val(x, sel) for x in node["args"]] if node["name"] not in ("CountRows",) else []
+        if name == "CountRows": return self.size(self.rows(node["args"][0]))
+        if name == "Date":       return np.datetime64(datetime.date(int(a[0]), int(a[1]), int(a[2])))
+        if name == "Today":      return np.datetime64(datetime.date.today())
+        if name == "DateAdd":    return a[0] + np.timedelta64(int(a[1]), "D")
+        if name == "Year":       return np.asarray(a[0]).astype("datetime64[Y]").astype(int) + 1970
+        if name == "Len":        return vec_str(a[0], lambda x: np.char.str_len(x.astype(str)))
+        if name == "Lower":      return vec_str(a[0], lambda x: np.char.lower(x.astype(str)))
+        if name == "Upper":      return vec_str(a[0], lambda x: np.char.upper(x.astype(str)))
+        if name == "StartsWith": return vec_str(a[0], lambda x: np.char.startswith(np.char.lower(x.astype(str)), str(a[1]).lower()))
+        if name == "EndsWith":   return vec_str(a[0], lambda x: np.char.endswith(np.char.lower(x.astype(str)), str(a[1]).lower()))
+        if name == "IsBlank":    return vec_str(a[0], lambda x: np.char.str_len(x.astype(str)) == 0) if is_dict_col(a[0]) else np.zeros(self.size(sel), bool)
+        if name == "Not":        return ~np.asarray(a[0], bool)
+        if name == "And":        return np.logical_and.reduce(a)
+        if name == "Or":         return np.logical_or.reduce(a)
+        if name == "Abs":        return np.abs(a[0])
+        if name == "Value":      return float(a[0])
+        if name in ("Round", "RoundUp", "RoundDown"): return pfx_round(a[0], int(a[1]), name)
+        if name == "If":         return np.where(a[0], a[1], a[2] if len(a) > 2 else 0)
+        raise ValueError(f"{name}() não é suportado no simulador")
+
+def delegation_run(formula: str, rows: int, limit: int, seed: int = 42) -> dict:
+    tree = pfx_parse(formula)
+    table = synth_table("Chamados", rows, seed)
+    out = {}
+    for mode, lim in (("deleg", rows), ("local", limit)):
+        t0 = time.perf_counter()
+        ev = VecEval(table, lim)
+        sel = ev.rows(tree) if not (tree["t"] == "call" and tree["name"] == "CountRows") else None
+        count = ev.size(sel) if sel is not None else ev.call(tree, slice(0, 0))
+        out[mode] = {"sel":sel, "count":int(count), "ms":(time.perf_counter() - t0) * 1000, "scanned":min(rows, lim)}
+    return out
+
+def delegation_preview(rows: int, sel, k: int = 50, seed: int = 42):
+    idx = np.arange(rows)[sel][:k] if isinstance(sel, slice) else sel[:k]
+    return synth_frame("Chamados", rows, idx, seed=seed)
+
+DELEG_SIM_SAMPLES = [
+    'Filter(Chamados, Status = "Aberto" && Valor > 500)',
+    'SortByColumns(Filter(Chamados, Regiao = "Sul"), "Valor", Descending)',
+    'Search(Chamados, "senha", "Titulo", "Cliente")',
+    'Filter(Chamados, Len(Titulo) > 22 && Prioridade = "Crítica")',
+    'Filter(Chamados, Criado >= Date(2025, 1, 1) && Ativo)',
+    'CountRows(Filter(Chamados, Status = "Aberto"))',
+]
+
+def delegation_simulator_lab(key: str = "dsim"):
+    lab_header("🧪 Simulador de Limite de Delegação","Mesma fórmula avaliada no servidor (todas as linhas) e localmente (só as primeiras N)")
+    c1,c2 = st.columns([1.4,1],gap="large")
+    with c1:
+        col_label("📝 Fórmula sobre a lista Chamados")
+        ex = st.selectbox("Exemplos",DELEG_SIM_SAMPLES,key=f"{key}_ex")
+        formula = st.text_area("Fórmula",ex,height=90,key=f"{key}_f_{DELEG_SIM_SAMPLES.index(ex)}",label_visibility="collapsed")
+        st.caption("Colunas: ID, Titulo, Cliente, Status, Regiao, Prioridade, Valor, Criado, Ativo")
+    with c2:
+        col_label("⚙️ Cenário")
+        rows = st.select_slider("Linhas na lista",[10_000,100_000,500_000,1_000_000,2_000_000,5_000_000],1_000_000,
+                                format_func=lambda v: f"{v:,}",key=f"{key}_rows")
+        limit = st.slider("Limite de linhas de dados",500,2000,500,100,key=f"{key}_lim")
+        profile = st.selectbox("Fonte de dados",["SharePoint","Dataverse"],key=f"{key}_prof")
+    try:
+        res = delegation_run(formula, int(rows), int(limit))
+        calls = analyze_powerfx(formula, profile, "Gallery.Items", int(limit), int(rows))["calls"]
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return
+    delegable = all(c["Delegável"] == "✅" for c in calls)
+    d, l = res["deleg"], res["local"]
+    ca,cb = st.columns(2,gap="large")
+    for col,mode,title,active in [(ca,d,"☁️ Delegável — avaliado no servidor",delegable),
+                                   (cb,l,f"📱 Não delegável — só as primeiras {limit:,} linhas",not delegable)]:
+        with col:
+            col_label(title + ("  ← o que o app usaria" if active else ""))
+            m1,m2,m3 = st.columns(3)
+            m1.metric("Resultado", f"{mode['count']:,}")
+            m2.metric("Linhas avaliadas", f"{mode['scanned']:,}")
+            m3.metric("Tempo", f"{mode['ms']:.1f} ms")
+            if mode["sel"] is not None:
+                st.dataframe(delegation_preview(int(rows), mode["sel"]),use_container_width=True,hide_index=True,height=240)
+    lost = d["count"] - l["count"]
+    if lost:
+        info_box(f"⚠️ Sem delegação o app mostraria <b>{l['count']:,}</b> em vez de <b>{d['count']:,}</b> resultados — "
+                 f"<b>{lost:,}</b> registros nunca apareceriam, sem nenhuma mensagem de erro.","danger" if not delegable else "warning")
+    else:
+        info_box("✅ Os dois modos retornam a mesma quantidade de resultados neste cenário.","success")
+    st.caption(f"No {profile}, esta fórmula é {'✅ delegável' if delegable else '❌ não delegável'} segundo o analisador acima. Dados sintéticos determinísticos (seed 42), avaliados com NumPy vetorizado.")
+
+
+# ══════════════════════════════════════════════
+# SHAREPOINT — LIMITE DE MODO DE EXIBIÇÃO (5.000) E COLUNAS INDEXADAS
+# ══════════════════════════════════════════════
+SPL_THRESHOLD = 5_000
+SPL_MAX_INDEXES = 20
+SPL_INDEX_KINDS = {"hash": "de hash", "sorted": "ordenado"}
+SPL_ALIASES = {"Title": "Titulo", "Created": "Criado", "Id": "ID"}
+SPL_OPS = {"eq": np.equal, "ne": np.not_equal, "gt": np.greater, "ge": np.greater_equal, "lt": np.less, "le": np.less_equal}
+SPL_TOKEN = re.compile(r"\s*(?:'((?:[^']|'')*)'|(\d{4}-\d\d-\d\d)(?:T[\d:.]*Z?)?|(-?\d+(?:\.\d+)?)|([A-Za-z_]\w*)|([(),]))")
+SPL_SAMPLES = [
+    "Status eq 'Aberto' and Regiao eq 'Sul'",
+    "Titulo eq 'Reset de senha #042' and Status eq 'Aberto'",
+    "Regiao eq 'Sul' and Titulo eq 'Reset de senha #042'",
+    "Criado ge '2026-06-20' and Prioridade eq 'Crítica'",
+    "Valor gt 5000 or Titulo eq 'VPN não conecta #001'",
+    "startswith(Titulo, 'VPN')",
+    "Status ne 'Concluído'",
+]
+
+def spl_parse(src: str, table: dict):
+    """$filter do OData (eq/ne/gt/ge/lt/le, and/or/not, startswith, substringof) → árvore de tuplas."""
+    toks, pos = [], 0
+    while pos < len(src.rstrip()):
+        m = SPL_TOKEN.match(src, pos)
+        if not m:
+            raise ValueError(f"Não entendi o filtro perto de “{src[pos:pos + 20].strip()}”.")
+        s, d, num, ident, p = m.groups()
+        toks.append(("str", s.replace("''", "'")) if s is not None else ("str", d) if d else ("num", float(num)) if num else
+                    ("id", ident) if ident else ("p", p))
+        pos = m.end()
+    i = 0
+    def peek(kind=None, val=None):
+        if i < len(toks) and (kind is None or toks[i][0] == kind) and (val is None or toks[i][1] == val):
+            return toks[i]
+    def take(kind, val=None, what="token"):
+        nonlocal i
+        t = peek(kind, val)
+        if t is None:
+            raise ValueError(f"Filtro incompleto: esperava {what}" + (f" antes de “{toks[i][1]}”." if i < len(toks) else " no fim."))
+        i += 1
+        return t[1]
+    def column(name):
+        name = SPL_ALIASES.get(name, name)
+        if name not in table:
+            raise ValueError(f"A lista não tem a coluna “{name}”. Colunas: {', '.join(table)}.")
+        return name
+    def literal(col):
+        nonlocal i
+        if i >= len(toks) or toks[i][0] == "p":
+            take("str", what="um valor")
+        kind, raw = toks[i]
+        i += 1
+        c = table[col]
+        if is_dict_col(c):
+            return raw if kind != "num" else f"{raw:g}"
+        if c.dtype == bool:
+            if raw not in ("true", "false"):
+                raise ValueError(f"{col} é Sim/Não: use true ou false.")
+            return raw == "true"
+        if c.dtype.kind == "M":
+            try:
+                return np.datetime64(str(raw)[:10], "D")
+            except ValueError:
+                raise ValueError(f"{col} é data: use '2026-01-31'.")
+        if kind != "num":
+            raise ValueError(f"{col} é número: compare sem aspas.")
+        return raw
+    def unary():
+        if peek("id", "not"):
+            take("id")
+            return ("not", unary())
+        if peek("p", "("):
+            take("p")
+            node = disj()
+            take("p", ")", "“)”")
+            return node
+        name = take("id", what="uma coluna")
+        if name in ("startswith", "substringof"):
+            take("p", "(", "“(”")
+            if name == "startswith":
+                col = column(take("id", what="uma coluna"))
+                take("p", ",", "“,”")
+                val = take("str", what="um texto entre aspas")
+            else:
+                val = take("str", what="um texto entre aspas")
+                take("p", ",", "“,”")
+                col = column(take("id", what="uma coluna"))
+            take("p", ")", "“)”")
+            if not is_dict_col(table[col]):
+                raise ValueError(f"{name}() só vale para colunas de texto.")
+            return ("fn", name, col, val)
+        col = column(name)
+        op = take("id", what="um operador (eq, ne, gt, ge, lt, le)")
+        if op not in SPL_OPS:
+            raise ValueError(f"Operador “{op}” não existe no OData: use eq, ne, gt, ge, lt ou le.")
+        return ("cmp", col, op, literal(col))
+    def conj():
+        parts = [unary()]
+        while peek("id", "and"):
+            take("id")
+            parts.append(unary())
+        return parts[0] if len(parts) == 1 else ("and", parts)
+    def disj():
+        parts = [conj()]
+        while peek("id", "or"):
+            take("id")
+            parts.append(conj())
+        return parts[0] if len(parts) == 1 else ("or", parts)
+    if not toks:
+        return None
+    tree = disj()
+    if i < len(toks):
+        raise ValueError(f"Sobrou “{toks[i][1]}” no fim do filtro.")
+    return tree
+
+def spl_text(node) -> str:
+    kind = node[0]
+    if kind in ("and", "or"):
+        return f" {kind} ".join(f"({spl_text(x)})" if x[0] in ("and", "or") else spl_text(x) for x in node[1])
+    if kind == "not":
+        return f"not {spl_text(node[1])}"
+    if kind == "fn":
+        return f"{node[1]}({node[2]}, '{node[3]}')"
+    v = node[3]
+    return f"{node[1]} {node[2]} " + (f"'{v}'" if isinstance(v, (str, np.datetime64)) else str(v).lower() if isinstance(v, bool) else f"{v:g}")
+
+def spl_mask(node, table: dict, idx) -> np.ndarray:
+    """Avaliação linha a linha (o que a varredura faz) sobre as linhas idx, ou sobre a lista toda com idx=None."""
+    kind = node[0]
+    if kind == "and":
+        return np.logical_and.reduce([spl_mask(x, table, idx) for x in node[1]])
+    if kind == "or":
+        return np.logical_or.reduce([spl_mask(x, table, idx) for x in node[1]])
+    if kind == "not":
+        return ~spl_mask(node[1], table, idx)
+    col = table[node[2] if kind == "fn" else node[1]]
+    col = col if idx is None else col[idx]
+    if kind == "fn":
+        fn = np.char.startswith if node[1] == "startswith" else (lambda a, v: np.char.find(a, v) >= 0)
+        return col.map(lambda cats: fn(np.char.lower(cats.astype(str)), node[3].lower()))
+    op, val = SPL_OPS[node[2]], node[3]
+    return col.map(lambda cats: op(cats, val)) if is_dict_col(col) else op(np.asarray(col), val)
+
+@st.cache_resource(max_entries=64, show_spinner="Criando índice…")
+def spl_index(rows: int, column: str) -> dict:
+    """Índice secundário: mapa de hash (valor → IDs) para texto e Sim/Não; array ordenado (chave, ID) para número e data."""
+    col = synth_table("Chamados", rows)[column]
+    t0 = time.perf_counter()
+    if is_dict_col(col) or col.dtype == bool:
+        codes, cats = (np.asarray(col.codes), col.cats) if is_dict_col(col) else (np.asarray(col, np.int8), np.array([False, True]))
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(cats) + 1))
+        ix = {"kind": "hash", "map": {cats[k].item(): order[bounds[k]:bounds[k + 1]] for k in range(len(cats)) if bounds[k + 1] > bounds[k]}}
+    else:
+        order = np.arange(rows) if column == "ID" else np.argsort(col, kind="stable")
+        ix = {"kind": "sorted", "keys": np.asarray(col)[order], "rows": order}
+    ix["ms"] = (time.perf_counter() - t0) * 1000
+    return ix
+
+def spl_seek(node, rows: int, indexed: tuple) -> Optional[np.ndarray]:
+    # Só condições que um índice resolve sozinho; ne, not e colunas sem índice exigem varredura
+    kind = node[0]
+    if kind == "cmp" and node[1] in indexed and node[2] != "ne":
+        ix = spl_index(rows, node[1])
+        if ix["kind"] == "hash":
+            return ix["map"].get(node[3], np.empty(0, np.int64)) if node[2] == "eq" else None
+        keys, val = ix["keys"], node[3]
+        lo = np.searchsorted(keys, val, "right" if node[2] == "gt" else "left") if node[2] in ("eq", "gt", "ge") else 0
+        hi = np.searchsorted(keys, val, "left" if node[2] == "lt" else "right") if node[2] in ("eq", "lt", "le") else len(keys)
+        return ix["rows"][lo:hi]
+    if kind == "fn" and node[1] == "startswith" and node[2] in indexed:
+        ix, pre = spl_index(rows, node[2]), node[3].lower()
+        hits = [r for v, r in ix["map"].items() if str(v).lower().startswith(pre)]
+        return np.concatenate(hits) if hits else np.empty(0, np.int64)
+    return None
+
+def spl_access(node, table: dict, rows: int, indexed: tuple, steps: list) -> Optional[dict]:
+    """Caminho de acesso como o SharePoint escolhe: a PRIMEIRA condição do filtro precisa de índice.
+    Devolve as linhas e quantas saíram do índice (o que o limite mede), ou None se só a varredura resolve."""
+    kind = node[0]
+    if kind == "and":
+        first, rest = node[1][0], node[1][1:]
+        acc = spl_access(first, table, rows, indexed, steps)
+        if acc is None:
+            return None
+        hit = acc["rows"][spl_mask(("and", rest) if len(rest) > 1 else rest[0], table, acc["rows"])]
+        steps.append((f"🧮 Demais condições avaliadas nos {len(acc['rows']):,} itens vindos do índice", len(acc["rows"]), len(hit)))
+        return {"rows": hit, "examined": acc["examined"], "candidates": acc["candidates"]}
+    if kind == "or":
+        parts = []
+        for x in node[1]:
+            acc = spl_access(x, table, rows, indexed, steps)
+            if acc is None:
+                return None
+            parts.append(acc)
+        hit = np.unique(np.concatenate([a["rows"] for a in parts]))
+        return {"rows": hit, "examined": sum(a["examined"] for a in parts), "candidates": sum(a["candidates"] for a in parts)}
+    hit = spl_seek(node, rows, indexed)
+    if hit is None:
+        return None
+    col = node[2] if kind == "fn" else node[1]
+    steps.append((f"🔎 Índice {SPL_INDEX_KINDS[spl_index(rows, col)['kind']]} de {col}: {spl_text(node)}", len(hit), len(hit)))
+    return {"rows": np.sort(hit), "examined": len(hit), "candidates": len(hit)}
+
+def spl_query(rows: int, flt: str, order: str, desc: bool, top: int, indexed: tuple, force: bool = False) -> dict:
+    """Executa o 'Obter itens' (filtro, ordenação e Top Count) com o limite de 5.000 itens examinados."""
+    table = synth_table("Chamados", rows)
+    tree = spl_parse(flt, table)
+    indexed = tuple(indexed) + ("ID",)
+    big, steps, blocked = rows > SPL_THRESHOLD, [], None
+    for c in indexed:
+        spl_index(rows, c)
+    t0 = time.perf_counter()
+    acc = spl_access(tree, table, rows, indexed, steps) if tree else None
+    if tree is None:
+        hit, examined = None, 0
+    elif acc is None:
+        first = tree[1][0] if tree[0] == "and" else tree
+        col = first[2] if first[0] == "fn" else first[1] if first[0] == "cmp" else None
+        if first[0] == "not" or first[0] == "cmp" and first[2] == "ne":
+            why = "usa ne/not, que sempre exige varredura"
+        elif col and col in indexed:
+            why = f"usa um operador que o índice {SPL_INDEX_KINDS[spl_index(rows, col)['kind']]} de {col} não atende"
+        elif col:
+            why = f"usa {col}, que não está indexada"
+        else:
+            why = "não pode ser resolvida só com índices"
+        if big:
+            blocked = f"A primeira condição ({spl_text(first)}) {why}: o SharePoint teria de examinar os {rows:,} itens da lista."
+        hit = np.flatnonzero(spl_mask(tree, table, None))
+        examined = rows
+        steps.append((f"🐢 Varredura completa: {spl_text(tree)}", rows, len(hit)))
+    else:
+        hit, examined = acc["rows"], acc["examined"]
+        if big and acc["candidates"] > SPL_THRESHOLD:
+            blocked = (f"O índice devolveu {acc['candidates']:,} itens para a primeira condição — acima de {SPL_THRESHOLD:,}. "
+                       "Um índice só ajuda se a condição for seletiva: comece o filtro pela condição que mais restringe.")
+    total = rows if hit is None else len(hit)
+    if order and order not in indexed and total > SPL_THRESHOLD and big:
+        blocked = blocked or f"Ordenar {total:,} itens por {order}, que não está indexada, excede o limite de exibição."
+    if order:
+        if hit is None and order in indexed:
+            # Sem filtro e ordenando por coluna indexada: percorre o índice na ordem e para no Top Count
+            ix = spl_index(rows, order)
+            if ix["kind"] == "sorted":
+                out = (ix["rows"][sort_order(ix["keys"], True)] if desc else ix["rows"])[:top]
+            else:
+                out = np.concatenate([ix["map"][k] for k in sorted(ix["map"], reverse=desc)])[:top]
+            examined = len(out)
+            steps.append((f"📑 Índice de {order} percorrido em ordem até {top:,} itens", len(out), len(out)))
+        else:
+            base = np.arange(rows) if hit is None else hit
+            keys = col_sort_key(table[order][base])
+            out = base[sort_order(keys, desc)][:top]
+            examined = max(examined, len(base))
+            steps.append((f"↕️ Ordenação por {order} de {len(base):,} itens", len(base), len(out)))
+    else:
+        out = (np.arange(min(top, rows)) if hit is None else hit[:top])
+        if hit is None:
+            examined = len(out)
+            steps.append((f"📄 Primeiros {len(out):,} itens na ordem do ID (sempre indexado)", len(out), len(out)))
+    ms = (time.perf_counter() - t0) * 1000
+    return {"count": total, "out": out, "examined": examined, "ms": ms, "steps": steps,
+            "blocked": blocked if big and not force else None, "would_block": blocked, "tree": tree}
+
+def sharepoint_index_lab(key: str):
+    import pandas as pd
+    lab_header("🗂️ Laboratório — Limite de 5.000 itens e colunas indexadas","Lista sintética de Chamados: marque colunas como indexadas e rode o 'Obter itens' — índices de hash/ordenados de verdade contra varredura completa")
+    c1,c2 = st.columns([1,1.3],gap="large")
+    with c1:
+        rows = st.select_slider("Itens na lista",[5_000,50_000,200_000,1_000_000],1_000_000,format_func=lambda v: f"{v:,}",key=f"{key}_rows")
+        cols = [c for c in synth_table("Chamados", rows) if c != "ID"]
+        indexed = st.multiselect(f"Colunas indexadas (Configurações da lista → Colunas indexadas; ID já é, máx. {SPL_MAX_INDEXES})",cols,max_selections=SPL_MAX_INDEXES,key=f"{key}_ix")
+        ex = st.selectbox("Exemplos de filtro",SPL_SAMPLES,key=f"{key}_ex")
+        flt = st.text_input("Filtrar consulta ($filter)",ex,key=f"{key}_f_{SPL_SAMPLES.index(ex)}")
+        a1,a2,a3 = st.columns([1.3,1,1])
+        order = a1.selectbox("Ordenar por",["(nenhum)", "ID"] + cols,key=f"{key}_ord")
+        desc = a2.toggle("desc",key=f"{key}_desc")
+        top = a3.number_input("Top Count",1,SPL_THRESHOLD,100,key=f"{key}_top")
+        order = "" if order == "(nenhum)" else order
+        if indexed:
+            st.caption("Índices: " + " · ".join(f"{c} ({SPL_INDEX_KINDS[spl_index(rows, c)['kind']]}, {spl_index(rows, c)['ms']:,.0f} ms para criar)" for c in indexed))
+    try:
+        r = spl_query(rows, flt, order, desc, int(top), tuple(indexed))
+        scan = spl_query(rows, flt, order, desc, int(top), (), force=True)
+    except ValueError as e:
+        c2.error(f"❌ {e}")
+        return
+    with c2:
+        if r["blocked"]:
+            st.error(f"🚫 **The attempted operation is prohibited because it exceeds the list view threshold.** {r['blocked']}")
+        else:
+            st.success(f"✅ {r['count']:,} itens atendem ao filtro · {len(r['out']):,} devolvidos")
+        m1,m2,m3 = st.columns(3)
+        m1.metric("Itens examinados", f"{r['examined']:,}", f"{r['examined'] / scan['examined']:.1%} da varredura" if scan["examined"] else None, delta_color="off")
+        m2.metric("Tempo", f"{r['ms']:,.1f} ms", f"sem índices: {scan['ms']:,.1f} ms", delta_color="off")
+        m3.metric("Limite de exibição", f"{SPL_THRESHOLD:,}", "excedido" if r["would_block"] else "ok", delta_color="inverse" if r["would_block"] else "off")
+        col_label("🧭 Plano de execução")
+        st.dataframe(pd.DataFrame(r["steps"], columns=["Etapa", "Itens examinados", "Itens resultantes"]), use_container_width=True, hide_index=True)
+        if not r["blocked"] and len(r["out"]):
+            st.dataframe(synth_frame("Chamados", rows, r["out"][:50]), use_container_width=True, hide_index=True, height=240)
+    if r["blocked"] and scan["count"] <= SPL_THRESHOLD and not indexed:
+        info_box("💡 O resultado tem menos de 5.000 itens, mas isso não importa: o limite conta os itens <b>examinados</b>, não os devolvidos. Indexe a coluna da primeira condição.", "warning")
+    elif r["would_block"] and not r["blocked"]:
+        info_box(f"✅ Com {rows:,} itens a lista está abaixo do limite e tudo funciona — mas essa mesma consulta falha quando a lista passar de {SPL_THRESHOLD:,}. Indexe antes de crescer.", "info")
+    st.caption("Regras simuladas: acima de 5.000 itens, a primeira condição do $filter precisa usar coluna indexada (eq/gt/ge/lt/le/startswith; ne e not varrem tudo) e devolver até 5.000 itens; "
+               "ordenar por coluna não indexada só funciona se o resultado couber no limite. O tempo é medido de verdade: busca no índice (hash ou searchsorted) contra máscara NumPy sobre a lista inteira.")
+
+
+# ══════════════════════════════════════════════
+# PERFORMANCE — LINHA DO TEMPO DO OnStart (SEQUENCIAL × Concurrent() × NAMED FORMULAS)
+# ══════════════════════════════════════════════
+BOOT_SAMPLE = """Set(gblPerfil, Office365Users.MyProfileV2());
+Set(gblConfig, LookUp(Configs_TB, Ativa = true));
+ClearCollect(colClientes, Filter(Clientes_TB, Regiao = gblPerfil.officeLocation));
+ClearCollect(colProdutos, Produtos_TB);
+ClearCollect(colCategorias, Categorias_TB);
+ClearCollect(colPedidos, Filter(Pedidos_TB, Vendedor = gblPerfil.mail));
+Set(gblMetas, LookUp(Metas_TB, Ano = Year(Today()) && Email = gblPerfil.mail));
+ClearCollect(colAvisos, Filter(Avisos_TB, Ativo = true));
+Navigate(If(gblConfig.Manutencao, telaManutencao, telaInicio))"""
+BOOT_STRATEGIES = ["Como escrito", "Sequencial", "Concurrent() em ondas", "Named formulas (lazy)"]
+BOOT_COLORS = ["#0050d0", "#5c2d91", "#0d9488", "#d97706", "#dc2626", "#2563eb", "#16a34a", "#9333ea"]
+
+def boot_steps(src: str) -> list:
+    """Quebra o OnStart em passos (itens do ';' e ramos de Concurrent) com o que cada um define, usa e chama."""
+    tree = pfx_parse(src)
+    items = tree["items"] if tree["t"] == "chain" else [tree]
+    steps = []
+    for g, item in enumerate(items):
+        parts = item["args"] if item["t"] == "call" and item["name"] == "Concurrent" else [item]
+        for n in parts:
+            calls = []
+            for x in pfx_walk(n):
+                if x["t"] != "call":
+                    continue
+                if "." in x["name"] and not PFX_CONTROL_RE.match(x["name"]):
+                    calls.append(x["name"].split(".")[0])
+                elif x["name"] in PFX_READ_FUNCS and x["args"] and pfx_is_source(x["args"][0]):
+                    calls.append(x["args"][0]["name"])
+                elif x["name"] in PFX_COLLECT:
+                    calls += [a["name"] for a in x["args"][1:] if pfx_is_source(a)]
+                elif x["name"] in PFX_WRITE_FUNCS and x["args"] and pfx_is_source(x["args"][0]):
+                    calls.append(x["args"][0]["name"])
+            target = n["args"][0]["name"] if (n["t"] == "call" and n["name"] in PFX_COLLECT | {"Set"}
+                                              and n["args"] and n["args"][0]["t"] == "id") else None
+            ids = {x["name"] for x in pfx_walk(n) if x["t"] == "id"}
+            steps.append({"label": src[n["pos"]:n.get("end", n["pos"] + 60)].strip(), "group": g, "defines": target,
+                          "named": target is not None and n["name"] != "Collect", "ids": ids - {target}, "calls": calls,
+                          "node": n})
+    defined = {}
+    for i, s in enumerate(steps):
+        # Depende do último passo anterior que definiu um nome usado aqui
+        s["deps"] = sorted({defined[x] for x in s["ids"] if x in defined})
+        if s["defines"]:
+            defined[s["defines"]] = i
+    return steps
+
+def boot_waves(steps: list) -> list:
+    level = []
+    for s in steps:
+        level.append(1 + max((level[d] for d in s["deps"]), default=-1))
+    return level
+
+def boot_plan(steps: list, strategy: str, needed: set) -> list:
+    """Para cada passo: (passos que precisam terminar antes, adiado?) segundo a estratégia."""
+    n = len(steps)
+    if strategy == "Sequencial":
+        return [([i - 1] if i else [], False) for i in range(n)]
+    if strategy == "Como escrito":
+        # Grupos do ';' em sequência; ramos de um mesmo Concurrent() juntos
+        prev = [[i for i, s in enumerate(steps) if s["group"] == g] for g in range(steps[-1]["group"] + 1)] if steps else []
+        return [([j for j in prev[s["group"] - 1]] if s["group"] else [], False) for s in steps]
+    if strategy == "Concurrent() em ondas":
+        level = boot_waves(steps)
+        return [([j for j in range(n) if level[j] == level[i] - 1], False) for i in range(n)]
+    # Named formulas: cada fórmula roda quando alguém a usa; só o que a primeira tela usa entra na abertura
+    keep = set()
+    stack = [i for i, s in enumerate(steps) if not s["named"] or s["defines"] in needed]
+    while stack:
+        i = stack.pop()
+        if i not in keep:
+            keep.add(i)
+            stack += steps[i]["deps"]
+    return [(steps[i]["deps"], i not in keep) for i in range(n)]
+
+async def boot_execute(steps: list, plan: list, latency: dict) -> list:
+    loop = asyncio.get_running_loop()
+    done = [loop.create_future() for _ in steps]
+    spans = [None] * len(steps)
+    startup = loop.create_future()
+    async def run(i):
+        deps, lazy = plan[i]
+        await asyncio.gather(*(done[d] for d in deps))
+        if lazy:
+            await startup   # named formula adiada: só avalia quando alguém a usa depois da abertura
+        t0, calls = loop.time(), []
+        for src in steps[i]["calls"]:
+            c0 = loop.time()
+            await asyncio.sleep(latency.get(src, 0) / 1000)   # camada de fonte de dados simulada
+            calls.append((src, c0, loop.time()))
+        spans[i] = (t0, loop.time(), calls)
+        done[i].set_result(None)
+    async def opening():
+        await asyncio.gather(*(done[i] for i, (_, lazy) in enumerate(plan) if not lazy))
+        startup.set_result(loop.time())
+    await asyncio.gather(opening(), *(run(i) for i in range(len(steps))))
+    return spans + [startup.result()]
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def boot_simulate(src: str, latency: tuple, needed: tuple) -> dict:
+    steps = boot_steps(src)
+    lat = dict(latency)
+    out = {}
+    for strategy in BOOT_STRATEGIES:
+        loop = FrtLoop()
+        try:
+            r = loop.run_until_complete(boot_execute(steps, boot_plan(steps, strategy, set(needed)), lat))
+        finally:
+            loop.close()
+        out[strategy] = {"spans": r[:-1], "startup": r[-1], "lazy": [p[1] for p in boot_plan(steps, strategy, set(needed))]}
+    return out
+
+def boot_rewrite(steps: list, strategy: str) -> str:
+    if strategy == "Concurrent() em ondas":
+        level = boot_waves(steps)
+        waves = []
+        for w in range(max(level) + 1 if level else 0):
+            ws = [steps[i]["label"] for i in range(len(steps)) if level[i] == w]
+            waves.append(ws[0] if len(ws) == 1 else "Concurrent(\n    " + ",\n    ".join(ws) + "\n)")
+        return ";\n".join(waves)
+    if strategy == "Named formulas (lazy)":
+        lines, rest = [], []
+        for s in steps:
+            n = s["node"]
+            if s["named"]:
+                # O valor começa logo após a primeira vírgula depois do nome (args[1]["pos"] é o operador em "a * 2")
+                name = re.compile(r"\s*('[^']*'|[^,']*)\s*,").match(s["label"], n["args"][0]["pos"] - n["pos"])
+                body = s["label"][name.end():].strip()
+                lines.append(f"{s['defines']} = {body[:-1].rstrip() if body.endswith(')') else body};")
+            else:
+                rest.append(s["label"])
+        return "// App.Formulas\n" + "\n".join(lines) + ("\n\n// App.OnStart (o que sobrou)\n" + ";\n".join(rest) if rest else "")
+    return ""
+
+def boot_waterfall(steps: list, r: dict, scale: float) -> str:
+    import html
+    rows = []
+    for i, (s, (t0, t1, calls)) in enumerate(zip(steps, r["spans"])):
+        bars = "".join(
+            f'<div title="{html.escape(src)}: {(c1 - c0) * 1000:,.0f} ms" style="position:absolute;left:{c0 / scale * 100:.2f}%;'
+            f'width:{max((c1 - c0) / scale * 100, .4):.2f}%;top:3px;height:16px;border-radius:4px;'
+            f'background:{BOOT_COLORS[int(hashlib.md5(src.encode()).hexdigest(), 16) % len(BOOT_COLORS)]};opacity:{.35 if r["lazy"][i] else .9}"></div>' for src, c0, c1 in calls)
+        if not calls:
+            bars = f'<div style="position:absolute;left:{t0 / scale * 100:.2f}%;top:7px;width:8px;height:8px;border-radius:50%;background:#94a3b8"></div>'
+        tag = " · adiada" if r["lazy"][i] else ""
+        rows.append(f'<div style="display:flex;align-items:center;gap:10px;margin:2px 0">'
+                    f'<div style="width:34%;font-size:.72rem;font-family:monospace;white-space:nowrap;overflow:hidden;text-overflow:ellipsis" '
+                    f'title="{html.escape(s["label"])}">{html.escape(s["label"][:70])}</div>'
+                    f'<div style="position:relative;flex:1;height:22px;background:#f8fafc;border-radius:4px">{bars}'
+                    f'<div style="position:absolute;left:{r["startup"] / scale * 100:.2f}%;top:0;bottom:0;border-left:2px dashed #dc2626"></div></div>'
+                    f'<div style="width:70px;font-size:.72rem;color:#64748b">{(t1 - t0) * 1000:,.0f} ms{tag}</div></div>')
+    return "".join(rows)
+
+def boot_timeline_lab(key: str):
+    import pandas as pd
+    lab_header("⏳ Laboratório — Linha do tempo do OnStart","Grafo de dependências das cargas, executado contra fontes simuladas (asyncio) em quatro estratégias")
+    c1,c2 = st.columns([1.3,1],gap="large")
+    with c1:
+        src = st.text_area("App.OnStart",BOOT_SAMPLE,height=230,key=f"{key}_src")
+    try:
+        steps = boot_steps(src) if src.strip() else []
+    except ValueError as e:
+        c1.error(f"❌ {e}")
+        return
+    if not steps:
+        c1.info("Cole uma fórmula de OnStart.")
+        return
+    sources = list(dict.fromkeys(c for s in steps for c in s["calls"]))
+    with c2:
+        col_label("🐢 Latência por fonte")
+        base = pd.DataFrame([{"Fonte": s, "Latência (ms)": 300 + int(hashlib.md5(s.encode()).hexdigest(), 16) % 1200} for s in sources])
+        lat = st.data_editor(base, hide_index=True, use_container_width=True, disabled=["Fonte"], key=f"{key}_lat_{len(sources)}",
+                             column_config={"Latência (ms)": st.column_config.NumberColumn(min_value=0, max_value=60_000, step=50)})
+        names = [s["defines"] for s in steps if s["named"]]
+        needed = st.multiselect("A primeira tela usa",names,[x for x in names if x.startswith("gbl")][:2],key=f"{key}_need")
+    latency = tuple((r["Fonte"], float(r["Latência (ms)"] or 0)) for _, r in lat.iterrows())
+    res = boot_simulate(src, latency, tuple(needed))
+    cols = st.columns(len(BOOT_STRATEGIES))
+    seq = res["Sequencial"]["startup"]
+    for c, strategy in zip(cols, BOOT_STRATEGIES):
+        t = res[strategy]["startup"]
+        c.metric(strategy, f"{t * 1000:,.0f} ms", f"{(t - seq) / seq:+.0%}" if seq and strategy != "Sequencial" else None, delta_color="inverse")
+    strategy = st.radio("Cascata",BOOT_STRATEGIES,index=2,horizontal=True,key=f"{key}_view")
+    r = res[strategy]
+    scale = max(max(x[1] for x in v["spans"]) for v in res.values()) or 1.0
+    st.markdown(boot_waterfall(steps, r, scale), unsafe_allow_html=True)
+    st.caption(f"Linha tracejada = app interativo em {r['startup'] * 1000:,.0f} ms · escala comum às quatro estratégias "
+               f"({scale * 1000:,.0f} ms) · {sum(len(s['calls']) for s in steps)} chamadas de dados em {len(steps)} passos"
+               + (" · barras claras = named formulas avaliadas só quando usadas" if any(r["lazy"]) else ""))
+    deps = [(steps[d]["defines"], s["label"][:50]) for s in steps for d in s["deps"]]
+    if deps:
+        st.caption("Dependências: " + " · ".join(f"{a} → {b}…" for a, b in deps))
+    rewrite = boot_rewrite(steps, strategy)
+    if rewrite:
+        st.code(rewrite, language="powerapps")
+
+
 def page_performance():
     st.markdown('<div class="main-wrap">',unsafe_allow_html=True)
     breadcrumb("Documentação","Performance & Delegação")
@@ -1498,10 +3558,380 @@ def page_performance():
 </tbody></table>""",unsafe_allow_html=True)
         st.code('// ✅ Carregar em paralelo no OnStart:\nConcurrent(\n    Set(gblUser, LookUp(Perfis, Email=User().Email)),\n    ClearCollect(colClientes, Clientes_TB),\n    ClearCollect(colProdutos, Produtos_TB)\n)\n// Concurrent() reduz tempo de carga em 60-80%!',language="powerapps")
     info_box("💡 <b>Regra de ouro:</b> Se sua lista tem mais de 500 itens, teste sempre com delegação real e observe o aviso azul ⚠️ no Power Apps Studio.","info")
+    st.divider()
+    powerfx_analyzer_lab("pfx_perf")
+    st.divider()
+    delegation_simulator_lab("dsim_perf")
+    st.divider()
+    boot_timeline_lab("boot_perf")
     st.markdown('</div>',unsafe_allow_html=True)
     section_quiz("performance")
 
 
+# ══════════════════════════════════════════════
+# SEGURANÇA — GRUPOS ANINHADOS DO AZURE AD (ENTRA ID)
+# ══════════════════════════════════════════════
+AAD_ROOTS = ["Todos", "Diretoria", "Financeiro", "Vendas", "TI", "RH", "Terceiros", "TI-Admins"]
+AAD_SAMPLES = {
+    "Financeiro (inclui aninhados)": '"Financeiro" in colGrupos.displayName',
+    "TI-Admins ou Diretoria":        '"TI-Admins" in colGrupos.displayName || "Diretoria" in colGrupos.displayName',
+    "Interno, exceto terceiros":     'EndsWith(User().Email, "@contoso.com") && IsEmpty(Filter(colGrupos, displayName = "Terceiros"))',
+    "Vendas sem RH":                 'And("Vendas" in colGrupos.displayName, Not("RH" in colGrupos.displayName))',
+}
+
+def aad_sample_file(groups: int, users: int, seed: int = 5) -> str:
+    # Exportação grupo → membro (grupo ou e-mail), com aninhamento profundo e alguns ciclos
+    import pandas as pd
+    path = os.path.join(SYNTH_DIR, f"aad_{groups}_{users}_{seed}.csv")
+    if os.path.exists(path):
+        return path
+    rng = np.random.default_rng(seed)
+    dept = list(range(len(AAD_ROOTS)))
+    names = list(AAD_ROOTS)
+    first = [-1, 0, 0, 0, 0, 0, -1, 4]
+    child, parent = [1, 2, 3, 4, 5, 7], [0, 0, 0, 0, 0, 4]
+    for g in range(len(AAD_ROOTS), groups):
+        p = int(rng.integers(1, g))
+        dept.append(dept[p] if p >= len(AAD_ROOTS) else p)
+        names.append(f"{AAD_ROOTS[dept[-1]]}-Equipe-{g:05d}")
+        first.append(p)
+        child.append(g); parent.append(p)
+        if rng.random() < .25:
+            child.append(g); parent.append(int(rng.integers(1, g)))
+    # Ciclos: um ancestral passa a ser membro de um descendente
+    for g in rng.integers(groups // 2, groups, 3):
+        a = int(g)
+        for _ in range(3):
+            if first[a] > len(AAD_ROOTS):
+                a = first[a]
+        if a != g:
+            child.append(a); parent.append(int(g))
+    names = np.array(names)
+    ext = rng.random(users) < .03
+    emails = np.array([f"u{i:06d}@{'parceiro.com' if e else 'contoso.com'}" for i, e in enumerate(ext)])
+    k = rng.choice([1, 2, 3], users, p=[.5, .35, .15])
+    mu = np.repeat(np.arange(users), k)
+    mg = rng.integers(len(AAD_ROOTS), groups, len(mu))
+    mg[ext[mu]] = 6
+    df = pd.DataFrame({"grupo": np.concatenate((names[parent], names[mg])),
+                       "membro": np.concatenate((names[child], emails[mu]))})
+    os.makedirs(SYNTH_DIR, exist_ok=True)
+    df.to_csv(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+    return path
+
+class AadGraph:
+    """
+    Grafo grupo → grupos-pai com fecho transitivo em bits (linha g = grupos dos quais g é membro).
+    Montado uma vez por SCC (Tarjan); inclusões de aresta são um OR nas linhas afetadas,
+    remoções recalculam só os grupos que alcançavam o membro.
+    """
+    def __init__(self, names: list, child, parent, emails, mem_user, mem_group):
+        self.names, self.index = list(names), {n: i for i, n in enumerate(names)}
+        self.n, self.width = len(names), (len(names) + 7) // 8
+        self.parents = [[] for _ in range(self.n)]
+        for c, p in zip(child.tolist(), parent.tolist()):
+            if p not in self.parents[c]:
+                self.parents[c].append(p)
+        self.emails, self.mem_user, self.mem_group = emails, mem_user, mem_group
+        self.edges = sum(map(len, self.parents))
+        self.anc = np.zeros((self.n, self.width), np.uint8)
+        t0 = time.perf_counter()
+        self.close(list(range(self.n)))
+        self.build_ms = (time.perf_counter() - t0) * 1000
+
+    def copy(self):
+        c = object.__new__(type(self))
+        c.__dict__.update(self.__dict__)
+        c.anc, c.parents = self.anc.copy(), [list(p) for p in self.parents]
+        return c
+
+    def column(self, g: int) -> np.ndarray:
+        return ((self.anc[:, g >> 3] >> (7 - (g & 7))) & 1).astype(bool)
+
+    def has(self, a: int, g: int) -> bool:
+        return bool((self.anc[a, g >> 3] >> (7 - (g & 7))) & 1)
+
+    def settle(self, comp: list):
+        row = np.zeros(self.width, np.uint8)
+        inside = set(comp)
+        for v in comp:
+            for p in self.parents[v]:
+                row[p >> 3] |= 0x80 >> (p & 7)
+                if p not in inside:
+                    row |= self.anc[p]
+        self.anc[comp] = row
+
+    def close(self, nodes: list):
+        # Tarjan iterativo: cada SCC sai depois dos SCCs-pai, então as linhas dos pais já estão prontas.
+        # Pais fora de `nodes` mantêm a linha atual.
+        inside = np.zeros(self.n, bool)
+        inside[nodes] = True
+        index, low, stack, on = {}, {}, [], set()
+        for root in nodes:
+            if root in index:
+                continue
+            work = [(root, 0)]
+            while work:
+                v, i = work.pop()
+                if i == 0:
+                    index[v] = low[v] = len(index)
+                    stack.append(v); on.add(v)
+                ps = self.parents[v]
+                while i < len(ps):
+                    p = ps[i]; i += 1
+                    if not inside[p]:
+                        continue
+                    if p not in index:
+                        work.append((v, i)); work.append((p, 0))
+                        break
+                    if p in on:
+                        low[v] = min(low[v], index[p])
+                else:
+                    if low[v] == index[v]:
+                        comp = []
+                        while True:
+                            w = stack.pop(); on.discard(w); comp.append(w)
+                            if w == v:
+                                break
+                        self.settle(comp)
+                    if work:
+                        u = work[-1][0]
+                        low[u] = min(low[u], low[v])
+
+    def affected(self, g: int) -> np.ndarray:
+        # Grupos que alcançam g (inclusive) — os únicos cujo fecho depende das arestas de saída de g
+        a = self.column(g)
+        a[g] = True
+        return np.flatnonzero(a)
+
+    def add(self, child: int, parent: int) -> bool:
+        """Inclui `child` como membro de `parent`; devolve True se a aresta fecha um ciclo."""
+        if parent in self.parents[child]:
+            raise ValueError(f"{self.names[child]} já é membro direto de {self.names[parent]}.")
+        cycle = child == parent or self.has(parent, child)
+        self.parents[child].append(parent)
+        self.edges += 1
+        row = self.anc[parent].copy()
+        row[parent >> 3] |= 0x80 >> (parent & 7)
+        self.anc[self.affected(child)] |= row
+        return cycle
+
+    def remove(self, child: int, parent: int):
+        if parent not in self.parents[child]:
+            raise ValueError(f"{self.names[child]} não é membro direto de {self.names[parent]}.")
+        rows = self.affected(child)
+        self.parents[child].remove(parent)
+        self.edges -= 1
+        self.anc[rows] = 0
+        self.close(rows.tolist())
+
+    def cycles(self) -> np.ndarray:
+        g = np.arange(self.n)
+        return np.flatnonzero((self.anc[g, g >> 3] >> (7 - (g & 7))) & 1)
+
+    def members(self, g: int) -> np.ndarray:
+        # Usuários com g no fecho: algum grupo direto é g ou tem g como ancestral
+        col = self.column(g)
+        col[g] = True
+        hit = col[self.mem_group]
+        return np.bincount(self.mem_user[hit], minlength=len(self.emails)) > 0
+
+    def path(self, starts: list, target: int) -> list:
+        prev = {s: None for s in starts}
+        queue = list(starts)
+        for v in queue:
+            if v == target:
+                out = []
+                while v is not None:
+                    out.append(self.names[v]); v = prev[v]
+                return out[::-1]
+            for p in self.parents[v]:
+                if p not in prev:
+                    prev[p] = v; queue.append(p)
+        return []
+
+    def group(self, name: str) -> int:
+        if name not in self.index:
+            raise ValueError(f"Grupo '{name}' não existe no grafo.")
+        return self.index[name]
+
+@st.cache_resource(max_entries=4, show_spinner="Calculando o fecho transitivo…")
+def aad_graph(digest: str, _open) -> AadGraph:
+    import pandas as pd
+    with _open() as fp:
+        try:
+            df = pd.read_csv(fp, dtype=str, keep_default_na=False)
+        except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+            raise ValueError(f"CSV inválido: {e}") from None
+    df.columns = [c.strip().lower() for c in df.columns]
+    if not {"grupo", "membro"} <= set(df.columns):
+        raise ValueError("O CSV precisa das colunas 'grupo' e 'membro' (membro = nome de grupo ou e-mail).")
+    grp, mem = df["grupo"].str.strip().to_numpy(), df["membro"].str.strip().to_numpy()
+    is_user = np.char.find(mem.astype(str), "@") >= 0
+    names = pd.unique(np.concatenate((grp, mem[~is_user])))
+    index = pd.Index(names)
+    emails, mem_user = np.unique(np.char.lower(mem[is_user].astype(str)), return_inverse=True)
+    return AadGraph(names, index.get_indexer(mem[~is_user]), index.get_indexer(grp[~is_user]),
+                    emails, mem_user.ravel(), index.get_indexer(grp[is_user]))
+
+def aad_group_arg(node) -> Optional[str]:
+    # Filter(colGrupos, displayName = "X") / LookUp(...) → "X"
+    if node["t"] != "call" or node["name"] not in ("Filter", "LookUp") or len(node["args"]) != 2:
+        return None
+    pred = node["args"][1]
+    if pred["t"] == "bin" and pred["op"] == "=":
+        for a, b in ((pred["l"], pred["r"]), (pred["r"], pred["l"])):
+            if a["t"] == "id" and a["name"] == "displayName" and b["t"] == "str":
+                return b["v"]
+    return None
+
+def aad_kind(v) -> str:
+    k = np.asarray(v).dtype.kind
+    return "texto" if k in "US" else "lógico" if k == "b" else "número" if k in "iuf" else type(v).__name__
+
+def aad_need(v, kind: str, what: str, node):
+    # Operandos do tipo errado viram erro legível, não TypeError do NumPy
+    if aad_kind(v) != kind:
+        raise ValueError(f"{what} na posição {node['pos']} espera {kind}, mas recebeu {aad_kind(v)}.")
+    return v
+
+def aad_eval(node, ctx: dict):
+    """Avalia uma fórmula Visible para todos os usuários de uma vez (arrays booleanos)."""
+    t = node["t"]
+    if t == "str":
+        return node["v"]
+    if t == "id" and node["name"] in ("true", "false"):
+        return node["name"] == "true"
+    if t == "dot" and pfx_dotted(node) == "User.Email":
+        return ctx["email"]
+    if t == "un" and node["op"] in ("!", "Not"):
+        return np.logical_not(aad_need(aad_eval(node["x"], ctx), "lógico", "Not", node))
+    if t == "bin":
+        op, r = node["op"], node["r"]
+        if op in ("in", "exactin") and (r["t"] == "dot" and r["name"] == "displayName" or r["t"] == "id" and r["name"].startswith(PFX_VAR_PREFIX)):
+            group = aad_eval(node["l"], ctx)
+            if not isinstance(group, str):
+                raise ValueError(f"Antes de \"{op}\" (posição {node['pos']}) deve vir o nome do grupo entre aspas, ex.: \"Financeiro\".")
+            return ctx["member"](group)
+        l, r = aad_eval(node["l"], ctx), aad_eval(r, ctx)
+        if op in ("&&", "And", "||", "Or"):
+            red = np.logical_and if op in ("&&", "And") else np.logical_or
+            return red(aad_need(l, "lógico", op, node), aad_need(r, "lógico", op, node))
+        if op in ("=", "<>"):
+            if aad_kind(l) != aad_kind(r) or aad_kind(l) not in ("texto", "lógico"):
+                raise ValueError(f"\"{op}\" na posição {node['pos']} compara {aad_kind(l)} com {aad_kind(r)}.")
+            eq = np.char.lower(l) == np.char.lower(r) if aad_kind(l) == "texto" else np.equal(l, r)
+            return eq if op == "=" else np.logical_not(eq)
+        if op == "in":
+            return np.char.find(np.char.lower(aad_need(r, "texto", "in", node)), np.char.lower(aad_need(l, "texto", "in", node))) >= 0
+    if t == "call":
+        name, args = node["name"], node["args"]
+        if name in ("And", "Or"):
+            red = np.logical_and if name == "And" else np.logical_or
+            return red.reduce([np.broadcast_to(aad_need(aad_eval(a, ctx), "lógico", f"{name}()", a), ctx["email"].shape) for a in args])
+        if name == "Not" and len(args) == 1:
+            return np.logical_not(aad_need(aad_eval(args[0], ctx), "lógico", "Not()", args[0]))
+        if name in ("StartsWith", "EndsWith") and len(args) == 2:
+            fn = np.char.startswith if name == "StartsWith" else np.char.endswith
+            return fn(np.char.lower(aad_need(aad_eval(args[0], ctx), "texto", f"{name}()", args[0])),
+                      str(aad_need(aad_eval(args[1], ctx), "texto", f"{name}()", args[1])).lower())
+        if name in ("IsEmpty", "IsBlank") and len(args) == 1 and aad_group_arg(args[0]):
+            return np.logical_not(ctx["member"](aad_group_arg(args[0])))
+    raise ValueError(f"Trecho não suportado no simulador na posição {node['pos']} — use \"Grupo\" in colGrupos.displayName, "
+                     "IsEmpty(Filter(colGrupos, displayName = \"Grupo\")), User().Email, And/Or/Not.")
+
+def aad_groups_lab(key: str):
+    import io
+    import pandas as pd
+    lab_header("🧩 Grupos aninhados do Azure AD → Visible","Fecho transitivo das associações calculado uma vez e atualizado por deltas; a fórmula é avaliada para todos os usuários")
+    c1,c2 = st.columns([1,1.3],gap="large")
+    with c1:
+        src = st.radio("Grafo de grupos",["Sintético","Enviar CSV"],horizontal=True,key=f"{key}_src")
+        if src == "Sintético":
+            a1,a2 = st.columns(2)
+            groups = a1.select_slider("Grupos",[1_000,5_000,10_000],5_000,format_func=lambda v: f"{v:,}",key=f"{key}_ng")
+            users = a2.select_slider("Usuários",[5_000,20_000,100_000],20_000,format_func=lambda v: f"{v:,}",key=f"{key}_nu")
+            path = aad_sample_file(groups, users)
+            digest, opener = f"{path}:{os.path.getsize(path)}", lambda: open(path, "rb")
+        else:
+            up = st.file_uploader("CSV com colunas grupo, membro",type=["csv"],key=f"{key}_up")
+            if up is None:
+                info_box("Exporte os membros de cada grupo (ex.: Get-MgGroupMember) como <code>grupo,membro</code> — membro é o nome de outro grupo ou o e-mail do usuário.", "info")
+                return
+            raw = up.getvalue()
+            digest, opener = hashlib.sha1(raw).hexdigest(), lambda: io.BytesIO(raw)
+    try:
+        base = aad_graph(digest, opener)
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return
+    g = st.session_state.get(f"{key}_g")
+    if g is None or st.session_state.get(f"{key}_digest") != digest:
+        g = base.copy()
+        st.session_state[f"{key}_g"], st.session_state[f"{key}_digest"] = g, digest
+    with c1:
+        col_label("✏️ Alterar aninhamento")
+        e1,e2 = st.columns(2)
+        child = e1.text_input("Grupo membro","Financeiro",key=f"{key}_child")
+        parent = e2.text_input("Grupo pai",next((n for n in g.names[len(AAD_ROOTS):] if n.startswith("Financeiro-")), g.names[-1]),key=f"{key}_parent")
+        b1,b2,b3 = st.columns(3)
+        try:
+            if b1.button("➕ Incluir",key=f"{key}_add",use_container_width=True):
+                t0 = time.perf_counter()
+                cycle = g.add(g.group(child.strip()), g.group(parent.strip()))
+                st.toast(f"{'🔁 Ciclo criado! ' if cycle else ''}Fecho atualizado em {(time.perf_counter() - t0) * 1000:,.2f} ms")
+            if b2.button("➖ Remover",key=f"{key}_rm",use_container_width=True):
+                t0 = time.perf_counter()
+                g.remove(g.group(child.strip()), g.group(parent.strip()))
+                st.toast(f"Fecho atualizado em {(time.perf_counter() - t0) * 1000:,.2f} ms")
+        except ValueError as e:
+            st.error(f"❌ {e}")
+        if b3.button("↩️ Original",key=f"{key}_reset",use_container_width=True):
+            g = st.session_state[f"{key}_g"] = base.copy()
+        m1,m2,m3 = st.columns(3)
+        m1.metric("Grupos", f"{g.n:,}")
+        m2.metric("Aninhamentos", f"{g.edges:,}", f"{len(g.mem_user):,} associações de usuário", delta_color="off")
+        m3.metric("Fecho inicial", f"{g.build_ms:,.0f} ms")
+        cyc = g.cycles()
+        if len(cyc):
+            st.warning(f"🔁 {len(cyc):,} grupos em ciclos de aninhamento: " + ", ".join(g.names[i] for i in cyc[:6]) + (" …" if len(cyc) > 6 else ""))
+    with c2:
+        pick = st.selectbox("Exemplo",list(AAD_SAMPLES),key=f"{key}_ex")
+        src = st.text_area("btnAprovar.Visible =",AAD_SAMPLES[pick],height=90,key=f"{key}_f_{pick}")
+        asked, cache = [], {}
+        def member(name):
+            if name not in cache:
+                cache[name] = g.members(g.group(str(name)))
+                asked.append(g.index[name])
+            return cache[name]
+        try:
+            t0 = time.perf_counter()
+            tree = pfx_parse(src)
+            vis = np.broadcast_to(aad_need(aad_eval(tree, {"email": g.emails, "member": member}), "lógico", "A fórmula Visible", tree), g.emails.shape)
+            ms = (time.perf_counter() - t0) * 1000
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            return
+        n1,n2,n3 = st.columns(3)
+        n1.metric("Usuários", f"{len(g.emails):,}")
+        n2.metric("Veem o controle", f"{int(vis.sum()):,}", f"{vis.mean():.1%}", delta_color="off")
+        n3.metric("Avaliado em", f"{ms:,.1f} ms")
+        u = st.number_input("Inspecionar usuário (índice)",0,len(g.emails) - 1,0,key=f"{key}_user")
+        direct = g.mem_group[g.mem_user == u].tolist()
+        rows = [{"Grupo": g.names[a], "Membro?": "✅" if g.members(a)[u] else "—",
+                 "Caminho": " → ".join([g.emails[u]] + g.path(direct, a)) if g.members(a)[u] else "—"} for a in asked]
+        st.markdown(f"**{g.emails[u]}** — {'👁️ vê' if vis[u] else '🚫 não vê'} o controle · grupos diretos: {', '.join(g.names[d] for d in direct)}")
+        if rows:
+            st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+    st.code('// App.OnStart — grupos transitivos (inclui aninhados) em uma chamada:\n'
+            'ClearCollect(colGrupos,\n    ForAll(Table(ParseJSON(Office365Groups.HttpRequest(\n'
+            '        "https://graph.microsoft.com/v1.0/me/transitiveMemberOf/microsoft.graph.group?$select=displayName",\n'
+            '        "GET")).value),\n    {displayName: Text(ThisRecord.Value.displayName)})\n);\n'
+            f'// Uso:\nbtnAprovar.Visible = {src}', language="powerapps")
+    info_box("⚠️ <b>Office365Groups.ListGroupMembers</b> devolve só os membros <b>diretos</b> — um usuário em um subgrupo de Financeiro não aparece. Use <code>transitiveMemberOf</code> uma vez no OnStart e teste contra <code>colGrupos</code>; ciclos de aninhamento não quebram o fecho, mas indicam grupos redundantes.", "warning")
+
+
 def page_seguranca():
     st.markdown('<div class="main-wrap">',unsafe_allow_html=True)
     breadcrumb("Documentação","Segurança por Perfil")
@@ -1521,6 +3951,8 @@ def page_seguranca():
         formula_card("Lista de Perfis no SharePoint","Controle de acesso sem licenças extras.",
             "Crie uma lista 'Perfis_TB' com Email e NivelAcesso. Simples e eficaz.",
             '// App.OnStart:\nSet(gblNivel,\n    LookUp(Perfis_TB,\n           Email = User().Email).NivelAcesso\n)\n// Valores possíveis: "Admin", "Editor", "Viewer"\n// Uso:\nbtnConf.Visible = gblNivel = "Admin"',color="#9d174d")
+    st.divider()
+    aad_groups_lab("aad_seg")
     st.markdown('</div>',unsafe_allow_html=True)
     section_quiz("seguranca")
 
@@ -1542,6 +3974,8 @@ def page_conectores():
 <tr><td class="conn-nm">✅ Microsoft Planner</td><td>Tarefas, buckets, kanban</td><td>API limitada. Sem campos personalizados.</td></tr>
 <tr><td class="conn-nm">💬 Microsoft Teams</td><td>Postar em canais, deep link, tabs</td><td>Melhor canal de distribuição de apps.</td></tr>
 </tbody></table>""",unsafe_allow_html=True)
+        sp()
+        sharepoint_index_lab("spl_conn")
     with t2:
         st.warning("**Requer Per App (~R$25/app/user/mês) ou Per User (~R$50/user/mês)**")
         st.markdown("""<table class="conn-tbl">
@@ -1558,6 +3992,21 @@ def page_conectores():
     section_quiz("conectores")
 
 
+def variaveis_collection():
+    if st.session_state.my_col is None:
+        col = ColCollection({"Produto":"text", "Valor":"num", "Qtd":"int"}, max_rows=10_000)
+        col.add_columns("Total", "Valor * Qtd")
+        st.session_state.my_col = col
+    return st.session_state.my_col
+
+def vendas_records(start: int, k: int) -> list:
+    # Next k products from the shared synthetic Vendas table (wraps around)
+    vendas = synth_table("Vendas", 10_000)
+    idx = (np.arange(start, start + k) % 10_000)
+    return [{"Produto":p, "Valor":float(v), "Qtd":int(q)}
+            for p, v, q in zip(vendas["Produto"][idx].decode(), vendas["Valor"][idx], vendas["Qtd"][idx])]
+
+
 def page_variaveis():
     st.markdown('<div class="main-wrap">',unsafe_allow_html=True)
     breadcrumb("Documentação","Variáveis na Prática")
@@ -1590,20 +4039,40 @@ def page_variaveis():
         st.code(f'Set(gblUser, "{st.session_state.gbl_user}")',language="powerapps")
     st.divider()
     st.markdown("#### Demo: Collections")
+    col=variaveis_collection()
     c1,c2=st.columns([1,3])
     with c1:
-        if st.button("➕ Collect()",key="col_add"):
-            n=len(st.session_state.my_col)+1
-            st.session_state.my_col.append({"Produto":f"Prod {n}","Valor":random.randint(10,99),"Qtd":random.randint(1,5)})
-        if st.button("🗑️ Clear()",key="col_clr"):
-            st.session_state.my_col=[]
+        try:
+            if st.button("➕ Collect()",key="col_add"):
+                col.collect(*vendas_records(col.seq,1))
+            if st.button("➕ Collect() ×1.000",key="col_add_k"):
+                col.collect(*vendas_records(col.seq,1_000))
+            if st.button("🔄 ClearCollect() ×10",key="col_cc"):
+                col.clear_collect(*vendas_records(0,10))
+            if st.button("🗑️ Clear()",key="col_clr"):
+                col.clear()
+            cond=st.text_input("RemoveIf(colCarrinho, …)",'Qtd = 1 || Produto = "Mouse"',key="col_rif")
+            if st.button("🧹 RemoveIf()",key="col_rif_btn"):
+                st.toast(f"{col.remove_if(cond):,} registro(s) removido(s)")
+            if col.n:
+                pr=st.number_input("Patch — linha",1,col.n,1,key=f"col_pr_{col.n}")
+                pq=st.number_input("Nova Qtd",1,99,5,key="col_pq")
+                if st.button("✏️ Patch()",key="col_patch"):
+                    col.patch(int(pr)-1,{"Qtd":int(pq)})
+                if st.button("❌ Remove() linha",key="col_rm"):
+                    col.remove([int(pr)-1])
+        except ValueError as e:
+            st.error(f"❌ {e}")
     with c2:
-        if st.session_state.my_col:
-            import pandas as pd
-            df=pd.DataFrame(st.session_state.my_col)
-            df["Total"]=df["Valor"]*df["Qtd"]
-            st.dataframe(df,use_container_width=True)
-            st.caption(f"Total: R$ {df['Total'].sum()}")
+        m1,m2,m3,m4=st.columns(4)
+        m1.metric("CountRows()",f"{col.count_rows():,}")
+        m2.metric("Sum(Qtd)",f"{col.sum('Qtd'):,.0f}")
+        m3.metric("Sum(Total)",f"R$ {col.sum('Total'):,.2f}")
+        m4.metric("Memória",f"{col.nbytes()/1024:,.1f} KB",f"máx. {col.max_rows:,} linhas",delta_color="off")
+        if col.n:
+            st.dataframe(col.to_arrow(),use_container_width=True,hide_index=True,height=300)
+            if col.n>500: st.caption(f"Exibindo as últimas 500 de {col.n:,} linhas")
+        st.code('Collect(colCarrinho, {Produto: "...", Valor: 99, Qtd: 1})\nClearCollect(colCarrinho, Vendas)\nRemoveIf(colCarrinho, ' + cond + ')\nPatch(colCarrinho, Index(colCarrinho, 1), {Qtd: 5})\n\n// Coluna calculada:\nAddColumns(colCarrinho, "Total", Valor * Qtd)\nCountRows(colCarrinho)  |  Sum(colCarrinho, Total)',language="powerapps")
     st.markdown('</div>',unsafe_allow_html=True)
     section_quiz("variaveis")
 
@@ -2211,13 +4680,920 @@ def page_automate_fundamentos():
     st.markdown('</div>', unsafe_allow_html=True)
 
 
+# ─────────────────────────────────────────────
+# POWER AUTOMATE — MOTOR DE EXPRESSÕES (WDL)
+# ─────────────────────────────────────────────
+WDL_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<str>'(?:[^']|'')*')
+  | (?P<num>-?\d+(?:\.\d+)?(?![A-Za-z_]))
+  | (?P<id>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op>\?\[|\?\.|[()\[\],.])
+""", re.X)
+
+WDL_TZ = {
+    "UTC": "UTC", "Coordinated Universal Time": "UTC",
+    "E. South America Standard Time": "America/Sao_Paulo",
+    "SA Western Standard Time": "America/Manaus",
+    "SA Eastern Standard Time": "America/Fortaleza",
+    "Argentina Standard Time": "America/Argentina/Buenos_Aires",
+    "Eastern Standard Time": "America/New_York",
+    "Central Standard Time": "America/Chicago",
+    "Pacific Standard Time": "America/Los_Angeles",
+    "GMT Standard Time": "Europe/London",
+    "W. Europe Standard Time": "Europe/Berlin",
+    "Romance Standard Time": "Europe/Paris",
+    "GTB Standard Time": "Europe/Lisbon",
+    "India Standard Time": "Asia/Kolkata",
+    "Tokyo Standard Time": "Asia/Tokyo",
+}
+WDL_MONTHS = {"en-US": ["January","February","March","April","May","June","July","August","September","October","November","December"],
+              "pt-BR": ["janeiro","fevereiro","março","abril","maio","junho","julho","agosto","setembro","outubro","novembro","dezembro"]}
+WDL_DAYS   = {"en-US": ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"],
+              "pt-BR": ["segunda-feira","terça-feira","quarta-feira","quinta-feira","sexta-feira","sábado","domingo"]}
+WDL_FMT_RE = re.compile(r"yyyy|yy|MMMM|MMM|MM|M|dddd|ddd|dd|d|HH|H|hh|h|mm|m|ss|s|f{1,7}|tt|zzz|K|'[^']*'|\\.|.")
+WDL_RANGE_MAX = 100_000
+WDL_NUMBER_MAX_DEC = 99   # precisão máxima do formatNumber (como no .NET Framework)
+
+def wdl_ts(value) -> datetime.datetime:
+    if isinstance(value, datetime.datetime):
+        return value
+    s = str(value).strip()
+    # .NET emite até 7 casas decimais e 'Z'; fromisoformat aceita no máximo 6 e, antes do 3.11, não aceita 'Z'
+    s = re.sub(r"(\.\d{6})\d+", r"\1", s)
+    s = re.sub(r"Z$", "+00:00", s)
+    try:
+        dt = datetime.datetime.fromisoformat(s)
+    except ValueError:
+        raise ValueError(f"'{value}' não é um timestamp ISO 8601 válido.")
+    return dt if dt.tzinfo else dt.replace(tzinfo=datetime.timezone.utc)
+
+def wdl_tz(name: str):
+    import zoneinfo
+    try:
+        return zoneinfo.ZoneInfo(WDL_TZ.get(name, name))
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Fuso horário desconhecido: '{name}'.")
+
+def wdl_format_ts(dt: datetime.datetime, fmt: str = "o", locale: str = "en-US") -> str:
+    utc = dt.utcoffset() == datetime.timedelta(0)
+    if fmt in (None, "", "o", "O"):
+        return dt.strftime("%Y-%m-%dT%H:%M:%S.%f") + "0" + ("Z" if utc else dt.strftime("%z")[:3] + ":" + dt.strftime("%z")[3:])
+    std = {"s": "yyyy-MM-ddTHH:mm:ss", "u": "yyyy-MM-dd HH:mm:ssZ", "d": "MM/dd/yyyy" if locale == "en-US" else "dd/MM/yyyy",
+           "D": "dddd, MMMM d, yyyy" if locale == "en-US" else "dddd, d' de 'MMMM' de 'yyyy", "t": "HH:mm", "T": "HH:mm:ss",
+           "g": "dd/MM/yyyy HH:mm", "G": "dd/MM/yyyy HH:mm:ss"}
+    fmt = std.get(fmt, fmt)
+    months, days = WDL_MONTHS.get(locale, WDL_MONTHS["en-US"]), WDL_DAYS.get(locale, WDL_DAYS["en-US"])
+    out = []
+    for tok in WDL_FMT_RE.findall(fmt):
+        if tok == "yyyy":   out.append(f"{dt.year:04d}")
+        elif tok == "yy":   out.append(f"{dt.year % 100:02d}")
+        elif tok == "MMMM": out.append(months[dt.month - 1])
+        elif tok == "MMM":  out.append(months[dt.month - 1][:3])
+        elif tok == "MM":   out.append(f"{dt.month:02d}")
+        elif tok == "M":    out.append(str(dt.month))
+        elif tok == "dddd": out.append(days[dt.weekday()])
+        elif tok == "ddd":  out.append(days[dt.weekday()][:3])
+        elif tok == "dd":   out.append(f"{dt.day:02d}")
+        elif tok == "d":    out.append(str(dt.day))
+        elif tok == "HH":   out.append(f"{dt.hour:02d}")
+        elif tok == "H":    out.append(str(dt.hour))
+        elif tok == "hh":   out.append(f"{(dt.hour % 12) or 12:02d}")
+        elif tok == "h":    out.append(str((dt.hour % 12) or 12))
+        elif tok == "mm":   out.append(f"{dt.minute:02d}")
+        elif tok == "m":    out.append(str(dt.minute))
+        elif tok == "ss":   out.append(f"{dt.second:02d}")
+        elif tok == "s":    out.append(str(dt.second))
+        elif tok[0] == "f": out.append(f"{dt.microsecond:06d}0"[:len(tok)])
+        elif tok == "tt":   out.append("AM" if dt.hour < 12 else "PM")
+        elif tok in ("zzz", "K"):
+            z = dt.strftime("%z")
+            out.append("Z" if tok == "K" and utc else f"{z[:3]}:{z[3:]}")
+        elif tok[0] == "'": out.append(tok[1:-1])
+        elif tok[0] == "\\": out.append(tok[1:])
+        else:               out.append(tok)
+    return "".join(out)
+
+def wdl_parse_ts(text, *rest):
+    # parseDateTime('<texto>', '<locale>'?, '<formato>'?) — o formato .NET vira um regex
+    fmt = next((r for r in rest if r and re.search(r"[yMdHhms]", r)), None)
+    if not fmt:
+        return wdl_format_ts(wdl_ts(text))
+    pattern = ""
+    for tok in WDL_FMT_RE.findall(fmt):
+        if tok in ("yyyy","MM","M","dd","d","HH","H","mm","m","ss","s"):
+            pattern += rf"(?P<{tok[0]}>\d{{1,4}})"
+        elif tok[0] == "'":
+            pattern += re.escape(tok[1:-1])
+        else:
+            pattern += re.escape(tok)
+    m = re.fullmatch(pattern, str(text).strip())
+    if not m:
+        raise ValueError(f"'{text}' não corresponde ao formato '{fmt}'.")
+    g = {k: int(v) for k, v in m.groupdict().items()}
+    dt = datetime.datetime(g.get("y", 1), g.get("M", 1), g.get("d", 1), g.get("H", 0), g.get("m", 0), g.get("s", 0),
+                           tzinfo=datetime.timezone.utc)
+    return wdl_format_ts(dt)
+
+def wdl_format_number(n, fmt: str, locale: str = "en-US") -> str:
+    n = float(n)
+    m = re.fullmatch(r"([CcNnFfPp])(\d*)", fmt)
+    if m:
+        kind, dec = m.group(1).upper(), int(m.group(2) or 2)
+        if dec > WDL_NUMBER_MAX_DEC:
+            raise ValueError(f"formatNumber(): precisão {dec:,} acima do máximo ({WDL_NUMBER_MAX_DEC}).")
+        if kind == "P":
+            n *= 100
+        s = f"{n:,.{dec}f}" if kind in ("C", "N", "P") else f"{n:.{dec}f}"
+    else:
+        dec = len(fmt.split(".")[1].rstrip("#")) if "." in fmt else 0
+        opt = len(fmt.split(".")[1]) - dec if "." in fmt else 0
+        if dec + opt > WDL_NUMBER_MAX_DEC:
+            raise ValueError(f"formatNumber(): mais de {WDL_NUMBER_MAX_DEC} casas decimais no formato.")
+        s = f"{n:,.{dec + opt}f}" if "," in fmt else f"{n:.{dec + opt}f}"
+        if opt and "." in s:
+            s = s.rstrip("0").rstrip(".") if len(s.split(".")[1].rstrip("0")) >= dec else s
+        kind = ""
+    if locale.startswith("pt"):
+        s = s.replace(",", "\x00").replace(".", ",").replace("\x00", ".")
+    if kind == "C":
+        s = ("R$ " if locale.startswith("pt") else "$") + s
+    elif kind == "P":
+        s += " %" if locale.startswith("pt") else "%"
+    return s
+
+def wdl_str(v) -> str:
+    if v is None: return ""
+    if isinstance(v, bool): return "True" if v else "False"
+    if isinstance(v, float) and v.is_integer(): return str(int(v))
+    if isinstance(v, (dict, list)): return json.dumps(v, ensure_ascii=False, separators=(",", ":"))
+    return str(v)
+
+def wdl_num(v):
+    if isinstance(v, bool) or v is None:
+        raise ValueError(f"Valor '{wdl_str(v)}' não é numérico.")
+    if isinstance(v, (int, float)):
+        return v
+    try:
+        return int(v) if re.fullmatch(r"-?\d+", str(v).strip()) else float(v)
+    except ValueError:
+        raise ValueError(f"Valor '{v}' não pode ser convertido em número.")
+
+def wdl_bool(v) -> bool:
+    if isinstance(v, bool): return v
+    if isinstance(v, (int, float)): return v != 0
+    if isinstance(v, str) and v.lower() in ("true", "false"): return v.lower() == "true"
+    raise ValueError(f"Valor '{wdl_str(v)}' não pode ser convertido em booleano.")
+
+def wdl_length(v):
+    if v is None:
+        raise ValueError("length() recebeu nulo — use coalesce() ou o operador ?.")
+    return len(v)
+
+def wdl_contains(coll, value):
+    if isinstance(coll, str): return str(value) in coll
+    if isinstance(coll, dict): return value in coll
+    return value in (coll or [])
+
+def wdl_shift(unit):
+    def fn(ts, n, fmt="o"):
+        return wdl_format_ts(wdl_ts(ts) + datetime.timedelta(**{unit: wdl_num(n)}), fmt)
+    return fn
+
+def wdl_date_diff(a, b):
+    d = wdl_ts(b) - wdl_ts(a)
+    sign = "-" if d.total_seconds() < 0 else ""
+    d = abs(d)
+    h, rem = divmod(d.seconds, 3600)
+    return f"{sign}{d.days}.{h:02d}:{rem // 60:02d}:{rem % 60:02d}" if d.days else f"{sign}{h:02d}:{rem // 60:02d}:{rem % 60:02d}"
+
+def wdl_div(a, b):
+    a, b = wdl_num(a), wdl_num(b)
+    if b == 0:
+        raise ValueError("Divisão por zero.")
+    return a // b if isinstance(a, int) and isinstance(b, int) else a / b
+
+def wdl_mod(a, b):
+    a, b = wdl_num(a), wdl_num(b)
+    if b == 0:
+        raise ValueError("Divisão por zero em mod().")
+    return a % b
+
+def wdl_range(a, n):
+    # O motor real recusa range() com mais de 100.000 itens
+    a, n = int(wdl_num(a)), int(wdl_num(n))
+    if not 0 <= n <= WDL_RANGE_MAX:
+        raise ValueError(f"range(): a quantidade deve estar entre 0 e {WDL_RANGE_MAX:,} (recebido {n:,}).")
+    return list(range(a, a + n))
+
+def wdl_union(*xs):
+    if all(isinstance(x, dict) for x in xs):
+        out = {}
+        for x in xs: out.update(x)
+        return out
+    out = []
+    for x in xs:
+        for v in x:
+            if v not in out: out.append(v)
+    return out
+
+def wdl_convert_tz(ts, src, dst, fmt="o"):
+    dt = wdl_ts(ts)
+    if src and str(src) not in ("UTC", "Coordinated Universal Time"):
+        dt = dt.replace(tzinfo=wdl_tz(src))
+    return wdl_format_ts(dt.astimezone(wdl_tz(dst)), fmt)
+
+WDL_FUNCS = {
+    # texto
+    "concat":      lambda *a: "".join(wdl_str(x) for x in a),
+    "toUpper":     lambda s: wdl_str(s).upper(),
+    "toLower":     lambda s: wdl_str(s).lower(),
+    "substring":   lambda s, i, n=None: wdl_str(s)[int(i):] if n is None else wdl_str(s)[int(i):int(i) + int(n)],
+    "slice":       lambda s, i, j=None: wdl_str(s)[int(i):None if j is None else int(j)],
+    "replace":     lambda s, a, b: wdl_str(s).replace(wdl_str(a), wdl_str(b)),
+    "trim":        lambda s: wdl_str(s).strip(),
+    "split":       lambda s, sep: wdl_str(s).split(wdl_str(sep)),
+    "join":        lambda arr, sep: wdl_str(sep).join(wdl_str(x) for x in arr),
+    "indexOf":     lambda s, x: (s.index(x) if x in s else -1) if isinstance(s, list) else wdl_str(s).lower().find(wdl_str(x).lower()),
+    "lastIndexOf": lambda s, x: wdl_str(s).lower().rfind(wdl_str(x).lower()),
+    "startsWith":  lambda s, x: wdl_str(s).lower().startswith(wdl_str(x).lower()),
+    "endsWith":    lambda s, x: wdl_str(s).lower().endswith(wdl_str(x).lower()),
+    "contains":    wdl_contains,
+    "length":      wdl_length,
+    "formatNumber":lambda n, fmt, loc="en-US": wdl_format_number(n, fmt, loc),
+    "guid":        lambda fmt="D": str(__import__("uuid").uuid4()),
+    # datas
+    "utcNow":      lambda fmt="o": wdl_format_ts(datetime.datetime.now(datetime.timezone.utc), fmt),
+    "formatDateTime": lambda ts, fmt="o", loc="en-US": wdl_format_ts(wdl_ts(ts), fmt, loc),
+    "parseDateTime": wdl_parse_ts,
+    "addDays":     wdl_shift("days"),
+    "addHours":    wdl_shift("hours"),
+    "addMinutes":  wdl_shift("minutes"),
+    "addSeconds":  wdl_shift("seconds"),
+    "startOfDay":  lambda ts, fmt="o": wdl_format_ts(wdl_ts(ts).replace(hour=0, minute=0, second=0, microsecond=0), fmt),
+    "startOfMonth":lambda ts, fmt="o": wdl_format_ts(wdl_ts(ts).replace(day=1, hour=0, minute=0, second=0, microsecond=0), fmt),
+    "dayOfWeek":   lambda ts: (wdl_ts(ts).weekday() + 1) % 7,
+    "dayOfMonth":  lambda ts: wdl_ts(ts).day,
+    "dayOfYear":   lambda ts: wdl_ts(ts).timetuple().tm_yday,
+    "ticks":       lambda ts: int((wdl_ts(ts) - datetime.datetime(1, 1, 1, tzinfo=datetime.timezone.utc)).total_seconds() * 10_000_000),
+    "dateDifference": wdl_date_diff,
+    "convertTimeZone": wdl_convert_tz,
+    "convertFromUtc":  lambda ts, dst, fmt="o": wdl_format_ts(wdl_ts(ts).astimezone(wdl_tz(dst)), fmt),
+    "convertToUtc":    lambda ts, src, fmt="o": wdl_format_ts(wdl_ts(ts).replace(tzinfo=wdl_tz(src)).astimezone(datetime.timezone.utc), fmt),
+    # lógica
+    "equals":      lambda a, b: a == b,
+    "and":         lambda *a: all(wdl_bool(x) for x in a),
+    "or":          lambda *a: any(wdl_bool(x) for x in a),
+    "not":         lambda a: not wdl_bool(a),
+    "greater":     lambda a, b: a > b,
+    "greaterOrEquals": lambda a, b: a >= b,
+    "less":        lambda a, b: a < b,
+    "lessOrEquals":lambda a, b: a <= b,
+    "empty":       lambda v: v is None or (hasattr(v, "__len__") and len(v) == 0),
+    "int":         lambda v: int(wdl_num(v)),
+    "float":       lambda v: float(wdl_num(v)),
+    "string":      wdl_str,
+    "bool":        wdl_bool,
+    "json":        lambda v: json.loads(v) if isinstance(v, str) else v,
+    "array":       lambda v: [v],
+    "createArray": lambda *a: list(a),
+    # arrays & matemática
+    "first":       lambda v: (v[0] if len(v) else None) if v is not None else None,
+    "last":        lambda v: (v[-1] if len(v) else None) if v is not None else None,
+    "skip":        lambda v, n: v[int(n):],
+    "take":        lambda v, n: v[:int(n)],
+    "union":       wdl_union,
+    "intersection":lambda a, *rest: [x for x in a if all(x in r for r in rest)] if isinstance(a, list)
+                                    else {k: v for k, v in a.items() if all(r.get(k) == v for r in rest)},
+    "range":       wdl_range,
+    "add":         lambda a, b: wdl_num(a) + wdl_num(b),
+    "sub":         lambda a, b: wdl_num(a) - wdl_num(b),
+    "mul":         lambda a, b: wdl_num(a) * wdl_num(b),
+    "div":         wdl_div,
+    "mod":         wdl_mod,
+    "min":         lambda *a: min(a[0] if len(a) == 1 else a),
+    "max":         lambda *a: max(a[0] if len(a) == 1 else a),
+    # utilitários
+    "base64":      lambda s: __import__("base64").b64encode(wdl_str(s).encode()).decode(),
+    "base64ToString": lambda s: __import__("base64").b64decode(wdl_str(s)).decode(),
+    "decodeBase64":   lambda s: __import__("base64").b64decode(wdl_str(s)).decode(),
+    "uriComponent":   lambda s: __import__("urllib.parse").parse.quote(wdl_str(s), safe=""),
+    "encodeUriComponent": lambda s: __import__("urllib.parse").parse.quote(wdl_str(s), safe=""),
+    "uriComponentToString": lambda s: __import__("urllib.parse").parse.unquote(wdl_str(s)),
+}
+# Funções de contexto → (mín., máx.) de argumentos
+WDL_CONTEXT_FUNCS = {"triggerBody": (0, 0), "triggerOutputs": (0, 0), "body": (0, 1), "outputs": (0, 1), "actions": (0, 1),
+                     "result": (0, 1), "variables": (1, 1), "item": (0, 0), "items": (0, 1), "parameters": (1, 1), "workflow": (0, 0)}
+WDL_LAZY = {"if", "coalesce"}
+
+def wdl_context_call(name, args, ctx):
+    if name == "triggerBody":    return ctx["triggerBody"]
+    if name == "triggerOutputs": return {"headers": ctx.get("headers", {}), "body": ctx["triggerBody"]}
+    if name in ("body", "outputs", "actions", "result"):
+        if not args:
+            return ctx.get("body")
+        acts = ctx.get("actions", {})
+        if args[0] not in acts:
+            raise ValueError(f"A ação '{args[0]}' não existe neste fluxo. Ações: {', '.join(acts) or '—'}")
+        out = acts[args[0]]
+        return {"body": out} if name == "outputs" else ({"outputs": {"body": out}} if name == "actions" else out)
+    if name == "variables":
+        if args[0] not in ctx.get("variables", {}):
+            raise ValueError(f"A variável '{args[0]}' não foi inicializada.")
+        return ctx["variables"][args[0]]
+    if name in ("item", "items"):
+        if not ctx.get("item_stack"):
+            raise ValueError(f"{name}() só pode ser usado dentro de um loop (Aplicar a cada).")
+        return ctx["item_stack"][-1]
+    if name == "parameters": return ctx.get("parameters", {}).get(args[0])
+    if name == "workflow":   return {"name": "Fluxo de Treinamento", "run": {"name": "08585"}}
+
+def wdl_index(obj, key, safe):
+    if obj is None:
+        if safe: return None
+        raise ValueError(f"Não é possível ler '{key}' de um valor nulo — use ?['{key}'].")
+    if isinstance(obj, list):
+        try:
+            return obj[int(key)]
+        except (IndexError, ValueError, TypeError):
+            if safe: return None
+            raise ValueError(f"Índice '{key}' fora do intervalo (0–{len(obj) - 1}).")
+    if isinstance(obj, dict):
+        if not isinstance(key, (str, int, float, bool)) and key is not None:
+            raise ValueError(f"Chave inválida do tipo {type(key).__name__} — use texto ou número.")
+        if key in obj:
+            return obj[key]
+        low = {str(k).lower(): k for k in obj}   # property names are case-insensitive
+        if str(key).lower() in low:
+            return obj[low[str(key).lower()]]
+        if safe: return None
+        raise ValueError(f"A propriedade '{key}' não existe. Disponíveis: {', '.join(list(map(str, obj))[:12])}")
+    raise ValueError(f"Não é possível indexar um valor do tipo {type(obj).__name__} com '{key}'.")
+
+class WdlCompiler:
+    """Analisa uma expressão WDL e a compila em closures Python (sem reanálise por execução)."""
+    def __init__(self, src: str):
+        self.toks, pos = [], 0
+        while pos < len(src):
+            m = WDL_TOKEN_RE.match(src, pos)
+            if not m:
+                raise ValueError(f"Caractere inesperado na posição {pos}: {src[pos]!r}")
+            if m.lastgroup != "ws":
+                self.toks.append((m.lastgroup, m.group(), pos))
+            pos = m.end()
+        self.toks.append(("eof", "", pos))
+        self.i = 0
+
+    def take(self, val=None):
+        tok = self.toks[self.i]
+        if val is not None and tok[1] != val:
+            raise ValueError(f"Esperado '{val}' na posição {tok[2]}, encontrado '{tok[1] or 'fim da expressão'}'")
+        self.i += 1
+        return tok
+
+    def compile(self):
+        fn = self.expr()
+        if self.toks[self.i][0] != "eof":
+            raise ValueError(f"Token inesperado '{self.toks[self.i][1]}' na posição {self.toks[self.i][2]}")
+        return fn
+
+    def expr(self):
+        kind, val, pos = self.take()
+        if kind == "str":
+            v = val[1:-1].replace("''", "'")
+            fn = lambda ctx, v=v: v
+        elif kind == "num":
+            v = float(val) if "." in val else int(val)
+            fn = lambda ctx, v=v: v
+        elif kind == "id" and val in ("true", "false", "null") and self.toks[self.i][1] != "(":
+            v = {"true": True, "false": False, "null": None}[val]
+            fn = lambda ctx, v=v: v
+        elif kind == "id":
+            fn = self.call(val, pos)
+        else:
+            raise ValueError(f"Token inesperado '{val or 'fim da expressão'}' na posição {pos}")
+        return self.postfix(fn)
+
+    def call(self, name, pos):
+        if self.toks[self.i][1] != "(":
+            raise ValueError(f"'{name}' deve ser chamado como função: {name}(...)")
+        if name in ("filter", "select", "where"):
+            raise ValueError(f"{name}() não é uma função de expressão — use a ação 'Filtrar matriz' / 'Selecionar'.")
+        self.take("(")
+        args = []
+        while self.toks[self.i][1] != ")":
+            args.append(self.expr())
+            if self.toks[self.i][1] != ",":
+                break
+            self.take(",")
+        self.take(")")
+        if name == "if":
+            if len(args) != 3:
+                raise ValueError("if() espera 3 argumentos: condição, valor se verdadeiro, valor se falso.")
+            c, t, f = args
+            return lambda ctx: t(ctx) if wdl_bool(c(ctx)) else f(ctx)
+        if name == "coalesce":
+            def coalesce(ctx):
+                for a in args:
+                    v = a(ctx)
+                    if v is not None:
+                        return v
+                return None
+            return coalesce
+        if name in WDL_CONTEXT_FUNCS:
+            lo, hi = WDL_CONTEXT_FUNCS[name]
+            if not lo <= len(args) <= hi:
+                want = str(lo) if lo == hi else f"de {lo} a {hi}"
+                raise ValueError(f"{name}() espera {want} argumento(s), recebeu {len(args)} (posição {pos}).")
+            impl = lambda *a, ctx: wdl_context_call(name, list(a), ctx)
+        else:
+            impl = WDL_FUNCS.get(name)
+        if impl is None:
+            import difflib
+            close = difflib.get_close_matches(name, list(WDL_FUNCS) + sorted(WDL_CONTEXT_FUNCS), 1, 0.7)
+            hint = f" Você quis dizer {close[0]}()?" if close else ""
+            raise ValueError(f"A função '{name}' não existe.{hint}")
+        context = name in WDL_CONTEXT_FUNCS
+        def run(ctx):
+            vals = [a(ctx) for a in args]
+            try:
+                return impl(*vals, ctx=ctx) if context else impl(*vals)
+            except (TypeError, AttributeError, IndexError, KeyError, OverflowError) as e:
+                raise ValueError(f"{name}(): argumentos inválidos ({e}).")
+        return run
+
+    def postfix(self, fn):
+        while True:
+            val = self.toks[self.i][1]
+            if val in ("[", "?["):
+                self.take()
+                key = self.expr()
+                self.take("]")
+                fn = (lambda base, key, safe: lambda ctx: wdl_index(base(ctx), key(ctx), safe))(fn, key, val == "?[")
+            elif val in (".", "?."):
+                self.take()
+                kind, name, pos = self.take()
+                if kind != "id":
+                    raise ValueError(f"Esperado nome de propriedade na posição {pos}")
+                fn = (lambda base, name, safe: lambda ctx: wdl_index(base(ctx), name, safe))(fn, name, val == "?.")
+            else:
+                return fn
+
+@st.cache_resource(max_entries=2048, show_spinner=False)
+def wdl_compile(text: str):
+    """
+    Compila uma expressão ('expr', '@expr' ou texto com '@{expr}') em uma função ctx → valor.
+    Cacheado por texto: o mesmo código não é reanalisado a cada rerun.
+    """
+    text = text.strip()
+    if "@{" in text:
+        parts, pos = [], 0
+        for m in re.finditer(r"@\{((?:[^{}']|'(?:[^']|'')*')*)\}", text):
+            if m.start() > pos:
+                lit = text[pos:m.start()]
+                parts.append(lambda ctx, lit=lit: lit)
+            inner = WdlCompiler(m.group(1)).compile()
+            parts.append(lambda ctx, inner=inner: wdl_str(inner(ctx)))
+            pos = m.end()
+        if pos < len(text):
+            lit = text[pos:]
+            parts.append(lambda ctx, lit=lit: lit)
+        return lambda ctx: "".join(p(ctx) for p in parts)
+    return WdlCompiler(text[1:] if text.startswith("@") else text).compile()
+
+WDL_SAMPLE_ENV = {
+    "triggerBody": {
+        "ID": 42, "Title": "Pedido de compra", "Nome": "  Maria da Silva ", "NomeCompleto": "Maria da Silva",
+        "Email": "Maria.Silva@Empresa.com", "Emails": "ana@empresa.com;bruno@empresa.com;carla@empresa.com",
+        "Status": "Urgente", "Valor": 1500.5, "Quantidade": "3", "Preco": "19.90", "Ativo": "true",
+        "Descricao": "Compra de 3 notebooks para o time de dados", "Observacao": None,
+        "DataInicio": "2026-03-01T12:00:00Z", "Vencimento": "2026-03-10T00:00:00Z",
+        "Endereco": {"Cidade": "São Paulo", "UF": "SP", "CEP": "01310-100"},
+        "Aprovadores": ["gerente@empresa.com", "diretor@empresa.com"],
+    },
+    "body": {"NomeCompleto": "Maria da Silva", "Texto": "Linha 1\nLinha 2", "Aprovado": True, "Valor": 2500},
+    "actions": {
+        "Obter_itens": {"value": [
+            {"ID": 1, "Titulo": "Notebook", "Status": "Ativo", "Email": "ana@empresa.com", "Valor": 4200},
+            {"ID": 2, "Titulo": "Monitor", "Status": "Inativo", "Email": "bruno@empresa.com", "Valor": 1100},
+            {"ID": 3, "Titulo": "Headset", "Status": "Ativo", "Email": "carla@empresa.com", "Valor": 350},
+        ]},
+        "Parse_JSON": {"ID": "A-100", "Endereco": {"Cidade": "Curitiba", "UF": "PR"}},
+        "HTTP": {"body": "{\"ok\": true, \"total\": 3}", "statusCode": 200},
+    },
+    "variables": {"arrNomes": ["Ana", "Bruno", "Carlos"], "arr1": [1, 2, 3], "arr2": [2, 3, 4],
+                  "arrStatus": ["Novo", "Aprovado", "Rejeitado"], "numTotal": 1250, "objConfig": {"tema": "escuro"}},
+}
+
+@st.cache_resource(max_entries=8, show_spinner="Lendo payload JSON…")
+def wdl_load_payload(digest: str, _raw: bytes):
+    # Parsed once per content hash and shared read-only across reruns and sessions
+    return json.loads(_raw)
+
+def wdl_env() -> dict:
+    env = dict(WDL_SAMPLE_ENV)
+    up = st.session_state.get("wdl_payload")
+    if up:
+        body = wdl_load_payload(up["digest"], up["raw"])
+        # Um objeto enviado sobrepõe os campos de exemplo; qualquer outro JSON substitui o triggerBody
+        env["triggerBody"] = {**env["triggerBody"], **body} if isinstance(body, dict) else body
+    return env
+
+def wdl_eval(text: str, env: dict) -> Tuple[object, float, float]:
+    t0 = time.perf_counter()
+    fn = wdl_compile(text)
+    t1 = time.perf_counter()
+    value = fn(env)
+    return value, (t1 - t0) * 1000, (time.perf_counter() - t1) * 1000
+
+def wdl_show(value, limit: int = 200):
+    if isinstance(value, list) and len(value) > limit:
+        st.caption(f"Exibindo {limit} de {len(value):,} itens")
+        value = value[:limit]
+    if isinstance(value, (dict, list)):
+        st.json(value, expanded=2)
+    else:
+        st.code(json.dumps(value, ensure_ascii=False) if not isinstance(value, str) else value, language="text")
+
+def wdl_try(key: str, default: str):
+    col_label("🧪 Teste a expressão")
+    expr = st.text_input("Expressão", default, key=f"wdl_{key}", label_visibility="collapsed")
+    if not expr.strip():
+        return
+    try:
+        value, _, ev_ms = wdl_eval(expr, wdl_env())
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return
+    wdl_show(value)
+    st.caption(f"{type(value).__name__ if value is not None else 'null'} · avaliado em {ev_ms:.2f} ms · payload na aba 🧪 Playground")
+
+def wdl_playground():
+    lab_header("🧪 Playground de Expressões","Avalie expressões reais contra um triggerBody() de exemplo ou o seu próprio JSON")
+    c1,c2 = st.columns([1,1.2],gap="large")
+    with c1:
+        col_label("📦 Payload do gatilho")
+        up = st.file_uploader("Enviar JSON (triggerBody)",type=["json"],key="wdl_up")
+        n = st.select_slider("…ou gerar um payload grande (itens em 'value')",[0,1_000,10_000,50_000,100_000],0,
+                             format_func=lambda v: f"{v:,}",key="wdl_gen")
+        cur = st.session_state.get("wdl_payload")
+        if up is not None:
+            raw = up.getvalue()
+            digest = hashlib.sha1(raw).hexdigest()
+            if not cur or cur["digest"] != digest:
+                st.session_state.wdl_payload = {"name":up.name, "size":len(raw), "raw":raw, "digest":digest}
+        elif n:
+            if not cur or cur["digest"] != f"gen-{n}":
+                raw = wdl_big_payload(n)
+                st.session_state.wdl_payload = {"name":f"gerado_{n:,}", "size":len(raw), "raw":raw, "digest":f"gen-{n}"}
+        elif cur:
+            st.session_state.wdl_payload = None
+        cur = st.session_state.get("wdl_payload")
+        if cur:
+            st.caption(f"📄 {cur['name']} — {cur['size']/1024/1024:,.2f} MB (parse feito uma vez, em cache)")
+        else:
+            st.json(WDL_SAMPLE_ENV["triggerBody"], expanded=False)
+        st.caption("Também disponíveis: body('Obter_itens'), body('Parse_JSON'), body('HTTP'), variables('arrNomes'|'arr1'|'arr2'|'numTotal'|'objConfig')")
+    with c2:
+        col_label("🧮 Expressão")
+        ex = st.selectbox("Exemplos",WDL_EXAMPLES,key="wdl_ex")
+        expr = st.text_area("Expressão",ex,height=90,key=f"wdl_pg_{WDL_EXAMPLES.index(ex)}",label_visibility="collapsed")
+        try:
+            value, comp_ms, ev_ms = wdl_eval(expr, wdl_env())
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            return
+        m1,m2 = st.columns(2)
+        m1.metric("Compilar (cache)", f"{comp_ms:.3f} ms")
+        m2.metric("Avaliar", f"{ev_ms:.3f} ms")
+        wdl_show(value)
+
+WDL_EXAMPLES = [
+    "concat('Olá, ', trim(triggerBody()?['Nome']), '!')",
+    "@{triggerBody()?['Title']} — R$ @{formatNumber(triggerBody()?['Valor'], 'N2', 'pt-BR')}",
+    "split(triggerBody()?['Emails'], ';')",
+    "formatDateTime(addDays(triggerBody()?['DataInicio'], 30), 'dddd, dd/MM/yyyy', 'pt-BR')",
+    "convertTimeZone(triggerBody()?['DataInicio'], 'UTC', 'E. South America Standard Time', 'dd/MM/yyyy HH:mm')",
+    "if(equals(triggerBody()?['Status'], 'Urgente'), 'Alta', 'Normal')",
+    "coalesce(triggerBody()?['Observacao'], 'Sem observação')",
+    "body('Parse_JSON')?['Endereco']?['Cidade']",
+    "length(coalesce(triggerBody()?['value'], body('Obter_itens')?['value']))",
+    "last(coalesce(triggerBody()?['value'], body('Obter_itens')?['value']))",
+    "json(body('HTTP')?['body'])?['total']",
+    "union(variables('arr1'), variables('arr2'))",
+    "uriComponent(triggerBody()?['Descricao'])",
+]
+
+def wdl_big_payload(n: int) -> bytes:
+    df = synth_frame("Pedidos", 100_000, slice(0, n))
+    df["Data"] = df["Data"].dt.strftime("%Y-%m-%dT00:00:00Z")
+    return ('{"@odata.count": %d, "value": %s}' % (n, df.to_json(orient="records", force_ascii=False))).encode()
+
+
+# ─────────────────────────────────────────────
+# PARSE JSON — INFERÊNCIA DE SCHEMA EM STREAMING
+# ─────────────────────────────────────────────
+PJ_CHUNK = 1 << 20          # 1 MB por leitura
+PJ_MAX_DEPTH = 100          # níveis de aninhamento; schema, caminhos e dump são recursivos
+PJ_TYPES = {bool: "boolean", int: "integer", float: "number", str: "string", type(None): "null",
+            dict: "object", list: "array"}
+
+class JsonStream:
+    """
+    Leitor JSON incremental: mantém só um buffer de poucos MB e decodifica um
+    valor por vez com o raw_decode em C, pedindo mais bytes quando o valor
+    está cortado no fim do buffer.
+    """
+    WS = re.compile(r"\s*")
+
+    def __init__(self, fp, chunk: int = PJ_CHUNK):
+        import codecs
+        self.fp, self.chunk = fp, chunk
+        self.dec = codecs.getincrementaldecoder("utf-8-sig")()
+        self.json = json.JSONDecoder()
+        self.buf, self.pos, self.eof, self.read_bytes, self.peak = "", 0, False, 0, 0
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        data = self.fp.read(self.chunk)
+        self.read_bytes += len(data)
+        self.eof = not data
+        if self.pos > self.chunk:               # descarta o que já foi consumido
+            self.buf, self.pos = self.buf[self.pos:], 0
+        self.buf += self.dec.decode(data, final=self.eof)
+        self.peak = max(self.peak, len(self.buf))
+        return bool(data)
+
+    def peek(self) -> str:
+        while True:
+            self.pos = self.WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, ch: str):
+        got = self.peek()
+        if got != ch:
+            raise ValueError(f"JSON inválido perto do byte {self.offset():,}: esperado '{ch}', encontrado '{got or 'fim do arquivo'}'")
+        self.pos += 1
+
+    def offset(self) -> int:
+        return self.read_bytes - len(self.buf.encode("utf-8", "ignore")) + len(self.buf[:self.pos].encode("utf-8", "ignore"))
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                v, end = self.json.raw_decode(self.buf, self.pos)
+                # número ou literal encostado no fim do buffer pode estar incompleto
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return v
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise ValueError(f"JSON inválido perto do byte {self.offset():,}: {e.msg}")
+            except RecursionError:
+                raise ValueError(f"JSON aninhado demais perto do byte {self.offset():,} (máximo {PJ_MAX_DEPTH} níveis).") from None
+            self.fill()
+
+class SchemaNode:
+    """Acumula a forma observada de um caminho JSON (tipos, propriedades, itens)."""
+    __slots__ = ("types", "seen", "objects", "props", "present", "items", "samples")
+
+    def __init__(self):
+        self.types, self.seen, self.objects = set(), 0, 0
+        self.props, self.present, self.items = {}, {}, None
+        self.samples = []
+
+    def child(self, key):
+        if key not in self.props:
+            self.props[key] = SchemaNode()
+        return self.props[key]
+
+    def item(self):
+        if self.items is None:
+            self.items = SchemaNode()
+        return self.items
+
+    def observe(self, v, depth: int = 0):
+        if depth > PJ_MAX_DEPTH:
+            raise ValueError(f"JSON aninhado demais (máximo {PJ_MAX_DEPTH} níveis).")
+        self.seen += 1
+        kind = PJ_TYPES.get(type(v), "string")
+        self.types.add(kind)
+        if kind == "object":
+            self.objects += 1
+            present, props = self.present, self.props
+            for k, x in v.items():
+                present[k] = present.get(k, 0) + 1
+                (props.get(k) or self.child(k)).observe(x, depth + 1)
+        elif kind == "array":
+            it = self.item()
+            for x in v:
+                it.observe(x, depth + 1)
+        elif kind != "null" and len(self.samples) < 3 and v not in self.samples:
+            self.samples.append(v)
+
+    def dump(self) -> dict:
+        return {"types": sorted(self.types), "objects": self.objects, "present": self.present,
+                "samples": self.samples, "props": {k: c.dump() for k, c in self.props.items()},
+                "items": self.items.dump() if self.items is not None and self.items.seen else None}
+
+def pj_walk(stream: JsonStream, node: SchemaNode, element: bool = False, depth: int = 0):
+    # Objetos e arrays são percorridos token a token até o primeiro array;
+    # cada elemento do array é decodificado inteiro (em C) e descartado em seguida
+    ch = stream.peek()
+    if element or ch not in "{[" or not ch:
+        if not ch:
+            raise ValueError("JSON vazio ou truncado.")
+        node.observe(stream.value(), depth)
+        return
+    if depth > PJ_MAX_DEPTH:
+        raise ValueError(f"JSON aninhado demais perto do byte {stream.offset():,} (máximo {PJ_MAX_DEPTH} níveis).")
+    node.seen += 1
+    if ch == "{":
+        node.types.add("object")
+        node.objects += 1
+        stream.pos += 1
+        if stream.peek() == "}":
+            stream.pos += 1
+            return
+        while True:
+            key = stream.value()
+            if not isinstance(key, str):
+                raise ValueError(f"Nome de propriedade inválido perto do byte {stream.offset():,}")
+            stream.expect(":")
+            node.present[key] = node.present.get(key, 0) + 1
+            pj_walk(stream, node.child(key), depth=depth + 1)
+            if stream.peek() == ",":
+                stream.pos += 1
+                continue
+            stream.expect("}")
+            return
+    node.types.add("array")
+    stream.pos += 1
+    it = node.item()
+    if stream.peek() == "]":
+        stream.pos += 1
+        return
+    while True:
+        pj_walk(stream, it, element=True, depth=depth + 1)
+        if stream.peek() == ",":
+            stream.pos += 1
+            continue
+        stream.expect("]")
+        return
+
+def pj_schema(node: dict, nullable: bool = True, strict_required: bool = True) -> dict:
+    types = set(node["types"])
+    if {"integer", "number"} <= types:
+        types.discard("integer")
+    null = "null" in types
+    types.discard("null")
+    out = {}
+    if len(types) == 1:
+        out["type"] = next(iter(types))
+    elif types:
+        out["type"] = sorted(types)
+    if null and nullable and types:
+        # Power Automate falha em nulos quando o schema declara só o tipo — aceita os dois
+        out["type"] = ([out["type"]] if isinstance(out.get("type"), str) else out.get("type", [])) + ["null"]
+    if "object" in types:
+        out["properties"] = {k: pj_schema(c, nullable, strict_required) for k, c in node["props"].items()}
+        req = [k for k, c in node["present"].items() if c == node["objects"]] if strict_required else list(node["props"])
+        if req:
+            out["required"] = req
+    if "array" in types and node["items"]:
+        out["items"] = pj_schema(node["items"], nullable, strict_required)
+    return out
+
+def pj_paths(node: dict, path: str = "body('Parse_JSON')", rows=None, limit: int = 400) -> list:
+    rows = [] if rows is None else rows
+    for k, c in node["props"].items():
+        if len(rows) >= limit:
+            break
+        p = f"{path}?['{k}']"
+        miss = node["objects"] - node["present"].get(k, 0)
+        rows.append({"Expressão": p, "Tipo": " | ".join(c["types"]),
+                     "Ausente em": f"{miss:,} de {node['objects']:,}" if miss else "—",
+                     "Exemplo": ", ".join(json.dumps(s, ensure_ascii=False)[:40] for s in c["samples"])})
+        pj_paths(c, p, rows, limit)
+    if node["items"]:
+        pj_paths(node["items"], "items('Aplicar_a_cada')", rows, limit)
+    return rows
+
+def pj_infer(fp) -> Tuple[dict, dict]:
+    stream = JsonStream(fp)
+    root = SchemaNode()
+    t0 = time.perf_counter()
+    pj_walk(stream, root)
+    if stream.peek():
+        raise ValueError(f"Conteúdo extra após o JSON perto do byte {stream.offset():,}.")
+    return root.dump(), {"bytes": stream.read_bytes, "ms": (time.perf_counter() - t0) * 1000,
+                         "peak": stream.peak}
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def pj_infer_cached(digest: str, _open) -> Tuple[dict, dict]:
+    # Cacheado pelo hash do conteúdo: trocar as opções do schema não relê o arquivo
+    with _open() as fp:
+        return pj_infer(fp)
+
+def pj_sample_file(n: int) -> str:
+    # Resposta OData exportada gerada em disco, bloco a bloco — nunca inteira na memória
+    path = os.path.join(SYNTH_DIR, f"odata_pedidos_{n}.json")
+    if os.path.exists(path):
+        return path
+    os.makedirs(SYNTH_DIR, exist_ok=True)
+    # Temporário exclusivo por chamada: duas sessões gerando o mesmo arquivo não escrevem uma por cima da outra
+    f = tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=SYNTH_DIR, suffix=".tmp", delete=False)
+    try:
+        with f:
+            f.write('{"@odata.context": "https://org.crm.dynamics.com/api/data/v9.2/$metadata#pedidos", "value": [')
+            for start in range(0, n, 50_000):
+                df = synth_frame("Pedidos", n, slice(start, min(n, start + 50_000)))
+                df["Data"] = df["Data"].dt.strftime("%Y-%m-%dT00:00:00Z")
+                recs = json.loads(df.to_json(orient="records", force_ascii=False))
+                for r in recs:
+                    r["Endereco"] = {"Cidade": ["São Paulo", "Recife", "Curitiba"][r["ID"] % 3], "CEP": None if r["ID"] % 7 == 0 else "01310-100"}
+                    if r["ID"] % 11 == 0:
+                        r["Desconto"] = round(r["ValorTotal"] * 0.05, 2)
+                    r["Tags"] = ["prioritario"] if r["Status"] == "Aprovado" else []
+                body = json.dumps(recs, ensure_ascii=False)[1:-1]
+                f.write(("," if start else "") + body)
+            f.write('], "@odata.nextLink": null}')
+        os.replace(f.name, path)
+    except BaseException:
+        os.remove(f.name)
+        raise
+    return path
+
+PJ_SAMPLE = """{
+  "value": [
+    {"ID": 1, "Titulo": "Notebook", "Valor": 4200, "Responsavel": {"Email": "ana@empresa.com"}, "Tags": ["ti"]},
+    {"ID": 2, "Titulo": "Monitor", "Valor": 1100.5, "Responsavel": null, "Tags": []},
+    {"ID": 3, "Titulo": "Headset", "Valor": 350, "Observacao": "Urgente", "Tags": ["ti", "rh"]}
+  ],
+  "@odata.nextLink": null
+}"""
+
+def parse_json_lab(key: str):
+    import io, contextlib
+    lab_header("🧬 Parse JSON — Gerador de Schema","Infere o schema a partir de uma amostra real, unindo todos os itens — em streaming, mesmo para centenas de MB")
+    c1,c2 = st.columns([1,1.3],gap="large")
+    with c1:
+        src = st.radio("Amostra",["Colar JSON","Enviar arquivo","Exportação OData gerada"],horizontal=True,key=f"{key}_src")
+        o1,o2 = st.columns(2)
+        nullable = o1.toggle("Aceitar null",True,key=f"{key}_null",help="Gera \"type\": [\"string\",\"null\"] — evita a falha 'Invalid type. Expected String but got Null'.")
+        strict = o2.toggle("required só se sempre presente",True,key=f"{key}_req",help="Desligado imita o 'Gerar a partir de amostra', que marca todos os campos vistos como obrigatórios.")
+        if src == "Colar JSON":
+            text = st.text_area("JSON de exemplo",PJ_SAMPLE,height=230,key=f"{key}_txt",label_visibility="collapsed")
+            raw = text.encode()
+            digest, opener = hashlib.sha1(raw).hexdigest(), lambda: io.BytesIO(raw)
+        elif src == "Enviar arquivo":
+            up = st.file_uploader("Arquivo JSON",type=["json"],key=f"{key}_up")
+            if up is None:
+                info_box("Envie a resposta exportada de uma API (ex.: saída da ação HTTP).", "info")
+                return
+            h = hashlib.sha1()
+            for block in iter(lambda: up.read(PJ_CHUNK), b""):
+                h.update(block)
+            up.seek(0)
+            digest, opener = h.hexdigest(), lambda: contextlib.nullcontext(up)
+        else:
+            n = st.select_slider("Registros em 'value'",[10_000,100_000,500_000,1_000_000],100_000,format_func=lambda v: f"{v:,}",key=f"{key}_n")
+            with st.spinner("Gerando arquivo em disco…"):
+                path = pj_sample_file(n)
+            digest, opener = f"{path}:{os.path.getsize(path)}", lambda: open(path, "rb")
+            st.caption(f"📄 {os.path.basename(path)} — {os.path.getsize(path)/1024/1024:,.1f} MB em disco")
+    with c2:
+        try:
+            with st.spinner("Percorrendo o JSON…"):
+                root, stats = pj_infer_cached(digest, opener)
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            return
+        schema = pj_schema(root, nullable, strict)
+        m1,m2,m3 = st.columns(3)
+        m1.metric("Lido", f"{stats['bytes']/1024/1024:,.1f} MB" if stats['bytes'] > 1 << 20 else f"{stats['bytes']/1024:,.1f} KB")
+        m2.metric("Tempo", f"{stats['ms']/1000:,.2f} s" if stats['ms'] > 1000 else f"{stats['ms']:,.0f} ms")
+        m3.metric("Buffer máx.", f"{stats['peak']/1024/1024:,.1f} MB" if stats['peak'] > 1 << 20 else f"{stats['peak']/1024:,.1f} KB")
+        st.code(json.dumps(schema, ensure_ascii=False, indent=2), language="json")
+    paths = pj_paths(root)
+    if paths:
+        import pandas as pd
+        col_label("🔎 Campos disponíveis como tokens")
+        st.dataframe(pd.DataFrame(paths), use_container_width=True, hide_index=True, height=260)
+
+
 def page_automate_expressoes():
     mark_page_visited(current_user()["id"], "automate_expressoes")
     st.markdown('<div class="main-wrap">', unsafe_allow_html=True)
     breadcrumb("Power Automate","Expressões & Funções")
     hero("automate_expressoes","🧮","Expressões & Funções","Transforme dados com expressões — texto, data, lógica e JSON.","Intermediário")
 
-    tabs = st.tabs(["📝 Texto","📅 Datas","🔢 Lógica","📦 Arrays & JSON","🔗 Utilitários"])
+    tabs = st.tabs(["📝 Texto","📅 Datas","🔢 Lógica","📦 Arrays & JSON","🔗 Utilitários","🧪 Playground"])
 
     with tabs[0]:
         c1,c2 = st.columns(2)
@@ -2264,6 +5640,7 @@ last(split(body()?['NomeCompleto'], ' '))
 
 // Índice
 indexOf(variables('arrStatus'), 'Aprovado')""", language="javascript")
+        wdl_try("txt", "join(split(toUpper(trim(triggerBody()?['Nome'])), ' '), '_')")
 
     with tabs[1]:
         c1,c2 = st.columns(2)
@@ -2310,6 +5687,7 @@ less(
 
 // Dia da semana (0=domingo)
 dayOfWeek(utcNow())""", language="javascript")
+        wdl_try("dt", "formatDateTime(convertFromUtc(triggerBody()?['DataInicio'], 'E. South America Standard Time'), 'dddd, dd/MM/yyyy HH:mm', 'pt-BR')")
 
     with tabs[2]:
         c1,c2 = st.columns(2)
@@ -2360,6 +5738,7 @@ json(body('HTTP')?['body'])
 
 // Objeto para JSON string
 string(variables('objConfig'))""", language="javascript")
+        wdl_try("log", "if(greater(float(triggerBody()?['Valor']), 1000), 'Aprovação da diretoria', 'Aprovação do gestor')")
 
     with tabs[3]:
         c1,c2 = st.columns(2)
@@ -2407,6 +5786,9 @@ Status eq 'Ativo' and Valor gt 100
 
 // Expand para lookup:
 $expand=Responsavel($select=Email,Title)""", language="javascript")
+        wdl_try("arr", "body('Obter_itens')?['value'][0]?['Titulo']")
+        sp()
+        parse_json_lab("pj_expr")
 
     with tabs[4]:
         c1,c2 = st.columns(2)
@@ -2427,6 +5809,10 @@ $expand=Responsavel($select=Email,Title)""", language="javascript")
                 "Integração com sistemas legados que retornam XML/SOAP.",
                 "xpath(xml(body('HTTP')?['body']),\n  '//NomeElemento/text()')",
                 color="#7c3aed")
+        wdl_try("util", "concat('https://api.exemplo.com/busca?q=', uriComponent(triggerBody()?['Descricao']))")
+
+    with tabs[5]:
+        wdl_playground()
 
     section_quiz("automate_expressoes")
     st.markdown('</div>', unsafe_allow_html=True)
@@ -2536,6 +5922,783 @@ CAT_COLORS.update({
 })
 
 
+# ══════════════════════════════════════════════
+# COPILOT STUDIO — ROTEADOR DE INTENÇÕES (TF-IDF)
+# ══════════════════════════════════════════════
+INTENT_TOPICS = {
+    "Consultar Status de Pedido": ["onde está meu pedido", "status do pedido", "rastrear compra", "quando chega meu produto", "meu pedido foi enviado?"],
+    "Cancelar Pedido":            ["quero cancelar meu pedido", "cancelar compra", "desistir da compra", "não quero mais o produto", "como cancelo um pedido"],
+    "Abrir Chamado":              ["quero abrir um chamado", "preciso de suporte técnico", "tem algum problema com meu acesso", "não consigo entrar no sistema", "meu computador não liga"],
+    "Redefinir Senha":            ["esqueci minha senha", "redefinir senha", "trocar a senha", "senha bloqueada", "resetar senha do e-mail"],
+    "Solicitar Férias":           ["quero solicitar férias", "tirar férias", "pedir folga", "agendar minhas férias", "quantos dias de férias eu tenho"],
+    "Falar com Atendente":        ["falar com um atendente", "quero falar com uma pessoa", "atendimento humano", "me transfere para um agente", "chamar suporte humano"],
+}
+# Paráfrases que NÃO estão nas trigger phrases — base do lote de teste
+INTENT_HELDOUT = {
+    "Consultar Status de Pedido": ["qual a situação da minha encomenda", "cadê minha compra", "previsão de entrega do pedido", "já despacharam meu pedido", "acompanhar entrega", "código de rastreio do pedido"],
+    "Cancelar Pedido":            ["cancela o pedido por favor", "quero desistir do pedido", "estorno da compra", "posso cancelar a encomenda", "anular meu pedido"],
+    "Abrir Chamado":              ["registrar um incidente", "o sistema está fora do ar", "abrir ticket de suporte", "impressora não funciona", "erro ao acessar o sistema"],
+    "Redefinir Senha":            ["minha senha expirou", "não lembro a senha", "desbloquear minha conta", "alterar senha de acesso", "recuperar senha"],
+    "Solicitar Férias":           ["marcar férias para janeiro", "saldo de férias", "quero uns dias de folga", "programar férias", "solicitação de férias"],
+    "Falar com Atendente":        ["quero um humano", "atendente por favor", "não quero falar com robô", "transferir para atendimento", "falar com alguém"],
+}
+INTENT_PREFIX = ["", "", "oi, ", "olá ", "bom dia, ", "por favor ", "preciso de ajuda: "]
+INTENT_SUFFIX = ["", "", "?", " por favor", " urgente", " agora"]
+INTENT_FALLBACK = "Fallback (não reconhecido)"
+
+def intent_fold(text: str) -> str:
+    # Minúsculas, sem acento e só letras/dígitos — "Férias?" e "ferias" viram o mesmo token
+    t = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+    return " ".join(re.findall(r"[a-z0-9]+", t))
+
+def intent_features(text: str) -> dict:
+    """Contagem de features: palavras + n-gramas de 3–5 caracteres dentro de cada palavra."""
+    feats = {}
+    for w in intent_fold(text).split():
+        feats["w:" + w] = feats.get("w:" + w, 0) + 1
+        p = f" {w} "
+        for n in (3, 4, 5):
+            for i in range(len(p) - n + 1):
+                g = p[i:i + n]
+                feats[g] = feats.get(g, 0) + 1
+    return feats
+
+class IntentIndex:
+    """
+    TF-IDF das trigger phrases guardado por feature (CSC): ptr → (frase, peso).
+    Um lote de frases é pontuado contra todas as frases de uma vez, e o tópico
+    recebe a maior similaridade entre suas frases.
+    """
+    def __init__(self, topics: dict):
+        self.topics = [t for t, ph in topics.items() if ph]
+        self.phrases, self.phrase_topic = [], []
+        for i, t in enumerate(self.topics):
+            self.phrases += topics[t]
+            self.phrase_topic += [i] * len(topics[t])
+        self.phrase_topic = np.array(self.phrase_topic)
+        self.starts = np.flatnonzero(np.r_[True, self.phrase_topic[1:] != self.phrase_topic[:-1]])
+        counts = [intent_features(p) for p in self.phrases]
+        self.vocab = {}
+        for c in counts:
+            for f in c:
+                self.vocab.setdefault(f, len(self.vocab))
+        df = np.zeros(len(self.vocab))
+        for c in counts:
+            df[[self.vocab[f] for f in c]] += 1
+        self.idf = np.log((1 + len(self.phrases)) / (1 + df)) + 1
+        row, feat, w = self.weights(counts)
+        order = np.argsort(feat, kind="stable")
+        self.post_phrase, self.post_w = row[order], w[order]
+        self.ptr = np.searchsorted(feat[order], np.arange(len(self.vocab) + 1))
+
+    def weights(self, counts: list):
+        # TF sublinear × IDF, normalizado por linha; features fora do vocabulário são descartadas
+        row, feat, tf = [], [], []
+        for i, c in enumerate(counts):
+            for f, k in c.items():
+                j = self.vocab.get(f)
+                if j is not None:
+                    row.append(i); feat.append(j); tf.append(k)
+        row, feat = np.array(row, np.int64), np.array(feat, np.int64)
+        w = (1 + np.log(np.array(tf, np.float64))) * self.idf[feat]
+        norm = np.sqrt(np.bincount(row, weights=w * w, minlength=len(counts)))
+        return row, feat, w / np.maximum(norm[row], 1e-12)
+
+    def phrase_scores(self, texts: list) -> np.ndarray:
+        """Cosseno lote × frases: cada entrada não nula do lote se junta à lista de postings da sua feature."""
+        row, feat, w = self.weights([intent_features(t) for t in texts])
+        lo = self.ptr[feat]
+        cnt = self.ptr[feat + 1] - lo
+        idx = np.repeat(lo - (np.cumsum(cnt) - cnt), cnt) + np.arange(cnt.sum())
+        flat = np.repeat(row, cnt) * len(self.phrases) + self.post_phrase[idx]
+        s = np.bincount(flat, weights=np.repeat(w, cnt) * self.post_w[idx], minlength=len(texts) * len(self.phrases))
+        return s.reshape(len(texts), len(self.phrases))
+
+    def scores(self, texts: list) -> Tuple[np.ndarray, np.ndarray]:
+        # (lote × tópicos) com a maior similaridade por tópico, e a frase vencedora de cada par
+        s = self.phrase_scores(texts)
+        best = np.maximum.reduceat(s, self.starts, axis=1)
+        arg = np.array([self.starts[i] + np.argmax(s[:, a:b], axis=1)
+                        for i, (a, b) in enumerate(zip(self.starts, np.r_[self.starts[1:], s.shape[1]]))]).T
+        return best, arg
+
+    def overlaps(self, limit: float) -> list:
+        # Frases de tópicos diferentes que se parecem demais entre si
+        s = self.phrase_scores(self.phrases)
+        t = self.phrase_topic
+        s[t[:, None] == t[None, :]] = 0
+        i, j = np.nonzero(np.triu(s) >= limit)
+        return sorted(({"Tópico A": self.topics[t[a]], "Frase A": self.phrases[a], "Tópico B": self.topics[t[b]],
+                        "Frase B": self.phrases[b], "Similaridade": round(float(s[a, b]), 3)} for a, b in zip(i, j)),
+                      key=lambda r: -r["Similaridade"])
+
+@st.cache_resource(max_entries=16, show_spinner=False)
+def intent_index(topics: tuple) -> IntentIndex:
+    return IntentIndex({t: list(ph) for t, ph in topics})
+
+def intent_test_batch(topics: dict, n: int, seed: int = 3) -> Tuple[list, list]:
+    """Lote rotulado: paráfrases inéditas (ou as próprias frases, para tópicos novos) com ruído de digitação."""
+    rng = random.Random(seed)
+    names = [t for t, ph in topics.items() if ph]
+    texts, labels = [], []
+    for _ in range(n):
+        t = rng.choice(names)
+        s = rng.choice(INTENT_HELDOUT.get(t) or topics[t])
+        words = s.split()
+        if len(words) > 2 and rng.random() < .2:
+            words.pop(rng.randrange(len(words)))
+        if rng.random() < .3:
+            k = rng.randrange(len(words))
+            w = words[k]
+            if len(w) > 3:
+                i = rng.randrange(len(w) - 1)
+                words[k] = w[:i] + w[i + 1] + w[i] + w[i + 2:]
+        s = rng.choice(INTENT_PREFIX) + " ".join(words) + rng.choice(INTENT_SUFFIX)
+        if rng.random() < .4:
+            s = intent_fold(s)
+        texts.append(s); labels.append(t)
+    return texts, labels
+
+@st.cache_data(max_entries=16, show_spinner="Pontuando o lote…")
+def intent_benchmark(topics: tuple, texts: tuple, labels: tuple, threshold: float, margin: float) -> dict:
+    idx = intent_index(topics)
+    t0 = time.perf_counter()
+    best, _ = idx.scores(list(texts))
+    ms = (time.perf_counter() - t0) * 1000
+    order = np.argsort(-best, axis=1)
+    top = best[np.arange(len(texts)), order[:, 0]]
+    second = best[np.arange(len(texts)), order[:, 1]] if best.shape[1] > 1 else np.zeros(len(texts))
+    names = np.array(idx.topics + [INTENT_FALLBACK])
+    pred = np.where(top >= threshold, order[:, 0], len(idx.topics))
+    lab = np.array(labels)
+    return {"ms": ms, "pred": names[pred].tolist(), "top": top, "ambiguous": (top >= threshold) & (top - second < margin),
+            "ok": names[pred] == lab, "fallback": pred == len(idx.topics)}
+
+def intent_lab(key: str):
+    import pandas as pd
+    lab_header("🎯 Laboratório — Para qual tópico vai esta frase?","TF-IDF de palavras + n-gramas de caracteres, sem acento, e ranking por cosseno contra todas as trigger phrases")
+    base = pd.DataFrame([{"Tópico": t, "Trigger phrases (separe com |)": " | ".join(ph)} for t, ph in INTENT_TOPICS.items()])
+    edited = st.data_editor(base, num_rows="dynamic", hide_index=True, use_container_width=True, key=f"{key}_topics")
+    topics = {}
+    for _, r in edited.iterrows():
+        name = str(r["Tópico"] or "").strip()
+        if name:
+            topics.setdefault(name, [])
+            topics[name] += [p.strip() for p in str(r["Trigger phrases (separe com |)"] or "").split("|") if p.strip()]
+    if len([t for t in topics.values() if t]) < 2:
+        info_box("Cadastre pelo menos dois tópicos com trigger phrases.", "warning")
+        return
+    frozen = tuple((t, tuple(ph)) for t, ph in topics.items())
+    idx = intent_index(frozen)
+    c1,c2,c3 = st.columns(3)
+    threshold = c1.slider("Confiança mínima (abaixo → Fallback)",0.0,1.0,0.3,0.05,key=f"{key}_thr")
+    margin = c2.slider("Margem p/ \"Você quis dizer…\"",0.0,0.3,0.05,0.01,key=f"{key}_mrg")
+    n = c3.select_slider("Frases de teste",[1_000,5_000,20_000],5_000,format_func=lambda v: f"{v:,}",key=f"{key}_n")
+    col_label("🗣️ Testar uma frase")
+    q = st.text_input("Frase do usuário","nao consigo acessar minha conta",key=f"{key}_q",label_visibility="collapsed")
+    if q.strip():
+        best, arg = idx.scores([q])
+        rank = np.argsort(-best[0])[:3]
+        st.dataframe(pd.DataFrame([{"Tópico": idx.topics[i], "Confiança": round(float(best[0, i]), 3),
+                                    "Frase mais parecida": idx.phrases[arg[0, i]]} for i in rank]),
+                     use_container_width=True, hide_index=True)
+        top = float(best[0, rank[0]])
+        second = float(best[0, rank[1]]) if len(rank) > 1 else 0.0
+        if top < threshold:
+            st.warning(f"↪️ Vai para o **{INTENT_FALLBACK}** — confiança {top:.2f} < {threshold:.2f}")
+        elif top - second < margin:
+            st.info(f"🤔 \"Você quis dizer…\" — **{idx.topics[rank[0]]}** e **{idx.topics[rank[1]]}** empatam (diferença {top - second:.3f})")
+        else:
+            st.success(f"✅ Dispara **{idx.topics[rank[0]]}** ({top:.2f})")
+    texts, labels = intent_test_batch(topics, n)
+    r = intent_benchmark(frozen, tuple(texts), tuple(labels), threshold, margin)
+    m1,m2,m3,m4 = st.columns(4)
+    m1.metric("Acerto", f"{r['ok'].mean():.1%}")
+    m2.metric("Fallback", f"{r['fallback'].mean():.1%}")
+    m3.metric("\"Você quis dizer…\"", f"{r['ambiguous'].mean():.1%}")
+    m4.metric("Lote pontuado em", f"{r['ms']:,.0f} ms", f"{len(idx.vocab):,} features × {len(idx.phrases)} frases", delta_color="off")
+    conf = pd.crosstab(pd.Series(labels, name="Esperado"), pd.Series(r["pred"], name="Previsto"))
+    c1,c2 = st.columns([1.3,1],gap="large")
+    with c1:
+        col_label("🔀 Matriz de confusão")
+        st.dataframe(conf, use_container_width=True)
+    with c2:
+        col_label("⚠️ Confusões mais frequentes")
+        wrong = pd.DataFrame({"Esperado": labels, "Previsto": r["pred"], "Frase": texts})[~r["ok"]]
+        pairs = wrong.groupby(["Esperado","Previsto"]).agg(Qtde=("Frase","size"), Exemplo=("Frase","first")).reset_index()
+        st.dataframe(pairs.sort_values("Qtde", ascending=False).head(8), use_container_width=True, hide_index=True)
+    ov = idx.overlaps(0.3)
+    if ov:
+        col_label("👯 Trigger phrases que se sobrepõem entre tópicos")
+        st.dataframe(pd.DataFrame(ov[:10]), use_container_width=True, hide_index=True)
+    info_box("💡 Confusões entre dois tópicos quase sempre vêm de trigger phrases com as mesmas palavras-chave (\"pedido\", \"acesso\"). Diversifique as frases e, quando a sobreposição for real, deixe o Copilot perguntar <b>\"Você quis dizer…\"</b>.", "info")
+
+
+# ══════════════════════════════════════════════
+# COPILOT STUDIO — EXECUTOR DE TÓPICOS (MÁQUINA DE ESTADOS)
+# ══════════════════════════════════════════════
+TSM_KINDS = {"SendActivity", "Question", "ConditionGroup", "SetVariable", "InvokeFlowAction",
+             "BeginDialog", "GotoAction", "EndDialog", "EndConversation"}
+TSM_TERMINAL = {"EndDialog", "EndConversation"}
+TSM_MAX_STEPS = 500
+TSM_SAMPLES = {
+"Férias (com redirecionamento)": """\
+Solicitar Férias:
+  kind: AdaptiveDialog
+  beginDialog:
+    kind: OnRecognizedIntent
+    intent:
+      triggerQueries: [quero solicitar férias, tirar férias, pedir folga, agendar minhas férias, marcar férias]
+    actions:
+      - kind: SendActivity
+        id: ola
+        activity: "Olá {System.User.DisplayName}! Vou te ajudar com a solicitação de férias."
+      - kind: Question
+        id: perguntaInicio
+        variable: Topic.DataInicio
+        prompt: Qual a data de início?
+        entity: DateTimePrebuiltEntity
+      - kind: Question
+        id: perguntaDias
+        variable: Topic.QtdDias
+        prompt: Quantos dias?
+        entity: NumberPrebuiltEntity
+      - kind: ConditionGroup
+        id: checaDias
+        conditions:
+          - id: muitosDias
+            condition: =Topic.QtdDias > 30
+            actions:
+              - kind: SendActivity
+                id: avisoMaximo
+                activity: Máximo de 30 dias por solicitação.
+              - kind: GotoAction
+                id: voltaDias
+                actionId: perguntaDias
+        elseActions:
+          - kind: InvokeFlowAction
+            id: criaSolicitacao
+            flowId: Criar Solicitação de Férias
+            input: {DataInicio: =Topic.DataInicio, QtdDias: =Topic.QtdDias}
+            output: {NumeroSolicitacao: Topic.NumeroSolicitacao}
+            mock: {NumeroSolicitacao: FER-2041}
+          - kind: SendActivity
+            id: confirma
+            activity: "✅ Solicitação {Topic.NumeroSolicitacao} criada para {Topic.DataInicio} ({Topic.QtdDias} dias)!"
+          - kind: BeginDialog
+            id: pesquisa
+            dialog: Pesquisa de Satisfação
+      - kind: EndConversation
+        id: fim
+
+Pesquisa de Satisfação:
+  kind: AdaptiveDialog
+  beginDialog:
+    kind: OnRecognizedIntent
+    intent:
+      triggerQueries: [quero avaliar o atendimento, dar feedback]
+    actions:
+      - kind: Question
+        id: nota
+        variable: Topic.Resolvido
+        prompt: Consegui te ajudar?
+        entity: {choices: [Sim, Não]}
+      - kind: ConditionGroup
+        id: checaNota
+        conditions:
+          - id: naoResolvido
+            condition: =Topic.Resolvido = "Não"
+            actions:
+              - kind: SendActivity
+                id: desculpa
+                activity: Sinto muito! Vou registrar para melhorarmos.
+        elseActions:
+          - kind: SendActivity
+            id: obrigado
+            activity: Que bom! Obrigado pelo retorno.
+""",
+"Com problemas (ciclo e beco sem saída)": """\
+Consultar Pedido:
+  kind: AdaptiveDialog
+  beginDialog:
+    kind: OnRecognizedIntent
+    intent:
+      triggerQueries: [onde está meu pedido, status do pedido, rastrear compra]
+    actions:
+      - kind: Question
+        id: numero
+        variable: Topic.Numero
+        prompt: Qual o número do pedido?
+        entity: NumberPrebuiltEntity
+      - kind: SetVariable
+        id: tentativa
+        variable: Topic.Tentativas
+        value: =Topic.Tentativas + 1
+      - kind: ConditionGroup
+        id: valida
+        conditions:
+          - id: invalido
+            condition: =Topic.Numero < 1000
+            actions:
+              - kind: GotoAction
+                id: repete
+                actionId: tentativa
+          - id: zerado
+            condition: =Topic.Numero = 0
+            actions:
+              - kind: SendActivity
+                id: aguarde
+                activity: Aguarde, consultando…
+              - kind: GotoAction
+                id: espera
+                actionId: aguarde
+        elseActions:
+          - kind: SendActivity
+            id: status
+            activity: "O pedido {Topic.Numero} está em transporte."
+          - kind: EndDialog
+            id: sai
+          - kind: SendActivity
+            id: nuncaExecuta
+            activity: Esta mensagem nunca é enviada.
+""",
+}
+
+def tsm_load(text: str) -> dict:
+    # PyYAML é opcional: sem ele o lab aceita o mesmo conteúdo em JSON
+    try:
+        import yaml
+    except ImportError:
+        try:
+            doc = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"PyYAML não está instalado — escreva o tópico em JSON ou instale pyyaml ({e}).")
+    else:
+        try:
+            doc = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ValueError(f"YAML inválido: {e}")
+    if not isinstance(doc, dict) or not doc:
+        raise ValueError("O documento deve mapear nome do tópico → AdaptiveDialog.")
+    return doc
+
+def tsm_value(v):
+    # "=expr" é Power FX; qualquer outro valor é literal
+    return pfx_parse(v[1:]) if isinstance(v, str) and v.startswith("=") else {"t": "lit", "v": v}
+
+def tsm_eval(node, env: dict):
+    """Avaliador escalar de Power FX para condições e variáveis de tópico (Blank = None)."""
+    t = node["t"]
+    if t in ("num", "str", "lit"):
+        return node["v"]
+    if t == "id":
+        if node["name"] in ("true", "false"):
+            return node["name"] == "true"
+        if node["name"] == "Blank":
+            return None
+        return env.get(node["name"])
+    if t == "dot":
+        return env.get(pfx_dotted(node))
+    if t == "un":
+        x = tsm_eval(node["x"], env)
+        if node["op"] not in ("-", "%"):
+            return not x
+        try:
+            x = float(x or 0)
+        except (TypeError, ValueError):
+            raise ValueError(f"Operação '{node['op']}' sobre {x!r} na posição {node['pos']}")
+        return -x if node["op"] == "-" else x / 100
+    if t == "bin":
+        op = node["op"]
+        if op in ("&&", "And"): return bool(tsm_eval(node["l"], env)) and bool(tsm_eval(node["r"], env))
+        if op in ("||", "Or"):  return bool(tsm_eval(node["l"], env)) or bool(tsm_eval(node["r"], env))
+        l, r = tsm_eval(node["l"], env), tsm_eval(node["r"], env)
+        if op == "&":  return f"{'' if l is None else l}{'' if r is None else r}"
+        if op in ("=", "<>"):
+            eq = (str(l).lower() == str(r).lower()) if isinstance(l, str) or isinstance(r, str) else l == r
+            return eq if op == "=" else not eq
+        if op in ("in", "exactin"):
+            return str(l).lower() in str(r).lower() if op == "in" else str(l) in str(r)
+        l, r = (0 if l is None else l), (0 if r is None else r)
+        try:
+            l, r = float(l), float(r)
+        except (TypeError, ValueError):
+            raise ValueError(f"Operação '{op}' entre {l!r} e {r!r} na posição {node['pos']}")
+        if op == "/" and r == 0:
+            raise ValueError("Divisão por zero")
+        ops = {"+": float.__add__, "-": float.__sub__, "*": float.__mul__, "/": float.__truediv__, "^": pow,
+               "<": float.__lt__, ">": float.__gt__, "<=": float.__le__, ">=": float.__ge__}
+        try:
+            return ops[op](l, r)
+        except OverflowError:
+            raise ValueError(f"Resultado fora do intervalo em '{op}' na posição {node['pos']}")
+    if t == "call":
+        name, args = node["name"], node["args"]
+        if name == "If":
+            if len(args) < 2:
+                raise ValueError(f"If() precisa de condição e resultado (posição {node.get('pos', 0)})")
+            for i in range(0, len(args) - 1, 2):
+                if tsm_eval(args[i], env):
+                    return tsm_eval(args[i + 1], env)
+            return tsm_eval(args[-1], env) if len(args) % 2 else None
+        vals = [tsm_eval(a, env) for a in args]
+        if not vals and name not in ("Today", "Now"):
+            raise ValueError(f"{name}() precisa de pelo menos um argumento (posição {node.get('pos', 0)})")
+        if name == "IsBlank": return vals[0] in (None, "")
+        if name == "Not":     return not vals[0]
+        if name == "And":     return all(vals)
+        if name == "Or":      return any(vals)
+        if name == "Text":    return "" if vals[0] is None else pfx_text(vals[0], *vals[1:3]) if isinstance(vals[0], (int, float)) else str(vals[0])
+        if name == "Value":   return pfx_value(vals[0], *vals[1:2]) if vals[0] not in (None, "") else None
+        if name == "Len":     return len(str(vals[0] or ""))
+        if name == "Lower":   return str(vals[0] or "").lower()
+        if name == "Upper":   return str(vals[0] or "").upper()
+        if name in ("Today", "Now"): return datetime.date.today().isoformat()
+    raise ValueError(f"Expressão não suportada no simulador na posição {node.get('pos', 0)}")
+
+class TopicMachine:
+    """
+    Tópicos compilados em um grafo de estados: cada nó tem destinos inteiros já resolvidos
+    (próximo, ramos da condição, Goto, redirecionamento), e o fecho de alcance é precomputado
+    para apontar ciclos sem pergunta, becos sem saída e nós inalcançáveis.
+    """
+    def __init__(self, doc: dict):
+        self.nodes, self.topics, self.entry, self.triggers = [], [], {}, {}
+        for name, dialog in doc.items():
+            dialog = self.field(doc, name, dict, "tópico")
+            body = self.field(dialog, "beginDialog", dict, name)
+            self.topics.append(str(name))
+            self.triggers[str(name)] = [str(q) for q in self.field(self.field(body, "intent", dict, name), "triggerQueries", list, name)]
+            end = self.alloc(str(name), {"kind": "EndDialog", "id": f"{name}·fim"}, implicit=True)
+            self.entry[str(name)] = self.build(str(name), self.field(body, "actions", list, name), end)
+        self.ids = {}
+        for i, n in enumerate(self.nodes):
+            if n["id"] in self.ids and not n["implicit"]:
+                raise ValueError(f"id duplicado: '{n['id']}'")
+            self.ids.setdefault(n["id"], i)
+        for n in self.nodes:
+            for ref in ("actionId", "dialog"):
+                if ref in n["raw"] and not isinstance(n["raw"][ref], str):
+                    raise ValueError(f"'{ref}' em {n['id']} deve ser um nome (texto), não {type(n['raw'][ref]).__name__}")
+            if n["kind"] == "GotoAction":
+                if n["raw"].get("actionId") not in self.ids:
+                    raise ValueError(f"GotoAction '{n['id']}' aponta para id inexistente '{n['raw'].get('actionId')}'")
+                n["goto"] = self.ids[n["raw"]["actionId"]]
+            elif n["kind"] == "BeginDialog":
+                if n["raw"].get("dialog") not in self.entry:
+                    raise ValueError(f"BeginDialog '{n['id']}' redireciona para tópico inexistente '{n['raw'].get('dialog')}'")
+                n["goto"] = self.entry[n["raw"]["dialog"]]
+        self.analyze()
+
+    @staticmethod
+    def field(a: dict, name: str, kind: type, where: str):
+        # Campo ausente vira vazio; tipo errado (T: 5, actions: abc) é erro do autor, não do simulador
+        v = a.get(name)
+        if v is None:
+            return kind()
+        if not isinstance(v, kind):
+            what = {dict: "um mapa (chave: valor)", list: "uma lista (- item)"}[kind]
+            raise ValueError(f"'{name}' ({where}) deve ser {what}, não {type(v).__name__}")
+        return v
+
+    def alloc(self, topic: str, a, implicit: bool = False) -> int:
+        if not isinstance(a, dict):
+            raise ValueError(f"Cada ação em {topic} deve ser um mapa com 'kind', não {type(a).__name__}: {a!r}")
+        kind = a.get("kind")
+        if not isinstance(kind, str) or kind not in TSM_KINDS:
+            raise ValueError(f"kind '{kind}' não suportado em {topic} — use {', '.join(sorted(TSM_KINDS))}")
+        self.nodes.append({"topic": topic, "kind": kind, "id": str(a.get("id") or f"{topic}·{kind}·{len(self.nodes)}"),
+                           "raw": a, "next": None, "branches": [], "else": None, "goto": None, "implicit": implicit})
+        return len(self.nodes) - 1
+
+    def build(self, topic: str, actions: list, cont: int) -> int:
+        # Aloca os irmãos primeiro; cada um aponta para o seguinte e o último para a continuação do pai
+        idx = [self.alloc(topic, a or {}) for a in actions]
+        for k, i in enumerate(idx):
+            n, a = self.nodes[i], self.nodes[i]["raw"]
+            n["next"] = idx[k + 1] if k + 1 < len(idx) else cont
+            if not isinstance(a.get("variable", ""), str):
+                raise ValueError(f"'variable' em {n['id']} deve ser um nome como Topic.Dias, não {a['variable']!r}")
+            if n["kind"] == "ConditionGroup":
+                for c in self.field(a, "conditions", list, n["id"]):
+                    if not isinstance(c, dict):
+                        raise ValueError(f"Cada item de 'conditions' em {n['id']} deve ser um mapa com condition/actions, não {c!r}")
+                    n["branches"].append((str(c.get("condition", "")), tsm_value(str(c.get("condition", "=false"))),
+                                          self.build(topic, self.field(c, "actions", list, n["id"]), n["next"])))
+                n["else"] = self.build(topic, self.field(a, "elseActions", list, n["id"]), n["next"])
+            elif n["kind"] == "SetVariable":
+                n["value"] = tsm_value(a.get("value"))
+            elif n["kind"] == "InvokeFlowAction":
+                n["output"], n["mock"] = self.field(a, "output", dict, n["id"]), self.field(a, "mock", dict, n["id"])
+            elif n["kind"] == "Question":
+                retries = a.get("maxRetries", 2)
+                if isinstance(retries, bool) or not isinstance(retries, int) or retries < 0:
+                    raise ValueError(f"'maxRetries' em {n['id']} deve ser um inteiro ≥ 0, não {retries!r}")
+                n["max_retries"] = retries
+                ent = a.get("entity") or "StringPrebuiltEntity"
+                n["choices"] = [str(c) for c in self.field(ent, "choices", list, n["id"])] if isinstance(ent, dict) else None
+                n["entity"] = "ChoiceEntity" if n["choices"] else str(ent)
+        return idx[0] if idx else cont
+
+    def successors(self, i: int) -> list:
+        n = self.nodes[i]
+        if n["kind"] in TSM_TERMINAL:
+            return []
+        if n["kind"] == "GotoAction":
+            return [n["goto"]]
+        if n["kind"] == "ConditionGroup":
+            return [b for _, _, b in n["branches"]] + [n["else"]]
+        if n["kind"] == "BeginDialog":
+            return [n["goto"], n["next"]]
+        return [n["next"]]
+
+    def analyze(self):
+        k = len(self.nodes)
+        adj = np.zeros((k, k), bool)
+        for i in range(k):
+            adj[i, self.successors(i)] = True
+        reach = adj.copy()
+        for j in range(k):   # fecho transitivo (Warshall) — grafos de tópico têm dezenas/centenas de nós
+            reach |= reach[:, j:j + 1] & reach[j]
+        self.adj, self.reach = adj, reach
+        terminal = np.array([n["kind"] in TSM_TERMINAL for n in self.nodes])
+        question = np.array([n["kind"] == "Question" for n in self.nodes])
+        entries = list(self.entry.values())
+        live = np.zeros(k, bool)
+        live[entries] = True
+        live |= reach[entries].any(axis=0)
+        on_cycle = np.diag(reach)
+        # Ciclo que não passa por nenhuma pergunta gira para sempre sem esperar o usuário
+        self.loops = [i for i in np.flatnonzero(on_cycle) if not (question & reach[i] & reach[:, i]).any() and not question[i]]
+        self.cycles = np.flatnonzero(on_cycle).tolist()
+        self.dead_ends = [i for i in np.flatnonzero(live & ~terminal) if not (reach[i] & terminal).any()]
+        self.unreachable = [i for i in np.flatnonzero(~live) if not self.nodes[i]["implicit"]]
+
+    def dot(self, visited: Optional[set] = None) -> str:
+        visited = visited or set()
+        out = ["digraph { rankdir=TB; node [shape=box, style=\"rounded,filled\", fontname=Helvetica, fontsize=10, fillcolor=\"#f3f4f6\"];"]
+        colors = {"Question": "#ede9fe", "ConditionGroup": "#fef3c7", "InvokeFlowAction": "#dbeafe", "BeginDialog": "#dcfce7",
+                  "EndDialog": "#e5e7eb", "EndConversation": "#e5e7eb", "GotoAction": "#ffedd5"}
+        bad = set(self.loops) | set(self.dead_ends) | set(self.unreachable)
+        for t in self.topics:
+            out.append(f'subgraph "cluster_{t}" {{ label="{t}"; fontname=Helvetica; color="#d1d5db";')
+            for i, n in enumerate(self.nodes):
+                if n["topic"] == t:
+                    fill = "#fecaca" if i in bad else "#bbf7d0" if i in visited else colors.get(n["kind"], "#f3f4f6")
+                    out.append(f'n{i} [label="{n["id"]}\\n{n["kind"]}", fillcolor="{fill}"];')
+            out.append("}")
+        for i, n in enumerate(self.nodes):
+            if n["kind"] == "ConditionGroup":
+                out += [f'n{i} -> n{b} [label="{c.replace(chr(34), "")}", fontsize=9];' for c, _, b in n["branches"]]
+                out.append(f'n{i} -> n{n["else"]} [label="senão", fontsize=9];')
+            elif n["kind"] == "BeginDialog":
+                out += [f'n{i} -> n{n["goto"]} [style=dashed, label="redireciona"];', f'n{i} -> n{n["next"]} [style=dotted, label="retorno"];']
+            else:
+                out += [f'n{i} -> n{j};' for j in self.successors(i)]
+        return "\n".join(out + ["}"])
+
+    # ── execução ──
+    def start(self, topic: str, env: Optional[dict] = None) -> dict:
+        return {"pc": self.entry[topic], "stack": [], "vars": dict(env or {}), "waiting": False, "retries": 0,
+                "visited": [], "branches": [], "status": "em andamento"}
+
+    def answer(self, n: dict, text: str, ref: datetime.datetime):
+        # Resolve a resposta com o extrator de entidades built-in; None = não reconhecida
+        if n["entity"] == "ChoiceEntity":
+            f = intent_fold(text)
+            return next((c for c in n["choices"] if intent_fold(c) == f or intent_fold(c) in f.split()), None)
+        if n["entity"] == "BooleanPrebuiltEntity":
+            f = intent_fold(text).split()
+            return True if {"sim", "yes", "claro", "s"} & set(f) else False if {"nao", "no", "n"} & set(f) else None
+        if n["entity"] in ("NumberPrebuiltEntity", "DateTimePrebuiltEntity"):
+            want = "Número" if n["entity"] == "NumberPrebuiltEntity" else "Data e Hora"
+            return next((v for _, _, kind, _, v in ent_extract(text, ref, "pt-BR") if kind == want and v is not None), None)
+        return text.strip() or None
+
+    def render(self, text: str, env: dict) -> str:
+        return re.sub(r"\{([\w.]+)\}", lambda m: "" if env.get(m.group(1)) is None else
+                      (f"{env[m.group(1)]:g}" if isinstance(env[m.group(1)], float) else str(env[m.group(1)])), str(text))
+
+    def run(self, s: dict, text: Optional[str] = None, ref: Optional[datetime.datetime] = None) -> list:
+        """Avança até a próxima pergunta (ou fim). Devolve as mensagens do bot desse trecho."""
+        out, ref = [], ref or datetime.datetime.combine(datetime.date.today(), datetime.time(9))
+        for _ in range(TSM_MAX_STEPS):
+            if s["pc"] is None:
+                return out
+            i = s["pc"]
+            n, a = self.nodes[i], self.nodes[i]["raw"]
+            if not s["waiting"]:
+                s["visited"].append(i)
+            kind = n["kind"]
+            if kind == "SendActivity":
+                out.append(self.render(a.get("activity", ""), s["vars"]))
+                s["pc"] = n["next"]
+            elif kind == "Question":
+                if not s["waiting"]:
+                    out.append(self.render(a.get("prompt", ""), s["vars"]) + (f"  [{' / '.join(n['choices'])}]" if n["choices"] else ""))
+                    s["waiting"] = True
+                    return out
+                if text is None:
+                    return out
+                val, text = self.answer(n, text, ref), None
+                if val is None and s["retries"] < n["max_retries"]:
+                    s["retries"] += 1
+                    out.append(a.get("repeatPrompt") or "Desculpe, não entendi. " + self.render(a.get("prompt", ""), s["vars"]))
+                    return out
+                s["vars"][a.get("variable", "Topic.Resposta")] = val
+                s["waiting"], s["retries"], s["pc"] = False, 0, n["next"]
+            elif kind == "ConditionGroup":
+                target, label = n["else"], "senão"
+                for c, ast, b in n["branches"]:
+                    if tsm_eval(ast, s["vars"]):
+                        target, label = b, c
+                        break
+                s["branches"].append((i, label))
+                s["pc"] = target
+            elif kind == "SetVariable":
+                s["vars"][a.get("variable", "Topic.Var")] = tsm_eval(n["value"], s["vars"])
+                s["pc"] = n["next"]
+            elif kind == "InvokeFlowAction":
+                for k, var in n["output"].items():
+                    s["vars"][str(var)] = n["mock"].get(k)
+                out.append(f"⚡ flow “{a.get('flowId', '?')}” executado")
+                s["pc"] = n["next"]
+            elif kind == "BeginDialog":
+                s["stack"].append(n["next"])
+                s["pc"] = n["goto"]
+            elif kind == "GotoAction":
+                s["pc"] = n["goto"]
+            elif kind == "EndDialog":
+                s["pc"] = s["stack"].pop() if s["stack"] else None
+                if s["pc"] is None:
+                    s["status"] = "concluído"
+            else:
+                s["pc"], s["status"] = None, "conversa encerrada"
+        s["pc"], s["status"] = None, f"⛔ loop: {TSM_MAX_STEPS} passos sem esperar o usuário"
+        out.append(s["status"])
+        return out
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def tsm_compile(text: str) -> TopicMachine:
+    return TopicMachine(tsm_load(text))
+
+def tsm_fake_answer(n: dict, rng: random.Random) -> str:
+    if rng.random() < .15:
+        return rng.choice(["não sei", "hmm", "pode repetir?", "asdf"])
+    if n["entity"] == "ChoiceEntity":
+        return rng.choice(n["choices"])
+    if n["entity"] == "NumberPrebuiltEntity":
+        return rng.choice([str(rng.randint(1, 60)), f"{rng.randint(1, 5000)}", rng.choice(["dez", "quinze", "quarenta"])])
+    if n["entity"] == "DateTimePrebuiltEntity":
+        return rng.choice(["amanhã", f"{rng.randint(1, 28)}/{rng.randint(1, 12)}", "próxima segunda"])
+    if n["entity"] == "BooleanPrebuiltEntity":
+        return rng.choice(["sim", "não"])
+    return rng.choice(["tudo certo", "preciso de ajuda", "ok"])
+
+@st.cache_data(max_entries=16, show_spinner="Reproduzindo conversas…")
+def tsm_replay(text: str, n: int, seed: int = 6) -> dict:
+    """Reproduz n conversas roteirizadas (gatilho + respostas geradas) e mede a cobertura de nós e ramos."""
+    m = tsm_compile(text)
+    rng = random.Random(seed)
+    starts = [t for t in m.topics if m.triggers[t]] or m.topics
+    node_hits = np.zeros(len(m.nodes), np.int64)
+    branch_hits, status, turns = {}, {}, []
+    t0 = time.perf_counter()
+    for _ in range(n):
+        s = m.start(rng.choice(starts), {"System.User.DisplayName": "Ana"})
+        k = 0
+        try:
+            m.run(s)
+            while s["pc"] is not None and k < 30:
+                m.run(s, tsm_fake_answer(m.nodes[s["pc"]], rng))
+                k += 1
+        except ValueError as e:   # erro de execução (ex.: divisão por zero com a resposta gerada) encerra só esta conversa
+            s["pc"], s["status"] = None, f"erro: {e}"
+        np.add.at(node_hits, s["visited"], 1)
+        for b in s["branches"]:
+            branch_hits[b] = branch_hits.get(b, 0) + 1
+        st_ = s["status"] if s["pc"] is None else "sem resposta (30 turnos)"
+        status[st_] = status.get(st_, 0) + 1
+        turns.append(k)
+    ms = (time.perf_counter() - t0) * 1000
+    all_branches = [(i, c) for i, nd in enumerate(m.nodes) if nd["kind"] == "ConditionGroup" for c in [c for c, _, _ in nd["branches"]] + ["senão"]]
+    real = [i for i, nd in enumerate(m.nodes) if not nd["implicit"]]
+    return {"ms": ms, "node_cov": float((node_hits[real] > 0).mean()) if real else 0.0,
+            "branch_cov": sum(b in branch_hits for b in all_branches) / max(len(all_branches), 1),
+            "status": status, "turns": float(np.mean(turns)) if turns else 0.0,
+            "hits": node_hits.tolist(), "missed_branches": [(m.nodes[i]["id"], c) for i, c in all_branches if (i, c) not in branch_hits]}
+
+def topic_lab(key: str):
+    import pandas as pd
+    lab_header("🧭 Laboratório — Tópico em YAML → máquina de estados","Compile o tópico, veja ciclos e becos sem saída, converse com ele e reproduza milhares de conversas para medir a cobertura")
+    pick = st.selectbox("Exemplo",list(TSM_SAMPLES),key=f"{key}_ex")
+    c1,c2 = st.columns([1,1.2],gap="large")
+    with c1:
+        text = st.text_area("YAML (editor de código do Copilot Studio)",TSM_SAMPLES[pick],height=420,key=f"{key}_yaml_{pick}")
+    try:
+        m = tsm_compile(text)
+    except ValueError as e:
+        c2.error(f"❌ {e}")
+        return
+    with c2:
+        m1,m2,m3,m4 = st.columns(4)
+        m1.metric("Estados", len([n for n in m.nodes if not n["implicit"]]))
+        m2.metric("Ciclos", len(m.cycles))
+        m3.metric("Loops sem pergunta", len(m.loops))
+        m4.metric("Inalcançáveis", len(m.unreachable))
+        for label, items in (("⛔ Loop sem esperar o usuário", m.loops), ("🚧 Beco sem saída (não chega a um fim)", m.dead_ends), ("👻 Nunca executa", m.unreachable)):
+            if items:
+                st.warning(f"{label}: " + ", ".join(m.nodes[i]["id"] for i in items))
+        chat = st.session_state.get(f"{key}_chat")
+        if chat is None or chat["text"] != text:
+            chat = st.session_state[f"{key}_chat"] = {"text": text, "state": None, "log": []}
+        box = st.container(height=260)
+        for who, msg in chat["log"]:
+            box.chat_message(who).write(msg)
+        said = st.chat_input("Diga algo ao agente…",key=f"{key}_in")
+        if said:
+            chat["log"].append(("user", said))
+            try:
+                if chat["state"] is None or chat["state"]["pc"] is None:
+                    idx = intent_index(tuple((t, tuple(m.triggers[t])) for t in m.topics if m.triggers[t]))
+                    best, _ = idx.scores([said])
+                    topic = idx.topics[int(np.argmax(best[0]))] if best[0].max() >= 0.3 else None
+                    if topic is None:
+                        chat["log"].append(("assistant", "🤷 Fallback: não entendi. Pode reformular?"))
+                    else:
+                        chat["state"] = m.start(topic, {"System.User.DisplayName": current_user()["name"].split()[0]})
+                        chat["log"] += [("assistant", f"🎯 tópico: {topic}")] + [("assistant", x) for x in m.run(chat["state"])]
+                else:
+                    chat["log"] += [("assistant", x) for x in m.run(chat["state"], said)]
+            except ValueError as e:
+                chat["log"].append(("assistant", f"❌ {e}"))
+            st.rerun()
+        s = chat["state"]
+        if s:
+            st.caption(f"Estado: **{m.nodes[s['pc']]['id'] if s['pc'] is not None else s['status']}** · variáveis: " +
+                       ", ".join(f"{k} = {v!r}" for k, v in s["vars"].items() if not k.startswith("System.")))
+        if st.button("🔄 Reiniciar conversa",key=f"{key}_reset"):
+            st.session_state[f"{key}_chat"] = None
+            st.rerun()
+    st.graphviz_chart(m.dot(set(s["visited"]) if s else None), use_container_width=True)
+    col_label("🔁 Replay em lote")
+    b1,b2 = st.columns([1,3])
+    n = b1.select_slider("Conversas",[500,2_000,10_000],2_000,format_func=lambda v: f"{v:,}",key=f"{key}_n")
+    r = tsm_replay(text, n)
+    with b2:
+        k1,k2,k3,k4 = st.columns(4)
+        k1.metric("Cobertura de nós", f"{r['node_cov']:.0%}")
+        k2.metric("Cobertura de ramos", f"{r['branch_cov']:.0%}")
+        k3.metric("Turnos médios", f"{r['turns']:.1f}")
+        k4.metric("Vazão", f"{n / max(r['ms'], 1e-3) * 1000:,.0f} conversas/s")
+    d1,d2 = st.columns(2)
+    d1.dataframe(pd.DataFrame([{"Desfecho": k, "Conversas": v} for k, v in r["status"].items()]), use_container_width=True, hide_index=True)
+    d2.dataframe(pd.DataFrame([{"Estado": nd["id"], "Tipo": nd["kind"], "Visitas": h} for nd, h in zip(m.nodes, r["hits"]) if not nd["implicit"]]),
+                 use_container_width=True, hide_index=True, height=220)
+    if r["missed_branches"]:
+        st.caption("Ramos nunca percorridos: " + "; ".join(f"{i} → {c}" for i, c in r["missed_branches"]))
+
+
 # ─────────────────────────────────────────────
 # COPILOT STUDIO — Tópicos & Diálogos
 # ─────────────────────────────────────────────
@@ -2602,6 +6765,8 @@ def page_copilot_topicos():
 // Condição:
 // Topic.NumeroPedido is not blank''',
                 color="#7c3aed")
+        sp()
+        intent_lab("intent_top")
 
     with tabs[1]:
         st.markdown("#### Tipos de Nós de Diálogo")
@@ -2639,6 +6804,8 @@ def page_copilot_topicos():
 [Mensagem] "✅ Solicitação {Topic.NumeroSolicitacao} criada! Seu gestor receberá o e-mail de aprovação."
     ↓
 [Encerrar conversa]''', language="text")
+        sp()
+        topic_lab("tsm_top")
 
     with tabs[2]:
         c1,c2 = st.columns(2)
@@ -2725,6 +6892,310 @@ def page_copilot_topicos():
     st.markdown('</div>', unsafe_allow_html=True)
 
 
+# ─────────────────────────────────────────────
+# COPILOT STUDIO — Extrator de Entidades (pt-BR / en-US)
+# ─────────────────────────────────────────────
+ENT_UNITS = {
+    "zero": 0, "um": 1, "uma": 1, "dois": 2, "duas": 2, "tres": 3, "quatro": 4, "cinco": 5, "seis": 6, "sete": 7, "oito": 8,
+    "nove": 9, "dez": 10, "onze": 11, "doze": 12, "treze": 13, "quatorze": 14, "catorze": 14, "quinze": 15, "dezesseis": 16,
+    "dezessete": 17, "dezoito": 18, "dezenove": 19, "vinte": 20, "trinta": 30, "quarenta": 40, "cinquenta": 50, "sessenta": 60,
+    "setenta": 70, "oitenta": 80, "noventa": 90, "cem": 100, "cento": 100, "duzentos": 200, "duzentas": 200, "trezentos": 300,
+    "quatrocentos": 400, "quinhentos": 500, "seiscentos": 600, "setecentos": 700, "oitocentos": 800, "novecentos": 900,
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+    "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16, "seventeen": 17,
+    "eighteen": 18, "nineteen": 19, "twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70,
+    "eighty": 80, "ninety": 90,
+}
+ENT_SCALE = {"mil": 1e3, "milhao": 1e6, "milhoes": 1e6, "bilhao": 1e9, "bilhoes": 1e9, "k": 1e3, "mi": 1e6,
+             "thousand": 1e3, "million": 1e6, "billion": 1e9}
+ENT_MONTHS = {m: i + 1 for names in (["janeiro", "fevereiro", "marco", "abril", "maio", "junho", "julho", "agosto", "setembro", "outubro", "novembro", "dezembro"],
+                                     ["january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november", "december"])
+              for i, m in enumerate(names)}
+ENT_WEEKDAYS = {d: i % 7 for names in (["segunda", "terca", "quarta", "quinta", "sexta", "sabado", "domingo"],
+                                       ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"])
+                for i, d in enumerate(names)}
+ENT_RELATIVE = {"depois de amanha": 2, "day after tomorrow": 2, "amanha": 1, "tomorrow": 1, "hoje": 0, "today": 0, "ontem": -1, "yesterday": -1}
+ENT_SECONDS = [("hor", 3600), ("hour", 3600), ("hr", 3600), ("min", 60), ("seg", 1), ("sec", 1), ("dia", 86400), ("day", 86400),
+               ("semana", 604800), ("week", 604800), ("mes", 2592000), ("month", 2592000), ("ano", 31536000), ("year", 31536000)]
+# Dobra acentos caractere a caractere: o texto dobrado tem o mesmo tamanho, então os spans valem para o original
+ENT_FOLD = {c: unicodedata.normalize("NFKD", chr(c))[0] for c in range(0xC0, 0x250) if unicodedata.normalize("NFKD", chr(c))[0].isascii()}
+
+def ent_alt(words) -> str:
+    return "(?:" + "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True)) + ")"
+
+_S = r"[ \t]"   # nunca \s: o lote é uma string só, separada por \n
+ENT_NUMD = r"\d+(?:[.,]\d+)*"
+ENT_WORD = rf"\b{ent_alt(ENT_UNITS.keys() | ENT_SCALE.keys() - {'k', 'mi'} | {'hundred'})}\b"
+ENT_NUMW = rf"{ENT_WORD}(?:(?:{_S}+(?:e|and){_S}+|{_S}+|-){ENT_WORD})*"
+ENT_NUM = rf"(?:\b{ENT_NUMD}(?:{_S}*{ent_alt(ENT_SCALE)}\b)?|{ENT_NUMW})"
+ENT_TIME = rf"\b\d{{1,2}}(?:h\d{{2}}\b|h\b|:\d{{2}}(?:{_S}*[ap]m\b)?|{_S}*[ap]m\b)"
+ENT_DATE = "|".join([
+    r"\b\d{4}-\d{2}-\d{2}\b", r"\b\d{1,2}/\d{1,2}(?:/\d{2,4})?\b",
+    rf"\b\d{{1,2}}{_S}+de{_S}+{ent_alt(ENT_MONTHS)}\b(?:{_S}+de{_S}+\d{{4}})?",
+    rf"\b{ent_alt(ENT_MONTHS)}{_S}+\d{{1,2}}(?:st|nd|rd|th)?\b(?:,?{_S}+\d{{4}})?",
+    rf"\b{ent_alt(ENT_RELATIVE)}\b",
+    rf"\b(?:(?:proxim[oa]|next|this|esta|nest[ae]){_S}+)?{ent_alt(ENT_WEEKDAYS)}(?:-feira)?\b",
+])
+ENT_PATTERNS = [
+    ("URL",         r"\b(?:https?://|www\.)[^\s<>\"']*[^\s<>\"'.,;:!?)]"),
+    ("Email",       r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+"),
+    ("Data e Hora", rf"\b(?:daqui{_S}+a|in){_S}+{ENT_NUM}{_S}*(?:minutos?|horas?|dias?|semanas?|mes(?:es)?|anos?|minutes?|hours?|days?|weeks?|months?|years?)\b"
+                    rf"|(?:{ENT_DATE})(?:,?{_S}*(?:(?:as|a|at|@){_S}*)?{ENT_TIME})?|(?:(?:as|at){_S}+)?{ENT_TIME}"),
+    ("CEP",         rf"\b\d{{5}}-\d{{3}}\b|\bcep:?{_S}*\d{{8}}\b|\bzip(?:{_S}*code)?:?{_S}*\d{{5}}(?:-\d{{4}})?\b"),
+    ("Telefone",    rf"(?:\+\d{{1,3}}{_S}?)?(?:\(\d{{2,3}}\){_S}?\d{{3,5}}[- ]\d{{4}}\b|\b\d{{2,3}}[ -]\d{{3,5}}-\d{{4}}\b|\b\d{{4,5}}-\d{{4}}\b)"),
+    ("Moeda",       rf"(?:r\$|us\$|\$|€|£){_S}*{ENT_NUMD}(?:{_S}*{ent_alt(ENT_SCALE)}\b)?"),
+    ("Duração",     rf"\buma{_S}+hora{_S}+e{_S}+meia\b|\ban?{_S}+hour{_S}+and{_S}+a{_S}+half\b|\bmeia{_S}+hora\b|\bhalf{_S}+(?:an{_S}+)?hour\b"),
+]
+# Entidades que começam por um número: um só ENT_NUM, e o sufixo decide se é Moeda, %, Duração ou Temperatura
+ENT_SUFFIXES = [
+    ("Moeda",       r"(?:reais|real|dolares|dolar|dollars?|bucks|euros?)\b"),
+    ("Porcentagem", rf"(?:%|por{_S}+cento\b|percent\b|per{_S}+cent\b)"),
+    ("Duração",     r"(?:horas?|hrs?|minutos?|mins?|segundos?|dias?|semanas?|meses|mes|anos?|hours?|minutes?|seconds?|days?|weeks?|months?|years?)\b"),
+    ("Temperatura", rf"(?:°{_S}*[cf]?|graus(?:{_S}+(?:celsius|fahrenheit))?\b|degrees(?:{_S}+(?:celsius|fahrenheit))?\b)"),
+]
+ENT_PATTERNS.append(("Número", rf"{ENT_NUM}(?:{_S}*(?:" + "|".join(f"(?P<s{i}>{p})" for i, (_, p) in enumerate(ENT_SUFFIXES)) + "))?"))
+ENT_GROUPS = {f"e{i}": name for i, (name, _) in enumerate(ENT_PATTERNS)}
+# Um único autômato: as alternativas são tentadas na ordem acima em cada posição (URL antes de Número etc.).
+# O lookbehind descarta de cara o meio das palavras, onde nenhuma entidade começa
+ENT_RE = re.compile("(?<!\\w)(?:" + "|".join(f"(?P<e{i}>{p})" for i, (_, p) in enumerate(ENT_PATTERNS)) + ")")
+ENT_NUM_RE = re.compile(ENT_NUM)
+ENT_TIME_RE = re.compile(rf"(\d{{1,2}})(?:h(\d{{2}})?|:(\d{{2}}))?{_S}*([ap]m)?$")
+ENT_COLORS = {"URL": "#dbeafe", "Email": "#e0e7ff", "Data e Hora": "#fef3c7", "CEP": "#fce7f3", "Telefone": "#ede9fe",
+              "Moeda": "#dcfce7", "Porcentagem": "#ccfbf1", "Duração": "#ffedd5", "Temperatura": "#fee2e2", "Número": "#f3f4f6"}
+
+def ent_fold(text: str) -> str:
+    return text.translate(ENT_FOLD).lower()
+
+def ent_kind(m) -> str:
+    kind = ENT_GROUPS[m.lastgroup]
+    if kind == "Número":
+        kind = next((k for i, (k, _) in enumerate(ENT_SUFFIXES) if m.group(f"s{i}") is not None), kind)
+    return kind
+
+def ent_number(s: str, locale: str) -> float:
+    """'1.250,90' (pt-BR) / '1,250.90' (en-US), '2,5 mil', 'cinco mil e trezentos', 'twenty-five'."""
+    m = ENT_NUM_RE.search(s)
+    if not m:
+        raise ValueError(f"Número não reconhecido em '{s}'")
+    s = m.group().strip()
+    d = re.match(ENT_NUMD, s)
+    if d:
+        num, rest = d.group(), s[d.end():].strip()
+        dec, grp = (",", ".") if locale == "pt-BR" else (".", ",")
+        if "," in num and "." in num:
+            dec, grp = (",", ".") if num.rfind(",") > num.rfind(".") else (".", ",")
+        if dec in num:
+            num = num.replace(grp, "").replace(dec, ".")
+        elif re.fullmatch(rf"\d{{1,3}}(?:\{grp}\d{{3}})+", num):
+            num = num.replace(grp, "")
+        else:
+            num = num.replace(grp, ".")
+        return float(num) * ENT_SCALE.get(rest, 1)
+    total = cur = 0.0
+    for w in re.split(r"[ \t-]+", s):
+        if w in ("e", "and"):
+            continue
+        if w == "hundred":
+            cur = max(cur, 1) * 100
+        elif w in ENT_SCALE:
+            total += max(cur, 1) * ENT_SCALE[w]
+            cur = 0
+        else:
+            cur += ENT_UNITS[w]
+    return total + cur
+
+def ent_seconds(s: str, locale: str) -> float:
+    if "meia" in s or "half" in s:
+        return 5400 if s.startswith(("uma", "a ", "an ")) else 1800
+    unit = s[ENT_NUM_RE.search(s).end():].strip()
+    return ent_number(s, locale) * next(v for k, v in ENT_SECONDS if unit.startswith(k))
+
+def ent_iso_duration(sec: float) -> str:
+    d, rem = divmod(int(round(sec)), 86400)
+    h, rem = divmod(rem, 3600)
+    m, s = divmod(rem, 60)
+    t = "".join(f"{v}{u}" for v, u in ((h, "H"), (m, "M"), (s, "S")) if v)
+    return "P" + (f"{d}D" if d else "") + (f"T{t}" if t else "" if d else "T0S")
+
+def ent_datetime(s: str, ref: datetime.datetime, locale: str) -> str:
+    """Resolve a expressão para ISO 8601 relativo a `ref` (como o Copilot faz com a hora da conversa)."""
+    m = re.match(rf"(?:daqui{_S}+a|in){_S}+(.+)", s)
+    if m:
+        unit = m.group(1)[ENT_NUM_RE.search(m.group(1)).end():].strip()
+        n = ent_number(m.group(1), locale) * (12 if unit.startswith(("ano", "year")) else 1)
+        if unit.startswith(("mes", "month", "ano", "year")) and n == int(n):
+            # Meses e anos de calendário: mesmo dia, limitado ao fim do mês (31/01 + 1 mês = 28 ou 29/02)
+            y, mo = divmod(ref.year * 12 + ref.month - 1 + int(n), 12)
+            return datetime.date(y, mo + 1, min(ref.day, calendar.monthrange(y, mo + 1)[1])).isoformat()
+        sec = ent_seconds(m.group(1), locale)
+        out = ref + datetime.timedelta(seconds=sec)
+        return out.isoformat(timespec="minutes") if sec < 86400 else out.date().isoformat()
+    d, rest = None, s
+    for i, pat in enumerate((r"(\d{4})-(\d{2})-(\d{2})", r"(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?",
+                             rf"(\d{{1,2}}){_S}+de{_S}+([a-z]+)(?:{_S}+de{_S}+(\d{{4}}))?", rf"([a-z]+){_S}+(\d{{1,2}})(?:st|nd|rd|th)?(?:,?{_S}+(\d{{4}}))?")):
+        m = re.match(pat, s)
+        if not m or (i == 3 and m.group(1) not in ENT_MONTHS):
+            continue
+        a, b, c = m.groups()
+        if i == 0:
+            y, mo, day = int(a), int(b), int(c)
+        elif i == 1:
+            day, mo = (int(a), int(b)) if locale == "pt-BR" else (int(b), int(a))
+            y = int(c) + (2000 if len(c) == 2 else 0) if c else ref.year
+        elif i == 2:
+            day, mo, y = int(a), ENT_MONTHS[b], int(c) if c else ref.year
+        else:
+            mo, day, y = ENT_MONTHS[a], int(b), int(c) if c else ref.year
+        d, rest = datetime.date(y, mo, day), s[m.end():]
+        break
+    if d is None:
+        for w, k in ENT_RELATIVE.items():
+            if s.startswith(w):
+                d, rest = ref.date() + datetime.timedelta(days=k), s[len(w):]
+                break
+    if d is None:
+        m = re.match(rf"(?:(proxim[oa]|next|this|esta|nest[ae]){_S}+)?([a-z]+)(?:-feira)?", s)
+        if m and m.group(2) in ENT_WEEKDAYS:
+            ahead = (ENT_WEEKDAYS[m.group(2)] - ref.weekday()) % 7
+            d, rest = ref.date() + datetime.timedelta(days=ahead or (7 if m.group(1) in ("proxima", "proximo", "next") else 0)), s[m.end():]
+    rest = re.sub(rf"^,?{_S}*(?:(?:at|as|a|@){_S}*)?", "", rest).strip()
+    t = ENT_TIME_RE.match(rest)
+    if t is None:
+        return (d or ref.date()).isoformat()
+    h, mi = int(t.group(1)), int(t.group(2) or t.group(3) or 0)
+    if t.group(4) == "pm" and h < 12: h += 12
+    if t.group(4) == "am" and h == 12: h = 0
+    return datetime.datetime.combine(d or ref.date(), datetime.time(h, mi)).isoformat(timespec="minutes")
+
+def ent_resolve(kind: str, s: str, raw: str, ref: datetime.datetime, locale: str):
+    if kind == "Número":      return ent_number(s, locale)
+    if kind == "Porcentagem": return ent_number(s, locale) / 100
+    if kind == "Moeda":
+        cur = "USD" if re.search(r"us\$|\$|dolar|dollar|bucks", s) and "r$" not in s else "EUR" if re.search(r"€|euro", s) else "GBP" if "£" in s else "BRL"
+        return f"{pfx_text(ent_number(s, locale), '#,##0.00', locale, 'en-US')} {cur}"
+    if kind == "Duração":     return ent_iso_duration(ent_seconds(s, locale))
+    if kind == "Temperatura": return f"{ent_number(s, locale):g} °{'F' if 'f' in s.split()[-1] or s.endswith('f') else 'C'}"
+    if kind == "Data e Hora": return ent_datetime(s, ref, locale)
+    if kind == "Telefone":    return re.sub(r"[^\d+]", "", raw)
+    if kind == "CEP":         return re.sub(r"\D", "", raw)
+    return raw
+
+def ent_extract(text: str, ref: datetime.datetime, locale: str) -> list:
+    """[(início, fim, entidade, texto, valor)] — um passe do autômato combinado sobre o texto dobrado."""
+    folded = ent_fold(text)
+    out = []
+    for m in ENT_RE.finditer(folded):
+        kind = ent_kind(m)
+        try:
+            val = ent_resolve(kind, m.group(), text[m.start():m.end()], ref, locale)
+        except (ValueError, KeyError, StopIteration, OverflowError):
+            val = None   # ex.: 31/02 casa o padrão, mas não é data
+        out.append((m.start(), m.end(), kind, text[m.start():m.end()], val))
+    return out
+
+def ent_sample_utterances(n: int, seed: int = 8) -> list:
+    rng = random.Random(seed)
+    names = ["ana", "bruno", "carla", "diego", "maria.silva", "joao"]
+    tpl = [
+        lambda: f"Quero agendar para {rng.choice(['amanhã', 'hoje', 'próxima sexta', f'{rng.randint(1, 28)}/{rng.randint(1, 12)}', f'{rng.randint(1, 28)} de março'])} às {rng.randint(8, 18)}h{rng.choice(['', '30'])}",
+        lambda: f"meu email é {rng.choice(names)}@contoso.com e o telefone (11) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+        lambda: f"o orçamento ficou em R$ {rng.randint(1, 99)}.{rng.randint(100, 999)},{rng.randint(10, 99)} com desconto de {rng.randint(5, 40)}%",
+        lambda: f"paguei {rng.choice(['cinquenta', 'cem', 'cinco mil', 'duzentos e trinta'])} reais e demorou {rng.choice(['meia hora', 'duas horas', '3 dias', 'uma hora e meia'])}",
+        lambda: f"entregar no CEP {rng.randint(10000, 99999)}-{rng.randint(100, 999)}, está fazendo {rng.randint(10, 38)} graus",
+        lambda: f"schedule it for {rng.choice(['tomorrow', 'next monday', 'march 3rd'])} at {rng.randint(1, 11)}pm, budget ${rng.randint(1, 9)},{rng.randint(100, 999)}.00",
+        lambda: f"veja https://contoso.sharepoint.com/sites/vendas/{rng.randint(1, 999)} e confirme em {rng.choice(['dez', 'quinze', 'vinte e cinco'])} por cento dos casos",
+        lambda: f"preciso de {rng.randint(2, 500)} unidades daqui a {rng.randint(2, 10)} dias",
+        lambda: "oi, tudo bem? preciso de ajuda com meu acesso",
+    ]
+    return [rng.choice(tpl)() for _ in range(n)]
+
+@st.cache_data(max_entries=8, show_spinner="Extraindo entidades do lote…")
+def ent_batch(digest: str, _texts: list, ref: datetime.datetime, locale: str) -> dict:
+    # O lote inteiro vira uma string só: um finditer e as posições mapeadas para a frase por searchsorted
+    t0 = time.perf_counter()
+    texts = [t.replace("\n", " ") for t in _texts]
+    blob = "\n".join(texts)
+    folded = ent_fold(blob)
+    starts = np.cumsum([0] + [len(t) + 1 for t in texts[:-1]])
+    pos, kinds, vals = [], [], []
+    for m in ENT_RE.finditer(folded):
+        kind = ent_kind(m)
+        try:
+            vals.append(ent_resolve(kind, m.group(), blob[m.start():m.end()], ref, locale))
+        except (ValueError, KeyError, StopIteration, OverflowError):
+            vals.append(None)
+        pos.append(m.start()); kinds.append(kind)
+    ms = (time.perf_counter() - t0) * 1000
+    row = np.searchsorted(starts, np.array(pos, np.int64), side="right") - 1
+    sample = [{"Frase #": int(r), "Entidade": k, "Valor": "—" if v is None else str(v)} for r, k, v in zip(row[:300], kinds[:300], vals[:300])]
+    return {"ms": ms, "n": len(texts), "bytes": len(blob.encode()), "matches": len(pos),
+            "with_entity": int(len(np.unique(row))), "counts": {k: kinds.count(k) for k in ENT_COLORS if k in kinds},
+            "unresolved": sum(v is None for v in vals), "sample": sample, "texts": texts[:int(row[min(len(row), 300) - 1]) + 1] if len(row) else []}
+
+ENT_SAMPLE = "Quero agendar para amanhã às 14h30, valor de R$ 1.250,90 e desconto de dez por cento. Meu e-mail é ana@contoso.com, telefone (11) 98765-4321, CEP 01310-100. Leva meia hora, está fazendo 28 graus — detalhes em www.contoso.com/pedidos. Preciso de cinco mil e trezentos itens."
+
+def entity_lab(key: str):
+    import html, io
+    import pandas as pd
+    lab_header("🧪 Extrator de Entidades Built-in","Um autômato regex combinado + números por extenso (\"cinco mil\", \"meia hora\") — teste ao vivo ou em lote")
+    c1,c2,c3 = st.columns([1,1,1])
+    locale = c1.radio("Idioma do agente",["pt-BR","en-US"],horizontal=True,key=f"{key}_loc",help="Define o separador decimal (1.250,90 × 1,250.90) e dia/mês × mês/dia. As palavras dos dois idiomas são sempre reconhecidas.")
+    day = c2.date_input("Data da conversa",datetime.date.today(),key=f"{key}_day")
+    hour = c3.time_input("Hora",datetime.time(9, 0),key=f"{key}_hour")
+    ref = datetime.datetime.combine(day, hour)
+    text = st.text_area("Frase do usuário",ENT_SAMPLE,height=90,key=f"{key}_txt")
+    t0 = time.perf_counter()
+    found = ent_extract(text, ref, locale)
+    ms = (time.perf_counter() - t0) * 1000
+    parts, last = [], 0
+    for a, b, kind, raw, _ in found:
+        parts.append(html.escape(text[last:a]))
+        parts.append(f'<mark title="{kind}" style="background:{ENT_COLORS[kind]};border-radius:4px;padding:1px 3px">{html.escape(raw)}'
+                     f'<sup style="font-size:9px;color:#6b7280;margin-left:2px">{kind}</sup></mark>')
+        last = b
+    parts.append(html.escape(text[last:]))
+    st.markdown(f'<div style="background:#fff;border:1px solid #e5e7eb;border-radius:10px;padding:12px 14px;line-height:2">{"".join(parts)}</div>', unsafe_allow_html=True)
+    if found:
+        st.dataframe(pd.DataFrame([{"Entidade": k, "Texto": r, "Valor resolvido": "—" if v is None else str(v)} for _, _, k, r, v in found]),
+                     use_container_width=True, hide_index=True)
+    st.caption(f"{len(found)} entidade(s) em {ms:.2f} ms")
+    col_label("📦 Lote")
+    b1,b2 = st.columns([1,2])
+    src = b1.radio("Frases",["Geradas","Enviar CSV"],key=f"{key}_bsrc")
+    with b2:
+        if src == "Geradas":
+            n = st.select_slider("Quantidade",[10_000,50_000,100_000],100_000,format_func=lambda v: f"{v:,}",key=f"{key}_n")
+            texts, digest = ent_sample_utterances(n), f"sample:{n}"
+        else:
+            up = st.file_uploader("CSV (coluna 'frase' ou a primeira coluna)",type=["csv"],key=f"{key}_up")
+            if up is None:
+                return
+            raw = up.getvalue()
+            try:
+                df = pd.read_csv(io.BytesIO(raw), dtype=str, keep_default_na=False)
+            except (pd.errors.ParserError, pd.errors.EmptyDataError, UnicodeDecodeError) as e:
+                st.error(f"❌ CSV inválido: {e}")
+                return
+            texts = df["frase" if "frase" in df.columns else df.columns[0]].tolist()
+            digest = hashlib.sha1(raw).hexdigest()
+    r = ent_batch(digest, texts, ref, locale)
+    m1,m2,m3,m4 = st.columns(4)
+    m1.metric("Frases", f"{r['n']:,}", f"{r['bytes']/1024/1024:,.1f} MB", delta_color="off")
+    m2.metric("Entidades", f"{r['matches']:,}", f"{r['with_entity']/max(r['n'], 1):.0%} das frases", delta_color="off")
+    m3.metric("Tempo", f"{r['ms']/1000:,.2f} s" if r['ms'] > 1000 else f"{r['ms']:,.0f} ms")
+    m4.metric("Vazão", f"{r['n']/max(r['ms'], 1e-3)*1000:,.0f} frases/s")
+    c1,c2 = st.columns([1,1.4],gap="large")
+    with c1:
+        st.bar_chart(pd.Series(r["counts"], name="Ocorrências"))
+        if r["unresolved"]:
+            st.caption(f"⚠️ {r['unresolved']:,} trecho(s) casaram o padrão mas não resolveram (ex.: 31/02)")
+    with c2:
+        sample = pd.DataFrame(r["sample"])
+        if len(sample):
+            sample.insert(1, "Frase", [r["texts"][i] for i in sample["Frase #"]])
+            st.dataframe(sample, use_container_width=True, hide_index=True, height=300)
+
+
 def page_copilot_entidades():
     mark_page_visited(current_user()["id"], "copilot_entidades")
     st.markdown('<div class="main-wrap">', unsafe_allow_html=True)
@@ -2749,6 +7220,8 @@ def page_copilot_entidades():
         ]
         for ic, nome, desc, tipo in entidades:
             st.markdown(f'<div class="sr"><div style="display:flex;align-items:center;gap:12px"><div style="font-size:20px">{ic}</div><div style="flex:1"><div class="sr-nm" style="font-family:inherit;color:#111827">{nome}</div><div class="sr-ds">{desc}</div></div><span style="background:#ede9fe;color:#5c2d91;font-size:10px;font-weight:700;padding:2px 8px;border-radius:8px">{tipo}</span></div></div>', unsafe_allow_html=True)
+        sp()
+        entity_lab("ent_cop")
 
     with tabs[1]:
         c1,c2 = st.columns(2)
@@ -3124,6 +7597,8 @@ Share      → Compartilhar com outro usuário
 //   "AccessMask": "ReadAccess, WriteAccess"
 // }''',
             color="#134e4a")
+        sp()
+        security_lab("sec_dv")
 
     with tabs[1]:
         c1,c2 = st.columns(2)
@@ -3475,6 +7950,464 @@ CAT_COLORS.update({
     "Dataverse-Apps":"#134e4a",
 })
 
+# ══════════════════════════════════════════════
+# INTEGRAÇÕES — SERVIDOR LOCAL DE CONECTORES (SharePoint REST, Dataverse Web API, Direct Line)
+# ══════════════════════════════════════════════
+MOCK_ROWS = 20_000
+MOCK_STATUS = ["Novo", "Em análise", "Aprovado", "Enviado", "Cancelado"]
+MOCK_CLIENTES = ["Contoso", "Fabrikam", "Northwind", "Adventure Works", "Tailspin", "Litware", "Wingtip"]
+MOCK_SECRET = "segredo-local-direct-line"
+MOCK_FILTER_RE = re.compile(r"^\s*(\w+)\s+eq\s+'([^']*)'\s*$")
+MOCK_MAX_CONVERSATIONS = 5_000   # conversas do Direct Line guardadas (LRU): as mais antigas expiram
+MOCK_MAX_LATENCY = 2_000         # ms aceitos no cabeçalho X-Mock-Latency-Ms
+
+class MockApi:
+    """
+    Estado do servidor local: a lista "Pedidos" (a mesma para SharePoint e Dataverse),
+    as conversas do Direct Line e as janelas de limite por cliente e serviço. O servidor é um só
+    para o processo inteiro; latência e limite chegam em cada requisição (X-Mock-*), por sessão.
+    """
+    def __init__(self):
+        rng = np.random.default_rng(44)
+        base = datetime.datetime(2025, 1, 1)
+        mins = np.sort(rng.integers(0, 600 * 24 * 60, MOCK_ROWS))
+        st_ = rng.integers(0, len(MOCK_STATUS), MOCK_ROWS)
+        cl = rng.integers(0, len(MOCK_CLIENTES), MOCK_ROWS)
+        val = np.round(rng.lognormal(7, 1, MOCK_ROWS), 2)
+        self.rows = [{"ID": i + 1, "Title": f"PED-{i + 1:06d}", "Cliente": MOCK_CLIENTES[cl[i]], "Status": MOCK_STATUS[st_[i]],
+                      "Valor": float(val[i]), "Created": (base + datetime.timedelta(minutes=int(mins[i]))).isoformat() + "Z"}
+                     for i in range(MOCK_ROWS)]
+        self.bot = IntentIndex(INTENT_TOPICS)
+        self.lock = threading.Lock()
+        self.conversations = collections.OrderedDict()
+        self.windows = {}
+        self.served = self.throttled = 0
+        handler = type("MockApiHandler", (MockApiHandler,), {"api": self})
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        threading.Thread(target=self.httpd.serve_forever, name="mock-api", daemon=True).start()
+
+    def admit(self, client: str, service: str, limit_rps: int) -> float:
+        """Janela deslizante de 1 s por cliente e serviço; devolve 0 ou os segundos do Retry-After."""
+        if not limit_rps:
+            return 0.0
+        now = time.monotonic()
+        with self.lock:
+            if len(self.windows) > 1_000:
+                self.windows = {k: w for k, w in self.windows.items() if w and w[-1] > now - 1.0}
+            w = self.windows.setdefault((client, service), collections.deque())
+            while w and w[0] <= now - 1.0:
+                w.popleft()
+            if len(w) >= limit_rps:
+                self.throttled += 1
+                return w[0] + 1.0 - now
+            w.append(now)
+            return 0.0
+
+    def query(self, q: dict, after: int, top: int) -> Tuple[list, bool]:
+        """Até `top` linhas com ID > after (IDs são sequenciais); o booleano diz se há próxima página."""
+        conds = []
+        for clause in filter(None, re.split(r"\s+and\s+", q.get("$filter", [""])[0])):
+            m = MOCK_FILTER_RE.match(clause)
+            if not m:
+                raise ValueError(f"$filter não suportado pelo servidor local: {clause!r} (use Coluna eq 'valor' [and ...])")
+            conds.append(m.groups())
+        rows = (r for r in itertools.islice(self.rows, after, None) if all(str(r.get(c)) == v for c, v in conds))
+        page = list(itertools.islice(rows, top + 1))
+        sel = [c.strip() for c in q.get("$select", [""])[0].split(",") if c.strip()]
+        if sel:
+            page = [{c: r.get(c) for c in ["ID"] + sel} for r in page]
+        return page[:top], len(page) > top
+
+    def conversation(self, cid: str) -> Optional[list]:
+        with self.lock:
+            log = self.conversations.get(cid)
+            if log is not None:
+                self.conversations.move_to_end(cid)
+            return log
+
+    def open_conversation(self) -> str:
+        cid = secrets.token_hex(8)
+        with self.lock:
+            self.conversations[cid] = []
+            while len(self.conversations) > MOCK_MAX_CONVERSATIONS:
+                self.conversations.popitem(last=False)
+        return cid
+
+    def reply(self, text: str) -> str:
+        best, _ = self.bot.scores([text])
+        k = int(np.argmax(best[0]))
+        if best[0][k] < 0.3:
+            return "Desculpe, não entendi. Pode reformular?"
+        return f"Certo! Vou te ajudar com: {self.bot.topics[k]}."
+
+class MockApiHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive: a conexão fica aberta entre requisições
+    disable_nagle_algorithm = True  # sem TCP_NODELAY, cabeçalho e corpo em writes separados esperam o ACK atrasado (~40 ms)
+    api: MockApi = None
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status: int, payload, headers: Optional[dict] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.route("GET")
+
+    def do_POST(self):
+        self.route("POST")
+
+    def setting(self, name: str, hi: float) -> float:
+        try:
+            v = float(self.headers.get(name) or 0)
+        except ValueError:
+            return 0.0
+        return min(max(v, 0.0), hi) if math.isfinite(v) else 0.0
+
+    @staticmethod
+    def top(q: dict, default: Optional[int]) -> Optional[int]:
+        raw = q.get("$top", [default])[0]
+        try:
+            top = int(raw) if raw is not None else None
+        except ValueError:
+            raise ValueError(f"$top inválido: {raw!r} (use um inteiro positivo)")
+        if top is not None and top < 1:
+            raise ValueError(f"$top deve ser um inteiro positivo (recebido {top}).")
+        return top
+
+    def route(self, method: str):
+        api = self.api
+        url = urllib.parse.urlsplit(self.path)
+        q = urllib.parse.parse_qs(url.query)
+        n = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(n) or b"{}") if n else {}
+        service = "sharepoint" if url.path.startswith("/_api/") else "dataverse" if url.path.startswith("/api/data/") else "directline"
+        latency, limit = self.setting("X-Mock-Latency-Ms", MOCK_MAX_LATENCY), int(self.setting("X-Mock-Limit-Rps", 100_000))
+        wait = api.admit(self.headers.get("X-Mock-Client") or self.client_address[0], service, limit)
+        if wait:
+            err = {"sharepoint": {"odata.error": {"code": "-2147024860, Microsoft.SharePoint.SPQueryThrottledException",
+                                                  "message": {"lang": "en-US", "value": "The request has been throttled."}}},
+                   "dataverse": {"error": {"code": "0x80072322", "message": f"Number of requests exceeded the limit of {limit} over time window of 1 seconds."}},
+                   "directline": {"error": {"code": "TooManyRequests", "message": "Rate limit exceeded."}}}[service]
+            return self.send_json(429, err, {"Retry-After": f"{max(wait, 0.01):.2f}"})
+        if latency:
+            time.sleep(latency / 1000)
+        with api.lock:
+            api.served += 1
+        try:
+            if service == "sharepoint":
+                return self.sharepoint(url, q)
+            if service == "dataverse":
+                return self.dataverse(url, q)
+            return self.directline(method, url, body)
+        except ValueError as e:
+            return self.send_json(400, {"error": {"code": "BadRequest", "message": str(e)}})
+
+    def sharepoint(self, url, q):
+        if not re.match(r"^/_api/web/lists/getbytitle\('Pedidos'\)/items$", urllib.parse.unquote(url.path)):
+            return self.send_json(404, {"odata.error": {"code": "-2130575322", "message": {"lang": "en-US", "value": "List does not exist."}}})
+        top = self.top(q, 100)
+        if top > 5000:
+            raise ValueError("The attempted operation is prohibited because it exceeds the list view threshold (5000).")
+        # $skiptoken=Paged=TRUE&p_ID=<último ID>: continua depois do último item da página anterior
+        tok = urllib.parse.parse_qs(q.get("$skiptoken", [""])[0])
+        after = int(tok.get("p_ID", ["0"])[0])
+        page, more = self.api.query(q, after, top)
+        out = {"value": page}
+        if more:
+            nxt = dict((k, v[0]) for k, v in q.items() if k != "$skiptoken")
+            nxt["$skiptoken"] = f"Paged=TRUE&p_ID={page[-1]['ID']}"
+            out["odata.nextLink"] = f"http://127.0.0.1:{self.api.port}{url.path}?{urllib.parse.urlencode(nxt)}"
+        self.send_json(200, out)
+
+    def dataverse(self, url, q):
+        if url.path != "/api/data/v9.2/cr123_pedidos":
+            return self.send_json(404, {"error": {"code": "0x80060888", "message": "Resource not found for the segment."}})
+        m = re.search(r"odata\.maxpagesize=(\d+)", self.headers.get("Prefer") or "")
+        size = min(max(int(m.group(1)), 1) if m else 5000, 5000)
+        out = {"@odata.context": f"http://127.0.0.1:{self.api.port}/api/data/v9.2/$metadata#cr123_pedidos"}
+        if "$top" in q:
+            # $top limita o total e desliga a paginação, como no Dataverse
+            out["value"] = self.api.query(q, 0, self.top(q, None))[0]
+            return self.send_json(200, out)
+        cookie = re.search(r'pagenumber="(\d+)".*?last="(\d+)"', q.get("$skiptoken", [""])[0])
+        page_no, after = (int(cookie.group(1)), int(cookie.group(2))) if cookie else (1, 0)
+        out["value"], more = self.api.query(q, after, size)
+        if more:
+            nxt = dict((k, v[0]) for k, v in q.items() if k != "$skiptoken")
+            nxt["$skiptoken"] = f'<cookie pagenumber="{page_no + 1}" last="{out["value"][-1]["ID"]}" istracking="False" />'
+            out["@odata.nextLink"] = f"http://127.0.0.1:{self.api.port}{url.path}?{urllib.parse.urlencode(nxt)}"
+        self.send_json(200, out)
+
+    def directline(self, method, url, body):
+        api = self.api
+        if (self.headers.get("Authorization") or "") != f"Bearer {MOCK_SECRET}" and not (self.headers.get("Authorization") or "").startswith("Bearer dl-"):
+            return self.send_json(403, {"error": {"code": "BadArgument", "message": "Missing or invalid token."}})
+        parts = url.path.strip("/").split("/")   # v3/directline/conversations/{id}/activities
+        if parts[:3] == ["v3", "directline", "tokens"] and method == "POST":
+            return self.send_json(200, {"token": "dl-" + secrets.token_hex(12), "expires_in": 3600})
+        if parts[:3] != ["v3", "directline", "conversations"]:
+            return self.send_json(404, {"error": {"code": "NotFound", "message": "Unknown endpoint."}})
+        if len(parts) == 3 and method == "POST":
+            cid = api.open_conversation()
+            return self.send_json(201, {"conversationId": cid, "token": "dl-" + secrets.token_hex(12), "expires_in": 1800,
+                                        "streamUrl": f"ws://127.0.0.1:{api.port}/v3/directline/conversations/{cid}/stream"})
+        log = api.conversation(parts[3] if len(parts) > 3 else "")
+        if log is None or parts[4:] != ["activities"]:
+            return self.send_json(404, {"error": {"code": "BadArgument", "message": "Conversation not found."}})
+        cid = parts[3]
+        if method == "POST":
+            now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            with api.lock:
+                act = {**body, "id": f"{cid}|{len(log):07d}", "timestamp": now}
+                log.append(act)
+                if body.get("type") == "message":
+                    log.append({"type": "message", "id": f"{cid}|{len(log):07d}", "timestamp": now,
+                                "from": {"id": "bot", "name": "Agente"}, "replyToId": act["id"], "text": api.reply(str(body.get("text", "")))})
+            return self.send_json(200, {"id": act["id"]})
+        wm = int(urllib.parse.parse_qs(url.query).get("watermark", ["0"])[0] or 0)
+        return self.send_json(200, {"activities": log[wm:], "watermark": str(len(log))})
+
+@st.cache_resource(show_spinner="Subindo o servidor local de conectores…")
+def mock_api() -> MockApi:
+    return MockApi()
+
+class HttpPool:
+    """Pool de conexões HTTP/1.1 keep-alive (http.client) com respeito ao Retry-After nos 429."""
+    def __init__(self, port: int, keep_alive: bool = True, max_retries: int = 8, headers: Optional[dict] = None):
+        self.port, self.keep_alive, self.max_retries = port, keep_alive, max_retries
+        self.headers = headers or {}   # enviados em toda requisição (ex.: configuração da sessão no servidor local)
+        self.idle = []
+        self.lock = threading.Lock()
+        self.opened = self.requests = self.throttled = self.bytes = 0
+
+    def conn(self) -> http.client.HTTPConnection:
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+            self.opened += 1
+        return http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+
+    def request(self, method: str, url: str, body=None, headers: Optional[dict] = None) -> Tuple[int, dict]:
+        path = urllib.parse.urlsplit(url)
+        path = path.path + (f"?{path.query}" if path.query else "")
+        hdrs = {"Accept": "application/json", **self.headers, **(headers or {})}
+        data = json.dumps(body).encode() if body is not None else None
+        if data is not None:
+            hdrs["Content-Type"] = "application/json"
+        if not self.keep_alive:
+            hdrs["Connection"] = "close"
+        for attempt in range(self.max_retries + 1):
+            c = self.conn()
+            try:
+                c.request(method, path, data, hdrs)
+                r = c.getresponse()
+                raw = r.read()
+            except (http.client.HTTPException, OSError):
+                # Conexão ociosa fechada pelo servidor: descarta e tenta com uma nova
+                c.close()
+                if attempt == self.max_retries:
+                    raise
+                continue
+            with self.lock:
+                self.requests += 1
+                self.bytes += len(raw)
+                if self.keep_alive and not r.will_close:
+                    self.idle.append(c)
+                else:
+                    c.close()
+            if r.status == 429 and attempt < self.max_retries:
+                with self.lock:
+                    self.throttled += 1
+                time.sleep(float(r.getheader("Retry-After") or 1))
+                continue
+            return r.status, json.loads(raw or b"{}")
+        return r.status, json.loads(raw or b"{}")
+
+    def close(self):
+        with self.lock:
+            for c in self.idle:
+                c.close()
+            self.idle.clear()
+
+def mock_fetch_all(pool: HttpPool, url: str, headers: Optional[dict] = None) -> dict:
+    """Segue nextLink até o fim — paginação é sequencial por natureza."""
+    t0, pages, rows, first = time.perf_counter(), 0, 0, None
+    while url:
+        status, payload = pool.request("GET", url, headers=headers)
+        if status != 200:
+            raise ValueError(f"HTTP {status}: {json.dumps(payload, ensure_ascii=False)[:300]}")
+        pages += 1
+        rows += len(payload.get("value", []))
+        first = first or payload
+        url = payload.get("odata.nextLink") or payload.get("@odata.nextLink")
+    return {"pages": pages, "rows": rows, "s": time.perf_counter() - t0, "first": first}
+
+def mock_burst(pool: HttpPool, jobs: list, workers: int) -> dict:
+    """Dispara (método, url, corpo, cabeçalhos) em paralelo e mede vazão e latência."""
+    from concurrent.futures import ThreadPoolExecutor
+    def one(job):
+        t = time.perf_counter()
+        status, _ = pool.request(*job)
+        return status, time.perf_counter() - t
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mock-client") as ex:
+        res = list(ex.map(one, jobs))
+    s = time.perf_counter() - t0
+    lat = np.array([r[1] for r in res]) * 1000
+    codes = collections.Counter(r[0] for r in res)
+    return {"s": s, "rps": len(jobs) / s, "p50": float(np.percentile(lat, 50)), "p95": float(np.percentile(lat, 95)),
+            "codes": dict(codes)}
+
+def mock_server_controls(key: str) -> Tuple[MockApi, dict]:
+    # O servidor é compartilhado: a configuração desta sessão vai em cabeçalhos, não em atributos do servidor
+    api = mock_api()
+    a1,a2 = st.columns(2)
+    latency = a1.slider("Latência do servidor (ms)",0,200,20,5,key=f"{key}_lat")
+    limit = a2.select_slider("Limite (req/s por serviço, 0 = sem)",[0,50,100,200,500,1000],200,key=f"{key}_rps")
+    client = st.session_state.setdefault("mock_client", secrets.token_hex(8))
+    st.caption(f"🟢 Servidor local em http://127.0.0.1:{api.port} · {api.served:,} respostas servidas · {api.throttled:,} respostas 429")
+    return api, {"X-Mock-Latency-Ms": str(latency), "X-Mock-Limit-Rps": str(limit), "X-Mock-Client": client}
+
+def mock_burst_report(pool: HttpPool, r: dict, n: int):
+    m1,m2,m3,m4 = st.columns(4)
+    m1.metric("Vazão", f"{r['rps']:,.0f} req/s")
+    m2.metric("Latência p50 / p95", f"{r['p50']:,.0f} / {r['p95']:,.0f} ms")
+    m3.metric("Conexões TCP abertas", f"{pool.opened:,}", f"{n / max(pool.opened, 1):,.1f} req por conexão", delta_color="off")
+    m4.metric("429 (com retry)", f"{pool.throttled:,}")
+    st.caption("Códigos finais: " + ", ".join(f"{k}: {v:,}" for k, v in sorted(r["codes"].items())) + f" · {pool.bytes / 1e6:,.1f} MB recebidos")
+
+def mock_odata_lab(key: str):
+    lab_header("🛰️ Laboratório — APIs REST no servidor local","SharePoint REST e Dataverse Web API emulados num servidor HTTP em thread: paginação, $top/$skiptoken e 429 com Retry-After")
+    api, session = mock_server_controls(key)
+    c1,c2 = st.columns([1,1.3],gap="large")
+    with c1:
+        svc = st.radio("Endpoint",["SharePoint REST","Dataverse Web API"],horizontal=True,key=f"{key}_svc")
+        size = st.select_slider("Página ($top / odata.maxpagesize)",[100,500,1000,2000,5000],500,key=f"{key}_top")
+        status = st.selectbox("$filter Status eq …",["(sem filtro)"] + MOCK_STATUS,key=f"{key}_flt")
+        q = {"$select": "Title,Cliente,Status,Valor"}
+        if status != "(sem filtro)":
+            q["$filter"] = f"Status eq '{status}'"
+        if svc == "SharePoint REST":
+            url = f"http://127.0.0.1:{api.port}/_api/web/lists/getbytitle('Pedidos')/items?" + urllib.parse.urlencode({**q, "$top": size})
+            headers = {"Accept": "application/json;odata=nometadata"}
+        else:
+            url = f"http://127.0.0.1:{api.port}/api/data/v9.2/cr123_pedidos?" + urllib.parse.urlencode(q)
+            headers = {"Prefer": f"odata.maxpagesize={size}", "OData-MaxVersion": "4.0"}
+        st.code(f"GET {urllib.parse.unquote(url)}\n" + "\n".join(f"{k}: {v}" for k, v in headers.items()), language="http")
+        b1,b2 = st.columns(2)
+        n = b2.select_slider("Requisições na rajada",[200,1_000,5_000],1_000,format_func=lambda v: f"{v:,}",key=f"{key}_n")
+        workers = b2.slider("Threads do cliente",1,32,8,key=f"{key}_w")
+        keep = b1.toggle("Keep-alive (pool de conexões)",True,key=f"{key}_keep")
+        go_pages = b1.button("📄 Paginar tudo",key=f"{key}_pages",use_container_width=True)
+        go_burst = b1.button("🚀 Rajada",key=f"{key}_burst",use_container_width=True)
+    with c2:
+        try:
+            if go_pages:
+                pool = HttpPool(api.port, keep, headers=session)
+                r = mock_fetch_all(pool, url, headers)
+                st.session_state[f"{key}_res"] = ("pages", r, pool)
+            if go_burst:
+                pool = HttpPool(api.port, keep, headers=session)
+                # N leituras da primeira página em paralelo, como vários flows consultando a mesma lista
+                r = mock_burst(pool, [("GET", url, None, headers)] * n, workers)
+                pool.close()
+                st.session_state[f"{key}_res"] = ("burst", r, pool)
+        except (ValueError, OSError) as e:
+            st.error(f"❌ {e}")
+        res = st.session_state.get(f"{key}_res")
+        if res and res[0] == "pages":
+            kind, r, pool = res
+            m1,m2,m3 = st.columns(3)
+            m1.metric("Páginas (nextLink)", f"{r['pages']:,}")
+            m2.metric("Linhas", f"{r['rows']:,}")
+            m3.metric("Tempo total", f"{r['s'] * 1000:,.0f} ms", f"{r['rows'] / max(r['s'], 1e-6):,.0f} linhas/s", delta_color="off")
+            st.caption(f"{pool.requests:,} requisições em {pool.opened:,} conexão(ões) · {pool.throttled:,} respostas 429 aguardaram o Retry-After")
+            first = dict(r["first"])
+            first["value"] = first.get("value", [])[:3] + ([f"… +{len(r['first']['value']) - 3} itens"] if len(first.get("value", [])) > 3 else [])
+            st.json(first, expanded=2)
+        elif res:
+            mock_burst_report(res[2], res[1], n)
+            info_box("💡 Desligue o keep-alive e compare: cada requisição abre uma conexão TCP nova. Com o limite baixo, "
+                     "mais threads só convertem vazão em respostas 429 — o teto é o limite do serviço, não o cliente.", "info")
+
+def mock_directline_lab(key: str):
+    lab_header("📡 Laboratório — Direct Line no servidor local","Token, conversa, envio de atividades e polling por watermark — e uma carga de várias conversas simultâneas")
+    api, session = mock_server_controls(key)
+    base = f"http://127.0.0.1:{api.port}/v3/directline"
+    c1,c2 = st.columns(2,gap="large")
+    with c1:
+        col_label("💬 Conversa")
+        pool = st.session_state.get(f"{key}_pool")
+        if pool is None or pool.port != api.port:
+            pool = st.session_state[f"{key}_pool"] = HttpPool(api.port)
+        pool.headers = session
+        conv = st.session_state.get(f"{key}_conv")
+        text = st.text_input("Mensagem",placeholder="ex.: esqueci minha senha",key=f"{key}_msg")
+        if st.button("Enviar",key=f"{key}_send") and text.strip():
+            try:
+                if conv is None:
+                    code, tok = pool.request("POST", f"{base}/tokens/generate", {}, {"Authorization": f"Bearer {MOCK_SECRET}"})
+                    if code != 200:
+                        raise ValueError(f"HTTP {code}: {tok}")
+                    code, c = pool.request("POST", f"{base}/conversations", {}, {"Authorization": f"Bearer {tok['token']}"})
+                    if code != 201:
+                        raise ValueError(f"HTTP {code}: {c}")
+                    conv = st.session_state[f"{key}_conv"] = {"id": c["conversationId"], "token": c["token"], "wm": "0", "log": []}
+                auth = {"Authorization": f"Bearer {conv['token']}"}
+                pool.request("POST", f"{base}/conversations/{conv['id']}/activities",
+                             {"type": "message", "from": {"id": "user1", "name": current_user()["name"]}, "text": text}, auth)
+                code, acts = pool.request("GET", f"{base}/conversations/{conv['id']}/activities?watermark={conv['wm']}", None, auth)
+                conv["wm"] = acts.get("watermark", conv["wm"])
+                conv["log"] += [(a["from"]["id"], a.get("text", "")) for a in acts.get("activities", [])]
+            except (ValueError, OSError) as e:
+                st.error(f"❌ {e}")
+        if conv:
+            for who, msg in conv["log"][-8:]:
+                st.chat_message("assistant" if who == "bot" else "user").write(msg)
+            st.caption(f"conversationId {conv['id']} · watermark {conv['wm']}")
+    with c2:
+        col_label("📈 Carga")
+        a1,a2 = st.columns(2)
+        convs = a1.select_slider("Conversas",[10,50,200],50,key=f"{key}_c")
+        msgs = a2.select_slider("Mensagens por conversa",[2,5,10],5,key=f"{key}_m")
+        workers = st.slider("Threads do cliente",1,32,8,key=f"{key}_w")
+        if st.button("🚀 Simular carga",key=f"{key}_load"):
+            try:
+                lp = HttpPool(api.port, headers=session)
+                auth = {"Authorization": f"Bearer {MOCK_SECRET}"}
+                t0 = time.perf_counter()
+                ids = []
+                for _ in range(convs):
+                    code, c = lp.request("POST", f"{base}/conversations", {}, auth)
+                    if code != 201:
+                        raise ValueError(f"HTTP {code} ao criar conversa: {c}")
+                    ids.append(c["conversationId"])
+                made = convs / (time.perf_counter() - t0)
+                jobs = [j for cid in ids for k in range(msgs) for j in (
+                    ("POST", f"{base}/conversations/{cid}/activities", {"type": "message", "from": {"id": "load"}, "text": random.choice(sum(INTENT_HELDOUT.values(), []))}, auth),
+                    ("GET", f"{base}/conversations/{cid}/activities?watermark={2 * k}", None, auth))]
+                r = mock_burst(lp, jobs, workers)
+                lp.close()
+                st.session_state[f"{key}_res"] = (r, lp, len(jobs) + convs, made)
+            except (ValueError, OSError) as e:
+                st.error(f"❌ {e}")
+        res = st.session_state.get(f"{key}_res")
+        if res:
+            r, lp, n, made = res
+            mock_burst_report(lp, r, n)
+            st.caption(f"Criação de {convs} conversas em série: {made:,.0f} req/s · depois {n - convs:,} envios + polls por watermark em paralelo")
+
+
 # ══════════════════════════════════════════════
 # POWER AUTOMATE — Conectores & Integrações
 # ══════════════════════════════════════════════
@@ -3575,6 +8508,8 @@ Obter conteúdo do arquivo usando o caminho:
 //   │         [ENVIAR EMAIL] notificação de aprovação ao solicitante
 //   └─ NÃO → [ATUALIZAR ITEM] Status = 'Rejeitado', MotivoRejeicao = body()?['comments']
 //             [ENVIAR EMAIL] notificação de rejeição com motivo''', language="text")
+        sp()
+        sharepoint_index_lab("spl_auto")
 
     with tabs[1]:
         c1,c2 = st.columns(2)
@@ -3700,6 +8635,10 @@ item()?['cr123_nome']
 item()?['cr123_clienteid']?['name']''',
                 color="#0d9488")
             info_box("💡 <b>Paginação automática:</b> Ative 'Paginação' nas configurações da ação 'Listar linhas' do Dataverse para buscar TODOS os registros automaticamente, contornando o limite de página.", "info")
+        sp()
+        dataverse_query_lab("dvq_conn", lang="OData")
+        sp()
+        dataverse_throughput_lab("dvt_conn")
 
     with tabs[3]:
         c1,c2 = st.columns(2)
@@ -3771,6 +8710,10 @@ body('HTTP_Token')?['access_token']
 Authorization: concat('Bearer ', body('HTTP_Token')?['access_token'])''',
                 color="#dc2626")
             info_box("🔐 <b>Segurança:</b> Nunca coloque credenciais diretamente no flow. Use <b>Parâmetros de ambiente</b> (Environment Variables) ou <b>Azure Key Vault</b> para armazenar chaves e secrets.", "warning")
+        sp()
+        parse_json_lab("pj_http")
+        sp()
+        mock_odata_lab("mock_http")
 
     with tabs[4]:
         st.markdown("#### Mapa de conectores por produto")
@@ -3799,6 +8742,295 @@ Authorization: concat('Bearer ', body('HTTP_Token')?['access_token'])''',
     st.markdown('</div>', unsafe_allow_html=True)
 
 
+# ══════════════════════════════════════════════
+# POWER AUTOMATE — SIMULADOR DE APROVAÇÕES (EVENTOS DISCRETOS)
+# ══════════════════════════════════════════════
+APV_TYPES = ["Aprovação básica", "Todos devem aprovar", "Primeiro a responder"]
+APV_DISTS = ["Lognormal", "Exponencial", "Gamma (k=3)"]
+APV_APPROVERS = [
+    {"Aprovador": "Gestor A",   "Resposta média (h)": 6.0,  "Distribuição": "Lognormal",   "Minutos por item": 4,  "Rejeição (%)": 10},
+    {"Aprovador": "Gestor B",   "Resposta média (h)": 9.0,  "Distribuição": "Lognormal",   "Minutos por item": 4,  "Rejeição (%)": 10},
+    {"Aprovador": "Jurídico",   "Resposta média (h)": 20.0, "Distribuição": "Exponencial", "Minutos por item": 15, "Rejeição (%)": 8},
+    {"Aprovador": "Financeiro", "Resposta média (h)": 10.0, "Distribuição": "Gamma (k=3)", "Minutos por item": 10, "Rejeição (%)": 3},
+    {"Aprovador": "Diretor",    "Resposta média (h)": 16.0, "Distribuição": "Lognormal",   "Minutos por item": 6,  "Rejeição (%)": 5},
+    {"Aprovador": "VP",         "Resposta média (h)": 8.0,  "Distribuição": "Lognormal",   "Minutos por item": 3,  "Rejeição (%)": 2},
+]
+APV_STAGES = [
+    {"Etapa": "N1 · Gestor",              "Tipo": "Primeiro a responder", "Aprovadores": "Gestor A, Gestor B",   "Prazo (h)": 24, "Escalar para": "Diretor"},
+    {"Etapa": "N2 · Jurídico + Financeiro", "Tipo": "Todos devem aprovar",  "Aprovadores": "Jurídico, Financeiro", "Prazo (h)": 48, "Escalar para": "VP"},
+    {"Etapa": "N3 · Diretoria",           "Tipo": "Aprovação básica",     "Aprovadores": "Diretor",              "Prazo (h)": 72, "Escalar para": ""},
+]
+APV_OUTCOMES = ["Aprovada", "Rejeitada", "Expirada", "Em andamento"]
+
+def apv_sample(dist: str, mean: float, n: int, rng: np.random.Generator) -> np.ndarray:
+    """Tempos de resposta em horas, sorteados em bloco para o motor de eventos só consumir índices."""
+    if mean <= 0:
+        return np.zeros(n)
+    if dist == "Exponencial":
+        return rng.exponential(mean, n)
+    if dist == "Gamma (k=3)":
+        return rng.gamma(3.0, mean / 3, n)
+    sigma = math.sqrt(math.log(2.0))   # CV = 1
+    return rng.lognormal(math.log(mean) - sigma * sigma / 2, sigma, n)
+
+def apv_num(r: dict, col: str, where: str) -> float:
+    """Célula numérica da tabela editada: vazia (None/NaN de linha nova) vale 0; infinito ou negativo é erro."""
+    v = r.get(col)
+    try:
+        x = 0.0 if v is None or v == "" else float(v)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{col}' de '{where}' não é um número.")
+    if math.isnan(x):
+        return 0.0
+    if not math.isfinite(x) or x < 0:
+        raise ValueError(f"'{col}' de '{where}' deve ser um número finito ≥ 0.")
+    return x
+
+def apv_config(approvers, stages) -> Tuple[tuple, tuple]:
+    """Valida as tabelas editadas e devolve tuplas hasheáveis para o cache."""
+    ap, names = [], set()
+    for r in approvers:
+        name = str(r.get("Aprovador") or "").strip()
+        if not name:
+            continue
+        if name in names:
+            raise ValueError(f"Aprovador '{name}' aparece duas vezes.")
+        if r.get("Distribuição") not in APV_DISTS:
+            raise ValueError(f"Distribuição inválida para '{name}' — use {', '.join(APV_DISTS)}.")
+        names.add(name)
+        rej = apv_num(r, "Rejeição (%)", name)
+        if rej > 100:
+            raise ValueError(f"'Rejeição (%)' de '{name}' deve ficar entre 0 e 100.")
+        ap.append((name, apv_num(r, "Resposta média (h)", name), r["Distribuição"],
+                   apv_num(r, "Minutos por item", name), rej / 100))
+    sg = []
+    for r in stages:
+        who = tuple(a.strip() for a in str(r.get("Aprovadores") or "").split(",") if a.strip())
+        if not who:
+            continue
+        esc = str(r.get("Escalar para") or "").strip()
+        for a in who + ((esc,) if esc else ()):
+            if a not in names:
+                raise ValueError(f"Etapa '{r.get('Etapa')}' usa o aprovador '{a}', que não está na tabela.")
+        if r.get("Tipo") not in APV_TYPES:
+            raise ValueError(f"Tipo inválido na etapa '{r.get('Etapa')}' — use {', '.join(APV_TYPES)}.")
+        sg.append((str(r.get("Etapa") or f"Etapa {len(sg) + 1}"), r["Tipo"], who,
+                   apv_num(r, "Prazo (h)", str(r.get("Etapa"))), esc))
+    if not sg:
+        raise ValueError("Defina ao menos uma etapa com aprovadores.")
+    return tuple(ap), tuple(sg)
+
+@st.cache_data(max_entries=24, show_spinner="Simulando aprovações…")
+def apv_simulate(approvers: tuple, stages: tuple, n: int, per_day: float, seed: int = 11) -> dict:
+    """
+    Simulação de eventos discretos com fila de prioridade (heapq). Cada aprovador é um servidor
+    FIFO: a resposta chega após a latência sorteada e ainda espera o aprovador ficar livre pelos
+    minutos de trabalho do item. Prazo vencido cancela a tarefa e escala (ou expira a solicitação).
+    """
+    rng = np.random.default_rng(seed)
+    A = len(approvers)
+    idx = {a[0]: i for i, a in enumerate(approvers)}
+    # Sorteio vetorizado: um bloco de latência/trabalho/rejeição por aprovador, recarregado se acabar
+    per_req = sum(len(s[2]) if s[1] != "Aprovação básica" else 1 for s in stages) / max(len(stages), 1)
+    size = int(n * per_req * len(stages) / A * 1.5) + 64
+    def refill(i):
+        _, mean, dist, work, rej = approvers[i]
+        return [apv_sample(dist, mean, size, rng).tolist(), (np.full(size, work / 60)).tolist(), (rng.random(size) < rej).tolist(), 0]
+    pools = [refill(i) for i in range(A)]
+    arrivals = np.cumsum(rng.exponential(24.0 / per_day, n)).tolist()
+    stage_of = [(s[1], [idx[a] for a in s[2]], s[3], idx[s[4]] if s[4] else -1) for s in stages]
+    S = len(stage_of)
+
+    heap = [(t, 0, 0, r) for r, t in enumerate(arrivals)]   # (tempo, seq, tipo, id)
+    heapq.heapify(heap)
+    push, pop = heapq.heappush, heapq.heappop
+    seq = n
+    # Tarefas em listas paralelas: req, aprovador, estado (0 pendente, 1 em serviço, 2 feita, 3 cancelada), criada, pronta
+    t_req, t_app, t_state, t_made, t_ready, t_reject, t_work = [], [], [], [], [], [], []
+    r_stage, r_start, r_left, r_tasks = [0] * n, [0.0] * n, [0] * n, [None] * n
+    r_end, r_out = [float("nan")] * n, [3] * n
+    rr = [0] * S
+    busy, queue = [False] * A, [[] for _ in range(A)]
+    qhead = [0] * A
+    busy_h, tasks, answered, timeouts = [0.0] * A, [0] * A, [0] * A, [0] * A
+    resp_h, wait_h, critical_h = [0.0] * A, [0.0] * A, [0.0] * A
+    stage_h, stage_n = [0.0] * S, [0] * S
+    events = 0
+
+    def draw(a):
+        p = pools[a]
+        if p[3] >= size:
+            pools[a] = p = refill(a)
+        k = p[3]
+        p[3] = k + 1
+        return p[0][k], p[1][k], p[2][k]
+
+    def new_task(r, a, t, timeout):
+        nonlocal seq
+        lat, work, rej = draw(a)
+        k = len(t_req)
+        t_req.append(r); t_app.append(a); t_state.append(0); t_made.append(t); t_ready.append(0.0)
+        t_reject.append(rej); t_work.append(work)
+        tasks[a] += 1
+        seq += 1
+        push(heap, (t + lat, seq, 1, k))
+        if timeout > 0:
+            seq += 1
+            push(heap, (t + timeout, seq, 3, k))
+        return k
+
+    def begin_stage(r, s, t):
+        typ, who, timeout, _ = stage_of[s]
+        if typ == "Aprovação básica":
+            who = [who[rr[s] % len(who)]]
+            rr[s] += 1
+        r_stage[r], r_start[r], r_left[r] = s, t, len(who)
+        r_tasks[r] = [new_task(r, a, t, timeout) for a in who]
+
+    def close_stage(r, t, a, outcome):
+        s = r_stage[r]
+        for k in r_tasks[r]:
+            if t_state[k] < 2:   # em serviço também: o aprovador termina o item, mas a resposta é descartada
+                t_state[k] = 3
+        d = t - r_start[r]
+        stage_h[s] += d
+        stage_n[s] += 1
+        if a >= 0:
+            critical_h[a] += d
+        if outcome == 0 and s + 1 < S:
+            begin_stage(r, s + 1, t)
+        else:
+            r_end[r], r_out[r] = t, outcome
+
+    def serve(a, t):
+        # Próximo item não cancelado da fila do aprovador
+        nonlocal seq
+        q = queue[a]
+        while qhead[a] < len(q):
+            k = q[qhead[a]]
+            qhead[a] += 1
+            if t_state[k] == 0:
+                t_state[k] = 1
+                wait_h[a] += t - t_ready[k]
+                busy_h[a] += t_work[k]
+                seq += 1
+                push(heap, (t + t_work[k], seq, 2, k))
+                return
+        busy[a] = False
+
+    while heap:
+        t, _, kind, x = pop(heap)
+        events += 1
+        if kind == 0:
+            begin_stage(x, 0, t)
+        elif kind == 1:
+            if t_state[x] != 0:
+                continue
+            a = t_app[x]
+            t_ready[x] = t
+            queue[a].append(x)
+            if not busy[a]:
+                busy[a] = True
+                serve(a, t)
+        elif kind == 2:
+            a, r = t_app[x], t_req[x]
+            serve(a, t)
+            if t_state[x] == 3:
+                continue
+            t_state[x] = 2
+            answered[a] += 1
+            resp_h[a] += t - t_made[x]
+            typ = stage_of[r_stage[r]][0]
+            if t_reject[x]:
+                close_stage(r, t, a, 1)
+            elif typ == "Todos devem aprovar":
+                r_left[r] -= 1
+                if r_left[r] == 0:
+                    close_stage(r, t, a, 0)
+            else:
+                close_stage(r, t, a, 0)
+        else:
+            if t_state[x] != 0:
+                continue
+            t_state[x] = 3
+            a, r = t_app[x], t_req[x]
+            timeouts[a] += 1
+            esc = stage_of[r_stage[r]][3]
+            if esc >= 0:
+                # A tarefa escalada substitui a vencida e não tem novo prazo
+                r_tasks[r].append(new_task(r, esc, t, 0))
+            else:
+                close_stage(r, t, a, 2)
+
+    end = np.array(r_end) - np.array(arrivals)
+    out = np.array(r_out)
+    horizon = max(float(np.nanmax(r_end)) if (out < 3).any() else 0.0, arrivals[-1])
+    done = end[out < 2]
+    pct = np.percentile(done, [50, 90, 99]) if done.size else np.full(3, np.nan)
+    return {"events": events, "pct": pct.tolist(), "mean": float(done.mean()) if done.size else float("nan"),
+            "outcomes": np.bincount(out, minlength=4).tolist(), "cycle": done, "horizon": horizon,
+            "stages": [{"Etapa": s[0], "Tipo": s[1], "Tempo médio (h)": stage_h[i] / stage_n[i] if stage_n[i] else 0.0,
+                        "Passagens": stage_n[i]} for i, s in enumerate(stages)],
+            "approvers": [{"Aprovador": ap[0], "Tarefas": tasks[i], "Respondidas": answered[i], "Prazos vencidos": timeouts[i],
+                           "Resposta média (h)": resp_h[i] / answered[i] if answered[i] else 0.0,
+                           "Fila de trabalho (h)": wait_h[i] / answered[i] if answered[i] else 0.0,
+                           "Utilização": busy_h[i] / horizon if horizon else 0.0,
+                           "Caminho crítico": critical_h[i]} for i, ap in enumerate(approvers)]}
+
+def approval_sim_lab(key: str):
+    import pandas as pd
+    lab_header("⏱️ Laboratório — Simulação de eventos discretos de aprovações","Monte a cadeia de aprovadores, distribuições de resposta, prazos e escalonamento — e simule até 100 mil solicitações")
+    c1,c2 = st.columns([1.2,1],gap="large")
+    with c1:
+        col_label("👥 Aprovadores")
+        ap = st.data_editor(pd.DataFrame(APV_APPROVERS), num_rows="dynamic", hide_index=True, use_container_width=True, key=f"{key}_ap",
+                            column_config={"Distribuição": st.column_config.SelectboxColumn("Distribuição", options=APV_DISTS, required=True),
+                                           "Rejeição (%)": st.column_config.NumberColumn("Rejeição (%)", min_value=0, max_value=100)})
+        col_label("🔀 Etapas (em sequência)")
+        sg = st.data_editor(pd.DataFrame(APV_STAGES), num_rows="dynamic", hide_index=True, use_container_width=True, key=f"{key}_sg",
+                            column_config={"Tipo": st.column_config.SelectboxColumn("Tipo", options=APV_TYPES, required=True)})
+    with c2:
+        n = st.select_slider("Solicitações simuladas",[10_000,25_000,50_000,100_000],25_000,format_func=lambda v: f"{v:,}",key=f"{key}_n")
+        per_day = st.slider("Chegadas por dia",5,300,60,5,key=f"{key}_rate")
+        try:
+            approvers, stages = apv_config(ap.to_dict("records"), sg.to_dict("records"))
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            return
+        t0 = time.perf_counter()
+        r = apv_simulate(approvers, stages, n, float(per_day))
+        ms = (time.perf_counter() - t0) * 1000
+        m1,m2,m3 = st.columns(3)
+        m1.metric("Ciclo p50", f"{r['pct'][0]:.1f} h")
+        m2.metric("Ciclo p90", f"{r['pct'][1]:.1f} h")
+        m3.metric("Ciclo p99", f"{r['pct'][2]:.1f} h")
+        m4,m5,m6 = st.columns(3)
+        m4.metric("Aprovadas", f"{r['outcomes'][0] / n:.1%}")
+        m5.metric("Rejeitadas", f"{r['outcomes'][1] / n:.1%}")
+        m6.metric("Expiradas", f"{r['outcomes'][2] / n:.1%}")
+        st.caption(f"{r['events']:,} eventos em {ms:,.0f} ms ({r['events'] / max(ms, 1e-3) * 1000:,.0f} eventos/s; resultado em cache por configuração) · horizonte {r['horizon'] / 24:,.0f} dias")
+        if r["cycle"].size:
+            hi = float(np.percentile(r["cycle"], 99.5))
+            h, edges = np.histogram(r["cycle"], bins=24, range=(0, hi or 1))
+            st.bar_chart(pd.Series(h, index=[f"{e:.0f}h" for e in edges[:-1]], name="Solicitações"))
+    df = pd.DataFrame(r["approvers"])
+    total = df["Caminho crítico"].sum()
+    df["Caminho crítico"] = df["Caminho crítico"] / total * 100 if total else 0.0
+    df["Utilização"] = df["Utilização"] * 100
+    worst = df.sort_values("Caminho crítico", ascending=False).iloc[0]
+    hot = df[df["Utilização"] > 85]["Aprovador"].tolist()
+    info_box(f"🚦 Gargalo: <b>{worst['Aprovador']}</b> define o fim de {worst['Caminho crítico']:.0f}% do tempo de etapa somado"
+             + (f" · utilização acima de 85%: <b>{', '.join(hot)}</b> — a fila cresce sem limite e os prazos passam a escalar" if hot else ""),
+             "warning" if hot else "info")
+    st.dataframe(df, use_container_width=True, hide_index=True,
+                 column_config={"Utilização": st.column_config.ProgressColumn("Utilização", format="%.0f%%", min_value=0, max_value=100),
+                                "Caminho crítico": st.column_config.ProgressColumn("Caminho crítico", format="%.0f%%", min_value=0, max_value=100),
+                                "Resposta média (h)": st.column_config.NumberColumn(format="%.1f"),
+                                "Fila de trabalho (h)": st.column_config.NumberColumn(format="%.2f")})
+    st.dataframe(pd.DataFrame(r["stages"]), use_container_width=True, hide_index=True,
+                 column_config={"Tempo médio (h)": st.column_config.NumberColumn(format="%.1f")})
+
+
 # ══════════════════════════════════════════════
 # POWER AUTOMATE — Aprovações & Workflows
 # ══════════════════════════════════════════════
@@ -4040,11 +9272,577 @@ aprovadores = ["cfo@", "coo@", "cto@"]
 // Dica: use variáveis para o email do
 // aprovador e uma única ação de aprovação
 // no final, evitando duplicação de código''', language="text")
+        st.divider()
+        approval_sim_lab("apv_sim")
 
     section_quiz("automate_aprovacoes")
     st.markdown('</div>', unsafe_allow_html=True)
 
 
+# ══════════════════════════════════════════════
+# POWER AUTOMATE — SIMULADOR DE EXECUÇÃO (CONCORRÊNCIA, RETRY, 429)
+# ══════════════════════════════════════════════
+FRT_POLICIES = {
+    # count, interval, mínimo, máximo (segundos) — a "Padrão" segue a política exponencial documentada
+    "Padrão":      ("exponential", 4, 7.5, 5.0, 45.0),
+    "Nenhuma":     ("none", 0, 0.0, 0.0, 0.0),
+    "Fixo":        ("fixed", 4, 20.0, 0.0, 0.0),
+    "Exponencial": ("exponential", 4, 7.5, 5.0, 3600.0),
+}
+FRT_SWEEP = (1, 2, 5, 10, 20, 30, 50)
+FRT_MAX_ATTEMPTS = 50_000   # itens × tentativas por execução simulada (~40 µs de CPU cada): segura o rerun em ~2 s
+
+class FrtSelector(selectors.DefaultSelector):
+    """Selector de tempo virtual: em vez de bloquear até o próximo timer, avança o relógio."""
+    def __init__(self):
+        super().__init__()
+        self.now = 0.0
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise ValueError("Execução travada: nenhuma ação pronta e nenhum timer pendente.")
+        self.now += max(timeout, 0.0)
+        return super().select(0)
+
+class FrtLoop(asyncio.SelectorEventLoop):
+    # asyncio.sleep/wait_for usam loop.time(): horas de flow rodam em milissegundos de CPU
+    def __init__(self):
+        self.clock = FrtSelector()
+        super().__init__(self.clock)
+
+    def time(self) -> float:
+        return self.clock.now
+
+class FrtConnector:
+    """Conector simulado: limite de chamadas por janela (429 + Retry-After), latência e falhas 5xx."""
+    def __init__(self, latency_ms: float, fail: float, limit: int, window: float, n: int, rng: np.random.Generator):
+        sigma = 0.6
+        self.lat = rng.lognormal(math.log(latency_ms / 1000) - sigma * sigma / 2, sigma, n).tolist()
+        self.err = (rng.random(n) < fail).tolist()
+        self.k, self.limit, self.window = 0, limit, window
+        self.recent = collections.deque()
+        self.calls = self.throttled = self.errors = 0
+
+    async def call(self) -> Tuple[int, float]:
+        now = asyncio.get_running_loop().time()
+        self.calls += 1
+        while self.recent and self.recent[0] <= now - self.window:
+            self.recent.popleft()
+        if self.limit and len(self.recent) >= self.limit:
+            self.throttled += 1
+            return 429, self.recent[0] + self.window - now
+        self.recent.append(now)
+        k = self.k = (self.k + 1) % len(self.lat)
+        await asyncio.sleep(self.lat[k])
+        if self.err[k]:
+            self.errors += 1
+            return 502, 0.0
+        return 200, 0.0
+
+def frt_delay(policy: tuple, attempt: int, rnd: float) -> float:
+    kind, _, interval, lo, hi = policy
+    if kind == "fixed":
+        return interval
+    # Exponencial com jitter de ±20%, limitado a [mínimo, máximo]
+    return min(max(interval * (2 ** attempt) * (0.8 + 0.4 * rnd), lo), hi)
+
+async def frt_action(conn: FrtConnector, policy: tuple, timeout: float, rnd) -> Tuple[bool, int]:
+    timeouts = 0
+    for attempt in range(policy[1] + 1):
+        try:
+            status, retry_after = await asyncio.wait_for(conn.call(), timeout)
+        except asyncio.TimeoutError:
+            status, retry_after = 408, 0.0
+            timeouts += 1
+        if status == 200:
+            return True, timeouts
+        if attempt == policy[1] or policy[0] == "none" or not (status == 429 or status >= 500 or status == 408):
+            return False, timeouts
+        # 429 respeita o Retry-After do conector; demais erros seguem a política
+        await asyncio.sleep(retry_after if status == 429 and retry_after > 0 else frt_delay(policy, attempt, next(rnd)))
+    return False, timeouts
+
+async def frt_apply_to_each(conn, items: int, concurrency: int, policy: tuple, timeout: float, rnd) -> dict:
+    loop = asyncio.get_running_loop()
+    gate = asyncio.Semaphore(concurrency)
+    took, ok, timeouts = np.zeros(items), np.zeros(items, bool), 0
+    async def one(i):
+        nonlocal timeouts
+        async with gate:
+            t0 = loop.time()
+            ok[i], to = await frt_action(conn, policy, timeout, rnd)
+            took[i] = loop.time() - t0
+            timeouts += to
+    await asyncio.gather(*(one(i) for i in range(items)))
+    return {"duration": loop.time(), "took": took, "ok": ok, "timeouts": timeouts}
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def frt_run(items: int, concurrency: int, policy: tuple, latency_ms: float, fail: float, limit: int,
+            timeout: float, seed: int = 9) -> dict:
+    """Um Apply to each completo no loop de tempo virtual; devolve duração, chamadas e falhas."""
+    if items * (policy[1] + 1) > FRT_MAX_ATTEMPTS:
+        raise ValueError(f"{items:,} itens × {policy[1] + 1} tentativas passam do limite do simulador ({FRT_MAX_ATTEMPTS:,} chamadas por execução) — "
+                         "reduza os itens ou o count da política.")
+    rng = np.random.default_rng(seed)
+    conn = FrtConnector(latency_ms, fail, limit, 60.0, items * 4 + 16, rng)
+    rnd = iter(rng.random(items * (policy[1] + 1) + 16).tolist())
+    loop = FrtLoop()
+    t0 = time.perf_counter()
+    try:
+        r = loop.run_until_complete(frt_apply_to_each(conn, items, concurrency, policy, timeout, rnd))
+    finally:
+        loop.close()
+    return {"duration": r["duration"], "calls": conn.calls, "throttled": conn.throttled, "errors": conn.errors,
+            "timeouts": r["timeouts"], "failed": int((~r["ok"]).sum()), "p95": float(np.percentile(r["took"], 95)),
+            "ms": (time.perf_counter() - t0) * 1000}
+
+def frt_fmt(seconds: float) -> str:
+    return f"{seconds:,.0f} s" if seconds < 120 else f"{seconds / 60:,.1f} min" if seconds < 7200 else f"{seconds / 3600:,.1f} h"
+
+def flow_runtime_lab(key: str):
+    import pandas as pd
+    lab_header("🧪 Laboratório — Concorrência, retry e throttling","Um Apply to each contra um conector simulado (latência, 5xx e 429 com Retry-After), executado com asyncio em tempo virtual")
+    c1,c2 = st.columns([1,1.3],gap="large")
+    with c1:
+        items = st.select_slider("Itens no Apply to each",[200,1_000,2_000,5_000],1_000,format_func=lambda v: f"{v:,}",key=f"{key}_items")
+        conc = st.slider("Grau de paralelismo (controle de simultaneidade)",1,50,20,key=f"{key}_conc")
+        a1,a2 = st.columns(2)
+        latency = a1.number_input("Latência média (ms)",20,20_000,800,50,key=f"{key}_lat")
+        fail = a2.slider("Falhas 5xx (%)",0,50,5,key=f"{key}_fail") / 100
+        limit = a1.number_input("Limite do conector (chamadas/min, 0 = sem)",0,10_000,600,50,key=f"{key}_limit")
+        timeout = a2.number_input("Timeout da ação (s)",1,7200,120,key=f"{key}_to")
+        pname = st.selectbox("Política de nova tentativa",list(FRT_POLICIES),key=f"{key}_pol")
+        kind, count, interval, lo, hi = FRT_POLICIES[pname]
+        if pname in ("Fixo", "Exponencial"):
+            b1,b2 = st.columns(2)
+            count = b1.number_input("count",1,90,count,key=f"{key}_count")
+            interval = float(b2.number_input("interval (s)",1,3600,int(interval),key=f"{key}_int"))
+        policy = (kind, int(count), interval, lo, hi)
+        st.code(json.dumps({"type": kind, **({"count": int(count), "interval": f"PT{interval:g}S"} if kind != "none" else {}),
+                            **({"minimumInterval": f"PT{lo:g}S", "maximumInterval": f"PT{hi:g}S"} if kind == "exponential" else {})}, indent=2), language="json")
+    args = (policy, float(latency), fail, int(limit), float(timeout))
+    try:
+        r = frt_run(items, conc, *args)
+    except ValueError as e:
+        c2.error(f"❌ {e}")
+        return
+    # A varredura são 7 execuções completas: só roda a pedido e fica guardada enquanto a configuração não mudar
+    if c1.button(f"📈 Varrer paralelismo ({', '.join(map(str, FRT_SWEEP))})",key=f"{key}_sweep",use_container_width=True):
+        with st.spinner("Simulando a varredura…"):
+            st.session_state[f"{key}_sw"] = ((items, args), [frt_run(items, c, *args) for c in FRT_SWEEP])
+    sweep = st.session_state.get(f"{key}_sw")
+    sweep = sweep[1] if sweep and sweep[0] == (items, args) else None
+    with c2:
+        m1,m2,m3 = st.columns(3)
+        m1.metric("Duração da execução", frt_fmt(r["duration"]))
+        m2.metric("Chamadas à API", f"{r['calls']:,}", f"{r['calls'] / items:.2f} por item", delta_color="off")
+        m3.metric("Itens com falha", f"{r['failed'] / items:.1%}")
+        m4,m5,m6 = st.columns(3)
+        m4.metric("Respostas 429", f"{r['throttled']:,}")
+        m5.metric("Erros 5xx / timeouts", f"{r['errors']:,} / {r['timeouts']:,}")
+        m6.metric("Item p95", frt_fmt(r["p95"]))
+        if sweep:
+            df = pd.DataFrame([{"Paralelismo": c, "Duração (min)": s["duration"] / 60, "Chamadas": s["calls"], "429": s["throttled"],
+                                "Falhas (%)": s["failed"] / items * 100} for c, s in zip(FRT_SWEEP, sweep)])
+            st.line_chart(df.set_index("Paralelismo")[["Duração (min)"]], height=200)
+            st.dataframe(df, use_container_width=True, hide_index=True,
+                         column_config={"Duração (min)": st.column_config.NumberColumn(format="%.1f"), "Falhas (%)": st.column_config.NumberColumn(format="%.1f")})
+        st.caption(f"Execução simulada em {r['ms']:,.0f} ms de CPU · cada item que falha após todas as tentativas cai no Scope Catch (Run After: falhou)")
+    best = min(zip(FRT_SWEEP, sweep), key=lambda p: (p[1]["failed"], p[1]["duration"])) if sweep else None
+    if limit and r["throttled"] > r["calls"] * 0.2:
+        info_box(f"🚦 {r['throttled'] / r['calls']:.0%} das chamadas voltaram 429: o limite de {limit}/min é o teto real de vazão "
+                 f"(~{limit / 60:.0f} chamadas/s). Mais paralelismo só gera mais 429"
+                 + (f" — na varredura, o melhor ponto foi paralelismo {best[0]}." if best else "."), "warning")
+    elif best:
+        info_box(f"💡 Na varredura, o paralelismo {best[0]} terminou mais rápido com menos falhas ({frt_fmt(best[1]['duration'])}).", "info")
+    else:
+        info_box("💡 Use <b>Varrer paralelismo</b> para comparar a mesma execução com 1 a 50 ramos em paralelo.", "info")
+
+
+# ══════════════════════════════════════════════
+# POWER AUTOMATE — ANALISADOR DE PACOTE DE FLOW EXPORTADO
+# ══════════════════════════════════════════════
+FLOW_CONNECTOR_TYPES = {"OpenApiConnection", "ApiConnection", "OpenApiConnectionWebhook", "ApiConnectionWebhook", "Http", "HttpWebhook"}
+FLOW_VAR_WRITES = {"SetVariable", "IncrementVariable", "DecrementVariable", "AppendToArrayVariable", "AppendToStringVariable"}
+FLOW_LOOPS = {"Foreach", "Until"}
+FLOW_MAX_MEMBER = 64 * 2**20   # maior definition.json aceita (descompactado)
+FLOW_MAX_RATIO = 200           # compressão acima disso é tratada como zip bomb
+FLOW_MAX_FOREACH = 100_000     # limite de itens do Apply to each (planos Premium)
+FLOW_MAX_UNTIL = 5_000         # máximo de voltas de um Until
+FLOW_RUNS_PER_DAY = {"Second": 86_400, "Minute": 1_440, "Hour": 24, "Day": 1, "Week": 1 / 7, "Month": 1 / 30}
+
+def flow_sample_definition(fixed: bool) -> dict:
+    """Flow de sincronização de pedidos — a versão 'fixed' aplica as recomendações do analisador."""
+    def sp(op, **params):
+        return {"type": "OpenApiConnection", "inputs": {"host": {"apiId": "/providers/Microsoft.PowerApps/apis/shared_sharepointonline",
+                "connectionName": "shared_sharepointonline", "operationId": op}, "parameters": params}, "runAfter": {}}
+    def dv(op, **params):
+        return {"type": "OpenApiConnection", "inputs": {"host": {"apiId": "/providers/Microsoft.PowerApps/apis/shared_commondataserviceforapps",
+                "connectionName": "shared_commondataserviceforapps", "operationId": op}, "parameters": params}, "runAfter": {}}
+    def after(a, **run_after):
+        a["runAfter"] = {k: v for k, v in run_after.items()}
+        return a
+    poll = {"type": "Until", "expression": "@equals(body('Consultar_status')?['status'], 'done')",
+            "limit": {"count": 60 if fixed else 5000, "timeout": "PT1H"},
+            "actions": {"Consultar_status": {"type": "Http", "inputs": {"method": "GET", "uri": "https://erp.contoso.com/api/status/@{items('Para_cada_linha')?['id']}"}, "runAfter": {}}},
+            "runAfter": {}}
+    if fixed:
+        poll["actions"]["Aguardar"] = after({"type": "Wait", "inputs": {"interval": {"count": 30, "unit": "Second"}}}, Consultar_status=["Succeeded"])
+    lines = {"type": "Foreach", "foreach": "@body('Obter_linhas')?['value']",
+             "actions": {"Aguardar_ERP": poll,
+                         "Atualizar_linha": after(dv("UpdateRecord", entityName="cr123_pedidolinhas"), Aguardar_ERP=["Succeeded"])},
+             "runAfter": {}}
+    if fixed:
+        lines["runtimeConfiguration"] = {"concurrency": {"repetitions": 10}}
+    body = {"Obter_item": sp("GetItem", dataset="https://contoso.sharepoint.com/sites/vendas", table="Pedidos", id="@items('Para_cada_pedido')?['cr123_spid']"),
+            "Obter_linhas": after(dv("ListRecords", entityName="cr123_pedidolinhas"), Obter_item=["Succeeded"]),
+            "Condicao_aprovado": after({"type": "If", "expression": {"equals": ["@body('Obter_item')?['Status']", "Aprovado"]},
+                                        "actions": {"Para_cada_linha": lines},
+                                        "else": {"actions": {"Registrar_pendente": sp("PostItem", table="Pendencias")}}}, Obter_linhas=["Succeeded"])}
+    if not fixed:
+        body["Somar_total"] = after({"type": "IncrementVariable", "inputs": {"name": "total", "value": 1}}, Condicao_aprovado=["Succeeded"])
+    loop = {"type": "Foreach", "foreach": "@outputs('Listar_pedidos')?['body/value']", "actions": body, "runAfter": {}}
+    if fixed:
+        loop["runtimeConfiguration"] = {"concurrency": {"repetitions": 20}}
+        actions = {
+            "Inicializar_total": {"type": "InitializeVariable", "inputs": {"variables": [{"name": "total", "type": "integer", "value": 0}]}, "runAfter": {}},
+            "Try": after({"type": "Scope", "actions": {
+                "Listar_pedidos": dv("ListRecords", entityName="cr123_pedidos", **{"$filter": "statuscode eq 1"}),
+                "Para_cada_pedido": after(loop, Listar_pedidos=["Succeeded"])}}, Inicializar_total=["Succeeded"]),
+            "Catch": after({"type": "Scope", "actions": {
+                "Notificar_falha": {"type": "OpenApiConnection", "inputs": {"host": {"apiId": "/providers/Microsoft.PowerApps/apis/shared_teams",
+                                    "connectionName": "shared_teams", "operationId": "PostMessageToConversation"}}, "runAfter": {}},
+                "Encerrar_com_falha": after({"type": "Terminate", "inputs": {"runStatus": "Failed"}}, Notificar_falha=["Succeeded"])}},
+                Try=["Failed", "TimedOut"]),
+            "Enviar_resumo": after({"type": "OpenApiConnection", "inputs": {"host": {"apiId": "/providers/Microsoft.PowerApps/apis/shared_office365",
+                                    "connectionName": "shared_office365", "operationId": "SendEmailV2"}}}, Try=["Succeeded"]),
+        }
+    else:
+        actions = {
+            "Inicializar_total": {"type": "InitializeVariable", "inputs": {"variables": [{"name": "total", "type": "integer", "value": 0}]}, "runAfter": {}},
+            "Listar_pedidos": after(dv("ListRecords", entityName="cr123_pedidos"), Inicializar_total=["Succeeded"]),
+            "Para_cada_pedido": after(loop, Listar_pedidos=["Succeeded"]),
+            # runAfter com o nome antigo da ação (renomeada depois de criada)
+            "Enviar_resumo": after({"type": "OpenApiConnection", "inputs": {"host": {"apiId": "/providers/Microsoft.PowerApps/apis/shared_office365",
+                                    "connectionName": "shared_office365", "operationId": "SendEmailV2"}}}, Aplicar_a_cada=["Succeeded"]),
+        }
+    return {"$schema": "https://schema.management.azure.com/providers/Microsoft.Logic/schemas/2016-06-01/workflowdefinition.json#",
+            "contentVersion": "1.0.0.0",
+            "triggers": {"Recorrencia": {"type": "Recurrence", "recurrence": {"frequency": "Hour" if fixed else "Minute", "interval": 1 if fixed else 15}}},
+            "actions": actions}
+
+def flow_sample_package(fixed: bool) -> str:
+    # Pacote no formato "Exportar → Pacote (.zip)": manifest.json + Microsoft.Flow/flows/<guid>/definition.json
+    import zipfile
+    path = os.path.join(SYNTH_DIR, f"flow_pedidos_{'corrigido' if fixed else 'original'}.zip")
+    if os.path.exists(path):
+        return path
+    os.makedirs(SYNTH_DIR, exist_ok=True)
+    guid = "7c1f3a52-0d4e-4a8b-9f21-" + ("5b6c7d8e9f01" if fixed else "0a1b2c3d4e5f")
+    name = "Sincronizar Pedidos" + (" (corrigido)" if fixed else "")
+    with zipfile.ZipFile(path + ".tmp", "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("manifest.json", json.dumps({"schema": "1.0", "details": {"displayName": name, "createdTime": "2025-03-01T12:00:00Z"},
+                                                 "resources": {guid: {"type": "Microsoft.Flow/flows", "details": {"displayName": name}}}}, indent=2))
+        zf.writestr(f"Microsoft.Flow/flows/{guid}/definition.json",
+                    json.dumps({"name": guid, "id": f"/providers/Microsoft.Flow/flows/{guid}", "type": "Microsoft.Flow/flows",
+                                "properties": {"displayName": name, "definition": flow_sample_definition(fixed)}}, indent=2))
+        zf.writestr(f"Microsoft.Flow/flows/{guid}/apisMap.json", "{}")
+        zf.writestr(f"Microsoft.Flow/flows/{guid}/connectionsMap.json", "{}")
+    os.replace(path + ".tmp", path)
+    return path
+
+def flow_map(v, what: str) -> dict:
+    # Definições enviadas pelo usuário: objeto esperado e veio outra coisa = erro legível, não AttributeError
+    if v is None:
+        return {}
+    if not isinstance(v, dict):
+        raise ValueError(f"{what} deve ser um objeto JSON, não {type(v).__name__}.")
+    return v
+
+def flow_text(v, what: str, default: str = "") -> str:
+    if v is None:
+        return default
+    if not isinstance(v, str):
+        raise ValueError(f"{what} deve ser um texto, não {type(v).__name__}.")
+    return v
+
+def flow_count(v, default: int) -> Optional[int]:
+    """count/interval/repetitions literais; expressões (@variables('n')) só são conhecidas em execução → None."""
+    if v is None:
+        return default
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return int(v)
+    if isinstance(v, str) and re.fullmatch(r"\s*\d+\s*", v):
+        return int(v)
+    return None
+
+def flow_children(a: dict) -> list:
+    """Ramos (rótulo, ações) de um contêiner: Foreach/Until/Scope, If (sim/não) e Switch (casos + padrão)."""
+    t = a.get("type")
+    if t in FLOW_LOOPS | {"Scope"}:
+        return [("", a.get("actions"))]
+    if t == "If":
+        return [("sim", a.get("actions")), ("não", flow_map(a.get("else"), "else do If").get("actions"))]
+    if t == "Switch":
+        return [(f"caso {k}", flow_map(c, f"caso {k} do Switch").get("actions")) for k, c in flow_map(a.get("cases"), "cases do Switch").items()] + \
+               [("padrão", flow_map(a.get("default"), "default do Switch").get("actions"))]
+    return []
+
+def flow_connector(a: dict) -> str:
+    inputs = a.get("inputs") if isinstance(a.get("inputs"), dict) else {}
+    host = inputs.get("host") if isinstance(inputs.get("host"), dict) else {}
+    if a.get("type") in ("Http", "HttpWebhook"):
+        return "HTTP"
+    conn = host.get("connection") if isinstance(host.get("connection"), dict) else {}
+    api = str(host.get("apiId") or conn.get("name") or host.get("connectionName") or "")
+    api = api.rsplit("/", 1)[-1].replace("shared_", "")
+    return f"{api} · {host.get('operationId', '?')}" if api else ""
+
+def flow_analyze(defn: dict, foreach_items: int, until_iters: int) -> dict:
+    """Achata a definição em nós com contêiner e multiplicador de laços, resolve runAfter e aplica as regras."""
+    import html
+    nodes, edges, findings = [], [], []
+    def walk(actions: dict, parent: int, branch: str, mult: float, worst: float, loops: list):
+        actions = flow_map(actions, f"actions de '{nodes[parent]['name']}'" if parent >= 0 else "actions da definição")
+        names = set(actions)
+        first = len(nodes)
+        for name, a in actions.items():
+            a = flow_map(a, f"A ação '{name}'")
+            t = flow_text(a.get("type"), f"type de '{name}'", "?")
+            node = {"name": name, "type": t, "parent": parent, "branch": branch, "mult": mult, "worst": worst,
+                    "loops": list(loops), "connector": flow_connector(a) if t in FLOW_CONNECTOR_TYPES else "",
+                    "runAfter": flow_map(a.get("runAfter"), f"runAfter de '{name}'"), "raw": a}
+            nodes.append(node)
+        for i in range(first, len(nodes)):
+            n = nodes[i]
+            for dep, statuses in n["runAfter"].items():
+                if not isinstance(statuses, list) or not all(isinstance(s, str) for s in statuses):
+                    raise ValueError(f"runAfter de '{n['name']}' → '{dep}' deve ser uma lista de status em texto (ex.: [\"Succeeded\"]).")
+                if dep not in names:
+                    findings.append({"sev": "danger", "rule": "runAfter quebrado",
+                                     "msg": f"<b>{n['name']}</b> roda depois de <b>{dep}</b>, que não existe no mesmo contêiner — o flow não salva/importa."})
+                    continue
+                j = first + list(actions).index(dep)
+                edges.append((j, i, [s for s in statuses]))
+        # Ordem topológica entre irmãos (Kahn): sobra = ciclo de runAfter
+        sib = list(range(first, len(nodes)))
+        indeg = {i: sum(1 for d in nodes[i]["runAfter"] if d in names) for i in sib}
+        ready = [i for i in sib if indeg[i] == 0]
+        seen = 0
+        while ready:
+            j = ready.pop()
+            seen += 1
+            for a_, b_, _ in edges:
+                if a_ == j and b_ in indeg:
+                    indeg[b_] -= 1
+                    if indeg[b_] == 0:
+                        ready.append(b_)
+        if seen < len(sib):
+            findings.append({"sev": "danger", "rule": "Ciclo de runAfter",
+                             "msg": "Ações em ciclo: " + ", ".join(nodes[i]["name"] for i in sib if indeg[i] > 0)})
+        for i in range(first, first + len(actions)):
+            a = nodes[i]["raw"]
+            t = a.get("type")
+            m, w = mult, worst
+            if t == "Foreach":
+                m, w = mult * foreach_items, worst * FLOW_MAX_FOREACH
+            elif t == "Until":
+                cap = flow_count(flow_map(a.get("limit"), f"limit de '{nodes[i]['name']}'").get("count"), 60)
+                cap = FLOW_MAX_UNTIL if cap is None else cap
+                m, w = mult * min(until_iters, cap), worst * cap
+            for label, acts in flow_children(a):
+                walk(acts, i, label, m, w, loops + [i] if t in FLOW_LOOPS else loops)
+    walk(flow_map(defn, "A definição").get("actions") or {}, -1, "", 1.0, 1.0, [])
+
+    children = {}
+    for i, n in enumerate(nodes):
+        children.setdefault(n["parent"], []).append(i)
+    def inside(i):
+        out = []
+        for c in children.get(i, []):
+            out += [c] + inside(c)
+        return out
+
+    for i, n in enumerate(nodes):
+        a, t = n["raw"], n["type"]
+        body = [nodes[c] for c in inside(i)]
+        if t in FLOW_LOOPS and n["loops"]:
+            outer = " → ".join(nodes[j]["name"] for j in n["loops"])
+            findings.append({"sev": "warning", "rule": "Laço aninhado",
+                             "msg": f"<b>{n['name']}</b> ({t}) dentro de {outer}: cada iteração externa repete o laço inteiro "
+                                    f"(~{n['mult'] * (foreach_items if t == 'Foreach' else until_iters):,.0f} iterações por execução na estimativa)."})
+        if t == "Until":
+            lim = a.get("limit") or {}
+            cap = flow_count(lim.get("count"), 60)
+            if cap is None:
+                findings.append({"sev": "warning", "rule": "Limite do Until por expressão",
+                                 "msg": f"<b>{n['name']}</b> usa count = <code>{html.escape(str(lim.get('count')))}</code>, conhecido só em execução. "
+                                        f"A estimativa usa as voltas médias informadas e o pior caso assume o máximo ({FLOW_MAX_UNTIL:,})."})
+            elif cap > 1000 or not lim:
+                findings.append({"sev": "danger", "rule": "Until sem limite efetivo",
+                                 "msg": f"<b>{n['name']}</b> aceita até {cap:,} iterações (timeout {lim.get('timeout', 'PT1H')}). "
+                                        "Defina um count realista — no pior caso são essas chamadas multiplicadas pelos laços externos."})
+            if not any(b["type"] == "Wait" for b in body) and any(b["connector"] for b in body):
+                findings.append({"sev": "warning", "rule": "Polling sem atraso",
+                                 "msg": f"<b>{n['name']}</b> chama {', '.join(sorted({b['connector'] for b in body if b['connector']}))} em loop sem <b>Atraso</b>: "
+                                        "cada volta é uma chamada imediata e consome limite de requisições."})
+        if t == "Foreach":
+            conc = flow_map(flow_map(a.get("runtimeConfiguration"), f"runtimeConfiguration de '{n['name']}'").get("concurrency"),
+                            f"concurrency de '{n['name']}'")
+            reps = flow_count(conc.get("repetitions"), 0)
+            writes = [b["name"] for b in body if b["type"] in FLOW_VAR_WRITES]
+            if reps is None:
+                findings.append({"sev": "warning", "rule": "Simultaneidade por expressão",
+                                 "msg": f"<b>{n['name']}</b> define repetitions = <code>{html.escape(str(conc.get('repetitions')))}</code>; "
+                                        "o grau de paralelismo só é conhecido em execução"
+                                        + (f" — se passar de 1, as variáveis alteradas no laço ({', '.join(writes)}) entram em condição de corrida." if writes else ".")})
+            elif reps > 1 and writes:
+                findings.append({"sev": "danger", "rule": "Variável em laço paralelo",
+                                 "msg": f"<b>{n['name']}</b> roda {reps} iterações em paralelo e altera variáveis ({', '.join(writes)}) — condição de corrida; "
+                                        "use Compose/Select depois do laço ou volte à execução em série."})
+            elif not reps and any(b["connector"] for b in body):
+                findings.append({"sev": "warning" if not writes else "info", "rule": "Controle de simultaneidade",
+                                 "msg": f"<b>{n['name']}</b> roda em série com {sum(1 for b in body if b['connector'])} chamada(s) a conector por item. "
+                                        + (f"Antes de ativar o paralelismo, tire as variáveis de dentro do laço ({', '.join(writes)})." if writes
+                                           else "Ative o controle de simultaneidade (até 50) se a ordem não importa.")})
+    catch = [n for n in nodes if any(set(s) & {"Failed", "TimedOut"} for s in n["runAfter"].values())]
+    if not catch and any(n["connector"] for n in nodes):
+        findings.append({"sev": "warning", "rule": "Sem tratamento de erros",
+                         "msg": "Nenhuma ação roda após <i>falhou/expirou</i>. Agrupe as ações num Scope <b>Try</b> e crie um Scope <b>Catch</b> com "
+                                "runAfter = Failed, TimedOut para notificar e encerrar com Terminate."})
+    elif catch:
+        tc = [n["name"] for n in catch if n["type"] == "Scope"]
+        findings.append({"sev": "success", "rule": "Tratamento de erros",
+                         "msg": f"Ações de falha: {', '.join(n['name'] for n in catch)}" + (" — padrão Try/Catch com Scope." if tc else ".")})
+    trig = flow_map(next(iter(flow_map(defn.get("triggers"), "triggers").values()), {}), "O gatilho")
+    rec = flow_map(trig.get("recurrence"), "recurrence do gatilho")
+    flow_text(rec.get("frequency"), "frequency da recorrência")
+    flow_text(trig.get("type"), "type do gatilho")
+    runs = FLOW_RUNS_PER_DAY.get(rec.get("frequency"), 0) / max(flow_count(rec.get("interval"), 1) or 1, 1) if rec else None
+    return {"nodes": nodes, "edges": edges, "findings": findings, "runs_per_day": runs,
+            "trigger": f"{trig.get('type', '?')}" + (f" a cada {rec.get('interval', 1)} {rec.get('frequency')}" if rec else ""),
+            "actions": sum(n["mult"] for n in nodes), "calls": sum(n["mult"] for n in nodes if n["connector"]),
+            "worst_calls": sum(n["worst"] for n in nodes if n["connector"])}
+
+def flow_dot(r: dict) -> str:
+    nodes = r["nodes"]
+    colors = {"Foreach": "#dbeafe", "Until": "#fee2e2", "Scope": "#f3f4f6", "If": "#fef3c7", "Switch": "#fef3c7"}
+    out = ["digraph { rankdir=TB; compound=true; node [shape=box, style=\"rounded,filled\", fontname=Helvetica, fontsize=10, fillcolor=\"#ffffff\"];"]
+    kids = {}
+    for i, n in enumerate(nodes):
+        kids.setdefault(n["parent"], []).append(i)
+    def emit(parent):
+        for i in kids.get(parent, []):
+            n = nodes[i]
+            label = f"{n['name']}\\n{n['type']}" + (f"\\n{n['connector']}" if n["connector"] else "") + (f"\\n×{n['mult']:,.0f}" if n["mult"] > 1 else "")
+            fill = "#ede9fe" if n["connector"] else "#ffffff"
+            if i in kids:
+                out.append(f'subgraph cluster_{i} {{ label="{n["name"]} ({n["type"]})"; style="rounded,filled"; fillcolor="{colors.get(n["type"], "#f9fafb")}"; fontname=Helvetica; fontsize=10;')
+                out.append(f'n{i} [label="{label}", shape=plaintext, style=""];')
+                emit(i)
+                out.append("}")
+            else:
+                out.append(f'n{i} [label="{label}", fillcolor="{fill}"];')
+    emit(-1)
+    for a, b, statuses in r["edges"]:
+        bad = set(statuses) - {"Succeeded"}
+        out.append(f'n{a} -> n{b}' + (f' [color="#dc2626", fontcolor="#dc2626", label="{", ".join(statuses)}", fontsize=9];' if bad else ";"))
+    return "\n".join(out + ["}"])
+
+def flow_members(open_zip) -> list:
+    """Lista as definições de flow do .zip sem extrair nada: só lê o diretório central e os membros relevantes."""
+    import zipfile
+    found = []
+    try:
+        with zipfile.ZipFile(open_zip()) as zf:
+            for info in zf.infolist():
+                n = info.filename
+                if info.is_dir() or not (n.endswith("/definition.json") or n == "definition.json" or re.match(r"^Workflows/[^/]+\.json$", n)):
+                    continue
+                if info.file_size > FLOW_MAX_MEMBER or (info.compress_size and info.file_size / info.compress_size > FLOW_MAX_RATIO):
+                    raise ValueError(f"{n}: {info.file_size / 2**20:,.0f} MB descompactados — acima do limite de segurança.")
+                found.append((n, info.file_size))
+    except zipfile.BadZipFile:
+        raise ValueError("O arquivo não é um .zip válido.")
+    if not found:
+        raise ValueError("Nenhum definition.json (pacote) ou Workflows/*.json (solução) encontrado no .zip.")
+    return found
+
+@st.cache_data(max_entries=64, show_spinner="Lendo definição do flow…")
+def flow_load(digest: str, member: str, _open_zip) -> Tuple[str, dict]:
+    # Descompacta só este membro, em streaming, direto para o parser JSON
+    import io, zipfile
+    with zipfile.ZipFile(_open_zip()) as zf, zf.open(member) as fh:
+        try:
+            doc = json.load(io.TextIOWrapper(fh, "utf-8-sig"))
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{member}: JSON inválido ({e})")
+    if not isinstance(doc, dict):
+        raise ValueError(f"{member}: a raiz deve ser um objeto JSON, não {type(doc).__name__}.")
+    try:
+        props = flow_map(doc.get("properties"), "properties")
+        defn = props.get("definition") or doc.get("definition") or doc
+        title = flow_text(props.get("displayName"), "displayName")
+    except ValueError as e:
+        raise ValueError(f"{member}: {e}")
+    if not isinstance(defn, dict) or "actions" not in defn:
+        raise ValueError(f"{member}: não parece uma definição de Logic Apps/Power Automate (sem 'actions').")
+    return title or member.split("/")[-2 if member.endswith("definition.json") else -1], defn
+
+def flow_package_lab(key: str):
+    import io
+    import pandas as pd
+    lab_header("📦 Laboratório — Analisador de pacote de flow exportado","Envie o .zip exportado (pacote ou solução): DAG de ações com runAfter e contêineres aninhados, regras de laço, simultaneidade, erros e chamadas por execução")
+    c1,c2 = st.columns([1,1.3],gap="large")
+    with c1:
+        src = st.radio("Pacote",["Exemplo com problemas","Exemplo corrigido","Enviar .zip"],horizontal=True,key=f"{key}_src")
+        if src == "Enviar .zip":
+            up = st.file_uploader("Pacote do flow (.zip)",type=["zip"],key=f"{key}_up")
+            if up is None:
+                info_box("No Power Automate: <b>Meus flows → … → Exportar → Pacote (.zip)</b>. Soluções exportadas também servem (pasta <code>Workflows/</code>).", "info")
+                return
+            raw = up.getvalue()
+            digest, opener = hashlib.sha1(raw).hexdigest(), lambda: io.BytesIO(raw)
+        else:
+            path = flow_sample_package(src == "Exemplo corrigido")
+            digest, opener = f"{path}:{os.path.getsize(path)}", lambda: open(path, "rb")
+            with open(path, "rb") as f:
+                st.download_button("⬇️ Baixar este pacote",f.read(),os.path.basename(path),"application/zip",key=f"{key}_dl")
+        try:
+            members = flow_members(opener)
+            member = st.selectbox(f"Flow ({len(members)} no pacote)",[m for m, _ in members],format_func=lambda m: m.split("/")[-2] if m.endswith("definition.json") and "/" in m else m,key=f"{key}_m") if len(members) > 1 else members[0][0]
+            name, defn = flow_load(digest, member, opener)
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            return
+        a1,a2 = st.columns(2)
+        items = a1.number_input("Itens por Apply to each",1,FLOW_MAX_FOREACH,100,key=f"{key}_items")
+        until = a2.number_input("Voltas médias de cada Until",1,FLOW_MAX_UNTIL,5,key=f"{key}_until")
+        try:
+            r = flow_analyze(defn, int(items), int(until))
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            return
+        runs = r["runs_per_day"]
+        if runs is None:
+            runs = st.number_input("Execuções por dia (gatilho não é recorrência)",1,100_000,50,key=f"{key}_runs")
+        st.markdown(f"**{name}** · gatilho {r['trigger']} · {len(r['nodes'])} ações")
+    with c2:
+        m1,m2,m3 = st.columns(3)
+        m1.metric("Ações por execução", f"{r['actions']:,.0f}")
+        m2.metric("Chamadas a conectores", f"{r['calls']:,.0f}", f"pior caso {r['worst_calls']:,.0f}", delta_color="off")
+        day = r["actions"] * runs
+        m3.metric("Requisições/dia", f"{day:,.0f}", f"{day / 40_000:.0%} do limite Premium (40 mil)", delta_color="inverse" if day > 40_000 else "off")
+        for f in sorted(r["findings"], key=lambda f: ["danger", "warning", "info", "success"].index(f["sev"])):
+            info_box(f"<b>{f['rule']}:</b> {f['msg']}", f["sev"])
+    st.graphviz_chart(flow_dot(r), use_container_width=True)
+    st.dataframe(pd.DataFrame([{"Ação": n["name"], "Tipo": n["type"], "Contêiner": r["nodes"][n["parent"]]["name"] + (f" ({n['branch']})" if n["branch"] else "") if n["parent"] >= 0 else "—",
+                                "Conector": n["connector"], "Execuções por run": n["mult"], "runAfter": ", ".join(f"{k}: {'/'.join(v)}" for k, v in n["runAfter"].items())}
+                               for n in r["nodes"]]), use_container_width=True, hide_index=True,
+                 column_config={"Execuções por run": st.column_config.NumberColumn(format="%.0f")})
+    st.caption("Cada ação executada conta como uma requisição da Power Platform; os laços multiplicam pelo número de itens/voltas informados. O .zip é lido pelo diretório central e só o definition.json é descompactado, em streaming.")
+
+
 # ══════════════════════════════════════════════
 # POWER AUTOMATE — Tratamento de Erros & Debug
 # ══════════════════════════════════════════════
@@ -4200,6 +9998,8 @@ P1D      = 1 dia
   Limite: Count = 50, Timeout = PT2H
   [Ações...]
   [Atraso] PT5M (intervalo entre tentativas)''', language="text")
+        sp()
+        flow_runtime_lab("frt_err")
 
     with tabs[3]:
         c1,c2 = st.columns(2)
@@ -4282,11 +10082,288 @@ concat(
             ]
             for t, d in erros:
                 st.markdown(f'<div style="background:#fef2f2;border-left:3px solid #dc2626;border-radius:6px;padding:8px 12px;margin-bottom:6px"><div style="font-weight:700;color:#7f1d1d;font-size:12px">⚠️ {t}</div><div style="font-size:11px;color:#991b1b;margin-top:2px">{d}</div></div>', unsafe_allow_html=True)
+        st.divider()
+        flow_package_lab("fpk_err")
 
     section_quiz("automate_erros")
     st.markdown('</div>', unsafe_allow_html=True)
 
 
+# ══════════════════════════════════════════════
+# COPILOT STUDIO — CHUNKING & BM25 (FONTES DE CONHECIMENTO)
+# ══════════════════════════════════════════════
+KB_DIR = os.path.join(SYNTH_DIR, "kb")
+KB_K1, KB_B = 1.2, 0.75
+KB_SEGMENT_CHUNKS = 20_000   # o worker grava um segmento a cada ~20k trechos — a busca já enxerga o que terminou
+KB_KEEP_JOBS = 32            # jobs terminados mantidos em memória (para exibir erros)
+KB_STOP = set("a o as os ao aos de da do das dos e em no na nos nas num numa um uma uns umas para pra por pelo pela com sem "
+              "que se ou como mais ja nao sao ser foi sua seu suas seus the of and to in is for on with by or be are".split())
+KB_TOPICS = {
+    "Reembolso de Despesas": ["O limite de reembolso para viagem nacional é de R$ {v} por dia de hospedagem",
+                              "Notas fiscais devem ser enviadas pelo app de despesas em até {d} dias após a viagem",
+                              "Despesas com táxi e aplicativo são reembolsadas mediante recibo digital",
+                              "Viagens internacionais têm diária de US$ {v} e exigem aprovação do diretor"],
+    "Férias e Ausências":    ["O colaborador pode dividir as férias em até três períodos, um deles com pelo menos {d} dias",
+                              "A solicitação de férias deve ser feita com {d} dias de antecedência no portal do RH",
+                              "O abono pecuniário permite vender até um terço das férias",
+                              "Ausências por consulta médica exigem atestado anexado em até {d} dias"],
+    "Segurança da Informação": ["A senha deve ter no mínimo {d} caracteres e ser trocada a cada 90 dias",
+                                "O MFA é obrigatório para acesso remoto ao e-mail e ao Teams",
+                                "Dados de clientes não podem ser compartilhados em listas públicas do SharePoint",
+                                "Incidentes de phishing devem ser reportados ao SOC em até {d} horas"],
+    "Home Office":           ["O trabalho remoto é permitido até {d} dias por semana conforme acordo com o gestor",
+                              "A empresa paga ajuda de custo de R$ {v} por mês para internet e energia",
+                              "Equipamentos como monitor e cadeira podem ser retirados no escritório mediante termo",
+                              "Reuniões de equipe presenciais acontecem toda {w}"],
+    "Compras e Fornecedores": ["Compras acima de R$ {v} exigem três cotações de fornecedores homologados",
+                               "O pedido de compra é aprovado pelo gestor e pelo financeiro no Power Automate",
+                               "Fornecedores novos passam por due diligence em até {d} dias úteis",
+                               "Contratos recorrentes são renovados automaticamente a cada {d} meses"],
+}
+KB_FILLER = ["Esta política se aplica a todos os colaboradores e terceiros", "Em caso de dúvida procure o seu gestor imediato",
+             "As regras podem ser revisadas pelo comitê a qualquer momento", "Exceções devem ser registradas com justificativa",
+             "O descumprimento pode gerar medidas disciplinares", "Consulte também o código de conduta da empresa"]
+
+def kb_tokens(text: str) -> list:
+    return [w for w in intent_fold(text).split() if w not in KB_STOP]
+
+def kb_pages(name: str, raw: bytes) -> list:
+    """Texto por página: PDF via pypdf (opcional); .txt/.md usam \\f como quebra de página."""
+    if name.lower().endswith(".pdf"):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise ValueError(f"{name}: para ler PDF instale o pacote pypdf (pip install pypdf) — .txt e .md funcionam sem ele.")
+        import io
+        return [p.extract_text() or "" for p in PdfReader(io.BytesIO(raw)).pages]
+    return raw.decode("utf-8", errors="replace").split("\f")
+
+def kb_chunks(pages: list, size: int, overlap: int) -> list:
+    # Janela de `size` palavras andando `size - overlap`; cada trecho guarda a página onde começa
+    words, page_of = [], []
+    for p, text in enumerate(pages):
+        w = text.split()
+        words += w
+        page_of += [p + 1] * len(w)
+    step = max(1, size - overlap)
+    return [(page_of[i], " ".join(words[i:i + size])) for i in range(0, max(1, len(words) - overlap), step) if words[i:i + size]]
+
+def kb_sample_docs(pages: int, seed: int = 4) -> list:
+    rng = random.Random(seed)
+    docs = []
+    for d in range(0, pages, 50):
+        topic = rng.choice(list(KB_TOPICS))
+        body = []
+        for _ in range(min(50, pages - d)):
+            sents = [rng.choice(KB_TOPICS[topic] if rng.random() < .35 else KB_FILLER) for _ in range(24)]
+            body.append(f"{topic} — revisão {d // 50 + 1}. " + ". ".join(s.format(v=rng.randrange(80, 900, 10), d=rng.randint(2, 30),
+                        w=rng.choice(["segunda", "quarta", "sexta"])) for s in sents) + ".")
+        docs.append((f"manual_{d // 50 + 1:03d}_{topic.split()[0].lower()}.txt", body))
+    return docs
+
+def kb_manifest(index_dir: str) -> dict:
+    path = os.path.join(index_dir, "manifest.json")
+    if not os.path.exists(path):
+        return {"segments": [], "files": {}}
+    with open(path) as f:
+        return json.load(f)
+
+def kb_write_segment(index_dir: str, docs: list, files: list) -> Optional[str]:
+    """docs = [(arquivo, página, texto)] → segmento imutável: termos ordenados + postings (trecho, tf) por termo.
+    Trechos sem nenhum termo (só stopwords, PDF escaneado) ficam de fora; sem termos, nenhum segmento é gravado (None)."""
+    tokens = [kb_tokens(text) for _, _, text in docs]
+    docs = [d for d, t in zip(docs, tokens) if t]
+    if not docs:
+        return None
+    toks, owner, dl = [], [], []
+    for i, t in enumerate(x for x in tokens if x):
+        toks += t
+        owner += [i] * len(t)
+        dl.append(len(t))
+    terms, inv = np.unique(np.array(toks, dtype=str), return_inverse=True)
+    key, tf = np.unique(inv.astype(np.int64) * len(docs) + np.array(owner, np.int64), return_counts=True)
+    blob = [text.encode() for _, _, text in docs]
+    arrays = {"terms": terms, "ptr": np.searchsorted(key // len(docs), np.arange(len(terms) + 1)),
+              "docs": (key % len(docs)).astype(np.int32), "tf": np.minimum(tf, 65535).astype(np.uint16),
+              "dl": np.array(dl, np.int32), "offsets": np.cumsum([0] + [len(b) for b in blob]),
+              "file": np.array([f for f, _, _ in docs], np.int32), "page": np.array([p for _, p, _ in docs], np.int32)}
+    name = f"seg_{time.time_ns():x}"
+    tmp = os.path.join(index_dir, f"{name}.tmp")
+    os.makedirs(tmp)
+    for n, a in arrays.items():
+        np.save(os.path.join(tmp, f"{n}.npy"), a)
+    with open(os.path.join(tmp, "text.bin"), "wb") as f:
+        f.write(b"".join(blob))
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"files": files, "tokens": int(sum(dl))}, f)
+    os.rename(tmp, os.path.join(index_dir, name))
+    return name
+
+@st.cache_resource(max_entries=256, show_spinner=False)
+def kb_segment(path: str) -> dict:
+    # Segmentos nunca mudam depois de gravados: abrir = memory-map, compartilhado por todas as sessões
+    seg = {n: np.load(os.path.join(path, f"{n}.npy"), mmap_mode="r") for n in ("terms", "ptr", "docs", "tf", "dl", "offsets", "file", "page")}
+    seg["text"] = np.memmap(os.path.join(path, "text.bin"), np.uint8, mode="r")
+    with open(os.path.join(path, "meta.json")) as f:
+        seg.update(json.load(f))
+    return seg
+
+class KbJobs:
+    """Fila de indexação em uma thread de fundo; a sessão só enfileira e consulta o progresso."""
+    def __init__(self):
+        from concurrent.futures import ThreadPoolExecutor
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kb-index")
+        self.lock = threading.Lock()
+        self.jobs = []
+
+    def submit(self, index_dir: str, label: str, size: int, overlap: int, sources: list) -> dict:
+        job = {"label": label, "index": index_dir, "done": 0, "total": len(sources), "pages": 0, "chunks": 0,
+               "status": "na fila", "error": None, "t0": time.perf_counter(), "ms": None}
+        with self.lock:
+            # Jobs terminados só servem para mostrar o último erro: guarda os KB_KEEP_JOBS mais recentes
+            finished = [j for j in self.jobs if j["ms"] is not None]
+            drop = {id(j) for j in finished[:max(len(finished) - KB_KEEP_JOBS, 0)]}
+            self.jobs = [j for j in self.jobs if id(j) not in drop] + [job]
+        self.pool.submit(self.run, job, size, overlap, sources)
+        return job
+
+    def commit(self, index_dir: str, docs: list, files: dict):
+        # Segmento gravado fora do lock; só a troca do manifesto é atômica (os.replace)
+        seg = kb_write_segment(index_dir, docs, list(files.values()))
+        with self.lock:
+            m = kb_manifest(index_dir)
+            if seg:
+                m["segments"].append(seg)
+            m["files"].update(files)
+            with open(os.path.join(index_dir, "manifest.json.tmp"), "w") as f:
+                json.dump(m, f)
+            os.replace(os.path.join(index_dir, "manifest.json.tmp"), os.path.join(index_dir, "manifest.json"))
+
+    def run(self, job: dict, size: int, overlap: int, sources: list):
+        try:
+            job["status"] = "indexando"
+            os.makedirs(job["index"], exist_ok=True)
+            known = kb_manifest(job["index"])["files"]
+            docs, files = [], {}
+            for name, digest, load in sources:
+                if digest not in known and digest not in files:
+                    pages = load()
+                    docs += [(len(files), page, text) for page, text in kb_chunks(pages, size, overlap)]
+                    files[digest] = name
+                    job["pages"] += len(pages)
+                job["done"] += 1
+                if len(docs) >= KB_SEGMENT_CHUNKS:
+                    self.commit(job["index"], docs, files)
+                    job["chunks"] += len(docs)
+                    docs, files = [], {}
+            if docs:
+                self.commit(job["index"], docs, files)
+                job["chunks"] += len(docs)
+            job["status"] = "concluído"
+        except Exception as e:  # a thread não tem onde mostrar erro: fica no job para a sessão exibir
+            job["status"], job["error"] = "erro", str(e)
+        job["ms"] = (time.perf_counter() - job["t0"]) * 1000
+
+    def active(self, index_dir: str) -> list:
+        with self.lock:
+            return [j for j in self.jobs if j["index"] == index_dir and j["ms"] is None]
+
+    def errors(self, index_dir: str) -> list:
+        with self.lock:
+            return [j["error"] for j in self.jobs if j["index"] == index_dir and j["error"]]
+
+@st.cache_resource
+def kb_jobs() -> KbJobs:
+    return KbJobs()
+
+def kb_search(index_dir: str, query: str, k: int = 5) -> Tuple[list, dict]:
+    """BM25 sobre todos os segmentos: df e tamanho médio são globais, a pontuação é por segmento e o top-k é unido no fim."""
+    t0 = time.perf_counter()
+    segs = [kb_segment(os.path.join(index_dir, s)) for s in kb_manifest(index_dir)["segments"]]
+    segs = [s for s in segs if len(s["terms"])]   # índices antigos podem ter segmentos vazios
+    q = list(dict.fromkeys(kb_tokens(query)))
+    n_docs = sum(len(s["dl"]) for s in segs)
+    stats = {"segments": len(segs), "chunks": n_docs, "postings": 0, "terms": q}
+    if not segs or not q:
+        return [], {**stats, "ms": (time.perf_counter() - t0) * 1000}
+    avgdl = sum(s["tokens"] for s in segs) / max(n_docs, 1)
+    spans, df = [], np.zeros(len(q))
+    for s in segs:
+        pos = np.searchsorted(s["terms"], q)
+        ok = (pos < len(s["terms"])) & (s["terms"][np.minimum(pos, len(s["terms"]) - 1)] == np.array(q))
+        lo, hi = np.where(ok, s["ptr"][np.minimum(pos, len(s["ptr"]) - 2)], 0), np.where(ok, s["ptr"][np.minimum(pos + 1, len(s["ptr"]) - 1)], 0)
+        spans.append((lo, hi))
+        df += hi - lo
+    idf = np.log(1 + (n_docs - df + .5) / (df + .5))
+    hits = []
+    for si, (s, (lo, hi)) in enumerate(zip(segs, spans)):
+        score = np.zeros(len(s["dl"]))
+        for j in np.flatnonzero(hi > lo):
+            d, tf = s["docs"][lo[j]:hi[j]], s["tf"][lo[j]:hi[j]].astype(np.float64)
+            score[d] += idf[j] * tf * (KB_K1 + 1) / (tf + KB_K1 * (1 - KB_B + KB_B * s["dl"][d] / avgdl))
+            stats["postings"] += int(hi[j] - lo[j])
+        top = np.argpartition(-score, min(k, len(score) - 1))[:k]
+        hits += [(float(score[i]), si, int(i)) for i in top if score[i] > 0]
+    out = []
+    for sc, si, i in sorted(hits, reverse=True)[:k]:
+        s = segs[si]
+        out.append({"score": sc, "file": s["files"][int(s["file"][i])], "page": int(s["page"][i]),
+                    "text": bytes(s["text"][s["offsets"][i]:s["offsets"][i + 1]]).decode("utf-8", errors="replace")})
+    return out, {**stats, "ms": (time.perf_counter() - t0) * 1000}
+
+def kb_progress(key: str, index_dir: str):
+    jobs = kb_jobs().active(index_dir)
+    for j in jobs:
+        st.progress(j["done"] / max(j["total"], 1), text=f"⏳ {j['label']}: {j['status']} — {j['done']}/{j['total']} arquivos · {j['pages']:,} páginas")
+    if st.session_state.get(f"{key}_busy") and not jobs:
+        st.session_state[f"{key}_busy"] = False
+        st.rerun(scope="app")   # terminou: a busca fora do fragmento passa a ver os segmentos novos
+    st.session_state[f"{key}_busy"] = bool(jobs)
+
+def knowledge_lab(key: str):
+    import html
+    lab_header("📚 Laboratório — Chunking & BM25 offline","Envie PDFs ou textos, ajuste o tamanho dos trechos e veja quais deles fundamentariam a resposta")
+    c1,c2 = st.columns([1,1.3],gap="large")
+    with c1:
+        a1,a2 = st.columns(2)
+        size = a1.select_slider("Trecho (palavras)",[100,200,300,500,800],300,key=f"{key}_size")
+        overlap = a2.select_slider("Sobreposição",[0,25,50,100,150],50,key=f"{key}_ovl")
+        index_dir = os.path.join(KB_DIR, f"c{size}_o{overlap}")
+        ups = st.file_uploader("Arquivos",type=["pdf","txt","md"],accept_multiple_files=True,key=f"{key}_up")
+        b1,b2,b3 = st.columns(3)
+        if b1.button("📥 Indexar",disabled=not ups,key=f"{key}_go",use_container_width=True):
+            sources = [(u.name, hashlib.sha1(u.getvalue()).hexdigest(), (lambda n=u.name, raw=u.getvalue(): kb_pages(n, raw))) for u in ups]
+            kb_jobs().submit(index_dir, f"{len(ups)} arquivo(s)", size, overlap, sources)
+            st.session_state[f"{key}_busy"] = True
+        if b2.button("📘 Manual 2.000 pág.",key=f"{key}_sample",use_container_width=True):
+            sources = [(name, f"sample:{name}", (lambda pages=pages: pages)) for name, pages in kb_sample_docs(2_000)]
+            kb_jobs().submit(index_dir, "Manual sintético", size, overlap, sources)
+            st.session_state[f"{key}_busy"] = True
+        if b3.button("🗑️ Apagar",key=f"{key}_rm",use_container_width=True,disabled=bool(kb_jobs().active(index_dir))):
+            shutil.rmtree(index_dir, ignore_errors=True)
+        busy = bool(kb_jobs().active(index_dir)) or st.session_state.get(f"{key}_busy", False)
+        st.fragment(kb_progress, run_every=1.0 if busy else None)(key, index_dir)
+        for err in kb_jobs().errors(index_dir):
+            st.error(f"❌ {err}")
+        m = kb_manifest(index_dir)
+        st.caption(f"📁 {len(m['files'])} arquivo(s) · {len(m['segments'])} segmento(s) em disco — cada combinação de trecho/sobreposição tem seu próprio índice")
+    with c2:
+        query = st.text_input("Pergunta do usuário","qual o limite de reembolso para viagem nacional",key=f"{key}_q")
+        hits, stats = kb_search(index_dir, query)
+        m1,m2,m3 = st.columns(3)
+        m1.metric("Trechos indexados", f"{stats['chunks']:,}")
+        m2.metric("Postings lidos", f"{stats['postings']:,}")
+        m3.metric("Busca", f"{stats['ms']:,.1f} ms")
+        if not stats["chunks"]:
+            info_box("Índice vazio para esta combinação — envie arquivos ou gere o manual sintético.", "info")
+        terms = set(stats["terms"])
+        for rank, h in enumerate(hits, 1):
+            words = [f"<b style='background:#fef3c7'>{html.escape(w)}</b>" if intent_fold(w) in terms else html.escape(w) for w in h["text"].split()]
+            st.markdown(f'<div class="sr"><div style="font-size:11px;color:#6b7280;margin-bottom:4px">#{rank} · {html.escape(h["file"])} · pág. {h["page"]} · BM25 {h["score"]:.2f}</div>'
+                        f'<div style="font-size:12px;color:#374151;line-height:1.6">{" ".join(words[:120])}{" …" if len(words) > 120 else ""}</div></div>', unsafe_allow_html=True)
+    info_box("💡 Trechos pequenos dão citações precisas, mas perdem contexto; trechos grandes diluem o BM25 (o termo pesa menos num texto longo). A sobreposição evita cortar a resposta no meio.", "info")
+
+
 # ══════════════════════════════════════════════
 # COPILOT STUDIO — IA Generativa & Plugins
 # ══════════════════════════════════════════════
@@ -4430,6 +10507,8 @@ def page_copilot_ia():
 // Dica: use PDFs com texto pesquisável
 // (não imagens escaneadas sem OCR)''',
                 color="#5c2d91")
+        sp()
+        knowledge_lab("kb_ia")
 
     with tabs[2]:
         info_box("🔌 <b>Plugin Actions</b> expõem capacidades do seu agente para o <b>Microsoft 365 Copilot</b> — qualquer usuário pode invocar seu agente dentro do Copilot no Teams, Outlook, Word etc.", "info")
@@ -4852,6 +10931,8 @@ POST .../conversations/{id}/activities
 // No Copilot Studio, capture via:
 // Tópico "Saudação" → nó Variável:
 // Global.UserEmail = System.Activity.Value.userEmail''', language="text")
+        sp()
+        mock_directline_lab("mock_dl")
 
     with tabs[4]:
         c1,c2 = st.columns(2)
@@ -4893,11 +10974,1378 @@ POST .../conversations/{id}/activities
 // - Fontes de conhecimento apontando
 //   para o ambiente correto (URLs de prod)
 // - Client ID/Secret do Azure AD corretos''', language="text")
+        sp()
+        solution_diff_lab("sol_cps")
 
     section_quiz("copilot_integracao")
     st.markdown('</div>', unsafe_allow_html=True)
 
 
+# ══════════════════════════════════════════════
+# DATAVERSE — EXECUTOR DE FETCHXML & ODATA
+# ══════════════════════════════════════════════
+DVQ_TABLES = {
+    "cr123_pedido": {
+        "schema": "Pedidos", "rows": 1_000_000, "set": "cr123_pedidos", "pk": "cr123_pedidoid",
+        "cols": {"cr123_pedidoid": "ID", "cr123_cliente": "Cliente", "cr123_funcionarioid": "FuncionarioID",
+                 "_cr123_funcionarioid_value": "FuncionarioID", "cr123_data": "Data", "cr123_status": "Status",
+                 "cr123_itens": "Itens", "cr123_valortotal": "ValorTotal"},
+    },
+    "cr123_funcionario": {
+        "schema": "Funcionarios", "rows": 50_000, "set": "cr123_funcionarios", "pk": "cr123_funcionarioid",
+        "cols": {"cr123_funcionarioid": "ID", "cr123_nome": "Nome", "emailaddress1": "Email", "cr123_cargo": "Cargo",
+                 "cr123_departamento": "Departamento", "cr123_cidade": "Cidade", "cr123_salario": "Salario",
+                 "cr123_admissao": "Admissao", "cr123_ativo": "Ativo"},
+    },
+}
+# 1:N funcionário → pedidos; navegação single-valued no pedido e collection-valued no funcionário
+DVQ_RELS = [{"one": "cr123_funcionario", "many": "cr123_pedido", "fk": "_cr123_funcionarioid_value",
+             "nav_one": "cr123_funcionarioid", "nav_many": "cr123_funcionario_pedidos"}]
+DVQ_INDEXED = {(r["many"], DVQ_TABLES[r["many"]]["cols"][r["fk"]]) for r in DVQ_RELS} | \
+              {(e, m["cols"][m["pk"]]) for e, m in DVQ_TABLES.items()}
+DVQ_MAX_ROWS = 5000          # tamanho de página padrão do Dataverse
+DVQ_FETCH_OPS = {"eq": "eq", "ne": "ne", "neq": "ne", "gt": "gt", "ge": "ge", "lt": "lt", "le": "le",
+                 "like": "like", "not-like": "not-like", "begins-with": "begins-with", "not-begin-with": "not-begins-with",
+                 "ends-with": "ends-with", "not-end-with": "not-ends-with", "in": "in", "not-in": "not-in",
+                 "null": "null", "not-null": "not-null", "between": "between",
+                 "on": "eq", "on-or-after": "ge", "on-or-before": "le"}
+
+def dvq_meta(entity: str) -> dict:
+    if entity not in DVQ_TABLES:
+        sets = {m["set"]: e for e, m in DVQ_TABLES.items()}
+        if entity in sets:
+            return DVQ_TABLES[sets[entity]]
+        raise ValueError(f"Tabela '{entity}' não existe. Disponíveis: {', '.join(DVQ_TABLES)}")
+    return DVQ_TABLES[entity]
+
+def dvq_entity(name: str) -> str:
+    return next((e for e, m in DVQ_TABLES.items() if name in (e, m["set"])), name)
+
+def dvq_phys(entity: str, attr: str) -> str:
+    cols = dvq_meta(entity)["cols"]
+    if attr not in cols:
+        raise ValueError(f"Coluna '{attr}' não existe em {entity}. Disponíveis: {', '.join(c for c in cols if not c.startswith('_'))}")
+    return cols[attr]
+
+def dvq_table(entity: str) -> dict:
+    m = dvq_meta(entity)
+    return synth_table(m["schema"], m["rows"])
+
+class DvIndex:
+    """
+    Índice hash sobre uma coluna inteira (chave primária ou lookup): endereçamento
+    direto chave → faixa em `order`, no formato CSR. Consulta = duas leituras por chave.
+    """
+    def __init__(self, keys: np.ndarray):
+        keys = np.asarray(keys).astype(np.int64)
+        self.lo = int(keys.min()) if len(keys) else 0
+        span = (int(keys.max()) - self.lo + 1) if len(keys) else 1
+        counts = np.bincount(keys - self.lo, minlength=span)
+        self.offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.order = np.argsort(keys, kind="stable").astype(np.int64)
+        self.span, self.unique = span, bool(counts.max(initial=0) <= 1)
+        self.slot_of = keys - self.lo
+
+    def slots(self, values) -> np.ndarray:
+        s = np.asarray(values).astype(np.int64) - self.lo
+        return np.where((s >= 0) & (s < self.span), s, -1)
+
+    def counts(self, values) -> np.ndarray:
+        s = self.slots(values)
+        c = self.offsets[np.maximum(s, 0) + 1] - self.offsets[np.maximum(s, 0)]
+        return np.where(s >= 0, c, 0)
+
+    def rows(self, values) -> np.ndarray:
+        s = self.slots(values)
+        s = s[s >= 0]
+        starts, ends = self.offsets[s], self.offsets[s + 1]
+        n = ends - starts
+        if not n.sum():
+            return np.zeros(0, np.int64)
+        # Expande as faixas [start, end) sem laço Python
+        pos = np.repeat(starts - np.concatenate(([0], np.cumsum(n)[:-1])), n) + np.arange(n.sum())
+        return self.order[pos]
+
+    def first(self, values) -> np.ndarray:
+        # Primeira linha de cada chave (N:1) ou -1 quando não existe
+        s = self.slots(values)
+        ok = (s >= 0) & (self.counts(values) > 0)
+        return np.where(ok, self.order[np.minimum(self.offsets[np.maximum(s, 0)], len(self.order) - 1)], -1)
+
+    def semijoin(self, rows: np.ndarray) -> np.ndarray:
+        # Chaves presentes nas linhas dadas, como tabela booleana indexada por slot
+        hit = np.zeros(self.span, bool)
+        hit[self.slot_of[rows]] = True
+        return hit
+
+@st.cache_resource(max_entries=8, show_spinner="Construindo índice…")
+def dvq_index(entity: str, column: str) -> DvIndex:
+    return DvIndex(dvq_table(entity)[column])
+
+# ── Parsers → representação comum ──
+# query = {entity, select, filter, order[(attr, desc)], top, links[...], count}
+# filtro = {"and"|"or": [...]} | {"not": f} | {"attr", "op", "value"} | {"link": rel, "cond": f}
+def dvq_parse_fetch(text: str) -> dict:
+    import xml.etree.ElementTree as ET
+    try:
+        root = ET.fromstring(text.strip())
+    except ET.ParseError as e:
+        raise ValueError(f"FetchXML inválido: {e}")
+    if root.tag != "fetch":
+        raise ValueError("O elemento raiz deve ser <fetch>.")
+    if root.get("aggregate", "false").lower() == "true":
+        raise ValueError("aggregate=\"true\" não é suportado neste laboratório — use o OData $count ou remova o agregado.")
+    ent = root.find("entity")
+    if ent is None:
+        raise ValueError("<fetch> precisa de um elemento <entity>.")
+    q = dvq_fetch_entity(ent, dvq_entity(ent.get("name", "")))
+    top = root.get("top") or root.get("count")
+    q["top"] = dvq_top(top, "top") if top else DVQ_MAX_ROWS
+    return q
+
+def dvq_top(raw, what: str) -> int:
+    try:
+        top = int(str(raw).strip())
+    except ValueError:
+        raise ValueError(f"{what} inválido: {raw!r} (use um inteiro ≥ 0).")
+    if top < 0:
+        raise ValueError(f"{what} não pode ser negativo (recebido {top}).")
+    return min(top, DVQ_MAX_ROWS)
+
+def dvq_fetch_entity(el, entity: str) -> dict:
+    dvq_meta(entity)
+    q = {"entity": entity, "select": None if el.find("all-attributes") is not None else
+         [a.get("name") for a in el.findall("attribute")], "filter": None, "order": [], "links": []}
+    for o in el.findall("order"):
+        q["order"].append((o.get("attribute"), o.get("descending", "false").lower() == "true"))
+    filters = [dvq_fetch_filter(f) for f in el.findall("filter")]
+    q["filter"] = filters[0] if len(filters) == 1 else ({"and": filters} if filters else None)
+    for le in el.findall("link-entity"):
+        if le.find("link-entity") is not None:
+            raise ValueError("link-entity aninhado não é suportado neste laboratório.")
+        sub = dvq_fetch_entity(le, dvq_entity(le.get("name", "")))
+        # O join usa o índice hash de inteiros: só chaves primárias e lookups
+        for side, ent_, attr in (("from", sub["entity"], le.get("from")), ("to", entity, le.get("to"))):
+            if (ent_, dvq_phys(ent_, attr or "")) not in DVQ_INDEXED:
+                raise ValueError(f"link-entity: {side}=\"{attr}\" não é chave primária nem lookup de {ent_} — "
+                                 "o vínculo só é suportado entre colunas de chave.")
+        sub.update({"from": le.get("from"), "to": le.get("to"), "alias": le.get("alias") or sub["entity"],
+                    "type": le.get("link-type", "inner"), "expand": "rows"})
+        q["links"].append(sub)
+    return q
+
+def dvq_fetch_filter(f) -> dict:
+    items = []
+    for c in f:
+        if c.tag == "filter":
+            items.append(dvq_fetch_filter(c))
+        elif c.tag == "condition":
+            op = c.get("operator", "eq")
+            if op not in DVQ_FETCH_OPS:
+                raise ValueError(f"Operador '{op}' não suportado. Suportados: {', '.join(DVQ_FETCH_OPS)}")
+            vals = [v.text for v in c.findall("value")]
+            items.append({"attr": c.get("attribute"), "op": DVQ_FETCH_OPS[op], "alias": c.get("entityname"),
+                          "value": vals if vals else c.get("value")})
+    return {f.get("type", "and"): items}
+
+ODATA_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<str>'(?:[^']|'')*')
+  | (?P<date>\d{4}-\d{2}-\d{2}(?:T[\d:.]+Z?)?)
+  | (?P<num>-?\d+(?:\.\d+)?)
+  | (?P<id>[A-Za-z_@][\w.@]*(?:/[A-Za-z_][\w]*)*)
+  | (?P<op>[(),:])
+""", re.X)
+
+def odata_split(text: str, sep: str) -> list:
+    # Divide em `sep` no nível zero de parênteses e fora de strings
+    out, depth, quote, cur = [], 0, False, ""
+    for ch in text:
+        if ch == "'":
+            quote = not quote
+        elif not quote and ch == "(":
+            depth += 1
+        elif not quote and ch == ")":
+            depth -= 1
+        if ch == sep and not depth and not quote:
+            out.append(cur)
+            cur = ""
+        else:
+            cur += ch
+    return out + [cur] if cur.strip() else out
+
+def dvq_parse_odata(url: str) -> dict:
+    from urllib.parse import unquote
+    url = unquote(url.strip())
+    path, _, qs = url.partition("?")
+    entity = dvq_entity(path.rstrip("/").split("/")[-1])
+    return dvq_odata_options(entity, odata_split(qs, "&"))
+
+def dvq_odata_options(entity: str, parts: list) -> dict:
+    dvq_meta(entity)
+    q = {"entity": entity, "select": None, "filter": None, "order": [], "links": [], "top": DVQ_MAX_ROWS, "count": False}
+    for part in parts:
+        key, _, val = part.strip().partition("=")
+        key = key.strip().lower()
+        if key == "$select":
+            q["select"] = [c.strip() for c in val.split(",") if c.strip()]
+        elif key == "$filter":
+            q["filter"] = ODataFilter(val, entity).parse()
+        elif key == "$orderby":
+            for o in val.split(","):
+                a, _, d = o.strip().partition(" ")
+                q["order"].append((a, d.strip().lower() == "desc"))
+        elif key == "$top":
+            q["top"] = dvq_top(val, "$top")
+        elif key == "$count":
+            q["count"] = val.strip().lower() == "true"
+        elif key == "$expand":
+            for ex in odata_split(val, ","):
+                m = re.fullmatch(r"\s*(\w+)\s*(?:\((.*)\))?\s*", ex, re.S)
+                if not m:
+                    raise ValueError(f"$expand inválido: {ex}")
+                rel, one = dvq_nav(entity, m.group(1))
+                sub = dvq_odata_options(rel["many"] if one else rel["one"], odata_split(m.group(2) or "", ";"))
+                sub.update(dvq_link_keys(rel, one))
+                if sub["order"]:
+                    raise ValueError("$orderby dentro de $expand não é suportado neste laboratório.")
+                sub.update({"alias": m.group(1), "type": "outer", "expand": "list" if one else "nested"})
+                q["links"].append(sub)
+        elif key:
+            raise ValueError(f"Opção de consulta não suportada: {key}")
+    return q
+
+def dvq_nav(entity: str, nav: str):
+    # Retorna (relacionamento, True se a navegação vai do lado 1 para o lado N)
+    for r in DVQ_RELS:
+        if r["one"] == entity and nav == r["nav_many"]:
+            return r, True
+        if r["many"] == entity and nav == r["nav_one"]:
+            return r, False
+    navs = [r["nav_many"] for r in DVQ_RELS if r["one"] == entity] + [r["nav_one"] for r in DVQ_RELS if r["many"] == entity]
+    raise ValueError(f"Propriedade de navegação '{nav}' não existe em {entity}. Disponíveis: {', '.join(navs) or '—'}")
+
+def dvq_link_keys(rel: dict, one_to_many: bool) -> dict:
+    pk_one = DVQ_TABLES[rel["one"]]["pk"]
+    return {"from": rel["fk"], "to": pk_one} if one_to_many else {"from": pk_one, "to": rel["fk"]}
+
+class ODataFilter:
+    """Parser recursivo de $filter: eq/ne/gt/ge/lt/le, and/or/not, funções de texto, in, any/all e navegação N:1."""
+    OPS = {"eq", "ne", "gt", "ge", "lt", "le"}
+    FUNCS = {"contains": "like", "startswith": "begins-with", "endswith": "ends-with"}
+
+
+    def __init__(self, src: str, entity: str):
+        self.entity, self.toks, pos = entity, [], 0
+        while pos < len(src):
+            m = ODATA_TOKEN_RE.match(src, pos)
+            if not m:
+                raise ValueError(f"$filter: caractere inesperado na posição {pos}: {src[pos]!r}")
+            if m.lastgroup != "ws":
+                self.toks.append((m.lastgroup, m.group()))
+            pos = m.end()
+        self.toks.append(("eof", ""))
+        self.i, self.lam = 0, {}
+
+    def peek(self):
+        return self.toks[self.i]
+
+    def take(self, val=None):
+        tok = self.toks[self.i]
+        if val is not None and tok[1] != val:
+            raise ValueError(f"$filter: esperado '{val}', encontrado '{tok[1] or 'fim'}'")
+        self.i += 1
+        return tok
+
+    def parse(self):
+        f = self.or_()
+        if self.peek()[0] != "eof":
+            raise ValueError(f"$filter: token inesperado '{self.peek()[1]}'")
+        return f
+
+    def or_(self):
+        items = [self.and_()]
+        while self.peek()[1] == "or":
+            self.take()
+            items.append(self.and_())
+        return items[0] if len(items) == 1 else {"or": items}
+
+    def and_(self):
+        items = [self.not_()]
+        while self.peek()[1] == "and":
+            self.take()
+            items.append(self.not_())
+        return items[0] if len(items) == 1 else {"and": items}
+
+    def not_(self):
+        if self.peek()[1] == "not":
+            self.take()
+            return {"not": self.not_()}
+        return self.primary()
+
+    def literal(self):
+        kind, val = self.take()
+        if kind == "str":  return val[1:-1].replace("''", "'")
+        if kind in ("num", "date"): return val
+        if kind == "id" and val in ("true", "false"): return val
+        if kind == "id" and val == "null": return None
+        raise ValueError(f"$filter: esperado um valor literal, encontrado '{val}'")
+
+    def attr(self, path: str):
+        # "lambda/coluna" → coluna da tabela do any(); "nav/coluna" → semi-join N:1
+        head, _, rest = path.partition("/")
+        if head in self.lam:
+            return self.lam[head], rest
+        if rest:
+            rel, one = dvq_nav(self.entity, head)
+            if one:
+                raise ValueError(f"'{head}' é uma coleção — use {head}/any(x: x/coluna ...)")
+            return ("nav", rel), rest
+        return None, path
+
+    def wrap(self, target, cond):
+        return cond if target is None or target == "self" else {"link": target[1], "from_one": target[0] == "any", "cond": cond}
+
+    def primary(self):
+        kind, val = self.peek()
+        if val == "(":
+            self.take()
+            f = self.or_()
+            self.take(")")
+            return f
+        if kind != "id":
+            raise ValueError(f"$filter: esperado nome de coluna, encontrado '{val or 'fim'}'")
+        self.take()
+        if val in self.FUNCS:
+            self.take("(")
+            target, a = self.attr(self.take()[1])
+            self.take(",")
+            v = self.literal()
+            self.take(")")
+            if val == "contains":
+                v = f"%{v}%"
+            return self.wrap(target, {"attr": a, "op": self.FUNCS[val], "value": v})
+        if val.endswith("/any") or val.endswith("/all"):
+            nav, fn = val.rsplit("/", 1)
+            rel, one = dvq_nav(self.entity, nav)
+            if not one:
+                raise ValueError(f"{fn}() só se aplica a navegações de coleção (1:N).")
+            if fn == "all":
+                raise ValueError("all() não é suportado neste laboratório — use not any(... not ...).")
+            self.take("(")
+            var = self.take()[1]
+            self.take(":")
+            self.lam[var] = "self"
+            inner_entity, self.entity = self.entity, rel["many"]
+            cond = self.or_()
+            self.entity = inner_entity
+            del self.lam[var]
+            self.take(")")
+            return {"link": rel, "from_one": True, "cond": cond}
+        target, a = self.attr(val)
+        op = self.take()[1]
+        if op == "in":
+            self.take("(")
+            vals = [self.literal()]
+            while self.peek()[1] == ",":
+                self.take()
+                vals.append(self.literal())
+            self.take(")")
+            return self.wrap(target, {"attr": a, "op": "in", "value": vals})
+        if op not in self.OPS:
+            raise ValueError(f"$filter: operador '{op}' não suportado. Use eq, ne, gt, ge, lt, le ou in.")
+        v = self.literal()
+        if v is None:
+            op = "null" if op == "eq" else "not-null"
+        return self.wrap(target, {"attr": a, "op": op, "value": v})
+
+# ── Execução vetorizada ──
+def dvq_scalar(col, v):
+    if is_dict_col(col):
+        return str(v)
+    kind = np.asarray(col).dtype.kind
+    if kind == "M":
+        try:
+            return np.datetime64(str(v)[:19].rstrip("Z"))
+        except ValueError:
+            raise ValueError(f"'{v}' não é uma data válida.")
+    if kind == "b":
+        return str(v).lower() in ("true", "1")
+    if kind in "iuf":
+        try:
+            return float(v)
+        except (TypeError, ValueError):
+            raise ValueError(f"'{v}' não é um número válido.")
+    return str(v)
+
+def dvq_like(pattern: str, mode: str):
+    pat = {"like": pattern, "begins-with": pattern + "%", "ends-with": "%" + pattern}.get(mode, pattern)
+    rx = re.compile("".join(".*" if ch == "%" else "." if ch == "_" else re.escape(ch) for ch in pat) + r"\Z", re.I | re.S)
+    return lambda cats: np.array([bool(rx.match(str(c))) for c in cats], bool)
+
+def dvq_condition(table: dict, entity: str, c: dict, sel) -> np.ndarray:
+    col = table[dvq_phys(entity, c["attr"])][sel]
+    op, v, n = c["op"], c["value"], len(col)
+    if op in ("null", "not-null"):
+        return np.full(n, op == "not-null")         # colunas sintéticas não têm nulos
+    if op in ("in", "not-in", "between"):
+        vals = v if isinstance(v, list) else [x.strip() for x in str(v).split(",")]
+        if op == "between":
+            if len(vals) != 2:
+                raise ValueError(f"between em '{c['attr']}' exige exatamente dois valores (recebeu {len(vals)}).")
+            lo, hi = dvq_scalar(col, vals[0]), dvq_scalar(col, vals[1])
+            return (col >= lo) & (col <= hi)
+        conv = [dvq_scalar(col, x) for x in vals]
+        m = vec_str(col, lambda a: np.isin(a, conv)) if is_dict_col(col) else np.isin(col, conv)
+        return m if op == "in" else ~m
+    if op.endswith("like") or "begins" in op or "ends" in op:
+        if not is_dict_col(col):
+            raise ValueError(f"O operador '{op}' só se aplica a colunas de texto.")
+        m = col.map(dvq_like(str(v), op.replace("not-", "")))
+        return ~m if op.startswith("not-") else m
+    x = dvq_scalar(col, v)
+    if is_dict_col(col):
+        if op in ("eq", "ne"):
+            # Igualdade em texto: compara códigos — a coluna nunca é decodificada
+            hit = np.array([str(c).lower() == x.lower() for c in col.cats], bool)
+            m = hit[col.codes]
+            return m if op == "eq" else ~m
+        col = col.decode()
+    return {"eq": np.equal, "ne": np.not_equal, "gt": np.greater, "ge": np.greater_equal,
+            "lt": np.less, "le": np.less_equal}[op](col, x)
+
+def dvq_seek(entity: str, f) -> Optional[Tuple[str, list]]:
+    # Igualdade/in em coluna indexada dentro de um AND de topo → busca no índice
+    conds = f["and"] if f and "and" in f else [f] if f and "attr" in f else []
+    best = None
+    for c in conds:
+        if "attr" in c and not c.get("alias") and c["op"] in ("eq", "in"):
+            phys = dvq_meta(entity)["cols"].get(c["attr"])
+            if (entity, phys) in DVQ_INDEXED:
+                vals = c["value"] if isinstance(c["value"], list) else [c["value"]]
+                try:
+                    nums = [float(x) for x in vals]
+                except (TypeError, ValueError):
+                    continue
+                if not all(x.is_integer() for x in nums):
+                    continue    # 10.5 não é uma chave: a varredura devolve vazio, o índice truncaria para 10
+                vals = [int(x) for x in nums]
+                if best is None or len(vals) < len(best[2]):
+                    best = (c, phys, vals)
+    return best
+
+class DvqExecutor:
+    def __init__(self, q: dict):
+        self.q, self.plan = q, []
+
+    def step(self, op, obj, detail, rows, t0):
+        self.plan.append({"Etapa": op, "Objeto": obj, "Detalhe": detail, "Linhas": int(rows),
+                          "ms": round((time.perf_counter() - t0) * 1000, 2)})
+
+    def mask(self, table, entity, f, sel, n) -> np.ndarray:
+        if f is None:
+            return np.ones(n, bool)
+        if "and" in f or "or" in f:
+            items = f.get("and", f.get("or"))
+            m = np.ones(n, bool) if "and" in f else np.zeros(n, bool)
+            for c in items:
+                m = (m & self.mask(table, entity, c, sel, n)) if "and" in f else (m | self.mask(table, entity, c, sel, n))
+            return m
+        if "not" in f:
+            return ~self.mask(table, entity, f["not"], sel, n)
+        if "link" in f:
+            return self.semijoin(table, entity, f, sel)
+        if f.get("alias"):
+            raise ValueError("Condições com entityname devem ficar dentro do <link-entity> correspondente neste laboratório.")
+        return dvq_condition(table, entity, f, sel)
+
+    def semijoin(self, table, entity, f, sel) -> np.ndarray:
+        # EXISTS via índice hash: filtra o outro lado, marca as chaves encontradas e testa cada linha daqui
+        t0 = time.perf_counter()
+        rel = f["link"]
+        other = rel["many"] if f["from_one"] else rel["one"]
+        keys = dvq_link_keys(rel, f["from_one"])
+        ot = dvq_table(other)
+        om = self.mask(ot, other, f["cond"], slice(None), len(ot[dvq_phys(other, keys["from"])]))
+        idx = dvq_index(other, dvq_phys(other, keys["from"]))
+        hit = idx.semijoin(np.flatnonzero(om))
+        slots = idx.slots(np.asarray(table[dvq_phys(entity, keys["to"])][sel]))
+        m = np.where(slots >= 0, hit[np.maximum(slots, 0)], False)
+        self.step("HashSemiJoin", f"{other}", f"{int(om.sum()):,} linhas de {other} satisfazem o filtro", m.sum(), t0)
+        return m
+
+    def run(self):
+        q, ent = self.q, self.q["entity"]
+        t0 = time.perf_counter()
+        table = dvq_table(ent)
+        n = len(next(iter(table.values())))
+        self.step("Carregar", ent, f"tabela sintética ({n:,} linhas, cache)", n, t0)
+        t0 = time.perf_counter()
+        seek = dvq_seek(ent, q["filter"])
+        if seek:
+            cond, phys, vals = seek
+            sel = dvq_index(ent, phys).rows(vals)
+            rest = {"and": [c for c in q["filter"]["and"] if c is not cond]} if "and" in q["filter"] else None
+            self.step("IndexSeek", f"{ent}.{cond['attr']}", f"índice hash — {len(vals)} chave(s)", len(sel), t0)
+        else:
+            sel, rest = slice(None), q["filter"]
+            self.step("TableScan", ent, "varredura vetorizada de todas as linhas", n, t0)
+        rows = np.arange(n, dtype=np.int64)[sel] if isinstance(sel, slice) else np.sort(sel)
+        if rest and rest.get("and") != []:
+            t0 = time.perf_counter()
+            m = self.mask(table, ent, rest, rows, len(rows))
+            rows = rows[m]
+            self.step("Filter", ent, dvq_describe(rest), len(rows), t0)
+        # link-entity inner → semi-join com o filtro do vínculo
+        for ln in q["links"]:
+            if ln["type"] == "inner":
+                t0 = time.perf_counter()
+                lt = dvq_table(ln["entity"])
+                lkey = dvq_phys(ln["entity"], ln["from"])
+                lmask = self.mask(lt, ln["entity"], ln["filter"], slice(None), len(lt[lkey]))
+                idx = dvq_index(ln["entity"], lkey)
+                hit = idx.semijoin(np.flatnonzero(lmask))
+                slots = idx.slots(np.asarray(table[dvq_phys(ent, ln["to"])][rows]))
+                rows = rows[np.where(slots >= 0, hit[np.maximum(slots, 0)], False)]
+                self.step("HashJoin (inner)", f"{ln['entity']} as {ln['alias']}", f"{ln['to']} = {ln['alias']}.{ln['from']}", len(rows), t0)
+        total = len(rows)
+        if q["order"]:
+            t0 = time.perf_counter()
+            keys = []
+            for a, desc in q["order"]:
+                col = table[dvq_phys(ent, a)][rows]
+                k = col.map(lambda c: np.argsort(np.argsort(c, kind="stable"), kind="stable")) if is_dict_col(col) else np.asarray(col)
+                k = k.astype("int64") if k.dtype.kind == "M" else k
+                keys.append(-k.astype(np.float64) if desc else k)
+            top = q["top"]
+            if len(keys) == 1 and top < len(rows) // 4:
+                part = np.argpartition(keys[0], top - 1)[:top] if top else np.zeros(0, np.int64)
+                rows = rows[part[np.argsort(keys[0][part], kind="stable")]]
+                how = f"top-{top} por argpartition"
+            else:
+                rows = rows[np.lexsort(keys[::-1])]
+                how = "ordenação completa (lexsort)"
+            self.step("Sort", ", ".join(f"{a} {'desc' if d else 'asc'}" for a, d in q["order"]), how, len(rows), t0)
+        rows = rows[:q["top"]]
+        t0 = time.perf_counter()
+        df = self.project(table, ent, q, rows)
+        self.step("Projetar", ent, f"$top/top = {q['top']:,}", len(df), t0)
+        return df, total
+
+    def columns(self, table, entity, select, rows, prefix=""):
+        cols = select or [c for c in dvq_meta(entity)["cols"] if not c.startswith("_")]
+        return {prefix + c: col_decode(table[dvq_phys(entity, c)][rows]) for c in cols}
+
+    def project(self, table, ent, q, rows):
+        import pandas as pd
+        data = self.columns(table, ent, q["select"], rows)
+        for ln in q["links"]:
+            t0 = time.perf_counter()
+            lt = dvq_table(ln["entity"])
+            idx = dvq_index(ln["entity"], dvq_phys(ln["entity"], ln["from"]))
+            keys = np.asarray(table[dvq_phys(ent, ln["to"])][rows])
+            if idx.unique:
+                # N:1 — uma busca no índice por linha de saída
+                hit = idx.first(keys)
+                ok = hit >= 0
+                if ln["filter"] is not None and ok.any():
+                    ok &= self.mask(lt, ln["entity"], ln["filter"], np.maximum(hit, 0), len(hit))
+                sep = "." if ln["expand"] == "rows" else "/"
+                for c, v in self.columns(lt, ln["entity"], ln["select"], np.maximum(hit, 0)).items():
+                    data[f"{ln['alias']}{sep}{c}"] = np.where(ok, v.astype(object), None)
+                self.step("IndexLookup (N:1)", f"{ln['entity']} as {ln['alias']}", f"{ok.sum():,} de {len(rows):,} encontrados", len(rows), t0)
+                continue
+            child = idx.rows(keys)
+            owner = np.repeat(np.arange(len(rows)), idx.counts(keys))
+            if ln["filter"] is not None:
+                keep = self.mask(lt, ln["entity"], ln["filter"], child, len(child))
+                child, owner = child[keep], owner[keep]
+            if ln["expand"] == "list":
+                # 1:N em OData → coleção aninhada por registro, com o $top do expand
+                first = np.searchsorted(owner, owner)
+                keep = np.arange(len(child)) - first < ln["top"]
+                child, owner = child[keep], owner[keep]
+                recs = pd.DataFrame(self.columns(lt, ln["entity"], ln["select"], child)).to_dict("records")
+                bounds = np.searchsorted(owner, np.arange(len(rows) + 1))
+                data[ln["alias"]] = [recs[bounds[i]:bounds[i + 1]] for i in range(len(rows))]
+                self.step("IndexLookup (1:N)", f"{ln['entity']} as {ln['alias']}", f"{len(child):,} filhos aninhados", len(rows), t0)
+                continue
+            # 1:N em FetchXML → uma linha por filho; no outer, pai sem filhos sai com nulos
+            counts = np.bincount(owner, minlength=len(rows))
+            reps = np.maximum(counts, 1) if ln["type"] == "outer" else counts
+            has = np.repeat(counts > 0, reps)
+            data = {c: np.repeat(np.asarray(v), reps) for c, v in data.items()}
+            for c, v in self.columns(lt, ln["entity"], ln["select"], child).items():
+                out = np.full(len(has), None, object)
+                out[has] = v
+                data[f"{ln['alias']}.{c}"] = out
+            self.step("IndexNestedLoop (1:N)", f"{ln['entity']} as {ln['alias']}", f"{len(child):,} linhas filhas", len(has), t0)
+        return pd.DataFrame(data).head(q["top"])
+
+def dvq_describe(f) -> str:
+    if f is None: return ""
+    if "and" in f: return " and ".join(dvq_describe(c) for c in f["and"])
+    if "or" in f:  return "(" + " or ".join(dvq_describe(c) for c in f["or"]) + ")"
+    if "not" in f: return f"not {dvq_describe(f['not'])}"
+    if "link" in f: return f"EXISTS({dvq_describe(f['cond'])})"
+    return f"{f['attr']} {f['op']} {f['value']!r}"
+
+def dvq_execute(text: str, lang: str):
+    q = dvq_parse_fetch(text) if lang == "FetchXML" else dvq_parse_odata(text)
+    ex = DvqExecutor(q)
+    t0 = time.perf_counter()
+    df, total = ex.run()
+    return df, total, ex.plan, (time.perf_counter() - t0) * 1000
+
+DVQ_SAMPLES = {
+    "FetchXML": {
+        "Pedidos aprovados acima de R$ 2.000 de vendedores de TI (join N:1)": '''<fetch top="50">
+  <entity name="cr123_pedido">
+    <attribute name="cr123_pedidoid" />
+    <attribute name="cr123_cliente" />
+    <attribute name="cr123_status" />
+    <attribute name="cr123_valortotal" />
+    <filter type="and">
+      <condition attribute="cr123_status" operator="eq" value="Aprovado" />
+      <condition attribute="cr123_valortotal" operator="gt" value="2000" />
+    </filter>
+    <link-entity name="cr123_funcionario" from="cr123_funcionarioid" to="cr123_funcionarioid" link-type="inner" alias="vendedor">
+      <attribute name="cr123_nome" />
+      <attribute name="cr123_departamento" />
+      <filter>
+        <condition attribute="cr123_departamento" operator="eq" value="TI" />
+      </filter>
+    </link-entity>
+    <order attribute="cr123_valortotal" descending="true" />
+  </entity>
+</fetch>''',
+        "Pedidos de um funcionário (busca no índice do lookup)": '''<fetch top="100">
+  <entity name="cr123_pedido">
+    <attribute name="cr123_pedidoid" />
+    <attribute name="cr123_data" />
+    <attribute name="cr123_valortotal" />
+    <filter>
+      <condition attribute="cr123_funcionarioid" operator="eq" value="1234" />
+    </filter>
+    <order attribute="cr123_data" descending="true" />
+  </entity>
+</fetch>''',
+        "Gerentes de Curitiba e seus pedidos (join 1:N)": '''<fetch top="200">
+  <entity name="cr123_funcionario">
+    <attribute name="cr123_nome" />
+    <attribute name="cr123_cargo" />
+    <filter>
+      <condition attribute="cr123_cargo" operator="eq" value="Gerente" />
+      <condition attribute="cr123_cidade" operator="eq" value="Curitiba" />
+    </filter>
+    <link-entity name="cr123_pedido" from="cr123_funcionarioid" to="cr123_funcionarioid" link-type="outer" alias="pedido">
+      <attribute name="cr123_pedidoid" />
+      <attribute name="cr123_valortotal" />
+    </link-entity>
+  </entity>
+</fetch>''',
+    },
+    "OData": {
+        "Filtro + $expand N:1 + $orderby": "cr123_pedidos?$select=cr123_pedidoid,cr123_cliente,cr123_valortotal"
+            "&$filter=cr123_status eq 'Entregue' and cr123_valortotal ge 1500 and startswith(cr123_cliente,'Ana')"
+            "&$expand=cr123_funcionarioid($select=cr123_nome,emailaddress1)&$orderby=cr123_valortotal desc&$top=20&$count=true",
+        "Navegação N:1 no $filter": "cr123_pedidos?$select=cr123_pedidoid,cr123_status,cr123_valortotal"
+            "&$filter=cr123_funcionarioid/cr123_departamento eq 'Jurídico' and cr123_data ge 2026-01-01&$top=50",
+        "any() sobre 1:N + $expand da coleção": "cr123_funcionarios?$select=cr123_nome,cr123_cargo"
+            "&$filter=cr123_ativo eq true and cr123_funcionario_pedidos/any(p: p/cr123_valortotal gt 9000)"
+            "&$expand=cr123_funcionario_pedidos($select=cr123_pedidoid,cr123_valortotal;$top=3)&$top=25",
+        "Busca por chave primária": "cr123_pedidos?$filter=cr123_pedidoid in (10, 500000, 999999)",
+    },
+}
+
+def dataverse_query_lab(key: str, lang: str = "FetchXML"):
+    lab_header("🔍 Executor de FetchXML & OData","Consultas reais sobre tabelas sintéticas de 1M de pedidos e 50 mil funcionários — com plano de execução")
+    c1,c2 = st.columns([1.1,1],gap="large")
+    with c1:
+        lang = st.radio("Linguagem",["FetchXML","OData"],index=["FetchXML","OData"].index(lang),horizontal=True,key=f"{key}_lang")
+        sample = st.selectbox("Exemplos",list(DVQ_SAMPLES[lang]),key=f"{key}_ex_{lang}")
+        text = st.text_area("Consulta",DVQ_SAMPLES[lang][sample],height=300 if lang == "FetchXML" else 140,
+                            key=f"{key}_q_{lang}_{list(DVQ_SAMPLES[lang]).index(sample)}",label_visibility="collapsed")
+        with st.expander("📚 Tabelas e relacionamentos"):
+            for e, m in DVQ_TABLES.items():
+                st.markdown(f"**{e}** (`{m['set']}`, {m['rows']:,} linhas) — chave `{m['pk']}`")
+                st.caption(", ".join(c for c in m["cols"] if not c.startswith("_")))
+            for r in DVQ_RELS:
+                st.caption(f"1:N {r['one']} → {r['many']} via `{r['fk']}` · navegação `{r['nav_one']}` (N:1) / `{r['nav_many']}` (1:N)")
+    with c2:
+        try:
+            with st.spinner("Executando…"):
+                df, total, plan, ms = dvq_execute(text, lang)
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            return
+        m1,m2,m3 = st.columns(3)
+        m1.metric("Linhas retornadas", f"{len(df):,}")
+        m2.metric("Correspondências", f"{total:,}")
+        m3.metric("Tempo total", f"{ms:,.0f} ms")
+        import pandas as pd
+        col_label("🧭 Plano de execução")
+        st.dataframe(pd.DataFrame(plan), use_container_width=True, hide_index=True)
+        if any(p["Etapa"] == "TableScan" for p in plan):
+            info_box("💡 Sem condição de igualdade em chave primária ou lookup, o Dataverse varre a tabela — filtre por colunas indexadas sempre que possível.", "warning")
+    st.dataframe(df.head(500), use_container_width=True, hide_index=True, height=320)
+
+
+# ══════════════════════════════════════════════
+# DATAVERSE — COLUNAS CALCULADAS & ROLLUP (VETORIZADO)
+# ══════════════════════════════════════════════
+CALC_TODAY = SYN_END + np.timedelta64(30, "D")   # "hoje" fixo: resultados iguais em qualquer dia
+
+def calc_str(x, n):
+    # Texto como DictCol (quando possível) ou escalar
+    if is_dict_col(x) or isinstance(x, str):
+        return x
+    a = np.asarray(x)
+    if a.ndim == 0:
+        return str(a.item() if a.dtype.kind != "f" or not float(a).is_integer() else int(a))
+    if a.dtype.kind == "M":
+        a = a.astype("datetime64[D]")
+    cats, codes = np.unique(a, return_inverse=True)
+    return DictCol(codes.astype(np.int32), cats.astype(str))
+
+def calc_kind(x) -> str:
+    if is_dict_col(x) or isinstance(x, str):
+        return "texto"
+    k = np.asarray(x).dtype.kind
+    return "data" if k == "M" else "lógico" if k == "b" else "número" if k in "iuf" else "texto"
+
+def calc_num(x, op: str):
+    # Aritmética só com números — texto e data viram erro legível, não erro do NumPy
+    if calc_kind(x) != "número":
+        raise ValueError(f"\"{op}\" espera número, mas recebeu {calc_kind(x)}.")
+    return np.asarray(x, np.float64)
+
+def calc_concat(parts, n):
+    # Concatena sobre as categorias: o produto de dicionários raramente passa de alguns milhares
+    out = ""
+    for p in (calc_str(p, n) for p in parts):
+        if isinstance(out, str) and isinstance(p, str):
+            out += p
+        elif isinstance(out, str):
+            out = DictCol(p.codes, np.char.add(out, p.cats.astype(str)))
+        elif isinstance(p, str):
+            out = DictCol(out.codes, np.char.add(out.cats.astype(str), p))
+        elif len(out.cats) * len(p.cats) <= 1_000_000:
+            cats = np.char.add(np.repeat(out.cats.astype(str), len(p.cats)), np.tile(p.cats.astype(str), len(out.cats)))
+            out = DictCol(out.codes.astype(np.int64) * len(p.cats) + p.codes, cats)
+        else:
+            out = calc_str(np.char.add(out.decode().astype(str), p.decode().astype(str)), n)
+    return out
+
+def calc_date(x):
+    a = np.asarray(x)
+    if a.dtype.kind != "M":
+        raise ValueError("Esperada uma coluna de data.")
+    return a
+
+# Função → (mínimo, máximo) de argumentos; None = sem limite
+CALC_FUNCS = {"CONCATENATE": (1, None), "ADDDAYS": (2, 2), "ADDHOURS": (2, 2), "ADDMONTHS": (2, 2), "ADDYEARS": (2, 2),
+              "DIFFINDAYS": (2, 2), "DIFFINMONTHS": (2, 2), "DIFFINYEARS": (2, 2), "IF": (3, 3), "AND": (1, None), "OR": (1, None),
+              "NOT": (1, 1), "ROUND": (1, 2), "ADD": (2, 2), "SUBTRACT": (2, 2), "MULTIPLY": (2, 2), "DIVIDE": (2, 2),
+              "NOW": (0, 0), "TODAY": (0, 0), "YEAR": (1, 1), "MONTH": (1, 1), "DAY": (1, 1), "CONTAINS": (2, 2),
+              "TRIM": (1, 1), "UPPER": (1, 1), "LOWER": (1, 1), "ISNULL": (1, 1), "TEXT": (1, 2)}
+
+class CalcCompiler:
+    """
+    Compila a fórmula de uma coluna calculada em uma função (tabela, linhas) → coluna.
+    Texto permanece em dicionário (DictCol); datas e números são arrays NumPy.
+    """
+    def __init__(self, entity: str):
+        self.entity = entity
+        self.refs = set()
+
+    def compile(self, src: str):
+        return self.node(pfx_parse(src))
+
+    def node(self, nd):
+        t = nd["t"]
+        if t == "num":
+            v = nd["v"]
+            return lambda tb, sel, n: v
+        if t == "str":
+            v = nd["v"]
+            return lambda tb, sel, n: v
+        if t == "id":
+            name = nd["name"]
+            if name in ("true", "false"):
+                return lambda tb, sel, n: name == "true"
+            phys = dvq_phys(self.entity, name)
+            self.refs.add(name)
+            return lambda tb, sel, n: tb[phys][sel]
+        if t == "un":
+            x = self.node(nd["x"])
+            if nd["op"] == "-":
+                return lambda tb, sel, n: -calc_num(x(tb, sel, n), "-")
+            return lambda tb, sel, n: ~np.asarray(x(tb, sel, n), bool)
+        if t == "bin":
+            return self.binop(nd["op"], self.node(nd["l"]), self.node(nd["r"]))
+        if t == "call":
+            return self.call(nd["name"].upper(), [self.node(a) for a in nd["args"]])
+        raise ValueError("Expressão não suportada em colunas calculadas.")
+
+    def binop(self, op, l, r):
+        if op == "&":
+            return lambda tb, sel, n: calc_concat([l(tb, sel, n), r(tb, sel, n)], n)
+        arith = {"+": np.add, "-": np.subtract, "*": np.multiply, "/": np.divide}
+        if op in arith:
+            return lambda tb, sel, n: arith[op](calc_num(l(tb, sel, n), op), calc_num(r(tb, sel, n), op))
+        cmp = {"=": np.equal, "<>": np.not_equal, "<": np.less, ">": np.greater, "<=": np.less_equal, ">=": np.greater_equal}
+        if op in cmp:
+            def compare(tb, sel, n):
+                a, b = l(tb, sel, n), r(tb, sel, n)
+                if is_dict_col(a) and isinstance(b, str):
+                    return a.map(lambda c: cmp[op](c, b))       # compara só as categorias
+                if is_dict_col(a):
+                    a = a.decode()
+                if is_dict_col(b):
+                    b = b.decode()
+                if calc_kind(a) == "data" and isinstance(b, str):
+                    try:
+                        b = np.datetime64(b)
+                    except ValueError:
+                        raise ValueError(f"\"{b}\" não é uma data válida — use AAAA-MM-DD.") from None
+                if calc_kind(a) != calc_kind(b):
+                    raise ValueError(f"\"{op}\" compara {calc_kind(a)} com {calc_kind(b)}.")
+                return cmp[op](a, b)
+            return compare
+        if op in ("&&", "And"):
+            return lambda tb, sel, n: np.logical_and(l(tb, sel, n), r(tb, sel, n))
+        if op in ("||", "Or"):
+            return lambda tb, sel, n: np.logical_or(l(tb, sel, n), r(tb, sel, n))
+        raise ValueError(f"Operador '{op}' não suportado.")
+
+    def call(self, name, a):
+        if name not in CALC_FUNCS:
+            raise ValueError(f"Função '{name}' não existe em colunas calculadas. Disponíveis: {', '.join(sorted(CALC_FUNCS))}")
+        lo, hi = CALC_FUNCS[name]
+        if len(a) < lo or (hi is not None and len(a) > hi):
+            want = f"{lo}" if lo == hi else f"pelo menos {lo}" if hi is None else f"de {lo} a {hi}"
+            raise ValueError(f"{name} espera {want} argumento(s), recebeu {len(a)}.")
+        if name == "CONCATENATE":
+            return lambda tb, sel, n: calc_concat([f(tb, sel, n) for f in a], n)
+        if name in ("NOW", "TODAY"):
+            return lambda tb, sel, n: CALC_TODAY
+        if name in ("ADDDAYS", "ADDHOURS", "ADDMONTHS", "ADDYEARS"):
+            unit = {"ADDDAYS": "D", "ADDHOURS": "h", "ADDMONTHS": "M", "ADDYEARS": "Y"}[name]
+            def add(tb, sel, n):
+                x, y = a[0](tb, sel, n), a[1](tb, sel, n)
+                # A documentação usa ADDDAYS(n, data); aceita também (data, n)
+                d, k = (y, x) if np.asarray(y).dtype.kind == "M" else (x, y)
+                k = np.asarray(k).astype(np.int64)
+                d = calc_date(d)
+                if unit in ("M", "Y"):
+                    m = d.astype("datetime64[M]")
+                    months = (k * (12 if unit == "Y" else 1)).astype("timedelta64[M]")
+                    return (m + months).astype("datetime64[D]") + (d.astype("datetime64[D]") - m.astype("datetime64[D]"))
+                return d + k.astype(f"timedelta64[{unit}]")
+            return add
+        if name in ("DIFFINDAYS", "DIFFINMONTHS", "DIFFINYEARS"):
+            unit = {"DIFFINDAYS": "D", "DIFFINMONTHS": "M", "DIFFINYEARS": "Y"}[name]
+            return lambda tb, sel, n: (calc_date(a[1](tb, sel, n)).astype(f"datetime64[{unit}]")
+                                       - calc_date(a[0](tb, sel, n)).astype(f"datetime64[{unit}]")).astype(np.int64)
+        if name in ("YEAR", "MONTH", "DAY"):
+            def part(tb, sel, n):
+                d = calc_date(a[0](tb, sel, n))
+                if name == "YEAR":  return d.astype("datetime64[Y]").astype(np.int64) + 1970
+                if name == "MONTH": return d.astype("datetime64[M]").astype(np.int64) % 12 + 1
+                return (d.astype("datetime64[D]") - d.astype("datetime64[M]")).astype(np.int64) + 1
+            return part
+        if name == "IF":
+            def if_(tb, sel, n):
+                c, x, y = np.asarray(a[0](tb, sel, n), bool), a[1](tb, sel, n), a[2](tb, sel, n)
+                if isinstance(x, str) or isinstance(y, str) or is_dict_col(x) or is_dict_col(y):
+                    # Texto: une os dicionários dos dois ramos e escolhe o código — sem decodificar
+                    x, y = (calc_str(v, n) for v in (x, y))
+                    x = DictCol(np.zeros(1, np.int32), np.array([x])) if isinstance(x, str) else x
+                    y = DictCol(np.zeros(1, np.int32), np.array([y])) if isinstance(y, str) else y
+                    codes = np.where(c, x.codes, y.codes.astype(np.int64) + len(x.cats))
+                    return DictCol(codes, np.concatenate((x.cats.astype(str), y.cats.astype(str))))
+                return np.where(c, x, y)
+            return if_
+        if name in ("AND", "OR"):
+            red = np.logical_and if name == "AND" else np.logical_or
+            return lambda tb, sel, n: red.reduce([np.broadcast_to(np.asarray(f(tb, sel, n), bool), (n,)) for f in a])
+        if name == "NOT":
+            return lambda tb, sel, n: ~np.asarray(a[0](tb, sel, n), bool)
+        if name == "ROUND":
+            def round_(tb, sel, n):
+                d = a[1](tb, sel, n) if len(a) > 1 else 0
+                if calc_kind(d) != "número" or np.ndim(d) != 0 or not float(d).is_integer():
+                    raise ValueError("ROUND espera um número inteiro fixo de casas decimais, ex.: ROUND(cr123_valor, 2).")
+                return np.round(calc_num(a[0](tb, sel, n), "ROUND"), int(d))
+            return round_
+        if name in ("ADD", "SUBTRACT", "MULTIPLY", "DIVIDE"):
+            fn = {"ADD": np.add, "SUBTRACT": np.subtract, "MULTIPLY": np.multiply, "DIVIDE": np.divide}[name]
+            return lambda tb, sel, n: fn(calc_num(a[0](tb, sel, n), name), calc_num(a[1](tb, sel, n), name))
+        if name in ("TRIM", "UPPER", "LOWER"):
+            fn = {"TRIM": np.char.strip, "UPPER": np.char.upper, "LOWER": np.char.lower}[name]
+            def text(tb, sel, n):
+                x = calc_str(a[0](tb, sel, n), n)
+                return fn(x) if isinstance(x, str) else DictCol(x.codes, fn(x.cats.astype(str)))
+            return text
+        if name == "CONTAINS":
+            def contains(tb, sel, n):
+                x, term = calc_str(a[0](tb, sel, n), n), str(a[1](tb, sel, n)).lower()
+                return term in x.lower() if isinstance(x, str) else x.map(lambda c: np.char.find(np.char.lower(c.astype(str)), term) >= 0)
+            return contains
+        if name == "ISNULL":
+            return lambda tb, sel, n: np.zeros(n, bool)
+        if name == "TEXT":
+            def text_(tb, sel, n):
+                x = a[0](tb, sel, n)
+                fmt = str(a[1](tb, sel, n)) if len(a) > 1 else ""
+                if fmt and set(fmt) == {"0"} and np.asarray(x).dtype.kind in "iuf":
+                    cats, codes = np.unique(np.asarray(x).astype(np.int64), return_inverse=True)
+                    return DictCol(codes.astype(np.int32), np.char.zfill(cats.astype(str), len(fmt)))
+                return calc_str(x, n)
+            return text_
+
+def calc_compile(entity: str, formula: str):
+    cc = CalcCompiler(entity)
+    return cc.compile(formula), cc.refs
+
+def calc_eval(entity: str, formula: str, rows: int):
+    """Avalia a coluna calculada nas primeiras `rows` linhas; devolve (coluna, ms)."""
+    fn, _ = calc_compile(entity, formula)
+    table = dvq_table(entity)
+    t0 = time.perf_counter()
+    out = fn(table, slice(0, rows), rows)
+    if not is_dict_col(out) and np.ndim(out) == 0:
+        out = np.full(rows, out)
+    return out, (time.perf_counter() - t0) * 1000
+
+CALC_SAMPLES = {
+    "cr123_pedido": {
+        "Código do pedido": 'CONCATENATE("PED-", TEXT(YEAR(cr123_data), "0000"), "-", cr123_status)',
+        "Dias desde o pedido": "DIFFINDAYS(cr123_data, NOW())",
+        "Prazo de entrega": "ADDDAYS(15, cr123_data)",
+        "Faixa de valor": 'IF(cr123_valortotal > 5000, "Alto", IF(cr123_valortotal > 1000, "Médio", "Baixo"))',
+        "Situação": 'IF(AND(cr123_status <> "Entregue", DIFFINDAYS(cr123_data, NOW()) > 60), "Atrasado", "No prazo")',
+        "Ticket médio por item": "ROUND(DIVIDE(cr123_valortotal, cr123_itens), 2)",
+    },
+    "cr123_funcionario": {
+        "Nome e cargo": 'CONCATENATE(UPPER(cr123_nome), " — ", cr123_cargo, " (", cr123_departamento, ")")',
+        "Tempo de casa (anos)": "DIFFINYEARS(cr123_admissao, TODAY())",
+        "Salário anual": "ROUND(MULTIPLY(cr123_salario, 13.33), 2)",
+    },
+}
+
+# ── Rollup: recálculo completo × manutenção incremental ──
+ROLLUP_AGGS = ["SUM", "COUNT", "AVG", "MIN", "MAX"]
+
+def rollup_full(fk, val, alive, n_parents: int, agg: str):
+    """Recalcula o rollup de todos os pais a partir de todos os filhos vivos."""
+    k, v = fk[alive], val[alive]
+    if agg in ("SUM", "COUNT", "AVG"):
+        cnt = np.bincount(k, minlength=n_parents).astype(np.float64)
+        if agg == "COUNT":
+            return cnt
+        s = np.bincount(k, weights=v, minlength=n_parents)
+        return s if agg == "SUM" else np.divide(s, cnt, out=np.full(n_parents, np.nan), where=cnt > 0)
+    order = np.argsort(k, kind="stable")
+    ks, vs = k[order], v[order]
+    starts = np.flatnonzero(np.r_[True, ks[1:] != ks[:-1]]) if len(ks) else np.zeros(0, np.int64)
+    out = np.full(n_parents, np.nan)
+    if len(ks):
+        red = np.minimum if agg == "MIN" else np.maximum
+        out[ks[starts]] = red.reduceat(vs, starts)
+    return out
+
+class RollupState:
+    """
+    Rollup mantido por deltas: SUM/COUNT/AVG somam a diferença de cada mudança;
+    MIN/MAX só recalculam os pais cujo extremo foi removido, via índice do lookup.
+    """
+    def __init__(self, fk, val, n_parents: int, agg: str):
+        self.fk, self.val = fk.astype(np.int64), val.astype(np.float64).copy()
+        self.alive = np.ones(len(fk), bool)
+        self.n_parents, self.agg = n_parents, agg
+        self.idx = DvIndex(self.fk)
+        self.sum = np.bincount(self.fk, weights=self.val, minlength=n_parents)
+        self.cnt = np.bincount(self.fk, minlength=n_parents).astype(np.float64)
+        self.ext = rollup_full(self.fk, self.val, self.alive, n_parents, agg) if agg in ("MIN", "MAX") else None
+
+    def value(self):
+        if self.agg == "SUM":   return self.sum
+        if self.agg == "COUNT": return self.cnt
+        if self.agg == "AVG":   return np.divide(self.sum, self.cnt, out=np.full(self.n_parents, np.nan), where=self.cnt > 0)
+        return self.ext
+
+    def apply(self, upd_rows, new_vals, del_rows, ins_fk, ins_vals):
+        old = self.val[upd_rows]
+        # SUM/COUNT: deltas por pai, sem tocar nos demais
+        np.add.at(self.sum, self.fk[upd_rows], new_vals - old)
+        np.add.at(self.sum, self.fk[del_rows], -self.val[del_rows])
+        np.add.at(self.cnt, self.fk[del_rows], -1)
+        np.add.at(self.sum, ins_fk, ins_vals)
+        np.add.at(self.cnt, ins_fk, 1)
+        dirty = np.zeros(0, np.int64)
+        if self.ext is not None:
+            red = np.minimum if self.agg == "MIN" else np.maximum
+            cur = self.ext[self.fk[upd_rows]]
+            # Atualização que "piora" o extremo atual ou exclusão dele → pai sujo
+            worse = (new_vals > old) if self.agg == "MIN" else (new_vals < old)
+            dirty = np.concatenate((self.fk[upd_rows][worse & (old == cur)], self.fk[del_rows][self.val[del_rows] == self.ext[self.fk[del_rows]]]))
+            ok = ~np.isin(self.fk[upd_rows], dirty)
+            red.at(self.ext, self.fk[upd_rows][ok], new_vals[ok])
+        self.val[upd_rows] = new_vals
+        self.alive[del_rows] = False
+        if len(ins_fk):
+            self.fk = np.concatenate((self.fk, ins_fk))
+            self.val = np.concatenate((self.val, ins_vals))
+            self.alive = np.concatenate((self.alive, np.ones(len(ins_fk), bool)))
+        dirty = np.unique(dirty)
+        if self.ext is not None and len(dirty):
+            # Relê só os filhos dos pais sujos: índice para as linhas originais + varredura das inseridas
+            base = len(self.idx.order)
+            rows = np.concatenate((self.idx.rows(dirty), base + np.flatnonzero(np.isin(self.fk[base:], dirty))))
+            rows = rows[self.alive[rows]]
+            self.ext[dirty] = rollup_full(self.fk[rows], self.val[rows], np.ones(len(rows), bool), self.n_parents, self.agg)[dirty]
+        if self.ext is not None and len(ins_fk):
+            fresh = np.isnan(self.ext[ins_fk])
+            self.ext[ins_fk[fresh]] = ins_vals[fresh]
+            red.at(self.ext, ins_fk, ins_vals)
+        return len(dirty)
+
+@st.cache_data(show_spinner="Medindo rollups…", max_entries=16)
+def rollup_benchmark(agg: str, sizes: tuple, batch: int, only_active: bool, seed: int = 7):
+    import pandas as pd
+    rng = np.random.default_rng(seed)
+    rows, check = [], []
+    for n in sizes:
+        t = synth_table("Pedidos", n)
+        n_par = max(2, n // 20)
+        fk = t["FuncionarioID"].astype(np.int64)
+        val = t["ValorTotal"].astype(np.float64)
+        if only_active:
+            # Filtro do rollup (Status ≠ Cancelado) aplicado na carga, como o job do Dataverse faz
+            keep = ~t["Status"].map(lambda c: c == "Cancelado")
+            fk, val = fk[keep], val[keep]
+        st_ = RollupState(fk, val, n_par, agg)
+        k = min(batch, len(fk) // 2)
+        upd = rng.choice(len(fk), k // 2, replace=False)
+        new = np.round(val[upd] * rng.uniform(0.5, 1.5, len(upd)), 2)
+        dele = np.setdiff1d(rng.choice(len(fk), k // 4, replace=False), upd)
+        ins_fk = rng.integers(1, n_par, k - len(upd) - len(dele)).astype(np.int64)
+        ins_v = np.round(rng.gamma(2.0, 400.0, len(ins_fk)), 2)
+        t0 = time.perf_counter()
+        dirty = st_.apply(upd, new, dele, ins_fk, ins_v)
+        inc_ms = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        full = rollup_full(st_.fk, st_.val, st_.alive, n_par, agg)
+        full_ms = (time.perf_counter() - t0) * 1000
+        inc = st_.value()
+        ok = bool(np.allclose(np.nan_to_num(inc, nan=-1), np.nan_to_num(full, nan=-1)))
+        rows.append({"Filhos": n, "Pais": n_par, "Mudanças": k, "Recalculo completo (ms)": round(full_ms, 2),
+                     "Incremental (ms)": round(inc_ms, 2), "Pais recalculados (MIN/MAX)": dirty, "Confere": "✅" if ok else "❌"})
+        check.append(full[1:6])
+    return pd.DataFrame(rows), check[-1]
+
+def calculated_columns_lab(key: str):
+    import pandas as pd
+    lab_header("🧮 Laboratório — Colunas Calculadas","A fórmula é compilada uma vez e avaliada em colunas inteiras (NumPy) — mas a cada leitura")
+    c1,c2 = st.columns([1,1.2],gap="large")
+    with c1:
+        ent = st.radio("Tabela",list(CALC_SAMPLES),horizontal=True,key=f"{key}_ent")
+        ex = st.selectbox("Exemplos",list(CALC_SAMPLES[ent]),key=f"{key}_ex_{ent}")
+        formula = st.text_area("Fórmula",CALC_SAMPLES[ent][ex],height=110,key=f"{key}_f_{ent}_{list(CALC_SAMPLES[ent]).index(ex)}",label_visibility="collapsed")
+        st.caption("Colunas: " + ", ".join(c for c in DVQ_TABLES[ent]["cols"] if not c.startswith("_")))
+        st.caption(f"NOW()/TODAY() = {CALC_TODAY} (fixo no laboratório)")
+    with c2:
+        total = DVQ_TABLES[ent]["rows"]
+        sizes = [s for s in (50, 1_000, 10_000, 100_000, 1_000_000) if s <= total]
+        try:
+            times = []
+            for s in sizes:
+                col, ms = calc_eval(ent, formula, s)
+                times.append({"Linhas lidas": s, "ms": round(ms, 3)})
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            return
+        m1,m2 = st.columns(2)
+        m1.metric("Ler 1 página (50 linhas)", f"{times[0]['ms']:.2f} ms")
+        m2.metric(f"Ordenar/filtrar por ela ({total:,})", f"{times[-1]['ms']:,.1f} ms")
+        st.dataframe(pd.DataFrame(times), use_container_width=True, hide_index=True)
+        info_box("Como a coluna calculada não é armazenada, filtrar ou ordenar por ela obriga a avaliá-la em <b>todas</b> as linhas a cada consulta — o custo cresce com a tabela. Ler uma página custa só as linhas exibidas.", "info")
+    show = {c: col_decode(dvq_table(ent)[DVQ_TABLES[ent]["cols"][c]][:8]) for c in sorted(calc_compile(ent, formula)[1])[:4]}
+    show["= calculada"] = col_decode(col)[:8]
+    st.dataframe(pd.DataFrame(show), use_container_width=True, hide_index=True)
+
+def rollup_lab(key: str):
+    lab_header("🔁 Laboratório — Rollup: recálculo completo × incremental","Funcionário (pai) ← Pedidos (filhos). O job de rollup pode recalcular tudo ou aplicar só os deltas")
+    c1,c2,c3 = st.columns(3)
+    agg = c1.selectbox("Agregação",ROLLUP_AGGS,key=f"{key}_agg")
+    batch = c2.select_slider("Mudanças desde o último job",[100,1_000,10_000,50_000],1_000,format_func=lambda v: f"{v:,}",key=f"{key}_batch")
+    only = c3.toggle("Filtro: Status ≠ Cancelado",True,key=f"{key}_flt")
+    df, sample = rollup_benchmark(agg, (10_000, 100_000, 1_000_000), batch, only)
+    last = df.iloc[-1]
+    m1,m2,m3 = st.columns(3)
+    m1.metric("Recálculo completo (1M filhos)", f"{last['Recalculo completo (ms)']:,.1f} ms")
+    m2.metric("Incremental", f"{last['Incremental (ms)']:,.2f} ms",
+              f"{last['Recalculo completo (ms)']/max(last['Incremental (ms)'], 1e-3):,.0f}× mais rápido" if last['Incremental (ms)'] < last['Recalculo completo (ms)'] else "mais lento")
+    m3.metric("Resultado confere", last["Confere"])
+    st.dataframe(df, use_container_width=True, hide_index=True)
+    st.line_chart(df.set_index("Filhos")[["Recalculo completo (ms)","Incremental (ms)"]])
+    st.caption(f"{agg} dos pais 1–5 após o lote: " + ", ".join("—" if np.isnan(v) else f"{v:,.2f}" for v in sample))
+    info_box("SUM, COUNT e AVG (soma ÷ contagem) se mantêm só com deltas. MIN e MAX precisam reler os filhos quando o extremo atual é excluído ou piorado — por isso o índice do lookup importa.", "info")
+
+
+# ══════════════════════════════════════════════
+# DATAVERSE — AVALIADOR DE PRIVILÉGIOS EFETIVOS
+# ══════════════════════════════════════════════
+SEC_OPS = ["Create", "Read", "Write", "Delete", "Append", "AppendTo", "Assign", "Share"]
+SEC_LEVELS = ["Nenhum", "Usuário", "Business Unit", "Pai/Filho", "Organização"]
+# Cada operação ocupa 4 bits cumulativos (Basic=1, Local=2, Deep=4, Global=8): o OR de vários
+# roles já dá o maior escopo, e "tem pelo menos BU" vira um teste de bit
+SEC_BITS = [0b0000, 0b0001, 0b0011, 0b0111, 0b1111]
+SEC_ROLES = {
+    "Vendedor":         {"Read": "Business Unit", "Write": "Usuário"},
+    "Gerente Regional": {"Read": "Pai/Filho",     "Write": "Business Unit"},
+    "Auditor":          {"Read": "Organização",   "Write": "Nenhum"},
+    "Suporte":          {"Read": "Usuário",       "Write": "Usuário"},
+    "Administrador":    {"Read": "Organização",   "Write": "Organização"},
+}
+SEC_REGIONS = ["Brasil", "LATAM", "EUA", "Europa", "Ásia"]
+SEC_CITIES = 3
+SEC_DEPTS = ["Vendas", "Financeiro", "TI"]
+
+def sec_mask(privs: dict) -> int:
+    m = 0
+    for op, level in privs.items():
+        m |= SEC_BITS[SEC_LEVELS.index(level)] << (4 * SEC_OPS.index(op))
+    return m
+
+def sec_level(mask, op: str):
+    # Maior escopo presente no nibble da operação (0 = Nenhum … 4 = Organização)
+    nib = (np.asarray(mask, np.int64) >> (4 * SEC_OPS.index(op))) & 0xF
+    return np.select([nib >= 8, nib >= 4, nib >= 2, nib >= 1], [4, 3, 2, 1], 0)
+
+@st.cache_resource(max_entries=4, show_spinner="Gerando organização sintética…")
+def sec_world(users: int, records: int, seed: int = 11) -> dict:
+    rng = np.random.default_rng(seed)
+    # Árvore de BUs: organização → regiões → cidades → departamentos
+    names, parent = ["Contoso (Org)"], [-1]
+    for r in SEC_REGIONS:
+        names.append(r); parent.append(0); ri = len(names) - 1
+        for c in range(1, SEC_CITIES + 1):
+            names.append(f"{r} · Filial {c}"); parent.append(ri); ci = len(names) - 1
+            for d in SEC_DEPTS:
+                names.append(f"{r} · Filial {c} · {d}"); parent.append(ci)
+    n_bu = len(names)
+    parent = np.array(parent)
+    # Conjunto de ancestrais pré-computado: under[a, b] = b está na subárvore de a
+    under = np.eye(n_bu, dtype=bool)
+    for b in range(n_bu):
+        a = parent[b]
+        while a >= 0:
+            under[a, b] = True
+            a = parent[a]
+    n_teams = max(10, users // 30)
+    leaf = np.flatnonzero(under.sum(axis=1) == 1)
+    user_bu = rng.choice(leaf, users)
+    user_bu[:max(1, users // 100)] = rng.choice(np.flatnonzero(parent >= 0), max(1, users // 100))
+    team_bu = rng.integers(0, n_bu, n_teams)
+    # Até 3 equipes por usuário (-1 = vazio)
+    k = rng.choice(4, users, p=[.45, .3, .17, .08])
+    user_teams = np.sort(np.where(np.arange(3) < k[:, None], rng.integers(0, n_teams, (users, 3)), -1), axis=1)
+    user_teams[:, 1:][user_teams[:, 1:] == user_teams[:, :-1]] = -1
+    # Papéis: índice em SEC_ROLES; usuários têm 1–2, equipes têm 1
+    role_p = [.5, .12, .05, .3, .03]
+    user_roles = np.stack([rng.choice(len(SEC_ROLES), users, p=role_p),
+                           np.where(rng.random(users) < .15, rng.choice(len(SEC_ROLES), users, p=role_p), -1)], axis=1)
+    team_roles = rng.choice(len(SEC_ROLES), n_teams, p=[.5, .2, .05, .25, 0])[:, None]
+    # Registros: dono é usuário (principal < users) ou equipe (principal ≥ users)
+    team_owned = rng.random(records) < .1
+    owner = np.where(team_owned, users + rng.integers(0, n_teams, records), rng.integers(0, users, records)).astype(np.int32)
+    principal_bu = np.concatenate((user_bu, team_bu)).astype(np.int16)
+    rec_bu = principal_bu[owner]
+    # Compartilhamentos (PrincipalObjectAccess): registro, principal, máscara
+    n_sh = records // 50
+    shares = {"record": rng.integers(0, records, n_sh), "principal": np.where(rng.random(n_sh) < .8, rng.integers(0, users, n_sh), users + rng.integers(0, n_teams, n_sh)),
+              "mask": np.where(rng.random(n_sh) < .6, sec_mask({"Read": "Usuário"}), sec_mask({"Read": "Usuário", "Write": "Usuário"}))}
+    return {"bu_names": np.array(names), "bu_parent": parent, "under": under, "users": users, "teams": n_teams,
+            "user_bu": user_bu, "team_bu": team_bu, "user_teams": user_teams, "user_roles": user_roles, "team_roles": team_roles,
+            "owner": owner, "rec_bu": rec_bu, "principal_bu": principal_bu, "shares": shares,
+            "counts_bu": np.bincount(rec_bu, minlength=n_bu), "counts_owner": np.bincount(owner, minlength=users + n_teams),
+            "column_profile": rng.random(users) < .03}
+
+def sec_principal_masks(w: dict, role_masks: np.ndarray):
+    # OR dos papéis de cada principal — papel -1 aponta para a máscara vazia no fim
+    rm = np.append(role_masks, 0)
+    users = np.bitwise_or.reduce(rm[w["user_roles"]], axis=1)
+    teams = np.bitwise_or.reduce(rm[w["team_roles"]], axis=1)
+    return np.concatenate((users, teams))
+
+def sec_user_principals(w: dict) -> np.ndarray:
+    """Matriz usuários × (1 + equipes): o próprio usuário e suas equipes como ids de principal (-1 = vazio)."""
+    u = np.arange(w["users"])
+    return np.concatenate((u[:, None], np.where(w["user_teams"] >= 0, w["users"] + w["user_teams"], -1)), axis=1)
+
+def sec_bu_access(w: dict, pmask: np.ndarray, op: str) -> np.ndarray:
+    # Usuários × BUs: quais BUs de dono estão liberadas para cada usuário, somando todos os principais
+    prin = sec_user_principals(w)
+    n_bu = len(w["bu_names"])
+    out = np.zeros((w["users"], n_bu), bool)
+    for j in range(prin.shape[1]):
+        p = prin[:, j]
+        ok = p >= 0
+        lvl = np.where(ok, sec_level(pmask[np.maximum(p, 0)], op), 0)
+        bu = w["principal_bu"][np.maximum(p, 0)]
+        out |= (lvl == 4)[:, None]
+        out |= (lvl == 3)[:, None] & w["under"][bu]
+        out |= (lvl == 2)[:, None] & (np.arange(n_bu)[None, :] == bu[:, None])
+    return out
+
+def sec_access_counts(w: dict, pmask: np.ndarray, op: str) -> np.ndarray:
+    """
+    Quantos registros cada usuário alcança, sem percorrer usuários × registros:
+    BUs liberadas × contagem por BU + donos (escopo Usuário) fora dessas BUs + compartilhamentos.
+    """
+    B = sec_bu_access(w, pmask, op)
+    total = B.astype(np.int64) @ w["counts_bu"]
+    prin = sec_user_principals(w)
+    # Escopo "Usuário": registros do próprio usuário e das suas equipes
+    user_lvl = sec_level(pmask[:w["users"]], op)
+    for j in range(prin.shape[1]):
+        p = prin[:, j]
+        ok = p >= 0
+        own = ok & np.where(j == 0, user_lvl >= 1, (user_lvl >= 1) | (sec_level(pmask[np.maximum(p, 0)], op) >= 1))
+        covered = B[np.arange(w["users"]), w["principal_bu"][np.maximum(p, 0)]]
+        total += np.where(own & ~covered, w["counts_owner"][np.maximum(p, 0)], 0)
+    # Compartilhamentos que ainda não estavam cobertos, sem contar o mesmo registro duas vezes
+    sh = w["shares"]
+    sh_ok = sec_level(sh["mask"], op) >= 1
+    rec, pr = sh["record"][sh_ok], sh["principal"][sh_ok]
+    # principal → usuários (usuário direto ou membros da equipe)
+    direct = pr < w["users"]
+    pairs_u = [pr[direct]]
+    pairs_r = [rec[direct]]
+    for j in range(w["user_teams"].shape[1]):
+        t = w["user_teams"][:, j]
+        members = np.flatnonzero(t >= 0)
+        team_of = t[members] + w["users"]
+        order = np.argsort(team_of, kind="stable")
+        team_sorted, mem_sorted = team_of[order], members[order]
+        tp = pr[~direct]
+        lo, hi = np.searchsorted(team_sorted, tp, "left"), np.searchsorted(team_sorted, tp, "right")
+        cnt = hi - lo
+        if cnt.sum():
+            idx = np.repeat(lo - np.concatenate(([0], np.cumsum(cnt)[:-1])), cnt) + np.arange(cnt.sum())
+            pairs_u.append(mem_sorted[idx])
+            pairs_r.append(np.repeat(rec[~direct], cnt))
+    pu, prr = np.concatenate(pairs_u), np.concatenate(pairs_r)
+    owner = w["owner"][prr]
+    covered = B[pu, w["rec_bu"][prr]]
+    own_lvl = user_lvl[pu] >= 1
+    team_own = (prin[pu, 1:] == owner[:, None]).any(axis=1) & (own_lvl | (sec_level(pmask[owner], op) >= 1))
+    covered |= ((owner == pu) & own_lvl) | team_own
+    key = np.unique(pu[~covered].astype(np.int64) * len(w["owner"]) + prr[~covered])
+    total += np.bincount(key // len(w["owner"]), minlength=w["users"])
+    return total
+
+def sec_user_records(w: dict, pmask: np.ndarray, user: int, op: str) -> np.ndarray:
+    """Máscara booleana sobre todos os registros para um usuário — consultas por índice, sem laço."""
+    prin = sec_user_principals(w)[user]
+    prin = prin[prin >= 0]
+    n_bu = len(w["bu_names"])
+    B = np.zeros(n_bu, bool)
+    owners = []
+    user_lvl = int(sec_level(pmask[user], op))
+    for p in prin:
+        lvl = int(sec_level(pmask[p], op))
+        bu = w["principal_bu"][p]
+        if lvl == 4:   B[:] = True
+        elif lvl == 3: B |= w["under"][bu]
+        elif lvl == 2: B[bu] = True
+        if lvl >= 1 or (user_lvl >= 1):
+            owners.append(p)
+    m = B[w["rec_bu"]]
+    if owners:
+        m |= np.isin(w["owner"], owners)
+    sh = w["shares"]
+    hit = np.isin(sh["principal"], prin) & (sec_level(sh["mask"], op) >= 1)
+    m[sh["record"][hit]] = True
+    return m
+
+def sec_explain(w: dict, pmask: np.ndarray, user: int, rec: int) -> list:
+    rows = []
+    owner, rbu = int(w["owner"][rec]), int(w["rec_bu"][rec])
+    prin = [int(p) for p in sec_user_principals(w)[user] if p >= 0]
+    for op in ("Read", "Write"):
+        why = []
+        user_lvl = int(sec_level(pmask[user], op))
+        for p in prin:
+            lvl = int(sec_level(pmask[p], op))
+            bu = int(w["principal_bu"][p])
+            label = f"usuário {user}" if p == user else f"equipe {p - w['users']}"
+            if lvl == 4:
+                why.append(f"{label}: escopo Organização")
+            elif lvl == 3 and w["under"][bu, rbu]:
+                why.append(f"{label}: Pai/Filho — BU do registro está sob {w['bu_names'][bu]}")
+            elif lvl == 2 and bu == rbu:
+                why.append(f"{label}: Business Unit {w['bu_names'][bu]}")
+            if owner == p and (lvl >= 1 or user_lvl >= 1):
+                why.append(f"{label}: é o dono do registro (escopo Usuário)")
+        sh = w["shares"]
+        s = (sh["record"] == rec) & np.isin(sh["principal"], prin) & (sec_level(sh["mask"], op) >= 1)
+        if s.any():
+            why.append("compartilhado diretamente (PrincipalObjectAccess)")
+        rows.append({"Operação": op, "Acesso": "✅" if why else "⛔", "Motivo": "; ".join(why) or "nenhum papel alcança a BU ou o dono do registro"})
+    return rows
+
+def security_lab(key: str):
+    import pandas as pd
+    lab_header("🛡️ Simulador de Privilégios Efetivos","Business Units, papéis, equipes, dono do registro e compartilhamentos → acesso de cada usuário a cada registro")
+    c1,c2 = st.columns([1,1.3],gap="large")
+    with c1:
+        a1,a2 = st.columns(2)
+        users = a1.select_slider("Usuários",[1_000,5_000,10_000],10_000,format_func=lambda v: f"{v:,}",key=f"{key}_u")
+        records = a2.select_slider("Registros",[100_000,1_000_000],1_000_000,format_func=lambda v: f"{v:,}",key=f"{key}_r")
+        col_label("🎭 Papéis (tabela cr123_pedido)")
+        base = pd.DataFrame([{"Papel": r, "Read": p["Read"], "Write": p["Write"]} for r, p in SEC_ROLES.items()])
+        roles = st.data_editor(base, hide_index=True, use_container_width=True, disabled=["Papel"], key=f"{key}_roles",
+                               column_config={op: st.column_config.SelectboxColumn(op, options=SEC_LEVELS, required=True) for op in ("Read", "Write")})
+    w = sec_world(users, records)
+    role_masks = np.array([sec_mask({"Read": r["Read"], "Write": r["Write"]}) for _, r in roles.iterrows()], np.int64)
+    pmask = sec_principal_masks(w, role_masks)
+    with c2:
+        t0 = time.perf_counter()
+        reads = sec_access_counts(w, pmask, "Read")
+        writes = sec_access_counts(w, pmask, "Write")
+        ms = (time.perf_counter() - t0) * 1000
+        m1,m2,m3 = st.columns(3)
+        m1.metric("Pares usuário × registro", f"{users * records:,.0f}")
+        m2.metric("Matriz avaliada em", f"{ms:,.0f} ms")
+        m3.metric("Leitura média", f"{reads.mean() / records:.1%}")
+        hist = pd.DataFrame({"Read": np.histogram(reads / records, bins=10, range=(0, 1))[0],
+                             "Write": np.histogram(writes / records, bins=10, range=(0, 1))[0]},
+                            index=[f"{i*10}–{i*10+10}%" for i in range(10)])
+        st.bar_chart(hist)
+        st.caption(f"{len(w['bu_names'])} BUs · {w['teams']:,} equipes · {len(w['shares']['record']):,} compartilhamentos · perfil de segurança de coluna com {int(w['column_profile'].sum()):,} usuários")
+    col_label("🔎 Consultar um usuário e um registro")
+    q1,q2,q3 = st.columns([1,1,2])
+    user = q1.number_input("Usuário",0,users - 1,7,key=f"{key}_qu")
+    rec = q2.number_input("Registro",0,records - 1,123_456 % records,key=f"{key}_qr")
+    with q3:
+        names = list(SEC_ROLES)
+        ur = [names[i] for i in w["user_roles"][user] if i >= 0]
+        tm = [int(t) for t in w["user_teams"][user] if t >= 0]
+        owner = int(w["owner"][rec])
+        st.markdown(f"**Usuário {user}** — BU *{w['bu_names'][w['user_bu'][user]]}* · papéis: {', '.join(ur)} · equipes: {', '.join(map(str, tm)) or '—'}")
+        st.markdown(f"**Registro {rec}** — dono: {'usuário ' + str(owner) if owner < users else 'equipe ' + str(owner - users)} · BU *{w['bu_names'][w['rec_bu'][rec]]}*")
+    st.dataframe(pd.DataFrame(sec_explain(w, pmask, int(user), int(rec))), use_container_width=True, hide_index=True)
+    t0 = time.perf_counter()
+    m = sec_user_records(w, pmask, int(user), "Read")
+    one_ms = (time.perf_counter() - t0) * 1000
+    st.caption(f"Usuário {user} lê {int(m.sum()):,} de {records:,} registros (calculado em {one_ms:.1f} ms) — "
+               f"cr123_valortotal {'visível' if w['column_profile'][user] else '🔒 oculto (fora do Column Security Profile)'}")
+
+
 # ══════════════════════════════════════════════
 # DATAVERSE — Fórmulas & Colunas Calculadas
 # ══════════════════════════════════════════════
@@ -5015,6 +12463,8 @@ IF(cr123_score >= 80, "Alto",
             ]
             for func, desc in funcoes:
                 st.markdown(f'<div style="display:flex;justify-content:space-between;padding:4px 0;border-bottom:1px solid #f3f4f6"><span style="font-family:JetBrains Mono,monospace;font-size:11px;color:#0078d4;font-weight:600">{func}</span><span style="font-size:11px;color:#6b7280">{desc}</span></div>', unsafe_allow_html=True)
+        sp()
+        calculated_columns_lab("calc_dv")
 
     with tabs[1]:
         info_box("🔢 <b>Rollup Columns</b> agregam valores de registros <b>filhos</b> (tabela relacionada 1:N). São calculadas de hora em hora em background — não são em tempo real.", "info")
@@ -5085,6 +12535,8 @@ IF(cr123_score >= 80, "Alto",
 // Campo: cr123_totaldetarefas''',
                 color="#0d9488")
             info_box("⏱️ <b>Rollup não é real-time.</b> Para dados em tempo real, use Calculated Column (se for fórmula simples) ou compute no Power Apps/Automate na hora de salvar.", "warning")
+        sp()
+        rollup_lab("rollup_dv")
 
     with tabs[2]:
         info_box("⚡ <b>Power FX nas colunas</b> é o recurso mais recente do Dataverse — permite usar a mesma sintaxe do Power Apps para criar colunas calculadas mais poderosas.", "info")
@@ -5248,11 +12700,845 @@ _cr123_clienteid_value eq {guid-do-cliente}
 &$filter=cr123_status eq 'Ativo'
 &$orderby=cr123_valor desc
 &$top=100''', language="text")
+        sp()
+        dataverse_query_lab("dvq_formulas")
 
     section_quiz("dataverse_formulas")
     st.markdown('</div>', unsafe_allow_html=True)
 
 
+# ══════════════════════════════════════════════
+# POWER APPS — ANALISADOR DE .msapp (FÓRMULAS, ÁRVORE DE CONTROLES, DELEGAÇÃO)
+# ══════════════════════════════════════════════
+MSAPP_PROFILES = {"sharepointonline": "SharePoint", "commondataservice": "Dataverse", "NativeCDS": "Dataverse", "sql": "SQL Server"}
+MSAPP_HEAVY_ONSTART_MS = 2_000
+MSAPP_SOURCES = {"Pedidos": "sharepointonline", "Clientes": "sharepointonline", "Produtos": "sharepointonline",
+                 "cr123_tarefas": "NativeCDS", "cr123_projetos": "NativeCDS", "Vendas": "sql"}
+MSAPP_MAX_MEMBER = 64 * 2**20
+MSAPP_KEEP_JOBS = 8          # análises terminadas mantidas em memória (LRU)
+
+def msapp_sample_file(controls: int, seed: int = 8) -> str:
+    """App sintético no formato do .msapp: Controls/<n>.json por tela + References/DataSources.json."""
+    import zipfile
+    path = os.path.join(SYNTH_DIR, f"app_{controls}_{seed}.msapp")
+    if os.path.exists(path):
+        return path
+    os.makedirs(SYNTH_DIR, exist_ok=True)
+    rng = random.Random(seed)
+    def ctl(name, template, rules, children=()):
+        return {"Type": "ControlInfo", "Name": name, "Template": {"Name": template, "Version": "2.5.0"},
+                "Rules": [{"Property": p, "Category": "Data", "InvariantScript": f, "RuleProviderType": "Unknown"} for p, f in rules.items()],
+                "Children": list(children)}
+    items = ["Filter(Pedidos, Status = \"Aberto\")", "Filter(Pedidos, IsBlank(Responsavel))", "Search(Clientes, txtBusca.Text, \"Title\")",
+             "SortByColumns(Filter(cr123_tarefas, cr123_status = 1), \"createdon\", SortOrder.Descending)",
+             "Filter(Produtos, Len(Codigo) > 5)", "Filter(Vendas, Year(Data) = 2025)", "colPedidos"]
+    labels = ["ThisItem.Title", "LookUp(Clientes, ID = ThisItem.ClienteId).Title", "Text(ThisItem.Valor, \"R$ #,##0.00\")",
+              "LookUp(cr123_projetos, cr123_projetoid = ThisItem.cr123_projeto).cr123_nome", "CountRows(Filter(Pedidos, Cliente = ThisItem.Title))"]
+    actions = ["Navigate(scrDetalhe, ScreenTransition.Fade)", "Patch(Pedidos, ThisItem, {Status: \"Fechado\"})",
+               "ForAll(colCarrinho, Patch(Pedidos, Defaults(Pedidos), {Title: ThisRecord.Nome}))",
+               "Set(gblSel, ThisItem); Refresh(Pedidos); ClearCollect(colPedidos, Pedidos)", "SubmitForm(frmEdicao)"]
+    screens, made, s = [], 0, 0
+    while made < controls:
+        s += 1
+        kids = []
+        for g in range(rng.randint(1, 3)):
+            tpl = [ctl(f"lbl{s}_{g}_{k}", "label", {"Text": rng.choice(labels)}) for k in range(rng.randint(2, 5))]
+            tpl.append(ctl(f"btn{s}_{g}", "button", {"OnSelect": rng.choice(actions), "Text": "\"Abrir\""}))
+            kids.append(ctl(f"gal{s}_{g}", "gallery", {"Items": rng.choice(items), "TemplateSize": "80"}, tpl))
+            made += len(tpl) + 1
+        kids += [ctl(f"txtBusca{s}", "text", {"Default": "\"\""}), ctl(f"lblTotal{s}", "label", {"Text": "CountRows(Pedidos) & \" pedidos\""}),
+                 ctl(f"btnSalvar{s}", "button", {"OnSelect": rng.choice(actions)})]
+        made += 4
+        screens.append(ctl(f"scrTela{s:03d}", "screen", {"OnVisible": rng.choice(["", "Refresh(Pedidos)", "ClearCollect(colProdutos, Produtos)"]), "Fill": "RGBA(255, 255, 255, 1)"}, kids))
+    onstart = ";\n".join(["Set(gblUsuario, Office365Users.MyProfileV2())", "ClearCollect(colPedidos, Filter(Pedidos, Vendedor = gblUsuario.mail))",
+                          "ClearCollect(colClientes, Clientes)", "ClearCollect(colProdutos, Produtos)", "Set(gblConfig, LookUp(cr123_projetos, cr123_ativo = true))",
+                          "ClearCollect(colVendas, Filter(Vendas, Year(Data) = Year(Today())))", "ClearCollect(colTarefas, cr123_tarefas)"])
+    with zipfile.ZipFile(path + ".tmp", "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("Header.json", json.dumps({"DocVersion": "1.346", "MinVersionToLoad": "1.331"}))
+        zf.writestr("Properties.json", json.dumps({"Name": f"App Vendas ({controls:,} controles)", "Author": "Demo"}))
+        zf.writestr("References/DataSources.json", json.dumps({"DataSources": [
+            {"Name": n, "Type": "NativeCDSDataSourceInfo" if api == "NativeCDS" else "ConnectedDataSourceInfo",
+             **({} if api == "NativeCDS" else {"ApiId": f"/providers/microsoft.powerapps/apis/shared_{api}"})} for n, api in MSAPP_SOURCES.items()]}))
+        zf.writestr("Controls/1.json", json.dumps({"TopParent": ctl("App", "appinfo", {"OnStart": onstart, "StartScreen": "scrTela001"})}))
+        for i, scr in enumerate(screens, 2):
+            zf.writestr(f"Controls/{i}.json", json.dumps({"TopParent": scr}))
+    os.replace(path + ".tmp", path)
+    return path
+
+def msapp_sources(zf) -> dict:
+    """Nome da fonte → perfil do analisador, a partir de References/DataSources.json."""
+    try:
+        with zf.open("References/DataSources.json") as fh:
+            doc = json.load(fh)
+    except KeyError:
+        return {}
+    out = {}
+    for d in doc.get("DataSources", []):
+        api = "NativeCDS" if "NativeCDS" in str(d.get("Type", "")) else str(d.get("ApiId", "")).rsplit("shared_", 1)[-1]
+        prof = next((p for k, p in MSAPP_PROFILES.items() if k.lower() in api.lower()), None)
+        if prof and d.get("Name"):
+            out[d["Name"]] = prof
+    return out
+
+def msapp_screens(zf):
+    """Gera (membro, TopParent) um de cada vez — Controls/*.json ou, em apps novos, Src/*.pa.yaml."""
+    names = [i for i in zf.infolist() if re.match(r"^Controls/\d+\.json$", i.filename)]
+    if names:
+        for info in sorted(names, key=lambda i: int(re.findall(r"\d+", i.filename)[0])):
+            if info.file_size > MSAPP_MAX_MEMBER:
+                raise ValueError(f"{info.filename}: {info.file_size / 2**20:,.0f} MB descompactados — acima do limite de segurança.")
+            with zf.open(info) as fh:
+                yield info.filename, json.load(fh).get("TopParent") or {}
+        return
+    try:
+        import yaml
+    except ImportError:
+        raise ValueError("Este .msapp só tem Src/*.pa.yaml — instale pyyaml para analisá-lo.")
+    def conv(name, body):
+        body = body or {}
+        kids = []
+        for ch in body.get("Children") or []:
+            kids += [conv(k, v) for k, v in (ch or {}).items()]
+        return {"Name": name, "Template": {"Name": str(body.get("Control", "screen")).split("@")[0].lower()},
+                "Rules": [{"Property": p, "InvariantScript": str(f)[1:] if str(f).startswith("=") else str(f)} for p, f in (body.get("Properties") or {}).items()],
+                "Children": kids}
+    for info in zf.infolist():
+        if info.filename.startswith("Src/") and info.filename.endswith(".pa.yaml"):
+            with zf.open(info) as fh:
+                doc = yaml.safe_load(fh) or {}
+            if "App" in doc:
+                yield info.filename, conv("App", {**doc["App"], "Control": "appinfo"})
+            for name, body in (doc.get("Screens") or {}).items():
+                yield info.filename, conv(name, body)
+
+def msapp_context(prop: str, template: str, in_gallery: bool) -> str:
+    if template == "appinfo" and prop == "OnStart":
+        return "App.OnStart"
+    if prop.startswith("On"):
+        return "Button.OnSelect"
+    if in_gallery:
+        return "Template da Gallery (ThisItem)"
+    return "Gallery.Items"
+
+def msapp_onstart(src: str, sources: dict) -> dict:
+    # Custo sequencial × em ondas de Concurrent(), com a latência típica do perfil de cada fonte
+    steps = boot_steps(src)
+    lat = [sum(PFX_PROFILES.get(sources.get(c, "SharePoint"), PFX_PROFILES["SharePoint"])["latency_ms"] for c in s["calls"]) for s in steps]
+    level = boot_waves(steps)
+    waves = sum(max((lat[i] for i in range(len(steps)) if level[i] == w), default=0) for w in set(level))
+    return {"steps": len(steps), "calls": sum(len(s["calls"]) for s in steps), "seq_ms": float(sum(lat)), "wave_ms": float(waves),
+            "concurrent": "Concurrent(" in src}
+
+class MsappJobs:
+    """Análise de .msapp numa thread de fundo: lê uma tela por vez do zip e publica o progresso no job."""
+    def __init__(self):
+        from concurrent.futures import ThreadPoolExecutor
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="msapp")
+        self.lock = threading.Lock()
+        self.jobs = collections.OrderedDict()   # LRU: resultados terminados além de MSAPP_KEEP_JOBS são descartados
+
+    def submit(self, digest: str, label: str, open_zip, row_limit: int, source_rows: int) -> dict:
+        with self.lock:
+            job = self.jobs.get((digest, row_limit, source_rows))
+            if job is not None and job["status"] != "erro":
+                self.jobs.move_to_end((digest, row_limit, source_rows))
+                return job
+            job = self.jobs[(digest, row_limit, source_rows)] = {
+                "label": label, "status": "na fila", "done": 0, "total": 0, "controls": 0, "formulas": 0,
+                "error": None, "result": None, "t0": time.perf_counter(), "ms": None}
+            finished = [k for k, j in self.jobs.items() if j["ms"] is not None]
+            for k in finished[:max(len(finished) - MSAPP_KEEP_JOBS, 0)]:
+                del self.jobs[k]
+        self.pool.submit(self.run, job, open_zip, row_limit, source_rows)
+        return job
+
+    def get(self, digest: str, row_limit: int, source_rows: int) -> Optional[dict]:
+        with self.lock:
+            job = self.jobs.get((digest, row_limit, source_rows))
+            if job is not None:
+                self.jobs.move_to_end((digest, row_limit, source_rows))
+            return job
+
+    def run(self, job: dict, open_zip, row_limit: int, source_rows: int):
+        import zipfile
+        try:
+            job["status"] = "lendo"
+            with zipfile.ZipFile(open_zip()) as zf:
+                sources = msapp_sources(zf)
+                job["total"] = sum(1 for i in zf.infolist() if re.match(r"^Controls/\d+\.json$|^Src/.*\.pa\.yaml$", i.filename))
+                names = sorted(sources, key=len, reverse=True)
+                src_re = re.compile(r"\b(" + "|".join(map(re.escape, names)) + r")\b") if names else None
+                screens, formulas, findings, calls, onstart = [], [], [], {}, {}
+                for member, top in msapp_screens(zf):
+                    tree = []
+                    def walk(c, depth, in_gallery, screen):
+                        tpl = str((c.get("Template") or {}).get("Name", "?"))
+                        rules = [(r.get("Property", "?"), str(r.get("InvariantScript") or "")) for r in c.get("Rules") or []]
+                        rules = [(p, f) for p, f in rules if f.strip()]
+                        tree.append(("    " * depth) + f"{c.get('Name', '?')}  [{tpl}]" + (f"  · {len(rules)} fórmula(s)" if rules else ""))
+                        job["controls"] += 1
+                        for prop, f in rules:
+                            formulas.append({"Tela": screen, "Controle": c.get("Name", "?"), "Tipo": tpl, "Propriedade": prop, "Fórmula": f})
+                            used = set(src_re.findall(f)) if src_re else set()
+                            if not used and not (tpl == "appinfo" and prop == "OnStart"):
+                                continue
+                            prof = next((sources[u] for u in used), "SharePoint")
+                            ctx = msapp_context(prop, tpl, in_gallery)
+                            try:
+                                res = analyze_powerfx(f, prof, ctx, row_limit, source_rows)
+                            except ValueError as e:
+                                findings.append({"Tela": screen, "Controle": c.get("Name"), "Propriedade": prop, "sev": "warning",
+                                                 "Regra": "Sintaxe", "Mensagem": str(e)})
+                                continue
+                            for x in res["findings"]:
+                                findings.append({"Tela": screen, "Controle": c.get("Name"), "Propriedade": prop, "sev": x["sev"],
+                                                 "Regra": x["rule"], "Mensagem": re.sub(r"<[^>]+>", "", x["msg"])})
+                            for call in res["calls"]:
+                                if call["Tipo"] == "leitura":
+                                    k = (call["Função"], call["Fonte"], re.sub(r"\s+", " ", call["Trecho"]))
+                                    calls.setdefault(k, []).append(f"{screen}.{c.get('Name')}.{prop}")
+                            if tpl == "appinfo" and prop == "OnStart":
+                                onstart.update(msapp_onstart(f, sources), total_ms=res["total_ms"], src=f)
+                        for ch in c.get("Children") or []:
+                            walk(ch, depth + 1, in_gallery or tpl == "gallery", screen)
+                    walk(top, 0, False, top.get("Name", member))
+                    job["formulas"] = len(formulas)
+                    screens.append({"Tela": top.get("Name", member), "Controles": len(tree), "tree": tree})
+                    job["done"] += 1
+            repeated = sorted(({"Função": k[0], "Fonte": k[1], "Trecho": k[2], "Ocorrências": len(v), "Onde": ", ".join(v[:4]) + (" …" if len(v) > 4 else "")}
+                               for k, v in calls.items() if len(v) > 1), key=lambda r: -r["Ocorrências"])
+            job["result"] = {"screens": screens, "formulas": formulas, "findings": findings, "repeated": repeated,
+                             "onstart": onstart or None, "sources": sources}
+            job["status"] = "concluído"
+        except (zipfile.BadZipFile, KeyError) as e:
+            job["status"], job["error"] = "erro", f"Arquivo .msapp inválido ({e})"
+        except Exception as e:  # a thread não tem onde mostrar erro: fica no job para a sessão exibir
+            job["status"], job["error"] = "erro", str(e)
+        job["ms"] = (time.perf_counter() - job["t0"]) * 1000
+
+@st.cache_resource
+def msapp_jobs() -> MsappJobs:
+    return MsappJobs()
+
+def msapp_progress(key: str, digest: str, row_limit: int, source_rows: int):
+    job = msapp_jobs().get(digest, row_limit, source_rows)
+    if job and job["ms"] is None:
+        st.progress(job["done"] / max(job["total"], 1),
+                    text=f"⏳ {job['label']}: {job['status']} — {job['done']}/{job['total']} telas · {job['controls']:,} controles · {job['formulas']:,} fórmulas")
+    if st.session_state.get(f"{key}_busy") and job and job["ms"] is not None:
+        st.session_state[f"{key}_busy"] = False
+        st.rerun(scope="app")   # terminou: o relatório fora do fragmento passa a ver o resultado
+    st.session_state[f"{key}_busy"] = bool(job and job["ms"] is None)
+
+def msapp_lab(key: str):
+    import io
+    import pandas as pd
+    lab_header("📱 Laboratório — Analisador de .msapp","Envie o app (.msapp): todas as fórmulas extraídas, árvore de controles por tela, delegação, chamadas repetidas e OnStart pesado")
+    c1,c2 = st.columns([1,1.3],gap="large")
+    with c1:
+        src = st.radio("App",["Sintético","Enviar .msapp"],horizontal=True,key=f"{key}_src")
+        if src == "Sintético":
+            n = st.select_slider("Controles",[200,2_000,10_000],2_000,format_func=lambda v: f"{v:,}",key=f"{key}_n")
+            path = msapp_sample_file(n)
+            digest, opener, label = f"{path}:{os.path.getsize(path)}", (lambda: open(path, "rb")), os.path.basename(path)
+        else:
+            up = st.file_uploader("Arquivo .msapp",type=["msapp","zip"],key=f"{key}_up")
+            if up is None:
+                info_box("No Power Apps Studio: <b>Arquivo → Salvar como → Este computador</b> gera o .msapp (um zip com Controls/*.json ou Src/*.pa.yaml).", "info")
+                return
+            raw = up.getvalue()
+            digest, opener, label = hashlib.sha1(raw).hexdigest(), (lambda: io.BytesIO(raw)), up.name
+        a1,a2 = st.columns(2)
+        row_limit = a1.select_slider("Limite de linhas",[500,1000,2000],2000,key=f"{key}_lim")
+        rows = a2.number_input("Linhas em cada fonte",1,10_000_000,25_000,1000,key=f"{key}_rows")
+        jobs = msapp_jobs()
+        job = jobs.get(digest, row_limit, int(rows))
+        # Job com erro não fica preso: o mesmo botão reenvia (submit substitui jobs em "erro")
+        if (job is None or job["error"]) and st.button("🔍 Analisar" if job is None else "🔁 Tentar novamente",key=f"{key}_go",use_container_width=True):
+            job = jobs.submit(digest, label, opener, row_limit, int(rows))
+            st.session_state[f"{key}_busy"] = True
+        busy = bool(job and job["ms"] is None) or st.session_state.get(f"{key}_busy", False)
+        st.fragment(msapp_progress, run_every=0.5 if busy else None)(key, digest, row_limit, int(rows))
+        if job and job["error"]:
+            st.error(f"❌ {job['error']}")
+            return
+    if not job or job["result"] is None:
+        return
+    r = job["result"]
+    with c1:
+        st.caption(f"✅ {job['done']} telas · {job['controls']:,} controles · {len(r['formulas']):,} fórmulas em {job['ms']:,.0f} ms (thread de fundo)")
+        scr = st.selectbox("Árvore de controles",[s["Tela"] for s in r["screens"]],key=f"{key}_scr")
+        tree = next(s["tree"] for s in r["screens"] if s["Tela"] == scr)
+        st.code("\n".join(tree[:400]) + (f"\n… +{len(tree) - 400} controles" if len(tree) > 400 else ""), language="text")
+    with c2:
+        sev = collections.Counter(f["sev"] for f in r["findings"])
+        m1,m2,m3 = st.columns(3)
+        m1.metric("Avisos de delegação", f"{sum(1 for f in r['findings'] if f['Regra'] == 'Delegação'):,}")
+        m2.metric("Chamadas repetidas", f"{sum(x['Ocorrências'] for x in r['repeated']):,}", f"{len(r['repeated'])} consultas distintas", delta_color="off")
+        m3.metric("Críticos / atenção", f"{sev.get('danger', 0):,} / {sev.get('warning', 0):,}")
+        o = r["onstart"]
+        if o:
+            heavy = o["total_ms"] > MSAPP_HEAVY_ONSTART_MS and not o["concurrent"]
+            info_box(f"{'🐢' if heavy else '✅'} <b>App.OnStart:</b> {o['steps']} instruções, {o['calls']} chamadas de dados — "
+                     f"~{o['total_ms']:,.0f} ms estimados antes da primeira tela" + (f"; só em latência, {o['seq_ms']:,.0f} ms em sequência → {o['wave_ms']:,.0f} ms com <code>Concurrent()</code> em ondas" if o["wave_ms"] < o["seq_ms"] else "")
+                     + (". Mova cargas para named formulas ou para o OnVisible de quem usa." if heavy else "."), "warning" if heavy else "success")
+        if r["findings"]:
+            df = pd.DataFrame(r["findings"])
+            rule = st.selectbox("Regra",["Todas"] + sorted(df["Regra"].unique()),key=f"{key}_rule")
+            st.dataframe((df if rule == "Todas" else df[df["Regra"] == rule]).drop(columns="sev"), use_container_width=True, hide_index=True, height=260)
+        if r["repeated"]:
+            col_label("🔁 Mesma consulta em vários lugares")
+            st.dataframe(pd.DataFrame(r["repeated"]), use_container_width=True, hide_index=True, height=200)
+    with st.expander(f"📜 Todas as fórmulas ({len(r['formulas']):,})"):
+        st.dataframe(pd.DataFrame(r["formulas"]), use_container_width=True, hide_index=True)
+
+
+# ══════════════════════════════════════════════
+# SOLUTIONS — INVENTÁRIO E DIFF DE ALM (customizations.xml EM STREAMING)
+# ══════════════════════════════════════════════
+SOL_KINDS = ["Tabelas", "Colunas", "Flows", "Agentes", "Componentes de agente", "Variáveis de ambiente", "Referências de conexão"]
+SOL_WF_CATEGORY = {"0": "Workflow clássico", "2": "Regra de negócio", "3": "Ação", "4": "Fluxo de processo", "5": "Cloud flow", "6": "Desktop flow"}
+SOL_EV_TYPES = {"100000000": "Texto", "100000001": "Número", "100000002": "Booleano", "100000003": "JSON", "100000004": "Fonte de dados", "100000005": "Segredo"}
+SOL_BOT_AUTH = {"0": "Não especificada", "1": "Sem autenticação", "2": "Microsoft (integrada)", "3": "Manual (Entra ID)"}
+SOL_BOT_COMPONENTS = {"0": "Tópico", "2": "Variável", "3": "Entidade", "9": "Tópico", "11": "Entidade", "12": "Variável", "14": "Arquivo", "15": "Instruções (GPT)", "16": "Fonte de conhecimento"}
+SOL_BULKY = {"FormXml", "SavedQueries", "RibbonDiffXml", "Visualizations", "CustomControlDefaultConfigs"}
+SOL_MAX_RATIO = FLOW_MAX_RATIO
+
+def sol_text(el, path: str) -> str:
+    return (el.findtext(path) or "").strip()
+
+def sol_flow(el, crc: dict) -> Tuple[str, dict]:
+    # A definição fica em Workflows/*.json: o CRC32 do diretório central do zip diz se mudou, sem descompactar
+    member = sol_text(el, "JsonFileName").lstrip("/")
+    return el.get("WorkflowId", "").strip("{}").lower(), {
+        "Nome": el.get("Name", ""), "Categoria": SOL_WF_CATEGORY.get(sol_text(el, "Category"), sol_text(el, "Category")),
+        "Estado": "Ativado" if sol_text(el, "StateCode") == "1" else "Desativado",
+        "Definição": f"{crc[member]:08x}" if member in crc else "—"}
+
+def sol_connref(el, crc: dict) -> Tuple[str, dict]:
+    return el.get("connectionreferencelogicalname", ""), {
+        "Nome": sol_text(el, "connectionreferencedisplayname"), "Conector": sol_text(el, "connectorid").rsplit("/", 1)[-1]}
+
+def sol_envvar(el, crc: dict) -> Tuple[str, dict]:
+    return el.get("schemaname", ""), {
+        "Nome": (el.find("displayname").get("default", "") if el.find("displayname") is not None else ""),
+        "Tipo": SOL_EV_TYPES.get(sol_text(el, "type"), sol_text(el, "type")),
+        "Obrigatória": "Sim" if sol_text(el, "isrequired") == "1" else "Não", "Valor padrão": sol_text(el, "defaultvalue") or "—"}
+
+def sol_bot(el, crc: dict) -> Tuple[str, dict]:
+    return el.get("schemaname", ""), {
+        "Nome": sol_text(el, "name"), "Idioma": sol_text(el, "language"),
+        "Autenticação": SOL_BOT_AUTH.get(sol_text(el, "authenticationmode"), sol_text(el, "authenticationmode"))}
+
+def sol_botcomponent(el, crc: dict) -> Tuple[str, dict]:
+    key = el.get("schemaname", "")
+    data = crc.get(f"botcomponents/{key}/data")
+    return key, {
+        "Nome": sol_text(el, "name"), "Agente": sol_text(el, "parentbotid/schemaname"),
+        "Tipo": SOL_BOT_COMPONENTS.get(sol_text(el, "componenttype"), sol_text(el, "componenttype")),
+        "Conteúdo": f"{data:08x}" if data is not None else "—"}
+
+# Elemento → (tipo do inventário, extrator); vale tanto dentro do customizations.xml quanto nos XML por pasta
+SOL_ITEMS = {"Workflow": ("Flows", sol_flow), "connectionreference": ("Referências de conexão", sol_connref),
+             "environmentvariabledefinition": ("Variáveis de ambiente", sol_envvar),
+             "bot": ("Agentes", sol_bot), "botcomponent": ("Componentes de agente", sol_botcomponent)}
+SOL_FOLDERS = re.compile(r"^(environmentvariabledefinitions/[^/]+/environmentvariabledefinition|bots/[^/]+/bot|botcomponents/[^/]+/botcomponent)\.xml$")
+
+def sol_manifest(zf) -> dict:
+    import xml.etree.ElementTree as ET
+    try:
+        with zf.open("solution.xml") as fh:
+            m = ET.parse(fh).getroot().find("SolutionManifest")
+    except KeyError:
+        raise ValueError("solution.xml não encontrado — o .zip não é uma solução exportada do Dataverse.")
+    except ET.ParseError as e:
+        raise ValueError(f"solution.xml inválido ({e})")
+    if m is None:
+        raise ValueError("solution.xml sem SolutionManifest.")
+    name = m.find("LocalizedNames/LocalizedName")
+    return {"Solução": sol_text(m, "UniqueName"), "Nome": name.get("description", "") if name is not None else "",
+            "Versão": sol_text(m, "Version"), "Tipo": "Managed" if sol_text(m, "Managed") == "1" else "Unmanaged",
+            "Publisher": sol_text(m, "Publisher/UniqueName"), "Prefixo": sol_text(m, "Publisher/CustomizationPrefix")}
+
+def sol_scan(fh, inv: dict, crc: dict) -> int:
+    """Percorre o customizations.xml com iterparse: cada item é lido ao fechar e removido da árvore em seguida."""
+    import xml.etree.ElementTree as ET
+    stack, table, ncols, seen = [], None, 0, 0
+    for ev, el in ET.iterparse(fh, ("start", "end")):
+        if ev == "start":
+            stack.append(el)
+            if el.tag == "entity":
+                table, ncols = el.get("Name", "").lower(), 0
+            continue
+        stack.pop()
+        tag = el.tag
+        seen += 1
+        if tag == "attribute" and table and stack and stack[-1].tag == "attributes":
+            name = sol_text(el, "LogicalName") or el.get("PhysicalName", "").lower()
+            disp = el.find("displaynames/displayname")
+            inv["Colunas"][f"{table}.{name}"] = {
+                "Nome": disp.get("description", "") if disp is not None else "", "Tipo": sol_text(el, "Type"),
+                "Obrigatoriedade": sol_text(el, "RequiredLevel"), "Tamanho": sol_text(el, "MaxLength") or "—",
+                "Auditoria": "Sim" if sol_text(el, "IsAuditEnabled") == "1" else "Não"}
+            ncols += 1
+        elif tag == "entity" and table:
+            disp = el.find("LocalizedNames/LocalizedName")
+            inv["Tabelas"][table] = {
+                "Nome": disp.get("description", "") if disp is not None else "", "Propriedade": sol_text(el, "OwnershipTypeMask"),
+                "Auditoria": "Sim" if sol_text(el, "IsAuditEnabled") == "1" else "Não",
+                "Change tracking": "Sim" if sol_text(el, "ChangeTrackingEnabled") == "1" else "Não", "Colunas": ncols}
+            table = None
+        elif tag in SOL_ITEMS and len(stack) == 2:
+            kind, fn = SOL_ITEMS[tag]
+            k, props = fn(el, crc)
+            inv[kind][k] = props
+        # Memória constante: o item já lido sai da árvore (o parser não guarda nada além da pilha atual)
+        if stack and (len(stack) == 2 or tag == "attribute" or tag in SOL_BULKY):
+            stack[-1].remove(el)
+    return seen
+
+@st.cache_data(max_entries=8, show_spinner="Lendo a solução em streaming…")
+def sol_inventory(digest: str, _open_zip) -> dict:
+    """Inventário por tipo de componente (chave → propriedades). O digest é o hash do arquivo: mesma versão, mesmo resultado."""
+    import zipfile
+    import xml.etree.ElementTree as ET
+    t0 = time.perf_counter()
+    inv = {k: {} for k in SOL_KINDS}
+    try:
+        with zipfile.ZipFile(_open_zip()) as zf:
+            infos = zf.infolist()
+            for i in infos:
+                if i.compress_size and i.file_size / i.compress_size > SOL_MAX_RATIO:
+                    raise ValueError(f"{i.filename}: compressão {i.file_size / i.compress_size:,.0f}:1 — tratado como zip bomb.")
+            crc = {i.filename: i.CRC for i in infos}
+            head = sol_manifest(zf)
+            if "customizations.xml" not in crc:
+                raise ValueError("customizations.xml não encontrado na solução.")
+            with zf.open("customizations.xml") as fh:
+                elements = sol_scan(fh, inv, crc)
+            for i in infos:
+                if SOL_FOLDERS.match(i.filename):
+                    with zf.open(i) as fh:
+                        root = ET.parse(fh).getroot()
+                    if root.tag in SOL_ITEMS:
+                        kind, fn = SOL_ITEMS[root.tag]
+                        k, props = fn(root, crc)
+                        inv[kind][k] = props
+            xml_mb = zf.getinfo("customizations.xml").file_size / 2**20
+    except zipfile.BadZipFile:
+        raise ValueError("O arquivo não é um .zip válido.")
+    except ET.ParseError as e:
+        raise ValueError(f"XML inválido na solução ({e})")
+    return {"head": head, "inv": inv, "elements": elements, "xml_mb": xml_mb, "ms": (time.perf_counter() - t0) * 1000}
+
+def sol_version(v: str) -> tuple:
+    return tuple(int(x) for x in re.findall(r"\d+", v))
+
+@st.cache_data(max_entries=16, show_spinner="Comparando versões…")
+def sol_compare(da: str, db: str, _open_a, _open_b) -> dict:
+    """Diff por tipo (➕/➖/✏️) e os alertas de ALM que ele implica no upgrade de A para B."""
+    a, b = sol_inventory(da, _open_a), sol_inventory(db, _open_b)
+    rows, findings = [], []
+    changed = collections.defaultdict(list)
+    for kind in SOL_KINDS:
+        ia, ib = a["inv"][kind], b["inv"][kind]
+        for k in sorted(ib.keys() - ia.keys()):
+            rows.append({"Componente": kind, "Chave": k, "Nome": ib[k].get("Nome", ""), "Mudança": "➕ Adicionado", "Detalhe": ""})
+        for k in sorted(ia.keys() - ib.keys()):
+            rows.append({"Componente": kind, "Chave": k, "Nome": ia[k].get("Nome", ""), "Mudança": "➖ Removido", "Detalhe": ""})
+        for k in sorted(ia.keys() & ib.keys()):
+            diff = [(f, ia[k].get(f), ib[k].get(f)) for f in ib[k] if ia[k].get(f) != ib[k].get(f)]
+            if diff:
+                changed[kind].append((k, diff))
+                rows.append({"Componente": kind, "Chave": k, "Nome": ib[k].get("Nome", ""), "Mudança": "✏️ Alterado",
+                             "Detalhe": "; ".join("definição/conteúdo alterado" if f in ("Definição", "Conteúdo") else f"{f}: {x} → {y}" for f, x, y in diff)})
+    ha, hb = a["head"], b["head"]
+    count = lambda kind, change: sum(1 for r in rows if r["Componente"] == kind and r["Mudança"] == change)
+    if ha["Prefixo"] != hb["Prefixo"] or ha["Solução"] != hb["Solução"]:
+        findings.append(("danger", f"Solução/prefixo diferentes (<code>{ha['Solução']}</code>/{ha['Prefixo']} → <code>{hb['Solução']}</code>/{hb['Prefixo']}): não é um upgrade da mesma solução — os componentes seriam importados lado a lado."))
+    if sol_version(hb["Versão"]) <= sol_version(ha["Versão"]):
+        findings.append(("warning", f"A versão não subiu ({ha['Versão']} → {hb['Versão']}). O import de uma solução managed com versão igual ou menor é recusado ou ignorado."))
+    lost = count("Tabelas", "➖ Removido") + count("Colunas", "➖ Removido")
+    if lost:
+        findings.append(("danger", f"{lost} tabela(s)/coluna(s) removidas. No upgrade de uma solução managed elas são <b>excluídas no destino, com os dados</b> — confirme antes, ou use <i>Stage for upgrade</i> para migrar os dados primeiro."))
+    retyped = [k for k, d in changed["Colunas"] if any(f == "Tipo" for f, _, _ in d)]
+    if retyped:
+        findings.append(("danger", f"Tipo alterado em {len(retyped)} coluna(s) ({', '.join(retyped[:3])}{'…' if len(retyped) > 3 else ''}): o Dataverse não converte o tipo de uma coluna existente e o import falha. Crie uma coluna nova e migre."))
+    required = [k for k, d in changed["Colunas"] if any(f == "Obrigatoriedade" and y == "applicationrequired" for f, _, y in d)]
+    if required:
+        findings.append(("warning", f"{len(required)} coluna(s) passaram a ser obrigatórias: registros antigos continuam vazios, mas formulários e Patch() que não enviam o campo passam a falhar."))
+    off = [k for k, d in changed["Flows"] if any(f == "Estado" and y == "Desativado" for f, _, y in d)]
+    if off:
+        findings.append(("warning", f"{len(off)} flow(s) chegam desativados na nova versão — no destino eles param depois do import."))
+    new_ev = [k for k, p in b["inv"]["Variáveis de ambiente"].items() if k not in a["inv"]["Variáveis de ambiente"] and p["Valor padrão"] == "—"]
+    if new_ev:
+        findings.append(("warning", f"Variáveis novas sem valor padrão ({', '.join(new_ev)}): o import pede o valor — informe no <i>deployment settings</i> do pipeline."))
+    new_cr = count("Referências de conexão", "➕ Adicionado")
+    if new_cr:
+        findings.append(("info", f"{new_cr} referência(s) de conexão nova(s): mapeie uma conexão no ambiente de destino, senão os flows que as usam ficam desligados."))
+    if not findings:
+        findings.append(("success", "Upgrade sem alertas: nada removido, nenhum tipo trocado e a versão subiu."))
+    return {"a": a, "b": b, "rows": rows, "findings": findings}
+
+def sol_sample_file(tables: int, version: str, seed: int = 47) -> str:
+    """Solução sintética no formato exportado: solution.xml, customizations.xml, Workflows/, bots/, botcomponents/ e variáveis de ambiente."""
+    import zipfile
+    from xml.sax.saxutils import escape, quoteattr
+    path = os.path.join(SYNTH_DIR, f"solution_{tables}_{version}.zip")
+    if os.path.exists(path):
+        return path
+    os.makedirs(SYNTH_DIR, exist_ok=True)
+    rng, nxt = random.Random(seed + tables), version != "1.0.0.0"
+    words = ["Pedido", "Cliente", "Produto", "Contrato", "Fatura", "Chamado", "Projeto", "Tarefa", "Ativo", "Fornecedor", "Visita", "Despesa"]
+    types = ["nvarchar"] * 4 + ["int", "decimal", "money", "datetime", "datetime", "bit", "picklist", "lookup", "memo"]
+    model = []
+    for t in range(tables):
+        w = words[t % len(words)] + (str(t // len(words)) if t >= len(words) else "")
+        cols = [(f"cr123_campo{c:02d}", rng.choice(types), "applicationrequired" if rng.random() < 0.1 else "none", f"Campo {c}") for c in range(rng.randint(8, 60))]
+        model.append([f"cr123_{w.lower()}", w, cols])
+    flows = [(f"{uuid:032x}", f"Flow {i:03d} — {rng.choice(words)}", rng.choice(["5", "5", "5", "0", "2"])) for i, uuid in enumerate(rng.getrandbits(128) for _ in range(max(3, tables // 5)))]
+    envs = {"cr123_SharePointUrl": ("100000000", "https://empresa.sharepoint.com/sites/dev"), "cr123_LimiteAprovacao": ("100000001", "5000"),
+            "cr123_ModoManutencao": ("100000002", "no"), "cr123_ConfigJson": ("100000003", "{\"retries\": 3}")}
+    conns = {"cr123_sharedcommondataserviceforapps_a1b2c": "shared_commondataserviceforapps", "cr123_sharedsharepointonline_d3e4f": "shared_sharepointonline"}
+    topics = [f"cr123_agenterh.topic.{w}{i}" for i, w in enumerate(words * (1 + tables // 100))][:max(5, tables // 10)]
+    changed_flows, changed_topics = set(), set()
+    if nxt:
+        # 1.1: mudanças determinísticas que exercitam todos os tipos de diff e de alerta
+        r2 = random.Random(seed + tables + 1)
+        del model[len(model) // 3]
+        for m in r2.sample(model, max(2, tables // 20)):
+            m[2].append((f"cr123_novo{len(m[2])}", "nvarchar", "none", "Campo novo"))
+        for m in r2.sample(model, max(2, tables // 50)):
+            m[2].pop(r2.randrange(1, len(m[2])))
+        for m in r2.sample(model, max(3, tables // 30)):
+            c = r2.randrange(len(m[2]))
+            m[2][c] = m[2][c][:2] + ("applicationrequired",) + m[2][c][3:]
+        m = model[0]
+        m[2][1] = (m[2][1][0], "memo" if m[2][1][1] != "memo" else "nvarchar") + m[2][1][2:]
+        model += [[f"cr123_novatabela{i}", f"Nova tabela {i}", [(f"cr123_campo{c:02d}", "nvarchar", "none", f"Campo {c}") for c in range(10)]] for i in range(max(2, tables // 25))]
+        changed_flows = {f[0] for f in r2.sample(flows, max(1, len(flows) // 10))}
+        flows[0] = flows[0][:2] + ("5",)
+        flows = flows[:-1] + [(f"{r2.getrandbits(128):032x}", f"Flow novo {i}", "5") for i in range(2)]
+        envs["cr123_SharePointUrl"] = ("100000000", "https://empresa.sharepoint.com/sites/hml")
+        envs["cr123_ApiKeyErp"] = ("100000005", "")
+        conns["cr123_sharedoffice365_g5h6i"] = "shared_office365"
+        changed_topics = set(r2.sample(topics, 2))
+        topics = topics[1:] + ["cr123_agenterh.topic.Beneficios"]
+    disabled = {flows[1][0]} if nxt and len(flows) > 1 else set()
+
+    def attr(name, typ, req, disp):
+        size = f"<MaxLength>{4000 if typ == 'memo' else 100}</MaxLength>" if typ in ("nvarchar", "memo") else ""
+        return (f'<attribute PhysicalName="{name}"><Type>{typ}</Type><Name>{name}</Name><LogicalName>{name}</LogicalName>'
+                f"<RequiredLevel>{req}</RequiredLevel><DisplayMask>ValidForAdvancedFind|ValidForForm|ValidForGrid</DisplayMask>"
+                "<ImeMode>auto</ImeMode><ValidForUpdateApi>1</ValidForUpdateApi><ValidForReadApi>1</ValidForReadApi><ValidForCreateApi>1</ValidForCreateApi>"
+                "<IsCustomField>1</IsCustomField><IsAuditEnabled>1</IsAuditEnabled><IsSecured>0</IsSecured><IntroducedVersion>1.0.0.0</IntroducedVersion>"
+                f"<IsCustomizable>1</IsCustomizable><IsRenameable>1</IsRenameable><SourceType>0</SourceType>{size}"
+                f'<displaynames><displayname description={quoteattr(disp)} languagecode="1046" /></displaynames></attribute>')
+    form = "<FormXml><forms type=\"main\"><systemform><form><tabs>" + "<tab><columns><column><sections><section><rows>" + "<row><cell><control /></cell></row>" * 30 + "</rows></section></sections></column></columns></tab></tabs></form></systemform></forms></FormXml>"
+    with zipfile.ZipFile(path + ".tmp", "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", '<?xml version="1.0" encoding="utf-8"?><Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"><Default Extension="xml" ContentType="application/octet-stream" /></Types>')
+        zf.writestr("solution.xml", f'<?xml version="1.0" encoding="utf-8"?><ImportExportXml version="9.2.25063.186" SolutionPackageVersion="9.2" languagecode="1046" generatedBy="CrmLive">'
+                    f'<SolutionManifest><UniqueName>ProjetoVendas</UniqueName><LocalizedNames><LocalizedName description="Projeto Vendas" languagecode="1046" /></LocalizedNames>'
+                    f"<Version>{version}</Version><Managed>1</Managed><Publisher><UniqueName>empresa</UniqueName><CustomizationPrefix>cr123</CustomizationPrefix></Publisher></SolutionManifest></ImportExportXml>")
+        with zf.open("customizations.xml", "w") as fh:
+            fh.write(b'<?xml version="1.0" encoding="utf-8"?><ImportExportXml xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"><Entities>')
+            for logical, disp, cols in model:
+                fh.write((f'<Entity><Name LocalizedName={quoteattr(disp)} OriginalName={quoteattr(disp)}>{logical}</Name><EntityInfo><entity Name="{logical}">'
+                          f'<LocalizedNames><LocalizedName description={quoteattr(disp)} languagecode="1046" /></LocalizedNames><attributes>'
+                          + "".join(attr(*c) for c in cols) +
+                          f"</attributes><OwnershipTypeMask>UserOwned</OwnershipTypeMask><IsAuditEnabled>1</IsAuditEnabled><ChangeTrackingEnabled>0</ChangeTrackingEnabled>"
+                          f"</entity></EntityInfo>{form}<SavedQueries /><RibbonDiffXml /></Entity>").encode())
+            fh.write(b"</Entities><Roles /><Workflows>")
+            for uuid, name, cat in flows:
+                fh.write((f'<Workflow WorkflowId="{{{uuid[:8]}-{uuid[8:12]}-{uuid[12:16]}-{uuid[16:20]}-{uuid[20:]}}}" Name={quoteattr(name)}>'
+                          f"<JsonFileName>/Workflows/Flow{uuid[:8]}-{uuid.upper()}.json</JsonFileName><Type>1</Type><Subprocess>0</Subprocess>"
+                          f"<Category>{cat}</Category><Mode>0</Mode><Scope>4</Scope><StateCode>{0 if uuid in disabled else 1}</StateCode><StatusCode>{1 if uuid in disabled else 2}</StatusCode></Workflow>").encode())
+            fh.write(b"</Workflows><connectionreferences>")
+            for logical, api in conns.items():
+                fh.write((f'<connectionreference connectionreferencelogicalname="{logical}"><connectionreferencedisplayname>{escape(api[7:])}</connectionreferencedisplayname>'
+                          f"<connectorid>/providers/Microsoft.PowerApps/apis/{api}</connectorid><iscustomizable>1</iscustomizable><statecode>0</statecode></connectionreference>").encode())
+            fh.write(b"</connectionreferences><Languages><Language>1046</Language></Languages></ImportExportXml>")
+        for uuid, name, cat in flows:
+            body = {"properties": {"displayName": name, "definition": {"triggers": {"manual": {"type": "Request"}}, "actions": {
+                "Compor": {"type": "Compose", "inputs": f"{name} v{version if uuid in changed_flows else '1.0.0.0'}"}}}}}
+            zf.writestr(f"Workflows/Flow{uuid[:8]}-{uuid.upper()}.json", json.dumps(body))
+        for schema, (typ, default) in envs.items():
+            zf.writestr(f"environmentvariabledefinitions/{schema}/environmentvariabledefinition.xml",
+                        f'<environmentvariabledefinition schemaname="{schema}"><displayname default={quoteattr(schema[6:])} />'
+                        + (f"<defaultvalue>{escape(default)}</defaultvalue>" if default else "") +
+                        f"<isrequired>{1 if typ == '100000005' else 0}</isrequired><type>{typ}</type></environmentvariabledefinition>")
+        zf.writestr("bots/cr123_agenterh/bot.xml", '<bot schemaname="cr123_agenterh"><authenticationmode>2</authenticationmode><language>1046</language><name>Agente RH</name></bot>')
+        for t in topics:
+            zf.writestr(f"botcomponents/{t}/botcomponent.xml", f'<botcomponent schemaname="{t}"><componenttype>9</componenttype><name>{t.rsplit(".", 1)[-1]}</name>'
+                        "<parentbotid><schemaname>cr123_agenterh</schemaname></parentbotid></botcomponent>")
+            zf.writestr(f"botcomponents/{t}/data", f"kind: AdaptiveDialog\nbeginDialog:\n  kind: OnRecognizedIntent\n  id: main\n  intent:\n    triggerQueries:\n      - {t}\n"
+                        + ("  actions:\n    - kind: SendActivity\n      activity: versão revisada\n" if t in changed_topics else ""))
+    os.replace(path + ".tmp", path)
+    return path
+
+def sol_upload(up) -> Tuple[str, object]:
+    # sha1 de um .zip de 200 MB custa ~0,3 s: calcula uma vez por arquivo enviado e guarda na sessão
+    import io
+    memo = st.session_state.setdefault("sol_sha1", {})
+    if up.file_id not in memo:
+        memo[up.file_id] = hashlib.sha1(up.getbuffer()).hexdigest()
+    return memo[up.file_id], lambda: io.BytesIO(up.getbuffer())
+
+def solution_diff_lab(key: str):
+    import pandas as pd
+    lab_header("🧾 Laboratório — Inventário e diff de Solutions","Envie duas versões exportadas da solução: inventário de tabelas, colunas, flows, agentes e variáveis de ambiente, e o que muda no upgrade")
+    c1,c2 = st.columns([1,1.3],gap="large")
+    with c1:
+        src = st.radio("Versões",["Exemplo sintético","Enviar dois .zip"],horizontal=True,key=f"{key}_src")
+        if src == "Exemplo sintético":
+            n = st.select_slider("Tabelas na solução",[50,300,1_500],300,format_func=lambda v: f"{v:,}",key=f"{key}_n")
+            pa, pb = sol_sample_file(n, "1.0.0.0"), sol_sample_file(n, "1.1.0.0")
+            (da, oa), (db, ob) = [(f"{p}:{os.path.getsize(p)}", (lambda p=p: open(p, "rb"))) for p in (pa, pb)]
+        else:
+            ua = st.file_uploader("Versão A (base, ex.: a que está em produção)",type=["zip"],key=f"{key}_a")
+            ub = st.file_uploader("Versão B (nova)",type=["zip"],key=f"{key}_b")
+            if ua is None or ub is None:
+                info_box("Em <b>make.powerapps.com → Soluções → Exportar</b>, baixe as duas versões (managed ou unmanaged). O inventário de cada arquivo fica em cache pelo hash: comparar de novo, ou trocar só uma das versões, não relê a outra.", "info")
+                return
+            (da, oa), (db, ob) = sol_upload(ua), sol_upload(ub)
+        t0 = time.perf_counter()
+        try:
+            r = sol_compare(da, db, oa, ob)
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            return
+        ms = (time.perf_counter() - t0) * 1000
+        a, b = r["a"], r["b"]
+        st.dataframe(pd.DataFrame([a["head"], b["head"]], index=["A", "B"]).T, use_container_width=True)
+        st.caption(f"customizations.xml: {a['xml_mb']:,.1f} MB lidos em {a['ms']:,.0f} ms · {b['xml_mb']:,.1f} MB em {b['ms']:,.0f} ms "
+                   f"({a['elements'] + b['elements']:,} elementos, iterparse). Esta comparação: {ms:,.0f} ms.")
+        for sev, msg in r["findings"]:
+            info_box(msg, sev)
+    with c2:
+        cols = st.columns(4)
+        for i, kind in enumerate(SOL_KINDS):
+            na, nb = len(a["inv"][kind]), len(b["inv"][kind])
+            cols[i % 4].metric(kind, f"{nb:,}", f"{nb - na:+,}" if nb != na else None, delta_color="off")
+        df = pd.DataFrame(r["rows"], columns=["Componente", "Chave", "Nome", "Mudança", "Detalhe"])
+        f1,f2 = st.columns(2)
+        kinds = f1.multiselect("Componentes",SOL_KINDS,key=f"{key}_kinds")
+        changes = f2.multiselect("Mudança",["➕ Adicionado","➖ Removido","✏️ Alterado"],key=f"{key}_chg")
+        if kinds:
+            df = df[df["Componente"].isin(kinds)]
+        if changes:
+            df = df[df["Mudança"].isin(changes)]
+        st.markdown(f"**{len(df):,} diferenças** entre {a['head']['Versão']} e {b['head']['Versão']}")
+        st.dataframe(df, use_container_width=True, hide_index=True, height=360)
+    with st.expander("📋 Inventário completo da versão B"):
+        kind = st.selectbox("Tipo",SOL_KINDS,key=f"{key}_inv")
+        st.dataframe(pd.DataFrame.from_dict(b["inv"][kind], orient="index").rename_axis("Chave").reset_index(), use_container_width=True, hide_index=True)
+    st.caption("O customizations.xml é lido com iterparse: cada tabela, coluna e flow é extraído ao fechar a tag e descartado em seguida, então a memória não cresce com o tamanho do arquivo. Definições de flow e conteúdo de tópicos são comparados pelo CRC32 do diretório central do zip, sem descompactar.")
+
+
+# ══════════════════════════════════════════════
+# DATAVERSE — PLANEJADOR DE VAZÃO (LIMITES DE PROTEÇÃO DO SERVIÇO)
+# ══════════════════════════════════════════════
+# Por usuário (identidade que chama a API), em janela deslizante de 5 minutos
+DVT_WINDOW = 300.0
+DVT_MAX_REQUESTS = 6_000
+DVT_MAX_EXEC_MS = 1_200_000      # 20 min de tempo de execução combinado
+DVT_MAX_CONCURRENT = 52
+DVT_TIMEOUT_MS = 120_000         # requisição síncrona acima de 2 min é cancelada
+DVT_RTT_MS = 80
+DVT_MAX_CALLS = 250_000        # teto da simulação (uma chamada = um evento)
+DVT_MBPS = 100
+# modo → (maior lote, ms fixos por chamada no servidor, fator do custo por registro)
+DVT_MODES = {"Requisições individuais": (1, 8, 1.0), "ExecuteMultiple / $batch": (1_000, 15, 1.0),
+             "CreateMultiple / UpdateMultiple": (1_000, 15, 0.35)}
+DVT_BATCHES = [1, 10, 25, 50, 100, 200, 500, 1_000]
+DVT_PARALLEL = list(range(1, 17)) + [20, 24, 32, 40, 48, 52, 64, 80, 96, 104, 128, 156]
+
+def dvt_call(mode: str, batch: int, row_ms: float, kb: float) -> Tuple[float, float]:
+    """(duração da chamada vista pelo cliente, tempo de execução no servidor) em ms, para um lote."""
+    _, fixed, factor = DVT_MODES[mode]
+    exec_ms = fixed + batch * row_ms * factor
+    return DVT_RTT_MS + exec_ms + batch * kb * 8 / DVT_MBPS, exec_ms
+
+def dvt_estimate(n: int, mode: str, batch: int, parallel: int, users: int, row_ms: float, kb: float) -> dict:
+    """Modelo de fluxo: vazão sem limites e quanto de cada orçamento da janela ela consome por usuário."""
+    call_ms, exec_ms = dvt_call(mode, batch, row_ms, kb)
+    calls = math.ceil(n / batch)
+    duration = calls * call_ms / 1000 / parallel
+    rate = parallel / users / (call_ms / 1000)            # chamadas/s de cada usuário
+    span = min(duration, DVT_WINDOW)
+    return {"duration": duration, "calls": calls, "exec_ms": exec_ms,
+            "req_use": rate * span / DVT_MAX_REQUESTS, "exec_use": rate * exec_ms * span / DVT_MAX_EXEC_MS,
+            "conc_use": math.ceil(parallel / users) / DVT_MAX_CONCURRENT}
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def dvt_simulate(n: int, mode: str, batch: int, parallel: int, users: int, row_ms: float, kb: float, seed: int = 48) -> dict:
+    """Eventos discretos: P trabalhadores repartidos entre os usuários, cada usuário com a própria janela de 5 min.
+    Estourar qualquer limite devolve 429 com Retry-After; o cliente espera e reenvia o mesmo lote."""
+    calls = math.ceil(n / batch)
+    if calls > DVT_MAX_CALLS:
+        raise ValueError(f"{calls:,} chamadas passam do limite da simulação ({DVT_MAX_CALLS:,}): " +
+                         ("use lotes maiores." if DVT_MODES[mode][0] > 1 else "simule menos registros ou uma operação em lote."))
+    rng = np.random.default_rng(seed)
+    jitter = rng.lognormal(-0.045, 0.3, calls)            # média ≈ 1
+    sizes = np.full(calls, batch)
+    sizes[-1] = n - batch * (calls - 1)
+    _, fixed, factor = DVT_MODES[mode]
+    exec_ms = (fixed + sizes * row_ms * factor) * jitter
+    wire_ms = DVT_RTT_MS + sizes * kb * 8 / DVT_MBPS
+    windows = [collections.deque() for _ in range(users)]  # (início, exec_ms) das chamadas aceitas
+    used = [0.0] * users
+    inflight = [0] * users
+    ev = [(0.0, w, -1) for w in range(parallel)]          # (tempo, trabalhador, chamada que terminou)
+    heapq.heapify(ev)
+    nxt, retry = 0, {}
+    done_t, done_n, throttled = np.zeros(calls), sizes, collections.Counter()
+    t429, timeouts = [], 0
+    while ev:
+        t, w, fin = heapq.heappop(ev)
+        u = w % users
+        if fin >= 0:
+            inflight[u] -= 1
+            done_t[fin] = t
+        i = retry.pop(w, None)
+        if i is None:
+            if nxt >= calls:
+                continue
+            i, nxt = nxt, nxt + 1
+        win = windows[u]
+        while win and win[0][0] <= t - DVT_WINDOW:
+            used[u] -= win.popleft()[1]
+        if inflight[u] >= DVT_MAX_CONCURRENT:
+            cause, wait = "Concorrência", 1.0
+        elif len(win) >= DVT_MAX_REQUESTS:
+            cause, wait = "Requisições", win[0][0] + DVT_WINDOW - t
+        elif used[u] >= DVT_MAX_EXEC_MS:
+            # Retry-After: quando sair da janela o suficiente para voltar abaixo do orçamento
+            acc, over = 0.0, used[u] - DVT_MAX_EXEC_MS
+            for start, e in win:
+                acc += e
+                if acc > over:
+                    break
+            cause, wait = "Tempo de execução", start + DVT_WINDOW - t
+        else:
+            win.append((t, exec_ms[i]))
+            used[u] += exec_ms[i]
+            inflight[u] += 1
+            timeouts += exec_ms[i] > DVT_TIMEOUT_MS
+            heapq.heappush(ev, (t + (wire_ms[i] + exec_ms[i]) / 1000, w, i))
+            continue
+        throttled[cause] += 1
+        t429.append(t)
+        retry[w] = i
+        heapq.heappush(ev, (t + max(wait, 0.05), w, -1))
+    duration = float(done_t.max())
+    return {"duration": duration, "calls": calls, "throttled": dict(throttled), "t429": np.array(t429),
+            "done_t": done_t, "done_n": done_n, "timeouts": int(timeouts), "rate": n / duration if duration else 0.0}
+
+@st.cache_data(max_entries=32, show_spinner="Procurando a melhor configuração…")
+def dvt_recommend(n: int, mode: str, users: int, row_ms: float, kb: float, margin: float = 0.95) -> dict:
+    """Varre lote × paralelismo pelo modelo de fluxo e confirma os melhores candidatos na simulação."""
+    top = DVT_MODES[mode][0]
+    grid, capped = [], 0
+    for b in (b for b in DVT_BATCHES if b <= top):
+        for p in (p for p in DVT_PARALLEL if p <= DVT_MAX_CONCURRENT * users):
+            e = dvt_estimate(n, mode, b, p, users, row_ms, kb)
+            if e["exec_ms"] * 1.5 < DVT_TIMEOUT_MS and max(e["req_use"], e["exec_use"], e["conc_use"]) <= margin:
+                if e["calls"] > DVT_MAX_CALLS:
+                    capped += 1     # cabe nos limites do serviço, mas não no teto da simulação
+                else:
+                    grid.append((e["duration"], p, -b, e))
+    grid.sort(key=lambda g: g[:3])
+    tried = []
+    for est, p, b, e in grid[:6]:
+        s = dvt_simulate(n, mode, -b, p, users, row_ms, kb)
+        tried.append({"Lote": -b, "Paralelismo": p, "Estimado": est, "Simulado": s["duration"], "429": sum(s["throttled"].values()),
+                      "Registros/s": s["rate"], "Pico do orçamento": max(e["req_use"], e["exec_use"])})
+    ok = [t for t in tried if t["429"] == 0] or tried
+    return {"best": min(ok, key=lambda t: t["Simulado"]) if ok else None, "tried": tried, "grid": len(grid), "capped": capped}
+
+def dvt_timeline(r: dict, buckets: int = 120):
+    import pandas as pd
+    edges = np.linspace(0, max(r["duration"], 1e-9), buckets + 1)
+    width = edges[1] - edges[0]
+    rate = np.histogram(r["done_t"], edges, weights=r["done_n"])[0] / width
+    t429 = np.histogram(r["t429"], edges)[0] if len(r["t429"]) else np.zeros(buckets)
+    return pd.DataFrame({"Minuto": edges[:-1] / 60, "Registros/s": rate, "429 no intervalo": t429})
+
+def dataverse_throughput_lab(key: str):
+    import pandas as pd
+    lab_header("🚦 Laboratório — Planejador de carga em massa no Dataverse","Lote, paralelismo e payload contra os limites de proteção do serviço (6.000 requisições, 20 min de execução e 52 simultâneas por usuário a cada 5 min)")
+    c1,c2 = st.columns([1,1.3],gap="large")
+    with c1:
+        n = st.select_slider("Registros a carregar",[10_000,50_000,200_000,1_000_000,5_000_000],200_000,format_func=lambda v: f"{v:,}",key=f"{key}_n")
+        mode = st.radio("Operação",list(DVT_MODES),index=1,key=f"{key}_mode")
+        a1,a2 = st.columns(2)
+        if DVT_MODES[mode][0] > 1:
+            batch = a1.select_slider("Registros por lote",[b for b in DVT_BATCHES if b > 1],1_000,key=f"{key}_b")
+        else:
+            batch = 1
+            a1.caption("Uma requisição HTTP por registro.")
+        parallel = a2.select_slider("Paralelismo (threads)",DVT_PARALLEL,16,key=f"{key}_p")
+        b1,b2,b3 = st.columns(3)
+        users = b1.number_input("Usuários de aplicação",1,3,1,key=f"{key}_u",help="Os limites valem por usuário: as threads são repartidas entre eles.")
+        row_ms = b2.number_input("ms no servidor por registro",2,500,20,key=f"{key}_ms",help="Cresce com plug-ins síncronos, regras de negócio e colunas indexadas.")
+        kb = b3.number_input("KB por registro",1,200,2,key=f"{key}_kb")
+        e = dvt_estimate(n, mode, batch, parallel, users, float(row_ms), float(kb))
+        call_ms, exec_ms = dvt_call(mode, batch, float(row_ms), float(kb))
+        cap = users * min(DVT_MAX_REQUESTS * batch, DVT_MAX_EXEC_MS / exec_ms * batch) / DVT_WINDOW
+        st.caption(f"Cada chamada: ~{call_ms / 1000:,.1f} s no cliente, ~{exec_ms / 1000:,.1f} s de execução no servidor · {e['calls']:,} chamadas no total · "
+                   f"teto sustentável com este lote: ~{cap:,.0f} registros/s")
+        m1,m2,m3 = st.columns(3)
+        m1.metric("Requisições / 5 min", f"{e['req_use']:.0%}")
+        m2.metric("Execução / 5 min", f"{e['exec_use']:.0%}")
+        m3.metric("Simultâneas", f"{e['conc_use']:.0%}")
+        if exec_ms > DVT_TIMEOUT_MS:
+            info_box(f"⏱️ Um lote leva ~{exec_ms / 1000:,.0f} s no servidor: acima do timeout de 2 min da requisição. Reduza o lote.", "danger")
+    try:
+        r = dvt_simulate(n, mode, batch, parallel, int(users), float(row_ms), float(kb))
+    except ValueError as ex:
+        r, err = None, ex
+    rec = dvt_recommend(n, mode, int(users), float(row_ms), float(kb))
+    best = rec["best"]
+    with c2:
+        if r:
+            thr = sum(r["throttled"].values())
+            m1,m2,m3 = st.columns(3)
+            m1.metric("Duração simulada", frt_fmt(r["duration"]), f"estimativa sem limites {frt_fmt(e['duration'])}", delta_color="off")
+            m2.metric("Vazão", f"{r['rate']:,.0f} registros/s")
+            m3.metric("Respostas 429", f"{thr:,}", " · ".join(f"{k}: {v:,}" for k, v in r["throttled"].items()) or None, delta_color="off")
+            st.line_chart(dvt_timeline(r).set_index("Minuto"), height=220)
+        else:
+            thr = 0
+            st.error(f"❌ {err}")
+        if best:
+            same = best["Lote"] == batch and best["Paralelismo"] == parallel
+            if not r:
+                cmp = "."
+            elif same:
+                cmp = "; é a configuração atual."
+            else:
+                gain = r["duration"] / best["Simulado"] if best["Simulado"] else 1
+                cmp = f"; {gain:,.1f}× mais rápido que a atual." if gain >= 1 else f"; {1 / gain:,.1f}× mais lento que a atual, mas sem 429."
+            info_box(f"🏁 <b>Recomendado:</b> lote de {best['Lote']:,} com paralelismo {best['Paralelismo']} — {frt_fmt(best['Simulado'])} "
+                     f"({best['Registros/s']:,.0f} registros/s, {best['429']} respostas 429)" + cmp,
+                     "success" if best["429"] == 0 else "warning")
+        elif rec["capped"]:
+            info_box(f"🧮 {rec['capped']} combinações cabem nos limites do serviço, mas todas passam do teto da simulação ({DVT_MAX_CALLS:,} chamadas): "
+                     "não há recomendação simulada. Use lotes maiores ou carregue menos registros por execução.", "warning")
+        else:
+            info_box("Nenhuma combinação cabe nos limites com esse custo por registro: reduza o tempo por registro (plug-ins) ou use mais usuários de aplicação.", "danger")
+        if thr:
+            info_box(f"🚦 Com os 429, {frt_fmt(r['duration'] - e['duration'])} a mais que a estimativa: cada Retry-After para a thread até a janela liberar orçamento. "
+                     "Mais threads que o orçamento comporta não aumentam a vazão — só geram 429.", "warning")
+        if rec["tried"]:
+            st.dataframe(pd.DataFrame(rec["tried"]), use_container_width=True, hide_index=True, column_config={
+                "Estimado": st.column_config.NumberColumn("Estimado (s)", format="%.0f"), "Simulado": st.column_config.NumberColumn("Simulado (s)", format="%.0f"),
+                "Registros/s": st.column_config.NumberColumn(format="%.0f"), "Pico do orçamento": st.column_config.ProgressColumn(format="%.2f", min_value=0, max_value=1)})
+    st.caption(f"Modelo: RTT de {DVT_RTT_MS} ms e {DVT_MBPS} Mbit/s; a janela de 5 min é por usuário e a chamada em lote conta como uma requisição, mas soma o tempo de execução de todos os registros. "
+               f"A recomendação varre {rec['grid']} combinações que cabem em 95% dos limites pelo modelo de fluxo e confirma as 6 mais rápidas na simulação. "
+               "Para a cota diária de requisições da Power Platform, cada registro do lote conta.")
+
+
 # ══════════════════════════════════════════════
 # DATAVERSE — Integração com Power Apps
 # ══════════════════════════════════════════════
@@ -5431,6 +13717,8 @@ LookUp(Tabela, ID = varId)  // ✅ delegável
 // Arquivo → Configurações → Avançado
 // → Limite de linhas de dados: até 2000
 // → Recomendado: sempre use filtros''', language="powerapps")
+        st.divider()
+        powerfx_analyzer_lab("pfx_dv", profile="Dataverse")
 
     with tabs[2]:
         info_box("🎨 <b>Model-Driven Apps</b> são geradas automaticamente pelo Dataverse — formulários, grids e navegação prontos, configurados via metadados. Ideal para processos empresariais complexos.", "info")
@@ -5525,6 +13813,10 @@ If(
 // Refresh após salvar:
 Refresh(cr123_projetos);
 ClearCollect(colProjetos, Filter(...))''', language="powerapps")
+        st.divider()
+        dataverse_throughput_lab("dvt_dva")
+        st.divider()
+        msapp_lab("msapp_dva")
 
     with tabs[4]:
         c1,c2 = st.columns(2)
@@ -5580,6 +13872,8 @@ ClearCollect(colProjetos, Filter(...))''', language="powerapps")
 // Ao importar em PROD:
 // Preencha o valor de produção durante a importação
 // → nunca hardcode URLs no código!''', language="text")
+        sp()
+        solution_diff_lab("sol_dva")
 
     section_quiz("dataverse_apps")
     st.markdown('</div>', unsafe_allow_html=True)